@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BENCH_DIR)
+
+from syntheticData import writeSortedBAM
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Benchmark BGZF multithreading (--io-threads) on addRGOnBAM.py and splitBAMByRG.py with a synthetic BAM.')
+    parser.add_argument('-n', '--nb-reads', type=int, default=2000000, help='Number of reads in synthetic BAM. [Default: %(default)s]')
+    parser.add_argument('-t', '--threads', type=int, nargs='+', default=[1, 4, 8], help='Evaluated numbers of threads. [Default: %(default)s]')
+    parser.add_argument('-w', '--work-dir', default=tempfile.gettempdir(), help='Directory used for the synthetic data. [Default: %(default)s]')
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    args = parser.parse_args()
+
+    in_bam = os.path.join(args.work_dir, "benchAlignmentIO_in.bam")
+    out_bam = os.path.join(args.work_dir, "benchAlignmentIO_out.bam")
+    writeSortedBAM(in_bam, args.nb_reads)
+    design = os.path.join(args.work_dir, "benchAlignmentIO_design.tsv")
+    with open(design, "w") as writer:
+        writer.write("splA\tgp1\n")
+    scenarios = {
+        "addRGOnBAM.py": [os.path.join(BIN_DIR, "addRGOnBAM.py"), "--sm", "splB", "--input-aln", in_bam, "--output-aln", out_bam],
+        "splitBAMByRG.py": [os.path.join(BIN_DIR, "splitBAMByRG.py"), "--RG-tag", "SM", "--input-aln", in_bam, "--input-design", design, "--output-pattern", out_bam]
+    }
+    print("\t".join(["Script", "Threads", "Wall_time_s", "Reads_by_s"]))
+    for script, cmd in scenarios.items():
+        for nb_threads in args.threads:
+            start_time = time.time()
+            subprocess.check_call(cmd + ["--io-threads", str(nb_threads)])
+            wall_time = time.time() - start_time
+            print("{}\t{}\t{:.2f}\t{:.0f}".format(script, nb_threads, wall_time, args.nb_reads / wall_time))
+            sys.stdout.flush()
+    for curr_file in [in_bam, out_bam, design]:
+        os.remove(curr_file)
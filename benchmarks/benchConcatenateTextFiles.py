@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import gzip
+import time
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BENCH_DIR)
+
+from syntheticData import writeText
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def concatenateByLine(inputs, output):
+    """
+    Concatenate text files line by line (implementation of concatenateTextFiles.py 1.0.0).
+
+    :param inputs: Pathes to files.
+    :type inputs: list
+    :param output: Path to the concatenated file.
+    :type output: str
+    """
+    out_open_fct = open
+    out_mode = "w"
+    if output.endswith('.gz'):
+        out_open_fct = gzip.open
+        out_mode = "wt"
+    with out_open_fct(output, out_mode) as writer:
+        last_line = "\n"
+        for curr_in_file in inputs:
+            if not last_line.endswith("\n"):
+                writer.write("\n")  # Start new line for a new file
+            in_open_fct = open
+            in_mode = "r"
+            if curr_in_file.endswith(".gz"):
+                in_open_fct = gzip.open
+                in_mode = "rt"
+            with in_open_fct(curr_in_file, in_mode) as reader:
+                for line in reader:
+                    writer.write(line)
+                    last_line = line
+
+
+def getContentHash(in_path):
+    """
+    Return the MD5 of the decompressed content of the file.
+
+    :param in_path: Path to the file (format: text or gzip).
+    :type in_path: str
+    :return: The hexadecimal digest.
+    :rtype: str
+    """
+    md5 = hashlib.md5()
+    open_fct = gzip.open if in_path.endswith(".gz") else open
+    with open_fct(in_path, "rb") as reader:
+        for chunk in iter(lambda: reader.read(16777216), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Benchmark the copy of gzip members and the parallel compression of concatenateTextFiles.py against the concatenation line by line with synthetic text files.')
+    parser.add_argument('-s', '--size', type=int, default=4096, help='Total size of the uncompressed inputs in megabytes. It is split in four files. [Default: %(default)s]')
+    parser.add_argument('-t', '--threads', type=int, nargs='+', default=[1, 4, 8], help='Evaluated numbers of compression threads. [Default: %(default)s]')
+    parser.add_argument('-w', '--work-dir', default=tempfile.gettempdir(), help='Directory used for the synthetic data. [Default: %(default)s]')
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    args = parser.parse_args()
+
+    nb_bytes = args.size * 1048576
+    inputs_by_type = {
+        "gzip": [os.path.join(args.work_dir, "benchConcatenateTextFiles_in{}.txt.gz".format(idx)) for idx in range(4)],
+        "plain": [os.path.join(args.work_dir, "benchConcatenateTextFiles_in{}.txt".format(idx)) for idx in range(4)]
+    }
+    for in_type, inputs in inputs_by_type.items():
+        for idx, curr_path in enumerate(inputs):
+            writeText(curr_path, nb_bytes // len(inputs), idx)
+    out_path = os.path.join(args.work_dir, "benchConcatenateTextFiles_out.txt.gz")
+    print("\t".join(["Inputs", "Implementation", "Threads", "Wall_time_s", "MB_by_s"]))
+    for in_type, inputs in inputs_by_type.items():
+        start_time = time.time()
+        concatenateByLine(inputs, out_path)
+        wall_time = time.time() - start_time
+        expected = getContentHash(out_path)
+        print("{}\t{}\t{}\t{:.2f}\t{:.1f}".format(in_type, "by_line", 1, wall_time, args.size / wall_time))
+        sys.stdout.flush()
+        for nb_threads in (args.threads if in_type == "plain" else [1]):  # Members of gzip inputs are copied without compression
+            cmd = [os.path.join(BIN_DIR, "concatenateTextFiles.py"), "--compression-threads", str(nb_threads), "--inputs"] + inputs + ["--output", out_path]
+            start_time = time.time()
+            subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+            wall_time = time.time() - start_time
+            if getContentHash(out_path) != expected:
+                raise Exception("Outputs are different between the two implementations with {} inputs and {} threads.".format(in_type, nb_threads))
+            print("{}\t{}\t{}\t{:.2f}\t{:.1f}".format(in_type, "by_block", nb_threads, wall_time, args.size / wall_time))
+            sys.stdout.flush()
+    for curr_file in inputs_by_type["gzip"] + inputs_by_type["plain"] + [out_path]:
+        os.remove(curr_file)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from anacore.sequenceIO import FastqIO
+from anacore.illumina import getInfFromSeqDesc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BENCH_DIR)
+sys.path.append(BIN_DIR)
+
+from illuCountBarcodes import getCountByBarcode
+from syntheticData import writeSkewedFASTQ
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getCountByBarcodeByRecord(in_seq):
+    """
+    Return the number of reads by barcode in the fastq file with parsing of each record (implementation of illuCountBarcodes.py 1.0.1).
+
+    :param in_seq: The path to the sequence file (format: fastq).
+    :type in_seq: int
+    :return: The number of reads by barcode.
+    :rtype: dict
+    """
+    count_by_barcode = dict()
+    for curr_seq in in_seq:
+        with FastqIO(curr_seq) as FH_in:
+            for record in FH_in:
+                barcode = getInfFromSeqDesc(record.description)["barcode"]
+                if barcode not in count_by_barcode:
+                    count_by_barcode[barcode] = 1
+                else:
+                    count_by_barcode[barcode] += 1
+    return count_by_barcode
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Benchmark the counting of reads by barcode in illuCountBarcodes.py against the parsing of each record with a synthetic fastq.')
+    parser.add_argument('-n', '--nb-reads', type=int, default=10000000, help='Number of reads in synthetic fastq. [Default: %(default)s]')
+    parser.add_argument('-j', '--nb-jobs', type=int, nargs='+', default=[1, 4, 8], help='Evaluated numbers of processes. [Default: %(default)s]')
+    parser.add_argument('-w', '--work-dir', default=tempfile.gettempdir(), help='Directory used for the synthetic data. [Default: %(default)s]')
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    args = parser.parse_args()
+
+    in_fastq = os.path.join(args.work_dir, "benchIlluCountBarcodes_R1.fastq.gz")
+    writeSkewedFASTQ(in_fastq, args.nb_reads)
+    print("\t".join(["Implementation", "Processes", "Wall_time_s", "Reads_by_s"]))
+    start_time = time.time()
+    expected = getCountByBarcodeByRecord([in_fastq])
+    wall_time = time.time() - start_time
+    print("{}\t{}\t{:.2f}\t{:.0f}".format("by_record", 1, wall_time, args.nb_reads / wall_time))
+    sys.stdout.flush()
+    for nb_jobs in args.nb_jobs:
+        start_time = time.time()
+        observed = getCountByBarcode([in_fastq], nb_jobs)
+        wall_time = time.time() - start_time
+        if observed != expected:
+            raise Exception("Counts are different between the two implementations with {} processes.".format(nb_jobs))
+        print("{}\t{}\t{:.2f}\t{:.0f}".format("by_chunk", nb_jobs, wall_time, args.nb_reads / wall_time))
+        sys.stdout.flush()
+    os.remove(in_fastq)
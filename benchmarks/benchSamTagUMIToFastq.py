@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import gzip
+import time
+import pysam
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from anacore.sequenceIO import FastqIO, Sequence
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BENCH_DIR)
+
+from syntheticData import writeUnalignedBAM
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getContentHash(in_path):
+    """
+    Return the MD5 of the decompressed content of the file.
+
+    :param in_path: Path to the file (format: gzip).
+    :type in_path: str
+    :return: The hexadecimal digest.
+    :rtype: str
+    """
+    md5 = hashlib.md5()
+    with gzip.open(in_path, "rb") as reader:
+        for chunk in iter(lambda: reader.read(16777216), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def writeFastqByRecord(in_aln, out_r1, out_r2, qual_offset=33):
+    """
+    Write the reads of the alignment file in a pair of fastq with UMI in reads ID with a conversion of each record (implementation of samTagUMIToFastq.py 1.1.0).
+
+    :param in_aln: Path to the alignments file (format: BAM).
+    :type in_aln: str
+    :param out_r1: Path to the outputted reads file R1 (format: FASTQ).
+    :type out_r1: str
+    :param out_r2: Path to the outputted reads file R2 (format: FASTQ).
+    :type out_r2: str
+    :param qual_offset: Quality offset in reads.
+    :type qual_offset: int
+    """
+    with FastqIO(out_r2, "w") as writer_r2:
+        with FastqIO(out_r1, "w") as writer_r1:
+            with pysam.AlignmentFile(in_aln, "rb", check_sq=False) as reader:
+                for curr_read in reader.fetch(until_eof=True):
+                    if not curr_read.is_secondary and not curr_read.is_supplementary and not curr_read.is_qcfail:
+                        barcode = None
+                        if curr_read.has_tag("BC"):
+                            barcode = curr_read.get_tag("BC").replace("-", "+")
+                        description = "{}:{}:0:{} {}={}".format(
+                            "1" if curr_read.is_read1 else "2",
+                            "Y" if curr_read.is_qcfail else "N",
+                            "" if barcode is None else barcode,
+                            "QX",
+                            curr_read.get_tag("QX")
+                        )
+                        read = Sequence(
+                            curr_read.query_name + ":" + curr_read.get_tag("RX"),
+                            curr_read.get_forward_sequence(),
+                            description,
+                            "".join([chr(elt + qual_offset) for elt in curr_read.get_forward_qualities()])
+                        )
+                        if curr_read.is_reverse:
+                            read = read.dnaRevCom()
+                        if curr_read.is_read1:
+                            writer_r1.write(read)
+                        else:
+                            writer_r2.write(read)
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Benchmark the batched conversion of samTagUMIToFastq.py against the conversion of each record with a synthetic unaligned BAM.')
+    parser.add_argument('-n', '--nb-reads', type=int, default=5000000, help='Number of reads in synthetic BAM. [Default: %(default)s]')
+    parser.add_argument('-t', '--threads', type=int, nargs='+', default=[1, 4, 8], help='Evaluated numbers of compression threads. [Default: %(default)s]')
+    parser.add_argument('-w', '--work-dir', default=tempfile.gettempdir(), help='Directory used for the synthetic data. [Default: %(default)s]')
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    args = parser.parse_args()
+
+    in_bam = os.path.join(args.work_dir, "benchSamTagUMIToFastq_in.bam")
+    out_r1 = os.path.join(args.work_dir, "benchSamTagUMIToFastq_R1.fastq.gz")
+    out_r2 = os.path.join(args.work_dir, "benchSamTagUMIToFastq_R2.fastq.gz")
+    writeUnalignedBAM(in_bam, args.nb_reads)
+    print("\t".join(["Implementation", "Threads", "Wall_time_s", "Reads_by_s"]))
+    start_time = time.time()
+    writeFastqByRecord(in_bam, out_r1, out_r2)
+    wall_time = time.time() - start_time
+    expected = [getContentHash(out_r1), getContentHash(out_r2)]
+    print("{}\t{}\t{:.2f}\t{:.0f}".format("by_record", 1, wall_time, args.nb_reads / wall_time))
+    sys.stdout.flush()
+    for nb_threads in args.threads:
+        cmd = [
+            os.path.join(BIN_DIR, "samTagUMIToFastq.py"),
+            "--compression-threads", str(nb_threads),
+            "--input-aln", in_bam,
+            "--output-reads", out_r1,
+            "--output-reads-2", out_r2
+        ]
+        start_time = time.time()
+        subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+        wall_time = time.time() - start_time
+        if [getContentHash(out_r1), getContentHash(out_r2)] != expected:
+            raise Exception("Reads are different between the two implementations with {} compression threads.".format(nb_threads))
+        print("{}\t{}\t{:.2f}\t{:.0f}".format("by_batch", nb_threads, wall_time, args.nb_reads / wall_time))
+        sys.stdout.flush()
+    for curr_file in [in_bam, out_r1, out_r2]:
+        os.remove(curr_file)
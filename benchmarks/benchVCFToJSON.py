@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import time
+import filecmp
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BENCH_DIR)
+
+from syntheticData import writeAnnotatedVCF
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getPeakMemory(cmd):
+    """
+    Execute the command and return its wall time and its peak of resident memory.
+
+    :param cmd: The command.
+    :type cmd: list
+    :return: The wall time in seconds and the maximum resident set size in megabytes.
+    :rtype: (float, float)
+    """
+    start_time = time.time()
+    process = subprocess.Popen(cmd, stderr=subprocess.DEVNULL)
+    pid, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.time() - start_time
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+    return wall_time, rusage.ru_maxrss / 1024  # ru_maxrss is in kilobytes on Linux
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Benchmark the time and the peak of memory of VCFToJSON.py with a synthetic annotated VCF.')
+    parser.add_argument('-n', '--nb-variants', type=int, default=1000000, help='Number of variants in synthetic VCF. [Default: %(default)s]')
+    parser.add_argument('-r', '--reference-script', help='Path to another version of VCFToJSON.py (example: previous release) evaluated on the same data. Its output must be identical.')
+    parser.add_argument('-w', '--work-dir', default=tempfile.gettempdir(), help='Directory used for the synthetic data. [Default: %(default)s]')
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    args = parser.parse_args()
+
+    in_vcf = os.path.join(args.work_dir, "benchVCFToJSON_in.vcf")
+    out_json = os.path.join(args.work_dir, "benchVCFToJSON_out.json")
+    out_ref = os.path.join(args.work_dir, "benchVCFToJSON_ref.json")
+    writeAnnotatedVCF(in_vcf, args.nb_variants)
+    print("\t".join(["Script", "Format", "Wall_time_s", "Variants_by_s", "Peak_RSS_MB"]))
+    if args.reference_script:
+        wall_time, peak_mem = getPeakMemory([sys.executable, args.reference_script, "--input-variants", in_vcf, "--output-variants", out_ref])
+        print("{}\t{}\t{:.2f}\t{:.0f}\t{:.1f}".format("reference", "json", wall_time, args.nb_variants / wall_time, peak_mem))
+        sys.stdout.flush()
+    for out_format in ["json", "ndjson"]:
+        cmd = [sys.executable, os.path.join(BIN_DIR, "VCFToJSON.py"), "--output-format", out_format, "--input-variants", in_vcf, "--output-variants", out_json]
+        wall_time, peak_mem = getPeakMemory(cmd)
+        if args.reference_script and out_format == "json" and not filecmp.cmp(out_ref, out_json, shallow=False):
+            raise Exception("Outputs are different between the reference script and VCFToJSON.py.")
+        print("{}\t{}\t{:.2f}\t{:.0f}\t{:.1f}".format("VCFToJSON.py", out_format, wall_time, args.nb_variants / wall_time, peak_mem))
+        sys.stdout.flush()
+    for curr_file in [in_vcf, out_json, out_ref]:
+        if os.path.exists(curr_file):
+            os.remove(curr_file)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import sys
+import json
+import argparse
+from statistics import median
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getComparison(baseline, current, metrics, threshold):
+    """
+    Return the comparison of the median of each metric between two results of runBenchmarks.py.
+
+    :param baseline: Results used as reference.
+    :type baseline: dict
+    :param current: Evaluated results.
+    :type current: dict
+    :param metrics: Compared metrics (example: wall_time_s, cpu_time_s, peak_rss_mb).
+    :type metrics: list
+    :param threshold: Maximum relative increase before flagging a regression (example: 0.2 for +20%).
+    :type threshold: float
+    :return: One dict by scenario and metric with keys: scenario, metric, baseline, current, ratio and status (ok, regression, improvement, missing or new).
+    :rtype: list
+    """
+    comparison = []
+    for name in sorted(set(baseline["scenarios"]) | set(current["scenarios"])):
+        for metric in metrics:
+            ref_value = None
+            if name in baseline["scenarios"]:
+                ref_value = median(baseline["scenarios"][name][metric])
+            value = None
+            if name in current["scenarios"]:
+                value = median(current["scenarios"][name][metric])
+            ratio = None
+            status = "missing" if value is None else "new"
+            if ref_value is not None and value is not None:
+                ratio = value / ref_value if ref_value != 0 else float("inf")
+                status = "ok"
+                if ratio > 1 + threshold:
+                    status = "regression"
+                elif ratio < 1 - threshold:
+                    status = "improvement"
+            comparison.append({
+                "scenario": name,
+                "metric": metric,
+                "baseline": ref_value,
+                "current": value,
+                "ratio": ratio,
+                "status": status
+            })
+    return comparison
+
+
+def getWarnings(baseline, current):
+    """
+    Return the differences of parameters and platforms between two results which can explain differences of measures.
+
+    :param baseline: Results used as reference.
+    :type baseline: dict
+    :param current: Evaluated results.
+    :type current: dict
+    :return: Warnings messages.
+    :rtype: list
+    """
+    warnings = []
+    if baseline["scale"] != current["scale"]:
+        warnings.append("Scales are different: {} in baseline and {} in current.".format(baseline["scale"], current["scale"]))
+    for key in sorted(set(baseline["platform"]) | set(current["platform"])):
+        if baseline["platform"].get(key) != current["platform"].get(key):
+            warnings.append("Platforms are different for {}: {} in baseline and {} in current.".format(key, baseline["platform"].get(key), current["platform"].get(key)))
+    return warnings
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Compare two results of runBenchmarks.py and flag scenarios where the median of a metric increases more than the threshold. The exit code is 1 if at least one regression is found.')
+    parser.add_argument('-m', '--metrics', nargs='+', choices=["wall_time_s", "cpu_time_s", "peak_rss_mb"], default=["wall_time_s", "peak_rss_mb"], help='Compared metrics. [Default: %(default)s]')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2, help='Maximum relative increase before flagging a regression. [Default: %(default)s]')
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    group_input = parser.add_argument_group('Inputs')
+    group_input.add_argument('-b', '--input-baseline', required=True, help='Path to the reference results (format: JSON).')
+    group_input.add_argument('-c', '--input-current', required=True, help='Path to the evaluated results (format: JSON).')
+    args = parser.parse_args()
+
+    # Load results
+    with open(args.input_baseline) as reader:
+        baseline = json.load(reader)
+    with open(args.input_current) as reader:
+        current = json.load(reader)
+
+    # Compare
+    for msg in getWarnings(baseline, current):
+        print("[WARNING] " + msg, file=sys.stderr)
+    comparison = getComparison(baseline, current, args.metrics, args.threshold)
+    print("\t".join(["Scenario", "Metric", "Baseline", "Current", "Ratio", "Status"]))
+    for row in comparison:
+        print("\t".join([
+            row["scenario"],
+            row["metric"],
+            "" if row["baseline"] is None else "{:.3f}".format(row["baseline"]),
+            "" if row["current"] is None else "{:.3f}".format(row["current"]),
+            "" if row["ratio"] is None else "{:.2f}".format(row["ratio"]),
+            row["status"]
+        ]))
+    sys.exit(1 if any(row["status"] == "regression" for row in comparison) else 0)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import datetime
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BENCH_DIR)
+sys.path.append(BIN_DIR)
+
+from jobProfiler import getPeakRSS, resetPeakRSS
+from scenarios import SCENARIOS
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def execScenario(scenario, inputs):
+    """
+    Run the scenario in the current process and return its resources usage. The setup of the scenario is not included in measures: the peak of resident memory is reset after the setup and it starts from the memory already used by imports and state (without reset, on Linux < 4.0, the peak includes the setup).
+
+    :param scenario: The scenario.
+    :type scenario: scenarios.Scenario
+    :param inputs: Pathes returned by the prepare function of the scenario.
+    :type inputs: dict
+    :return: Wall time in seconds, CPU time in seconds (process and its children) and peak of resident memory in megabytes during the run (process or its largest child).
+    :rtype: dict
+    """
+    state = None if scenario.setup is None else scenario.setup(inputs)
+    resetPeakRSS()
+    start_usages = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    start_time = time.perf_counter()
+    scenario.run(inputs, state)
+    wall_time = time.perf_counter() - start_time
+    peak_rss = getPeakRSS()
+    end_usages = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return {
+        "wall_time_s": wall_time,
+        "cpu_time_s": sum(end.ru_utime + end.ru_stime - start.ru_utime - start.ru_stime for start, end in zip(start_usages, end_usages)),
+        "peak_rss_mb": max(peak_rss, end_usages[1].ru_maxrss) / 1024  # Sizes are in kilobytes
+    }
+
+
+def getPlatformInfo():
+    """
+    Return information on the machine and the environment used to produce the measures.
+
+    :return: Information by title.
+    :rtype: dict
+    """
+    info = {
+        "python": platform.python_version(),
+        "system": platform.platform(),
+        "machine": platform.machine(),
+        "nb_cpu": os.cpu_count()
+    }
+    for module_name in ["anacore", "numpy", "pysam"]:
+        try:
+            module = __import__(module_name)
+            info[module_name] = getattr(module, "__version__", None)
+        except ImportError:
+            info[module_name] = None
+    return info
+
+
+def measureScenario(name, inputs):
+    """
+    Run the scenario in a new process and return its resources usage. Each measure starts from a fresh interpreter to isolate the peak of memory.
+
+    :param name: Name of the scenario.
+    :type name: str
+    :param inputs: Pathes returned by the prepare function of the scenario.
+    :type inputs: dict
+    :return: Wall time in seconds, CPU time in seconds and peak of resident memory in megabytes.
+    :rtype: dict
+    """
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker-scenario", name, "--worker-inputs", json.dumps(inputs)]
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+    return json.loads(process.stdout.decode().strip().split("\n")[-1])
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Run the benchmarks scenarios on synthetic data and record wall time, CPU time and peak of resident memory of each run. Results can be compared with compareBenchmarks.py.')
+    parser.add_argument('-s', '--scale', type=float, default=1.0, help='Multiplicative factor applied on the default size of synthetic datasets. [Default: %(default)s]')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='Number of runs by scenario. [Default: %(default)s]')
+    parser.add_argument('-n', '--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS), help='Names of the evaluated scenarios. [Default: all]')
+    parser.add_argument('-w', '--work-dir', default=tempfile.gettempdir(), help='Directory used for the synthetic data. Data are kept between executions and reused for the same scale. [Default: %(default)s]')
+    parser.add_argument('-o', '--output', default="benchmarks.json", help='Path to the results (format: JSON). [Default: %(default)s]')
+    parser.add_argument('--worker-scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--worker-inputs', help=argparse.SUPPRESS)
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    args = parser.parse_args()
+
+    # Measure in worker
+    if args.worker_scenario is not None:
+        usage = execScenario(SCENARIOS[args.worker_scenario], json.loads(args.worker_inputs))
+        print(json.dumps(usage))
+        sys.exit(0)
+
+    # Run scenarios
+    results = {
+        "version": __version__,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "platform": getPlatformInfo(),
+        "scale": args.scale,
+        "repeats": args.repeats,
+        "scenarios": {}
+    }
+    print("\t".join(["Scenario", "Repeat", "Wall_time_s", "CPU_time_s", "Peak_RSS_MB"]))
+    for name in args.scenarios:
+        inputs = SCENARIOS[name].prepare(args.work_dir, args.scale)
+        measures = {"wall_time_s": [], "cpu_time_s": [], "peak_rss_mb": []}
+        for repeat_idx in range(args.repeats):
+            usage = measureScenario(name, inputs)
+            for metric, value in usage.items():
+                measures[metric].append(round(value, 4))
+            print("{}\t{}\t{:.3f}\t{:.3f}\t{:.1f}".format(name, repeat_idx + 1, usage["wall_time_s"], usage["cpu_time_s"], usage["peak_rss_mb"]))
+            sys.stdout.flush()
+        results["scenarios"][name] = measures
+    with open(args.output, "w") as writer:
+        json.dump(results, writer, indent=2)
@@ -0,0 +1,198 @@
+"""Benchmarks scenarios by script. Each scenario prepares its synthetic inputs once, loads optional untimed state and runs functions imported from the bin directory."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import logging
+import argparse
+from collections import OrderedDict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+
+from syntheticData import getSyntheticAmplicons, getSyntheticGenome, writeBAM, writeBED, writeFASTQ, writeGTF, writeVCF
+
+
+class Scenario:
+    """Benchmark unit: inputs preparation, untimed setup and timed run."""
+
+    def __init__(self, name, prepare, run, setup=None):
+        """
+        Build and return an instance of Scenario.
+
+        :param name: Name of the scenario (script.subject).
+        :type name: str
+        :param prepare: Function writing the inputs in work directory and returning their pathes: prepare(work_dir, scale) -> dict. It is called in the main process and outputs are reused between repeats.
+        :type prepare: function
+        :param run: Timed function: run(inputs, state).
+        :type run: function
+        :param setup: Untimed function returning the state used by run: setup(inputs) -> object.
+        :type setup: function
+        :return: The new instance.
+        :rtype: Scenario
+        """
+        self.name = name
+        self.prepare = prepare
+        self.run = run
+        self.setup = setup
+
+
+def getLogger():
+    """
+    Return a silent logger for functions requiring the logger of their script.
+
+    :return: The logger.
+    :rtype: logging.Logger
+    """
+    log = logging.getLogger("benchmarks")
+    log.setLevel(logging.WARNING)
+    return log
+
+
+def getDatasetPathes(work_dir, scale):
+    """
+    Write the shared synthetic dataset if it does not exist and return its pathes. Sizes at scale 1: 2 chromosomes of 2Mb, 1000 amplicons, 200 000 reads pairs, 400 genes, 3 VCF of 50 000 sites and 2 000 000 reads in fastq.
+
+    :param work_dir: Directory used for the synthetic data.
+    :type work_dir: str
+    :param scale: Multiplicative factor applied on the default size of each dataset.
+    :type scale: float
+    :return: Path by file type.
+    :rtype: dict
+    """
+    prefix = os.path.join(work_dir, "synthetic_scale{}".format(scale))
+    pathes = {
+        "bed": prefix + "_panel.bed",
+        "bam": prefix + "_reads.bam",
+        "gtf": prefix + "_annot.gtf",
+        "vcf": [prefix + "_caller{}.vcf".format(idx) for idx in range(3)],
+        "fastq": prefix + "_R1.fastq.gz"
+    }
+    genome = None
+    amplicons = None
+    if not os.path.exists(pathes["bed"]) or not os.path.exists(pathes["bam"] + ".bai"):
+        genome = getSyntheticGenome(2, 2000000)
+        amplicons = getSyntheticAmplicons(genome, max(1, int(1000 * scale)))
+        writeBED(pathes["bed"], amplicons)
+        writeBAM(pathes["bam"], genome, amplicons, max(1, int(200000 * scale)))
+    if not os.path.exists(pathes["gtf"]):
+        genome = getSyntheticGenome(2, 2000000) if genome is None else genome
+        writeGTF(pathes["gtf"], genome, max(1, int(400 * scale)))
+    for idx, curr_path in enumerate(pathes["vcf"]):
+        if not os.path.exists(curr_path):
+            genome = getSyntheticGenome(2, 2000000) if genome is None else genome
+            writeVCF(curr_path, genome, max(1, int(50000 * scale)), idx, ["splA", "splB"], 0.2 * idx)
+    if not os.path.exists(pathes["fastq"]):
+        writeFASTQ(pathes["fastq"], max(1, int(2000000 * scale)))
+    return pathes
+
+
+########################################################################
+#
+# SCENARIOS
+#
+########################################################################
+def setupAddAmpliRG(inputs):
+    """Return amplicons by chromosome and RG ID by amplicon name."""
+    from anacore.bed import getSortedAreasByChr
+    panel_regions = getSortedAreasByChr(inputs["bed"])
+    RG_id_by_source = {}
+    for chrom in sorted(panel_regions):
+        for curr_area in panel_regions[chrom]:
+            RG_id_by_source[curr_area.name] = str(len(RG_id_by_source) + 1)
+    return panel_regions, RG_id_by_source
+
+
+def runAddAmpliRG(inputs, state):
+    """Tag reads pairs by amplicon source."""
+    import pysam
+    import addAmpliRG
+    panel_regions, RG_id_by_source = state
+    args = argparse.Namespace(anchor_offset=4, check_strand=True, min_zoi_cov=10)
+    with pysam.AlignmentFile(inputs["bam"]) as FH_in:
+        new_header = FH_in.header.to_dict()
+        new_header["RG"] = [{"ID": RG_id, "LB": name} for name, RG_id in RG_id_by_source.items()]
+        with pysam.AlignmentFile(inputs["out"], "wbu", header=new_header) as addAmpliRG.FH_out:
+            addAmpliRG.processPairedReads(FH_in, panel_regions, RG_id_by_source, args)
+    os.remove(inputs["out"])
+
+
+def setupShallows(inputs):
+    """Return the targeted regions."""
+    from shallowsAnalysis import getTargets
+    return getTargets(inputs["bam"], inputs["bed"])
+
+
+def runShallows(inputs, state):
+    """Find shallow areas in targeted regions."""
+    from shallowsAnalysis import shallowFromAlignment
+    shallowFromAlignment(inputs["bam"], state, "fragment", 30, getLogger())
+
+
+def setupShallowsAnnot(inputs):
+    """Return the shallow areas."""
+    from shallowsAnalysis import getTargets, shallowFromAlignment
+    return shallowFromAlignment(inputs["bam"], getTargets(inputs["bam"], inputs["bed"]), "fragment", 30, getLogger())
+
+
+def runShallowsAnnot(inputs, state):
+    """Annotate shallow areas with transcripts and known variants."""
+    from anacore.gtf import loadModel
+    from shallowsAnalysis import setTranscriptsAnnotByOverlap, setVariantsByOverlap, variantsRegionFromVCF
+    setTranscriptsAnnotByOverlap(state, loadModel(inputs["gtf"], "transcripts"))
+    setVariantsByOverlap(state, variantsRegionFromVCF(inputs["vcf"][0], 3))
+
+
+def runMergeVCFCallers(inputs, state):
+    """Merge variants from three callers."""
+    import mergeVCFCallers
+    mergeVCFCallers.log = getLogger()
+    list(mergeVCFCallers.getMergedRecords(inputs["vcf"], ["caller0", "caller1", "caller2"], "ANN", set()))
+
+
+def runCigarlineGraph(inputs, state):
+    """Sum reads status by position."""
+    from cigarlineGraph import sumStatusFromAln
+    sumStatusFromAln(inputs["bam"])
+
+
+def runIlluCountBarcodes(inputs, state):
+    """Count reads by barcode in a gzip fastq."""
+    from illuCountBarcodes import getCountByBarcode
+    getCountByBarcode([inputs["fastq"]])
+
+
+def prepareWithOutput(out_name):
+    """
+    Return a prepare function adding the path of an output file to the dataset pathes.
+
+    :param out_name: Suffix of the output file.
+    :type out_name: str
+    :return: The prepare function.
+    :rtype: function
+    """
+    def prepare(work_dir, scale):
+        inputs = getDatasetPathes(work_dir, scale)
+        inputs["out"] = os.path.join(work_dir, "benchmarks_out_{}".format(out_name))
+        return inputs
+    return prepare
+
+
+SCENARIOS = OrderedDict(
+    (curr_scenario.name, curr_scenario) for curr_scenario in [
+        Scenario("addAmpliRG.processPairedReads", prepareWithOutput("addAmpliRG.bam"), runAddAmpliRG, setupAddAmpliRG),
+        Scenario("shallowsAnalysis.shallowFromAlignment", getDatasetPathes, runShallows, setupShallows),
+        Scenario("shallowsAnalysis.annotations", getDatasetPathes, runShallowsAnnot, setupShallowsAnnot),
+        Scenario("mergeVCFCallers.getMergedRecords", getDatasetPathes, runMergeVCFCallers),
+        Scenario("cigarlineGraph.sumStatusFromAln", getDatasetPathes, runCigarlineGraph),
+        Scenario("illuCountBarcodes.getCountByBarcode", getDatasetPathes, runIlluCountBarcodes)
+    ]
+)
@@ -0,0 +1,457 @@
+"""Deterministic generators of synthetic genomic files (BED, BAM, GTF, VCF, FASTQ and text) used by benchmarks. The same seed and size always produce the same content."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import gzip
+import pysam
+import random
+
+
+def getSyntheticGenome(nb_chrom=2, chrom_len=1000000, seed=0):
+    """
+    Return random chromosomes sequences.
+
+    :param nb_chrom: Number of chromosomes.
+    :type nb_chrom: int
+    :param chrom_len: Length of each chromosome.
+    :type chrom_len: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    :return: Sequence by chromosome name.
+    :rtype: dict
+    """
+    rand = random.Random(seed)
+    return {"chr{}".format(idx + 1): "".join(rand.choices("ACGT", k=chrom_len)) for idx in range(nb_chrom)}
+
+
+def getSyntheticAmplicons(genome, nb_amplicons, seed=0):
+    """
+    Return non-overlapping amplicons evenly distributed on the genome. The coordinates are 1-based like in anacore.region.Region.
+
+    :param genome: Sequence by chromosome name.
+    :type genome: dict
+    :param nb_amplicons: Number of amplicons.
+    :type nb_amplicons: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    :return: Amplicons. Each amplicon is a dict with keys: chrom, start, end, name, strand, thickStart and thickEnd (ZOI without primers).
+    :rtype: list
+    """
+    rand = random.Random(seed)
+    amplicons = []
+    nb_by_chrom = -(-nb_amplicons // len(genome))
+    for chrom, seq in genome.items():
+        step = len(seq) // (nb_by_chrom + 1)
+        if step < 300:
+            raise ValueError("The genome is too small to contain {} non-overlapping amplicons.".format(nb_amplicons))
+        for idx in range(nb_by_chrom):
+            if len(amplicons) == nb_amplicons:
+                break
+            start = step * (idx + 1) + rand.randint(0, 50)
+            length = rand.randint(150, 250)
+            amplicons.append({
+                "chrom": chrom,
+                "start": start,
+                "end": start + length - 1,
+                "name": "ampl{}".format(len(amplicons)),
+                "strand": rand.choice("+-"),
+                "thickStart": start + rand.randint(18, 25),
+                "thickEnd": start + length - 1 - rand.randint(18, 25)
+            })
+    return amplicons
+
+
+def writeBED(out_path, amplicons):
+    """
+    Write amplicons in a BED file with strand and ZOI stored in thickStart and thickEnd.
+
+    :param out_path: Path to the outputted file (format: BED).
+    :type out_path: str
+    :param amplicons: Amplicons returned by getSyntheticAmplicons().
+    :type amplicons: list
+    """
+    with open(out_path, "w") as writer:
+        for ampl in amplicons:
+            writer.write("{}\t{}\t{}\t{}\t0\t{}\t{}\t{}\n".format(
+                ampl["chrom"], ampl["start"] - 1, ampl["end"], ampl["name"], ampl["strand"], ampl["thickStart"] - 1, ampl["thickEnd"]
+            ))
+
+
+def writeBAM(out_path, genome, amplicons, nb_pairs, seed=0, read_len=100, off_target_rate=0.05):
+    """
+    Write paired-end reads coming from amplicons in a BAM sorted by coordinates and index it. The amplicons depths are heterogeneous to produce shallow areas and reads are perfect matches with MD tag.
+
+    :param out_path: Path to the outputted file (format: BAM).
+    :type out_path: str
+    :param genome: Sequence by chromosome name.
+    :type genome: dict
+    :param amplicons: Amplicons returned by getSyntheticAmplicons().
+    :type amplicons: list
+    :param nb_pairs: Number of reads pairs.
+    :type nb_pairs: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    :param read_len: Maximum length of reads.
+    :type read_len: int
+    :param off_target_rate: Proportion of pairs outside amplicons.
+    :type off_target_rate: float
+    """
+    rand = random.Random(seed)
+    weights = [rand.choice([0.05, 1, 1, 1, 2, 4]) for ampl in amplicons]
+    header = {"HD": {"VN": "1.6", "SO": "unsorted"}, "SQ": [{"SN": chrom, "LN": len(seq)} for chrom, seq in genome.items()]}
+    tmp_path = out_path + "_unsorted.bam"
+    with pysam.AlignmentFile(tmp_path, "wb", header=header) as writer:
+        tid_by_chrom = {chrom: writer.header.get_tid(chrom) for chrom in genome}
+        for idx in range(nb_pairs):
+            if rand.random() < off_target_rate:
+                chrom = rand.choice(list(genome))
+                frag_start = rand.randrange(len(genome[chrom]) - 400)
+                frag_end = frag_start + rand.randint(150, 400) - 1
+                r1_is_reverse = rand.random() < 0.5
+            else:
+                ampl = rand.choices(amplicons, weights)[0]
+                chrom = ampl["chrom"]
+                frag_start = ampl["start"] - 1 + rand.randint(0, 2)
+                frag_end = ampl["end"] - 1 - rand.randint(0, 2)
+                r1_is_reverse = ampl["strand"] == "-"
+            curr_len = min(read_len, frag_end - frag_start + 1)
+            qualities = pysam.qualitystring_to_array("".join(rand.choices("FF:,", k=curr_len)))
+            for is_read1 in (True, False):
+                is_reverse = r1_is_reverse if is_read1 else not r1_is_reverse
+                read = pysam.AlignedSegment(writer.header)
+                read.query_name = "pair{}".format(idx)
+                read.flag = 1 + 2 + (64 if is_read1 else 128) + (16 if is_reverse else 32)
+                read.reference_id = tid_by_chrom[chrom]
+                read.reference_start = frag_end - curr_len + 1 if is_reverse else frag_start
+                read.mapping_quality = 60
+                read.cigartuples = [(0, curr_len)]
+                read.query_sequence = genome[chrom][read.reference_start:read.reference_start + curr_len]
+                read.query_qualities = qualities
+                read.set_tag("MD", str(curr_len))
+                read.next_reference_id = read.reference_id
+                read.next_reference_start = frag_start if is_reverse else frag_end - curr_len + 1
+                read.template_length = (frag_end - frag_start + 1) * (-1 if is_reverse else 1)
+                writer.write(read)
+    pysam.sort("-o", out_path, tmp_path)
+    pysam.index(out_path)
+    os.remove(tmp_path)
+
+
+def writeGTF(out_path, genome, nb_genes, seed=0):
+    """
+    Write genes with their transcripts, exons and CDS in a GTF file.
+
+    :param out_path: Path to the outputted file (format: GTF).
+    :type out_path: str
+    :param genome: Sequence by chromosome name.
+    :type genome: dict
+    :param nb_genes: Number of genes.
+    :type nb_genes: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    """
+    rand = random.Random(seed)
+    nb_by_chrom = -(-nb_genes // len(genome))
+    gene_idx = 0
+    with open(out_path, "w") as writer:
+        for chrom, seq in genome.items():
+            step = len(seq) // nb_by_chrom
+            for idx_in_chrom in range(nb_by_chrom):
+                if gene_idx == nb_genes:
+                    break
+                strand = rand.choice("+-")
+                gene_attr = 'gene_id "ENSG{:011d}"; gene_name "GENE{}";'.format(gene_idx, gene_idx)
+                records = []
+                area_start = step * idx_in_chrom + 1
+                gene_start = None
+                gene_end = None
+                for tr_idx in range(rand.randint(1, 3)):
+                    tr_id = "ENST{:011d}".format(gene_idx * 10 + tr_idx)
+                    tr_attr = '{} transcript_id "{}"; transcript_name "GENE{}-{}";'.format(gene_attr, tr_id, gene_idx, tr_idx + 1)
+                    exons = []
+                    exon_start = area_start + rand.randint(0, 200)
+                    for exon_idx in range(rand.randint(2, 10)):
+                        exon_end = exon_start + rand.randint(50, 300)
+                        if exon_end >= area_start + step - 1:
+                            break
+                        exons.append((exon_start, exon_end))
+                        exon_start = exon_end + rand.randint(100, max(100, step // 20))
+                    if len(exons) == 0:
+                        continue
+                    gene_start = exons[0][0] if gene_start is None else min(gene_start, exons[0][0])
+                    gene_end = exons[-1][1] if gene_end is None else max(gene_end, exons[-1][1])
+                    records.append((exons[0][0], exons[-1][1], "transcript", tr_attr))
+                    for exon_idx, (start, end) in enumerate(exons if strand == "+" else exons[::-1]):
+                        records.append((start, end, "exon", '{} exon_number "{}";'.format(tr_attr, exon_idx + 1)))
+                        if len(exons) > 2 and 0 < exon_idx < len(exons) - 1:  # First and last exons are UTR
+                            records.append((start, end, "CDS", '{} exon_number "{}"; protein_id "ENSP{:011d}";'.format(tr_attr, exon_idx + 1, gene_idx * 10 + tr_idx)))
+                if len(records) != 0:
+                    writer.write("{}\tsynthetic\tgene\t{}\t{}\t.\t{}\t.\t{}\n".format(chrom, gene_start, gene_end, strand, gene_attr))
+                    for start, end, feature, attr in records:
+                        writer.write("{}\tsynthetic\t{}\t{}\t{}\t.\t{}\t{}\t{}\n".format(chrom, feature, start, end, strand, "0" if feature == "CDS" else ".", attr))
+                gene_idx += 1
+
+
+def writeVCF(out_path, genome, nb_variants, seed=0, samples=("splA",), missing_rate=0.0):
+    """
+    Write SNVs and short indels with known variants annotations (GENE, CDS, AA and CNT like in COSMIC) and AD/DP by sample. The variants sites depend only on the genome and nb_variants: files written with different seeds share the same sites (with missing_rate) but have different supports.
+
+    :param out_path: Path to the outputted file (format: VCF).
+    :type out_path: str
+    :param genome: Sequence by chromosome name.
+    :type genome: dict
+    :param nb_variants: Number of variants sites.
+    :type nb_variants: int
+    :param seed: Seed for the random generator of supports and missing sites.
+    :type seed: int
+    :param samples: Samples names.
+    :type samples: list
+    :param missing_rate: Proportion of sites not written in the file.
+    :type missing_rate: float
+    """
+    sites_rand = random.Random(nb_variants)
+    rand = random.Random(seed)
+    nb_by_chrom = -(-nb_variants // len(genome))
+    with open(out_path, "w") as writer:
+        writer.write("##fileformat=VCFv4.2\n")
+        writer.write('##FILTER=<ID=PASS,Description="All filters passed">\n')
+        writer.write('##FILTER=<ID=lowAD,Description="Alternative allele depth lower than 10">\n')
+        writer.write('##INFO=<ID=GENE,Number=1,Type=String,Description="Gene symbol">\n')
+        writer.write('##INFO=<ID=CDS,Number=1,Type=String,Description="HGVSc">\n')
+        writer.write('##INFO=<ID=AA,Number=1,Type=String,Description="HGVSp">\n')
+        writer.write('##INFO=<ID=CNT,Number=1,Type=Integer,Description="Number of samples with this variant">\n')
+        writer.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        writer.write('##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Allelic depths for the ref and alt alleles in the order listed">\n')
+        writer.write('##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Total depth">\n')
+        for chrom, seq in genome.items():
+            writer.write("##contig=<ID={},length={}>\n".format(chrom, len(seq)))
+        writer.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{}\n".format("\t".join(samples)))
+        var_idx = 0
+        for chrom, seq in genome.items():
+            step = (len(seq) - 20) // nb_by_chrom
+            for idx_in_chrom in range(nb_by_chrom):
+                if var_idx == nb_variants:
+                    break
+                pos = step * idx_in_chrom + sites_rand.randint(1, step)
+                var_type = sites_rand.random()
+                ref = seq[pos - 1]
+                if var_type < 0.8:  # Substitution
+                    alt = sites_rand.choice([nt for nt in "ACGT" if nt != ref])
+                elif var_type < 0.9:  # Insertion
+                    alt = ref + "".join(sites_rand.choices("ACGT", k=sites_rand.randint(1, 6)))
+                else:  # Deletion
+                    ref = seq[pos - 1:pos + sites_rand.randint(1, 6)]
+                    alt = ref[0]
+                info = "GENE=GENE{};CDS=c.{}{}>{};AA=p.V{}M;CNT={}".format(var_idx // 50, pos, ref, alt, pos // 3, sites_rand.randint(1, 50))
+                var_idx += 1
+                if rand.random() < missing_rate:
+                    continue
+                supports = []
+                for spl in samples:
+                    depth = rand.randint(20, 3000)
+                    alt_depth = rand.randint(1, depth)
+                    supports.append("{}:{},{}:{}".format("1/1" if alt_depth / depth > 0.9 else "0/1", depth - alt_depth, alt_depth, depth))
+                writer.write("{}\t{}\t.\t{}\t{}\t{}\t{}\t{}\tGT:AD:DP\t{}\n".format(
+                    chrom, pos, ref, alt, rand.randint(10, 3000), rand.choice(["PASS", "PASS", "PASS", "lowAD"]), info, "\t".join(supports)
+                ))
+
+
+def writeFASTQ(out_path, nb_reads, seed=0, read_len=150, nb_barcodes=96, error_rate=0.02):
+    """
+    Write reads with Illumina's headers containing dual index barcodes. Most of reads come from a set of barcodes and the others contain sequencing errors in barcodes.
+
+    :param out_path: Path to the outputted file (format: fastq or gzip if path ends with ".gz").
+    :type out_path: str
+    :param nb_reads: Number of reads.
+    :type nb_reads: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    :param read_len: Length of reads.
+    :type read_len: int
+    :param nb_barcodes: Number of expected barcodes.
+    :type nb_barcodes: int
+    :param error_rate: Proportion of reads with an unexpected barcode.
+    :type error_rate: float
+    """
+    rand = random.Random(seed)
+    barcodes = ["{}+{}".format("".join(rand.choices("ACGT", k=8)), "".join(rand.choices("ACGT", k=8))) for idx in range(nb_barcodes)]
+    sequences = ["".join(rand.choices("ACGT", k=read_len)) for idx in range(1000)]
+    qualities = ["".join(rand.choices("FFFF:,#", k=read_len)) for idx in range(1000)]
+    open_fct = gzip.open if out_path.endswith(".gz") else open
+    with open_fct(out_path, "wt", **({"compresslevel": 1} if out_path.endswith(".gz") else {})) as writer:
+        for start_idx in range(0, nb_reads, 10000):
+            batch = []
+            for idx in range(start_idx, min(start_idx + 10000, nb_reads)):
+                barcode = rand.choice(barcodes)
+                if rand.random() < error_rate:
+                    barcode = "".join(rand.choice("ACGTN") if nt != "+" and rand.random() < 0.2 else nt for nt in barcode)
+                batch.append("@A00102:319:HFLHKDRXY:1:{}:{}:{} 1:N:0:{}\n{}\n+\n{}\n".format(
+                    1101 + idx // 4000000, rand.randint(1000, 30000), idx, barcode, rand.choice(sequences), rand.choice(qualities)
+                ))
+            writer.write("".join(batch))
+
+
+def writeSortedBAM(out_path, nb_reads, read_len=150, seed=42):
+    """
+    Write a coordinate sorted BAM with random reads.
+
+    :param out_path: Path to the outputted file (format: BAM).
+    :type out_path: str
+    :param nb_reads: Number of reads.
+    :type nb_reads: int
+    :param read_len: Length of reads.
+    :type read_len: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    """
+    rand = random.Random(seed)
+    chrom_len = 50000000
+    header = {
+        "HD": {"VN": "1.6", "SO": "coordinate"},
+        "SQ": [{"SN": "chr1", "LN": chrom_len}],
+        "RG": [{"ID": "1", "SM": "splA"}]
+    }
+    positions = sorted(rand.randrange(chrom_len - read_len) for idx in range(nb_reads))
+    quals = pysam.qualitystring_to_array("".join(rand.choice("#,:FF") for idx in range(read_len)))
+    with pysam.AlignmentFile(out_path, "wb", header=header) as writer:
+        for idx, pos in enumerate(positions):
+            read = pysam.AlignedSegment(writer.header)
+            read.query_name = "M70265:329:000000000-D5GLP:1:1101:{}:{}".format(idx % 30000, idx)
+            read.reference_id = 0
+            read.reference_start = pos
+            read.mapping_quality = 60
+            read.cigarstring = "{}M".format(read_len)
+            read.query_sequence = "".join(rand.choice("ACGT") for nt_idx in range(read_len))
+            read.query_qualities = quals
+            read.set_tag("RG", "1")
+            writer.write(read)
+
+
+def writeUnalignedBAM(out_path, nb_reads, read_len=150, seed=42):
+    """
+    Write an unaligned BAM with random pairs of reads and their UMI and barcode in tags.
+
+    :param out_path: Path to the outputted file (format: BAM).
+    :type out_path: str
+    :param nb_reads: Number of reads.
+    :type nb_reads: int
+    :param read_len: Length of reads.
+    :type read_len: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    """
+    rand = random.Random(seed)
+    header = {"HD": {"VN": "1.6", "SO": "unsorted"}}
+    sequences = ["".join(rand.choice("ACGT") for nt_idx in range(read_len)) for idx in range(1000)]
+    quals = [pysam.qualitystring_to_array("".join(rand.choice("#,:FF") for nt_idx in range(read_len))) for idx in range(10)]
+    with pysam.AlignmentFile(out_path, "wb", header=header) as writer:
+        for idx in range(nb_reads):
+            read = pysam.AlignedSegment(writer.header)
+            read.query_name = "A00102:319:HFLHKDRXY:1:1101:{}:{}".format((idx // 2) % 30000, idx // 2)
+            read.flag = 77 if idx % 2 == 0 else 141
+            read.query_sequence = sequences[idx % 1000]
+            read.query_qualities = quals[idx % 10]
+            read.set_tag("RX", "{}-{}".format(sequences[(idx // 2) % 1000][:7], sequences[(idx // 2 + 1) % 1000][:7]))
+            read.set_tag("QX", "FFFFFFF FFFFFFF")
+            read.set_tag("BC", "ACGTACGT-TTGACCAG")
+            writer.write(read)
+
+
+def writeSkewedFASTQ(out_path, nb_reads, nb_barcodes=400, read_len=151, seed=42):
+    """
+    Write a gzipped fastq with Illumina's headers and barcodes following a skewed distribution.
+
+    :param out_path: Path to the outputted file (format: fastq.gz).
+    :type out_path: str
+    :param nb_reads: Number of reads.
+    :type nb_reads: int
+    :param nb_barcodes: Number of distinct barcodes.
+    :type nb_barcodes: int
+    :param read_len: Length of reads.
+    :type read_len: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    """
+    rand = random.Random(seed)
+    barcodes = ["".join(rand.choice("ACGTN") for nt_idx in range(8)) + "+" + "".join(rand.choice("ACGT") for nt_idx in range(8)) for idx in range(nb_barcodes)]
+    weights = [1 / (idx + 1) for idx in range(nb_barcodes)]
+    sequences = ["".join(rand.choice("ACGT") for nt_idx in range(read_len)) for idx in range(1000)]
+    quality = "".join(rand.choice("#,:FF") for nt_idx in range(read_len))
+    with gzip.open(out_path, "wt", compresslevel=1) as writer:
+        batch_size = 100000
+        for batch_start in range(0, nb_reads, batch_size):
+            batch_barcodes = rand.choices(barcodes, weights, k=min(batch_size, nb_reads - batch_start))
+            writer.write("".join(
+                "@A00102:319:HFLHKDRXY:1:1101:{}:{} 1:N:0:{}\n{}\n+\n{}\n".format(
+                    (batch_start + idx) % 30000, batch_start + idx, barcode, sequences[idx % 1000], quality
+                ) for idx, barcode in enumerate(batch_barcodes)
+            ))
+
+
+def writeAnnotatedVCF(out_path, nb_variants, seed=42):
+    """
+    Write a VCF with random SNVs annotated by VEP (three features by variant and AF in populations).
+
+    :param out_path: Path to the outputted file (format: VCF).
+    :type out_path: str
+    :param nb_variants: Number of variants.
+    :type nb_variants: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    """
+    rand = random.Random(seed)
+    titles = ["Allele", "Consequence", "SYMBOL", "Feature", "Feature_type", "HGVSc", "HGVSp", "Existing_variation", "EUR_AF", "gnomAD_AF", "gnomAD_NFE_AF", "CLIN_SIG", "CADD_PHRED"]
+    with open(out_path, "w") as writer:
+        writer.write("##fileformat=VCFv4.2\n")
+        writer.write('##INFO=<ID=ANN,Number=.,Type=String,Description="Consequence annotations from Ensembl VEP. Format: {}">\n'.format("|".join(titles)))
+        writer.write('##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Allelic depths for the ref and alt alleles in the order listed">\n')
+        writer.write('##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Total depth">\n')
+        writer.write("##contig=<ID=chr1,length=248956422>\n")
+        writer.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tsplA\n")
+        pos = 10000
+        for idx in range(nb_variants):
+            pos += rand.randint(1, 200)
+            ref, alt = rand.sample("ACGT", 2)
+            annotations = []
+            for feature_idx in range(3):
+                annotations.append("|".join([
+                    alt, "missense_variant", "GENE{}".format(idx // 100), "ENST{:011d}".format(idx * 3 + feature_idx), "Transcript",
+                    "ENST{:011d}.1:c.{}{}>{}".format(idx * 3 + feature_idx, pos % 3000, ref, alt), "",
+                    "rs{}&COSV{}".format(idx, idx), "0.01", "0.001", "0.002", "benign", "12.3"
+                ]))
+            depth = rand.randint(50, 2000)
+            writer.write("chr1\t{}\t.\t{}\t{}\t{}\tPASS\tANN={}\tAD:DP\t{},{}:{}\n".format(
+                pos, ref, alt, rand.randint(10, 3000), ",".join(annotations), depth - depth // 10, depth // 10, depth
+            ))
+
+
+def writeText(out_path, size, seed=42):
+    """
+    Write a text file with fastq-like lines.
+
+    :param out_path: Path to the outputted file (format: text or gzip if path ends with ".gz").
+    :type out_path: str
+    :param size: Approximate size of the uncompressed content in bytes.
+    :type size: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    """
+    rand = random.Random(seed)
+    records = [
+        "@A00102:319:HFLHKDRXY:1:1101:{}:{} 1:N:0:ACGTACGT+TTGACCAG\n{}\n+\n{}\n".format(
+            rand.randint(1000, 30000), idx, "".join(rand.choice("ACGT") for nt_idx in range(151)), "".join(rand.choice("#,:FF") for nt_idx in range(151))
+        ) for idx in range(2000)
+    ]
+    open_fct = gzip.open if out_path.endswith(".gz") else open
+    with open_fct(out_path, "wt", **({"compresslevel": 1} if out_path.endswith(".gz") else {})) as writer:
+        written = 0
+        while written < size:
+            batch = "".join(rand.choices(records, k=1000))
+            writer.write(batch)
+            written += len(batch)
@@ -3,7 +3,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '2.6.0'
+__version__ = '2.7.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -14,6 +14,7 @@ import json
 import logging
 import argparse
 from anacore.annotVcf import AnnotVCFIO, getAlleleRecord
+from variantsJSONIO import VariantsJSONWriter
 
 
 ########################################################################
@@ -21,7 +22,7 @@ from anacore.annotVcf import AnnotVCFIO, getAlleleRecord
 # FUNCTIONS
 #
 ########################################################################
-def getAnnotSummary(allele_record, initial_alt, annot_field="ANN", pop_prefixes=None, pathogenicity_fields=None, logger=None):
+def getAnnotSummary(allele_record, initial_alt, annot_field="ANN", pop_prefixes=None, pathogenicity_fields=None, logger=None, pop_info_by_key=None):
     """
     Return a summary of the diffrent annotations of the variant. This summary is about identical known variants (xref), AF in populations (pop_AF), annotations of the variant and annotations of the collocated variants.
 
@@ -37,6 +38,8 @@ def getAnnotSummary(allele_record, initial_alt, annot_field="ANN", pop_prefixes=
     :type pathogenicity_fields: str
     :param logger: The logger object.
     :type loggger: logging.Logger
+    :param pop_info_by_key: The source and the name of the population by annotation tag (see getPopInfoByKey()). Tags missing in this dictionary are parsed with getPopInfo().
+    :type pop_info_by_key: dict
     :return: First the dentical known variants (e.g. {"cosmic": ["COSM14", "COSM15"], "dbSNP":[]}), second AF in populations (e.g. [{"source":"1KG", "name":"Global", "AF":0.85}]), third annotations of the variant and fourth annotations of the collocated variants.
     :rtype: list
     :warnings: The allele_record must only contains one variant.
@@ -64,7 +67,10 @@ def getAnnotSummary(allele_record, initial_alt, annot_field="ANN", pop_prefixes=
         if is_self_variant:
             for key in annot:
                 if key.endswith("_AF") and annot[key] is not None:
-                    source, name = getPopInfo(key, pop_prefixes, logger)
+                    if pop_info_by_key is not None and key in pop_info_by_key:
+                        source, name = pop_info_by_key[key]
+                    else:
+                        source, name = getPopInfo(key, pop_prefixes, logger)
                     pop_id = source + "_" + name
                     for curr_AF in annot[key].split("&"):
                         if pop_id not in pop_AF:
@@ -150,6 +156,22 @@ def getPopInfo(annot_key, pop_prefixes=None, logger=None):
     return source, name
 
 
+def getPopInfoByKey(annot_keys, pop_prefixes=None, logger=None):
+    """
+    Return by annotation tag storing AF in population the source and the name of the population. This parsing is done once from the annotation titles of the header instead of for each annotation.
+
+    :param annot_keys: The titles of the annotation fields.
+    :type annot_keys: list
+    :param pop_prefixes: The prefixes used to determine database name in population allele frequency fields (example: "gnomAD" is used in gnomAD_AF, gnomAD_EUR_AF).
+    :type pop_prefixes: list
+    :param logger: The logger object.
+    :type loggger: logging.Logger
+    :return: By tag the source and the name of the population (see getPopInfo()).
+    :rtype: dict
+    """
+    return {key: getPopInfo(key, pop_prefixes, logger) for key in annot_keys if key.endswith("_AF")}
+
+
 ########################################################################
 #
 # MAIN
@@ -168,6 +190,7 @@ if __name__ == "__main__":
     group_input.add_argument('-i', '--input-variants', required=True, help='The path to the file file containing variants and annotated with VEP v88+ (format: VCF).')
     group_output = parser.add_argument_group('Outputs')  # Outputs
     group_input.add_argument('-o', '--output-variants', required=True, help='The path to the file outputted file (format: JSON).')
+    group_output.add_argument('-f', '--output-format', default="json", choices=["json", "ndjson"], help='Format of the outputted file: "json" for a list of variants and "ndjson" for one variant by line. [Default: %(default)s]')
     args = parser.parse_args()
 
     # Logger
@@ -176,14 +199,15 @@ if __name__ == "__main__":
     log.setLevel(logging.INFO)
     log.info("Command: " + " ".join(sys.argv))
 
-    # Convert VCF in python dict
-    json_data = list()
-    with AnnotVCFIO(args.input_variants, "r", args.annotation_field) as FH_vcf:
+    # Convert VCF in JSON
+    with AnnotVCFIO(args.input_variants, "r", args.annotation_field) as FH_vcf, VariantsJSONWriter(args.output_variants, (args.output_format == "ndjson"), sort_keys=True, default=lambda o: o.__dict__) as FH_out:
         # Get sources IDs for VCF coming from merged sources
         id_by_src = None
         if args.merged_sources:
             SRC_id_desc = FH_vcf.info["SRC"].description.split("Possible values: ")[1].replace("'", '"')
             id_by_src = json.loads(SRC_id_desc)
+        # Population information by annotation tag
+        pop_info_by_key = getPopInfoByKey(FH_vcf.ANN_titles, args.populations_prefixes, log)
         # Records
         for record in FH_vcf:
             for idx_alt, alt in enumerate(record.alt):
@@ -231,9 +255,9 @@ if __name__ == "__main__":
                         args.annotation_field,
                         args.populations_prefixes,
                         args.pathogenicity_fields,
-                        log
+                        log,
+                        pop_info_by_key
                     )
-                json_data.append(curr_json)
                 # Evidences
                 if "EVID_PA" in FH_vcf.format:
                     curr_json["evidences"] = {}
@@ -245,9 +269,5 @@ if __name__ == "__main__":
                         if curr_evidence["EVID_PS"] is not None:
                             curr_json["evidences"][spl]["prec_same_dis"] = curr_evidence["EVID_PS"]
                             curr_json["evidences"][spl]["imp_same_dis"] = curr_evidence["EVID_IS"]
-    # Write output file
-    with open(args.output_variants, "w") as FH_out:
-        FH_out.write(
-            json.dumps(json_data, default=lambda o: o.__dict__, sort_keys=True)
-        )
+                FH_out.write(curr_json)
     log.info("End of job")
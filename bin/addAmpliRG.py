@@ -3,7 +3,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '2.1.0'
+__version__ = '2.2.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -15,6 +15,7 @@ import logging
 import argparse
 from statistics import median
 from anacore.bed import getSortedAreasByChr
+from alignmentIO import addIOArguments, openAlignmentReader, openAlignmentWriter
 
 
 ########################################################################
@@ -480,6 +481,7 @@ if __name__ == "__main__":
     group_output = parser.add_argument_group('Outputs')  # Outputs
     group_output.add_argument('-o', '--output-aln', required=True, help='The path to the alignments file (format: BAM).')
     group_output.add_argument('-s', '--output-summary', help='The path to the summary file (format: see --summary-format). It contains information about the number of reads out off target, reversed and valid.')
+    addIOArguments(parser, with_uncompressed=False)
     args = parser.parse_args()
 
     # Logger
@@ -494,7 +496,7 @@ if __name__ == "__main__":
     # Filter reads in panel
     log_data = None
     tmp_aln = args.output_aln + "_tmp.bam"
-    with pysam.AlignmentFile(args.input_aln, "rb") as FH_in:
+    with openAlignmentReader(args.input_aln, args.io_threads) as FH_in:
         RG_id_by_source = dict()
         # Replace RG in header
         new_header = FH_in.header.to_dict()
@@ -506,15 +508,18 @@ if __name__ == "__main__":
                 RG_id_by_source[curr_area.name] = str(RG_idx)
                 RG_idx += 1
         # Parse reads
-        with pysam.AlignmentFile(tmp_aln, "wb", header=new_header) as FH_out:
+        with openAlignmentWriter(tmp_aln, new_header, args.io_threads, uncompressed=True) as FH_out:  # Temporary file is not compressed because it is immediately sorted
             if args.single_mode:
                 log_data = processSingleReads(FH_in, panel_regions, RG_id_by_source, args)
             else:
                 log_data = processPairedReads(FH_in, panel_regions, RG_id_by_source, args)
 
     # Sort output file
-    pysam.sort("-o", args.output_aln, tmp_aln)
-    pysam.index(args.output_aln)
+    sort_opt = ["-@", str(args.io_threads - 1)]
+    if args.compression_level is not None:
+        sort_opt.extend(["-l", str(args.compression_level)])
+    pysam.sort(*sort_opt, "-o", args.output_aln, tmp_aln)
+    pysam.index("-@", str(args.io_threads - 1), args.output_aln)
     os.remove(tmp_aln)
 
     # Write summary
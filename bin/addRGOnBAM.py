@@ -3,12 +3,12 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.1.0'
+__version__ = '1.2.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
-import pysam
 import argparse
+from alignmentIO import addIOArguments, openAlignmentReader, openWriterFromArgs
 
 
 ########################################################################
@@ -38,10 +38,11 @@ if __name__ == "__main__":
     group_input.add_argument('-a', '--input-aln', required=True, help='The path to the alignments file (format: BAM).')
     group_output = parser.add_argument_group('Outputs')  # Outputs
     group_output.add_argument('-o', '--output-aln', required=True, help='The path to the outputted alignments file (format: BAM).')
+    addIOArguments(parser)
     args = parser.parse_args()
 
     # Process
-    with pysam.AlignmentFile(args.input_aln, "rb") as FH_in:
+    with openAlignmentReader(args.input_aln, args.io_threads) as FH_in:
         # Replace RG in header
         new_header = FH_in.header.to_dict()
         RG = {"ID": args.id}
@@ -71,7 +72,7 @@ if __name__ == "__main__":
             RG["SM"] = args.sm
         new_header["RG"] = [RG]
         # Replace RG in reads
-        with pysam.AlignmentFile(args.output_aln, "wb", header=new_header) as FH_out:
+        with openWriterFromArgs(args.output_aln, new_header, args) as FH_out:
             for curr_read in FH_in.fetch(until_eof=True):
                 curr_read.set_tag("RG", args.id)
                 FH_out.write(curr_read)
@@ -3,13 +3,21 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2019 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.1.0'
+__version__ = '2.1.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
+import os
+import zlib
 import pysam
+import shutil
+import struct
 import argparse
+import tempfile
 from anacore.illumina import getInfFromSeqID
+from alignmentIO import addIOArguments, openAlignmentReader, openAlignmentWriter, openWriterFromArgs
+
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
 
 
 ########################################################################
@@ -17,6 +25,158 @@ from anacore.illumina import getInfFromSeqID
 # FUNCTIONS
 #
 ########################################################################
+class ReadGroupsManager:
+    """Create reads groups on the fly from reads IDs (flowcell_id.lane_id) and previous reads groups. The parsing of reads IDs is memoized by lane prefix (instrument:run:flowcell:lane)."""
+
+    def __init__(self, old_RG_by_rgid, force_spl=None, force_lib=None, barcode=None):
+        """
+        Build and return an instance of ReadGroupsManager.
+
+        :param old_RG_by_rgid: Old reads groups by ID.
+        :type old_RG_by_rgid: dict
+        :param force_spl: Force sample name in new RG. Otherwise the samples names are retrieved from the previous reads groups if they exist.
+        :type force_spl: str
+        :param force_lib: Force library name in new RG. Otherwise the libraries names are retrieved from the previous reads groups if they exist.
+        :type force_lib: str
+        :param barcode: barcode added in new platform unit.
+        :type barcode: str
+        :return: The new instance.
+        :rtype: ReadGroupsManager
+        """
+        self.old_RG_by_rgid = old_RG_by_rgid
+        self.force_spl = force_spl
+        self.force_lib = force_lib
+        self.barcode = barcode
+        self.RG_by_uid = {}
+        self._id_by_key = {}  # Memoization: new RG ID by (old RG ID, lane prefix)
+
+    def getID(self, read):
+        """
+        Return the new RG ID for the read. The reads group is created if it does not exist.
+
+        :param read: The read.
+        :type read: pysam.AlignedSegment
+        :return: The new RG ID.
+        :rtype: str
+        """
+        old_rg_id = read.get_tag("RG") if read.has_tag("RG") else None
+        key = (old_rg_id, tuple(read.query_name.split(":", 4)[:4]))  # Old RG ID and instrument:run:flowcell:lane
+        if key not in self._id_by_key:
+            self._id_by_key[key] = self._getOrCreate(read.query_name, old_rg_id)
+        return self._id_by_key[key]
+
+    def _getOrCreate(self, read_id, old_rg_id):
+        """
+        Return the new RG ID corresponding to the read ID and the old RG ID. The reads group is created if it does not exist.
+
+        :param read_id: The read ID.
+        :type read_id: str
+        :param old_rg_id: The previous RG ID of the read.
+        :type old_rg_id: str
+        :return: The new RG ID.
+        :rtype: str
+        """
+        old_rg = {} if old_rg_id is None else self.old_RG_by_rgid[old_rg_id]
+        id = getGatkRgId(read_id)
+        pu = id if self.barcode is None else "{}.{}".format(id, self.barcode)
+        uid = pu if "ID" not in old_rg else "{}.{}".format(old_rg["ID"], pu)
+        if uid not in self.RG_by_uid:
+            self.RG_by_uid[uid] = {
+                "ID": str(len(self.RG_by_uid) + 1),
+                "PL": "ILLUMINA",
+                "PU": pu
+            }
+            # SM
+            if self.force_spl is not None:
+                self.RG_by_uid[uid]["SM"] = self.force_spl
+            elif "SM" in old_rg:
+                self.RG_by_uid[uid]["SM"] = old_rg["SM"]
+            # LB
+            if self.force_lib is not None:
+                self.RG_by_uid[uid]["LB"] = self.force_lib
+            elif "LB" in old_rg:
+                self.RG_by_uid[uid]["LB"] = old_rg["LB"]
+        return self.RG_by_uid[uid]["ID"]
+
+
+def getBAMBodyOffset(in_aln):
+    """
+    Return the offset of the first BGZF block after the header in the BAM file. The header must be stored in its own blocks (this is the case in files written by htslib).
+
+    :param in_aln: Path to the alignment file (format: BAM).
+    :type in_aln: str
+    :return: The offset of the first BGZF block containing records or None if the last block of the header contains also records.
+    :rtype: int
+    """
+    data = b""
+    offset = 0
+    header_len = None
+    with open(in_aln, "rb") as handle:
+        while header_len is None or len(data) < header_len:
+            block_header = handle.read(18)
+            if len(block_header) < 18:  # End of file
+                return None
+            block_size = struct.unpack("<H", block_header[16:18])[0] + 1
+            block_data = handle.read(block_size - 18)
+            data += zlib.decompress(block_data[:-8], -15)  # Remove CRC32 and ISIZE
+            offset += block_size
+            if header_len is None:
+                header_len = getBAMHeaderLength(data)
+    return offset if len(data) == header_len else None
+
+
+def getBAMHeaderLength(data):
+    """
+    Return the length of the header (magic, text and references) in uncompressed BAM content.
+
+    :param data: Start of the uncompressed BAM content.
+    :type data: bytes
+    :return: The length of the header or None if data is too short to determine it.
+    :rtype: int
+    """
+    if len(data) < 12:
+        return None
+    l_text = struct.unpack("<i", data[4:8])[0]
+    pos = 8 + l_text
+    if len(data) < pos + 4:
+        return None
+    n_ref = struct.unpack("<i", data[pos:pos + 4])[0]
+    pos += 4
+    for ref_idx in range(n_ref):
+        if len(data) < pos + 4:
+            return None
+        l_name = struct.unpack("<i", data[pos:pos + 4])[0]
+        pos += 4 + l_name + 4  # l_name, name and l_ref
+    return pos
+
+
+def writeWithNewHeader(in_aln, body_offset, out_aln, new_header):
+    """
+    Write the records of the alignment file with a new header. BGZF blocks of records are copied without decompression.
+
+    :param in_aln: Path to the alignment file (format: BAM).
+    :type in_aln: str
+    :param body_offset: Offset of the first BGZF block containing records (see getBAMBodyOffset).
+    :type body_offset: int
+    :param out_aln: Path to the outputted alignment file (format: BAM).
+    :type out_aln: str
+    :param new_header: The new header.
+    :type new_header: dict
+    """
+    with pysam.AlignmentFile(out_aln, "wb", header=new_header):
+        pass
+    with open(out_aln, "rb+") as handle:  # Remove EOF marker
+        handle.seek(-len(BGZF_EOF), os.SEEK_END)
+        if handle.read() != BGZF_EOF:
+            raise IOError("The file {} does not end with BGZF EOF marker.".format(out_aln))
+        handle.seek(-len(BGZF_EOF), os.SEEK_END)
+        handle.truncate()
+    with open(out_aln, "ab") as handle_out:
+        with open(in_aln, "rb") as handle_in:
+            handle_in.seek(body_offset)
+            shutil.copyfileobj(handle_in, handle_out)
+
+
 def getGatkRgId(read_id):
     """
     Return the read group ID of the read. GATK RG ID format: flowcell_id.lane_id.
@@ -30,56 +190,6 @@ def getGatkRgId(read_id):
     return "{}.{}".format(read_info["flowcell_id"], read_info["lane_id"])
 
 
-def getRGInfo(input_aln, force_spl=None, force_lib=None, barcode=None):
-    """
-    Return new RG info by uid ([old_rg_id.]flowcell_id.lane_id[.barcode]) and old read RG info by old RG_ID.
-
-    :param input_aln: Path to the previous alignment file (format: BAM).
-    :type input_aln: str
-    :param force_spl: Force sample name in new RG. Otherwise the samples names are retrieved from the previous reads groups if they exist.
-    :type force_spl: str
-    :param force_lib: Force library name in new RG. Otherwise the libraries names are retrieved from the previous reads groups if they exist.
-    :type force_lib: str
-    :param barcode: barcode added in new platform unit.
-    :type barcode: str
-    :return: new RG info by uid ([old_rg_id.]flowcell_id.lane_id[.barcode]) and old read RG info by old RG_ID.
-    :rtype: (dict, dict)
-    """
-    RG_by_uid = {}
-    old_RG_by_rgid = {}
-    next_id = 1
-    with pysam.AlignmentFile(input_aln, "rb") as FH_in:
-        # Header
-        header = FH_in.header
-        if "RG" in header:
-            for group in header["RG"]:
-                old_RG_by_rgid[group["ID"]] = group
-        # Records
-        for curr_read in FH_in.fetch(until_eof=True):
-            old_rg = {} if not curr_read.has_tag("RG") else old_RG_by_rgid[curr_read.get_tag("RG")]
-            id = getGatkRgId(curr_read.query_name)
-            pu = id if barcode is None else "{}.{}".format(id, barcode)
-            uid = pu if "ID" not in old_rg else "{}.{}".format(old_rg["ID"], pu)
-            if uid not in RG_by_uid:
-                RG_by_uid[uid] = {
-                    "ID": str(next_id),
-                    "PL": "ILLUMINA",
-                    "PU": pu
-                }
-                next_id += 1
-                # SM
-                if force_spl is not None:
-                    RG_by_uid[uid]["SM"] = force_spl
-                elif "SM" in old_rg:
-                    RG_by_uid[uid]["SM"] = old_rg["SM"]
-                # LB
-                if force_lib is not None:
-                    RG_by_uid[uid]["LB"] = force_lib
-                elif "LB" in old_rg:
-                    RG_by_uid[uid]["LB"] = old_rg["LB"]
-    return RG_by_uid, old_RG_by_rgid
-
-
 ########################################################################
 #
 # MAIN
@@ -88,6 +198,7 @@ def getRGInfo(input_aln, force_spl=None, force_lib=None, barcode=None):
 if __name__ == "__main__":
     # Manage parameters
     parser = argparse.ArgumentParser(description='Add RG on reads. ID, PL and PU are determined from reads and optional option barcode ; LB, SM can be retrieved from previous BAM or forced.')
+    parser.add_argument('-f', '--tmp-folder', help='Path to the folder used for the temporary alignments file. [Default: folder of the output or the system temporary folder if the output is "-"]')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_RG = parser.add_argument_group('Reads groups')  # Reads groups
     group_RG.add_argument('-l', '--library-name', help='Force library name. Otherwise the libraries names are retrieved from the previous reads groups if they exist.')
@@ -97,22 +208,38 @@ if __name__ == "__main__":
     group_input.add_argument('-a', '--input-aln', required=True, help='The path to the alignments file (format: BAM).')
     group_output = parser.add_argument_group('Outputs')  # Outputs
     group_output.add_argument('-o', '--output-aln', required=True, help='The path to the outputted alignments file (format: BAM).')
+    addIOArguments(parser)
     args = parser.parse_args()
 
-    # Get the reads groups
-    RG_by_uid, old_RG_by_rgid = getRGInfo(args.input_aln, args.sample_name, args.library_name, args.barcode)
-
-    # Change read groups
-    with pysam.AlignmentFile(args.input_aln, "rb") as FH_in:
-        # Replace RG in header
-        new_header = FH_in.header.to_dict()
-        new_header["RG"] = list(RG_by_uid.values())
-        # Replace RG in reads
-        with pysam.AlignmentFile(args.output_aln, "wb", header=new_header) as FH_out:
-            for curr_read in FH_in.fetch(until_eof=True):
-                old_rg = {} if not curr_read.has_tag("RG") else old_RG_by_rgid[curr_read.get_tag("RG")]
-                id = getGatkRgId(curr_read.query_name)
-                pu = id if args.barcode is None else "{}.{}".format(id, args.barcode)
-                uid = pu if "ID" not in old_rg else "{}.{}".format(old_rg["ID"], pu)
-                curr_read.set_tag("RG", RG_by_uid[uid]["ID"])
-                FH_out.write(curr_read)
+    # Add reads groups in one pass: records are written with their new RG in a temporary file while reads groups are discovered
+    if args.tmp_folder is None:
+        args.tmp_folder = tempfile.gettempdir() if args.output_aln == "-" else os.path.dirname(os.path.abspath(args.output_aln))
+    fd, tmp_aln = tempfile.mkstemp(dir=args.tmp_folder, prefix="addRGOnBAMAutoIllu_", suffix=".bam")
+    os.close(fd)
+    try:
+        with openAlignmentReader(args.input_aln, args.io_threads) as FH_in:
+            in_header = FH_in.header.to_dict()
+            old_RG_by_rgid = {group["ID"]: group for group in in_header.get("RG", [])}
+            rg_manager = ReadGroupsManager(old_RG_by_rgid, args.sample_name, args.library_name, args.barcode)
+            tmp_header = {key: value for key, value in in_header.items() if key != "RG"}
+            with openAlignmentWriter(tmp_aln, tmp_header, args.io_threads, args.compression_level) as FH_tmp:
+                for curr_read in FH_in.fetch(until_eof=True):
+                    curr_read.set_tag("RG", rg_manager.getID(curr_read))
+                    FH_tmp.write(curr_read)
+
+        # Write reads with the final header
+        new_header = in_header
+        new_header["RG"] = list(rg_manager.RG_by_uid.values())
+        body_offset = None
+        if args.output_aln != "-" and not args.uncompressed_output:
+            body_offset = getBAMBodyOffset(tmp_aln)
+        if body_offset is not None:  # Records blocks are copied without recompression
+            writeWithNewHeader(tmp_aln, body_offset, args.output_aln, new_header)
+        else:
+            with openAlignmentReader(tmp_aln, args.io_threads) as FH_tmp:
+                with openWriterFromArgs(args.output_aln, new_header, args) as FH_out:
+                    for curr_read in FH_tmp.fetch(until_eof=True):
+                        FH_out.write(curr_read)
+    finally:
+        if os.path.exists(tmp_aln):
+            os.remove(tmp_aln)
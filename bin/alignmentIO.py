@@ -0,0 +1,132 @@
+#
+# Copyright (C) 2021 IUCT-O
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Functions to open alignments files with multithreaded BGZF compression shared by scripts."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import pysam
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def addIOArguments(parser, with_output=True, with_uncompressed=True):
+    """
+    Add arguments to control alignments files compression and decompression: --io-threads, --compression-level and --uncompressed-output.
+
+    :param parser: The parser of the script.
+    :type parser: argparse.ArgumentParser
+    :param with_output: If False only arguments used for reading are added.
+    :type with_output: bool
+    :param with_uncompressed: If False the argument --uncompressed-output is not added (for example when the output must be indexed).
+    :type with_uncompressed: bool
+    :return: The group of arguments.
+    :rtype: argparse._ArgumentGroup
+    """
+    group_io = parser.add_argument_group('Alignments I/O')  # Alignments I/O
+    group_io.add_argument('--io-threads', type=int, default=1, help='Number of threads used to compress and decompress each alignments file. [Default: %(default)s]')
+    if with_output:
+        group_io.add_argument('--compression-level', type=int, choices=range(0, 10), help='BGZF compression level for the outputted alignments files: 0 for no compression and 9 for the best compression. [Default: htslib default]')
+        if with_uncompressed:
+            group_io.add_argument('--uncompressed-output', action='store_true', help='Write outputted alignments files in uncompressed BAM. It speeds-up piping between tools (with "-" as output path to write on stdout).')
+    return group_io
+
+
+def getWriteMode(uncompressed=False):
+    """
+    Return pysam mode used to write BAM.
+
+    :param uncompressed: If True the BAM is written without BGZF compression.
+    :type uncompressed: bool
+    :return: The pysam mode.
+    :rtype: str
+    """
+    return "wbu" if uncompressed else "wb"
+
+
+def openAlignmentReader(filepath, threads=1, **kwargs):
+    """
+    Return reader on alignments file with multithreaded BGZF decompression.
+
+    :param filepath: Path to the alignments file (format: BAM). Use "-" to read stdin.
+    :type filepath: str
+    :param threads: Number of threads used in decompression.
+    :type threads: int
+    :param kwargs: Other parameters for pysam.AlignmentFile (example: check_sq).
+    :type kwargs: dict
+    :return: The reader.
+    :rtype: pysam.AlignmentFile
+    """
+    return pysam.AlignmentFile(filepath, "rb", threads=threads, **kwargs)
+
+
+def openAlignmentWriter(filepath, header, threads=1, compression_level=None, uncompressed=False):
+    """
+    Return writer on alignments file with multithreaded BGZF compression.
+
+    :param filepath: Path to the alignments file (format: BAM). Use "-" to write on stdout.
+    :type filepath: str
+    :param header: The header.
+    :type header: dict or pysam.AlignmentHeader
+    :param threads: Number of threads used in compression.
+    :type threads: int
+    :param compression_level: BGZF compression level (0-9). Default: htslib default.
+    :type compression_level: int
+    :param uncompressed: If True the BAM is written without BGZF compression. This is useful to pipe the output in another tool.
+    :type uncompressed: bool
+    :return: The writer.
+    :rtype: pysam.AlignmentFile
+    """
+    format_options = None
+    if compression_level is not None and not uncompressed:
+        format_options = ["level={}".format(compression_level)]
+    return pysam.AlignmentFile(
+        filepath,
+        getWriteMode(uncompressed),
+        header=header,
+        threads=threads,
+        format_options=format_options
+    )
+
+
+def openWriterFromArgs(filepath, header, args):
+    """
+    Return writer on alignments file parametrized with arguments added by addIOArguments.
+
+    :param filepath: Path to the alignments file (format: BAM). Use "-" to write on stdout.
+    :type filepath: str
+    :param header: The header.
+    :type header: dict or pysam.AlignmentHeader
+    :param args: The parsed arguments of the script.
+    :type args: argparse.Namespace
+    :return: The writer.
+    :rtype: pysam.AlignmentFile
+    """
+    return openAlignmentWriter(
+        filepath,
+        header,
+        args.io_threads,
+        args.compression_level,
+        getattr(args, "uncompressed_output", False)
+    )
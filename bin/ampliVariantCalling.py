@@ -3,20 +3,25 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.4.1'
+__version__ = '1.7.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
 import os
 import sys
 import time
+import signal
 import argparse
+import threading
 import subprocess
 from subprocess import Popen, PIPE
+from concurrent.futures import ThreadPoolExecutor
 
 BIN_DIR = os.path.dirname(__file__)
 os.environ['PATH'] = os.environ['PATH'] + os.pathsep + BIN_DIR
 
+from nonOverlappingDesign import getNonOverlappingThread, getSelectedArea, writeDesign
+
 
 ########################################################################
 #
@@ -103,28 +108,99 @@ class Cmd:
 
     def submit(self, log_file=None):
         """
-        Launch command, trace this action in log and parse results.
+        Launch command, trace this action in log and parse results. The trace is written in one block at the end of the command with wall time and peak RSS to keep log readable when several commands are submitted concurrently.
 
         :param log_file: Path to the sample process log file.
         :type log_file: str
         """
+        # Process
+        start_time = time.time()
+        process = Popen(self.get_cmd(), shell=True, stdout=subprocess.DEVNULL)
+        returncode, rusage = waitProcess(process)
         # Log
         if log_file is not None:
-            FH_log = Logger(log_file)
-            FH_log.write('# ' + self.description + '\n')
-            FH_log.write('\tSoftware:\n\t\t' + os.path.basename(self.program) + ' version: ' + self.get_version() + '\n')
-            FH_log.write('\tCommand:\n\t\t' + self.get_cmd() + '\n')
-            FH_log.write('\tExecution:\n\t\tstart: ' + time.strftime("%d %b %Y %H:%M:%S", time.localtime()) + '\n')
-            FH_log.close()
+            Logger.static_write(
+                log_file,
+                '# ' + self.description + '\n' +
+                '\tSoftware:\n\t\t' + os.path.basename(self.program) + ' version: ' + self.get_version() + '\n' +
+                '\tCommand:\n\t\t' + self.get_cmd() + '\n' +
+                getExecutionTrace(start_time, time.time(), rusage.ru_maxrss)
+            )
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.get_cmd())
+        # Post-process results
+        if log_file is not None:
+            self.parser(log_file)
+
+
+class CmdPipeline:
+    """
+    Chain of commands where the standard output of each command is connected to the standard input of the next one by an OS pipe. Intermediate results are streamed without temporary files and a command is blocked when the next one does not consume its output (backpressure).
+
+    :Example:
+        CmdPipeline([StepA(in_file, None), StepB(None, out_file)], "Steps A and B.").submit(log_file)
+    """
+
+    def __init__(self, cmds, description):
+        """
+        :param cmds: The chained commands. Each command must read standard input (except the first) and write on standard output (except the last).
+        :type cmds: list
+        :param description: The description of the chain.
+        :type description: str
+        """
+        self.cmds = cmds
+        self.description = description
+
+    def get_cmd(self):
+        """
+        Return the command line.
+
+        :return: The command line.
+        :rtype: str
+        """
+        return " | ".join([curr_cmd.get_cmd() for curr_cmd in self.cmds])
+
+    def submit(self, log_file=None):
+        """
+        Launch commands, trace this action in log and parse results. The return code of each command is checked: the error raised is the one of the first failed command not killed by SIGPIPE.
+
+        :param log_file: Path to the sample process log file.
+        :type log_file: str
+        """
         # Process
-        subprocess.check_output(self.get_cmd(), shell=True)
+        start_time = time.time()
+        processes = list()
+        prev_stdout = None
+        for cmd_idx, curr_cmd in enumerate(self.cmds):
+            is_last = cmd_idx == len(self.cmds) - 1
+            processes.append(
+                Popen(curr_cmd.get_cmd(), shell=True, stdin=prev_stdout, stdout=(subprocess.DEVNULL if is_last else PIPE))
+            )
+            if prev_stdout is not None:
+                prev_stdout.close()  # Only the reader keeps the pipe open: the writer receives SIGPIPE if the reader fails
+            prev_stdout = processes[-1].stdout
+        steps = list()
+        for curr_cmd, curr_process in zip(self.cmds, processes):
+            returncode, rusage = waitProcess(curr_process)
+            steps.append({"cmd": curr_cmd, "returncode": returncode, "end": time.time(), "max_rss": rusage.ru_maxrss})
         # Log
         if log_file is not None:
-            FH_log = Logger(log_file)
-            FH_log.write('\t\tend:   ' + time.strftime("%d %b %Y %H:%M:%S", time.localtime()) + '\n')
-            FH_log.close()
-            # Post-process results
-            self.parser(log_file)
+            Logger.static_write(
+                log_file,
+                '# ' + self.description + '\n' +
+                '\tSoftware:\n' + "".join(['\t\t' + os.path.basename(curr_cmd.program) + ' version: ' + curr_cmd.get_version() + '\n' for curr_cmd in self.cmds]) +
+                '\tCommand:\n\t\t' + self.get_cmd() + '\n' +
+                getExecutionTrace(start_time, time.time(), max(curr_step["max_rss"] for curr_step in steps)) +
+                '\tSteps:\n' + "".join(['\t\t{}: return code {}, wall time {:.1f}s, peak RSS {:.1f} MB\n'.format(os.path.basename(curr_step["cmd"].program), curr_step["returncode"], curr_step["end"] - start_time, curr_step["max_rss"] / 1024) for curr_step in steps])
+            )
+        failed_steps = [curr_step for curr_step in steps if curr_step["returncode"] != 0]
+        if len(failed_steps) != 0:  # A writer killed by SIGPIPE (directly or through its shell) is the consequence of the failure of one of its readers
+            first_error = next((curr_step for curr_step in failed_steps if curr_step["returncode"] not in {-signal.SIGPIPE, 128 + signal.SIGPIPE}), failed_steps[0])
+            raise subprocess.CalledProcessError(first_error["returncode"], first_error["cmd"].get_cmd())
+        # Post-process results
+        if log_file is not None:
+            for curr_cmd in self.cmds:
+                curr_cmd.parser(log_file)
 
 
 class Logger:
@@ -134,6 +210,8 @@ class Logger:
     :copyright: FROGS's team INRA.
     """
 
+    lock = threading.Lock()  # Serialize writes from concurrent commands
+
     def __init__(self, filepath=None):
         """
         :param filepath: The log filepath. [default : STDOUT]
@@ -176,12 +254,13 @@ class Logger:
         :param msg: The message to write.
         :type msg: str
         """
-        if filepath is not None and filepath is not sys.stdout:
-            FH_log = open(filepath, "a")
-            FH_log.write(msg)
-            FH_log.close()
-        else:
-            sys.stdout.write(msg)
+        with Logger.lock:
+            if filepath is not None and filepath is not sys.stdout:
+                FH_log = open(filepath, "a")
+                FH_log.write(msg)
+                FH_log.close()
+            else:
+                sys.stdout.write(msg)
 
 
 class TmpFiles:
@@ -287,7 +366,7 @@ class SamtoolsIndex(Cmd):
 class SplitBAMByRG(Cmd):
     """Split BAM by groups of non-overlapping amplicons."""
 
-    def __init__(self, in_design, in_aln, out_pattern):
+    def __init__(self, in_design, in_aln, out_pattern, RG_update=None, merge_RG=False):
         """
         :param in_design: Path to the amplicons description file (format: BED).
         :type in_design: str
@@ -295,8 +374,14 @@ class SplitBAMByRG(Cmd):
         :type in_aln: str
         :param out_pattern: The path pattern for the outputted alignments files (format: BAM). In this path the keyword "{GP}" is replace by the group name for each group.
         :type out_pattern: str
+        :param RG_update: By tag the value set in all the RG of the outputted alignments files (example: {"SM": "splA"}).
+        :type RG_update: dict
+        :param merge_RG: If True all the RG of each outputted alignments file are replaced by only one RG with ID "1" and the values of RG_update.
+        :type merge_RG: bool
         """
         cmd_param = "" + \
+            (" --merge-RG" if merge_RG else "") + \
+            ("" if not RG_update else " --update-RG " + " ".join(["'{}:{}'".format(tag, value) for tag, value in RG_update.items()])) + \
             " --input-design " + in_design + \
             " --input-aln " + in_aln + \
             " --output-pattern " + out_pattern
@@ -308,36 +393,6 @@ class SplitBAMByRG(Cmd):
                      "--version")
 
 
-class AddRGOnBAM(Cmd):
-    """Add tag on reads by origin (amplicon ID)."""
-
-    def __init__(self, in_aln, out_aln, platform, sample, library):
-        """
-        :param in_aln: Path to the alignments file (format: BAM).
-        :type in_aln: str
-        :param out_aln: Path to the outputted alignments file (format: BAM).
-        :type out_aln: str
-        :param platform: Platform/technology used to produce the reads.
-        :type platform: str
-        :param sample: Sample. Use pool name where a pool is being sequenced.
-        :type sample: str
-        :param library: Library.
-        :type library: str
-        """
-        cmd_param = "" + \
-            " --pl " + platform + \
-            " --sm " + sample + \
-            " --lb " + library + \
-            " --input-aln " + in_aln + \
-            " --output-aln " + out_aln
-
-        Cmd.__init__(self,
-                     "addRGOnBAM.py",
-                     "Adds tag on reads by origin (amplicon ID).",
-                     cmd_param,
-                     "--version")
-
-
 class VarDictStep1(Cmd):
     """Dicover variants."""
 
@@ -349,7 +404,7 @@ class VarDictStep1(Cmd):
         :type in_regions: str
         :param in_aln: Path to the alignments file (format: BAM).
         :type in_aln: str
-        :param out_file: Path to the outputted file.
+        :param out_file: Path to the outputted file. With None the result is written on standard output.
         :type out_file: str
         :param min_alt_freq: The threshold for allele frequency.
         :type min_alt_freq: float
@@ -370,7 +425,7 @@ class VarDictStep1(Cmd):
             " -b " + in_aln + \
             " -G " + in_reference + \
             " " + in_regions + \
-            " > " + out_file
+            ("" if out_file is None else " > " + out_file)
 
         Cmd.__init__(self,
                      vardict_call,
@@ -381,17 +436,17 @@ class VarDictStep1(Cmd):
 class VarDictStep2(Cmd):
     """Filter variant on strand bias."""
 
-    def __init__(self, in_file, out_file):
+    def __init__(self, in_file=None, out_file=None):
         """
-        :param in_file: Path to the input file.
+        :param in_file: Path to the input file. With None the input is read on standard input.
         :type in_file: str
-        :param out_file: Path to the outputted file.
+        :param out_file: Path to the outputted file. With None the result is written on standard output.
         :type out_file: str
         """
         cmd_param = "" + \
-            " cat " + in_file + " | " + \
+            ("" if in_file is None else " cat " + in_file + " | ") + \
             " ##PROGRAM##" + \
-            " > " + out_file
+            ("" if out_file is None else " > " + out_file)
 
         Cmd.__init__(self,
                      "teststrandbias.R",
@@ -404,7 +459,7 @@ class VarDictStep3(Cmd):
 
     def __init__(self, in_file, out_variants, min_alt_freq=0.02):
         """
-        :param in_file: Path to the input file.
+        :param in_file: Path to the input file. With None the input is read on standard input.
         :type in_file: str
         :param out_variants: Path to the outputted file (format: VCF).
         :type out_variants: str
@@ -412,7 +467,7 @@ class VarDictStep3(Cmd):
         :type min_alt_freq: float
         """
         cmd_param = "" + \
-            " cat " + in_file + " | " + \
+            ("" if in_file is None else " cat " + in_file + " | ") + \
             " ##PROGRAM##" + \
             " -A" + \
             " -a" + \
@@ -527,41 +582,95 @@ class fixVardictHeader(Cmd):
                      "--version")
 
 
-def filterBED(in_bed, in_names, out_bed, nb_col=None):
+def getExecutionTrace(start_time, end_time, max_rss):
+    """
+    Return the execution part of a command trace.
+
+    :param start_time: Start of the command (seconds since the epoch).
+    :type start_time: float
+    :param end_time: End of the command (seconds since the epoch).
+    :type end_time: float
+    :param max_rss: Peak resident set size in kilobytes.
+    :type max_rss: int
+    :return: The execution trace.
+    :rtype: str
+    """
+    return '\tExecution:\n' + \
+        '\t\tstart: ' + time.strftime("%d %b %Y %H:%M:%S", time.localtime(start_time)) + '\n' + \
+        '\t\tend:   ' + time.strftime("%d %b %Y %H:%M:%S", time.localtime(end_time)) + '\n' + \
+        '\t\twall time: {:.1f}s\n'.format(end_time - start_time) + \
+        '\t\tpeak RSS: {:.1f} MB\n'.format(max_rss / 1024)
+
+
+def getAmpliconsByGroup(in_design):
+    """
+    Return by group name the IDs of its amplicons.
+
+    :param in_design: Path to the list of amplicons (format: TSV). The first column is the ID of the amplicon and the second is the name of the group.
+    :type in_design: str
+    :return: By group name the list of amplicons IDs.
+    :rtype: dict
+    """
+    amplicons_by_group = dict()
+    with open(in_design) as FH_gp:
+        for line in FH_gp:
+            if not line.startswith("#"):
+                amplicon_id, group_name = [elt.strip() for elt in line.split("\t")]
+                amplicons_by_group.setdefault(group_name, list()).append(amplicon_id)
+    return amplicons_by_group
+
+
+def splitBEDByGroup(in_bed, amplicons_by_group, outputs):
     """
-    Filter a BED file with the list of names of regions to keep.
+    Write BED files by group with the regions of this group. The initial file is read only once for all the outputs.
 
     :param in_bed: Path to the initial file (format: BED).
     :type in_bed: str
-    :param in_names: Path to the file containing the list of names of the retained regions.
-    :type in_names: str
-    :param out_bed: Path to the filtered file (format: BED).
-    :type out_bed: str
-    :param nb_col: Number of columns in output.
-    :type nb_col: int
+    :param amplicons_by_group: By group name the list of names of retained regions.
+    :type amplicons_by_group: dict
+    :param outputs: The outputs written from the initial file. Each output is a tuple (out_bed_by_group, nb_col) where out_bed_by_group is by group name the path to the filtered file (format: BED) and nb_col is the number of columns kept in this file (None for all).
+    :type outputs: list
     """
-    # Retrieve retained regions names
-    retained_regions = dict()
-    with open(in_names) as FH_names:
-        for line in FH_names:
-            retained_regions[line.strip()] = 1
-    # Filter BED
-    with open(in_bed) as FH_in:
-        with open(out_bed, "w") as FH_out:
+    group_by_region = {region: group for group, regions in amplicons_by_group.items() for region in regions}
+    handles_by_group = dict()
+    try:
+        for out_bed_by_group, nb_col in outputs:
+            for group, path in out_bed_by_group.items():
+                handles_by_group.setdefault(group, list()).append((open(path, "w"), nb_col))
+        with open(in_bed) as FH_in:
             for line in FH_in:
                 if line.startswith("browser ") or line.startswith("track ") or line.startswith("#"):
-                    FH_out.write(line)
+                    for handles in handles_by_group.values():
+                        for FH_out, nb_col in handles:
+                            FH_out.write(line)
                 else:
                     fields = [field.strip() for field in line.split("\t")]
-                    if fields[3] in retained_regions:
-                        if nb_col is not None:
-                            line = "\t".join(fields[:nb_col]) + "\n"
-                        FH_out.write(line)
+                    if fields[3] in group_by_region:
+                        for FH_out, nb_col in handles_by_group.get(group_by_region[fields[3]], []):
+                            FH_out.write(line if nb_col is None else "\t".join(fields[:nb_col]) + "\n")
+    finally:
+        for handles in handles_by_group.values():
+            for FH_out, nb_col in handles:
+                FH_out.close()
 
 
-def VarDictFct(in_reference, in_regions, in_aln, out_variants, logger, tmp_file, min_alt_freq=0.02, min_alt_count=4, min_base_qual=25, vardict_call="vardict-java"):
+def waitProcess(process):
     """
-    Dicover amplicons variants with VarDict.
+    Wait the end of the process and return its return code and the resources used by the process and its children.
+
+    :param process: The process.
+    :type process: subprocess.Popen
+    :return: The return code and the resources usage.
+    :rtype: (int, resource.struct_rusage)
+    """
+    pid, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    return process.returncode, rusage
+
+
+def VarDictFct(in_reference, in_regions, in_aln, out_variants, logger, min_alt_freq=0.02, min_alt_count=4, min_base_qual=25, vardict_call="vardict-java"):
+    """
+    Dicover amplicons variants with VarDict. The three steps are streamed through pipes without intermediate files.
 
     :param in_reference: Path to the reference sequences file (format: fasta).
     :type in_reference: str
@@ -573,8 +682,6 @@ def VarDictFct(in_reference, in_regions, in_aln, out_variants, logger, tmp_file,
     :type out_variants: str
     :param logger: Logger used to trace sub-commands.
     :type logger: Logger
-    :param tmp_file: Temporaries files manager.
-    :type tmp_file: TmpFiles
     :param min_alt_freq: The threshold for allele frequency.
     :type min_alt_freq: float
     :param min_base_qual: The phred score for a base to be considered a good call.
@@ -582,11 +689,61 @@ def VarDictFct(in_reference, in_regions, in_aln, out_variants, logger, tmp_file,
     :param vardict_call: Command used to call vardict.
     :type vardict_call: str
     """
-    out_vardict = tmp.add("vardict.txt")
-    out_strand_bias = tmp.add("strdBias.txt")
-    VarDictStep1(in_reference, in_regions, in_aln, out_vardict, min_alt_freq, min_alt_count, min_base_qual, vardict_call).submit(logger)
-    VarDictStep2(out_vardict, out_strand_bias).submit(logger)
-    VarDictStep3(out_strand_bias, out_variants, min_alt_freq).submit(logger)
+    CmdPipeline(
+        [
+            VarDictStep1(in_reference, in_regions, in_aln, None, min_alt_freq, min_alt_count, min_base_qual, vardict_call),
+            VarDictStep2(),
+            VarDictStep3(None, out_variants, min_alt_freq)
+        ],
+        "Discovers variants and filters them on strand bias."
+    ).submit(logger)
+
+
+def processGroup(group_name, group_aln, group_design, args, tmp_file):
+    """
+    Call and filter variants on the alignments of one group of non-overlapping amplicons.
+
+    :param group_name: The group name.
+    :type group_name: str
+    :param group_aln: Path to the alignments file of the group (format: BAM). It must contain only one RG with sample, library and platform.
+    :type group_aln: str
+    :param group_design: Paths to the design files of the group: "with_prim", "with_prim_4_col" and "wout_prim" (format: BED). See splitBEDByGroup.
+    :type group_design: dict
+    :param args: The parsed arguments of the script.
+    :type args: argparse.Namespace
+    :param tmp_file: Temporaries files manager.
+    :type tmp_file: TmpFiles
+    :return: The group files: name, aln, vcf, design_wout_prim and design_with_prim.
+    :rtype: dict
+    """
+    # Index BAM
+    tmp_file.files.append(group_aln + ".bai")
+    SamtoolsIndex(group_aln).submit(args.output_log)
+
+    # Call variants
+    group_vcf = tmp_file.add(group_name + ".vcf")
+    VarDictFct(
+        args.input_genome,
+        group_design["with_prim_4_col"],
+        group_aln, group_vcf,
+        args.output_log,
+        args.min_alt_freq,
+        args.min_alt_count,
+        args.min_base_qual,
+        args.vardict_call
+    )
+
+    # Filters variants located on primers
+    group_clean_vcf = tmp_file.add(group_name + "_clean.vcf")
+    FilterVCFPrimers(args.input_genome, group_design["with_prim"], group_vcf, group_clean_vcf).submit(args.output_log)
+
+    return {
+        "name": group_name,
+        "aln": group_aln,
+        "vcf": group_clean_vcf,
+        "design_wout_prim": group_design["wout_prim"],
+        "design_with_prim": group_design["with_prim"]
+    }
 
 
 ########################################################################
@@ -598,6 +755,7 @@ if __name__ == "__main__":
     # Manage parameters
     parser = argparse.ArgumentParser(description='Varaint calling on Illumina amplicon sequencing. It use VarDictJava (see: https://github.com/AstraZeneca-NGS/VarDictJava).')
     parser.add_argument('-m', '--min-alt-freq', default=0.02, type=float, help='Variants with an allele frequency under this value are not emitted. [Default: %(default)s]')
+    parser.add_argument('-j', '--nb-jobs', default=1, type=int, help='Number of groups of non-overlapping amplicons processed in parallel. [Default: %(default)s]')
     parser.add_argument('-c', '--min-alt-count', default=4, type=int, help='Variants with an allele count under this value are not emitted. [Default: %(default)s]')
     parser.add_argument('-q', '--min-base-qual', default=25, type=int, help='The phred score for a base to be considered a good call. [Default: %(default)s]')
     parser.add_argument('-t', '--vardict-call', default="vardict-java", help='Command used to call vardict. [Default: %(default)s]')
@@ -607,7 +765,9 @@ if __name__ == "__main__":
     group_panel = parser.add_argument_group('Design')  # Design
     group_panel.add_argument('-pi', '--input-design-with-primers', required=True, help='The path to the amplicons design with their primers (format: BED).')
     group_panel.add_argument('-po', '--input-design-wout-primers', required=True, help='The path to the amplicons design without their primers (format: BED).')
-    group_panel.add_argument('-pg', '--input-non-overlapping-design', required=True, help='The path to the list of amplicons (format: TSV). The first column is the ID of the amplicon and the second is the name of the group where the amplicon has no overlap with other amplicons of this group.')
+    group_panel.add_argument('-pg', '--input-non-overlapping-design', help='The path to the list of amplicons (format: TSV). The first column is the ID of the amplicon and the second is the name of the group where the amplicon has no overlap with other amplicons of this group. By default, groups are computed from the design with primers (see nonOverlappingDesign.py).')
+    group_panel.add_argument('-pb', '--balanced-groups', action='store_true', help='When groups are computed, spread amplicons evenly between groups.')
+    group_panel.add_argument('-pm', '--groups-margin', default=0, type=int, help='When groups are computed, the minimum distance between two amplicons in same group. [Default: %(default)s]')
     group_input = parser.add_argument_group('Inputs')  # Inputs
     group_input.add_argument('-l', '--library-name', help='The library name (example: "patient1_libA").')
     group_input.add_argument('-a', '--input-aln', required=True, help='The path to the alignment file (format: BAM).')
@@ -621,70 +781,48 @@ if __name__ == "__main__":
     library_name = os.path.basename(args.input_aln).split(".")[0] if args.library_name is None else args.library_name
 
     # Get non-overlapping groups
-    groups_names = set()
-    with open(args.input_non_overlapping_design) as FH_gp:
-        for line in FH_gp:
-            if not line.startswith("#"):
-                amplicon_id, group_name = [elt.strip() for elt in line.split("\t")]
-                groups_names.add(group_name)
-    groups_names = list(groups_names)
+    if args.input_non_overlapping_design is None:
+        args.input_non_overlapping_design = tmp.add("nonOverlappingDesign.tsv")
+        non_overlapping_threads = getNonOverlappingThread(
+            getSelectedArea(args.input_design_with_primers, args.groups_margin),
+            args.balanced_groups
+        )
+        writeDesign(non_overlapping_threads, args.input_non_overlapping_design)
+        amplicons_by_group = {"grp" + str(thread_idx): [area["id"] for area in thread] for thread_idx, thread in enumerate(non_overlapping_threads)}
+    else:
+        amplicons_by_group = getAmpliconsByGroup(args.input_non_overlapping_design)
+    groups_names = list(amplicons_by_group)
 
     # Split BAM in non-overlapping regions
     gp_alignment = [tmp.add(gp + ".bam") for gp in groups_names]
     out_bam_pattern = gp_alignment[-1][:-(len(groups_names[-1]) + 4)] + "{GP}.bam"
-    SplitBAMByRG(args.input_non_overlapping_design, args.input_aln, out_bam_pattern).submit(args.output_log)
-
-    # Variant calling
-    groups = list()
-    for idx_gp, curr_gp in enumerate(groups_names):
-        curr_gp_aln = gp_alignment[idx_gp]
-
-        # Index BAM
-        tmp.files.append(curr_gp_aln + ".bai")
-        SamtoolsIndex(curr_gp_aln).submit(args.output_log)
-
-        # Select regions of current group
-        curr_gp_regions = tmp.add(curr_gp + "_amplicons.txt")
-        subprocess.check_output('grep "' + curr_gp + '$" ' + args.input_non_overlapping_design + ' | cut -f 1 > ' + curr_gp_regions, shell=True)
-        curr_gp_regions_with_prim = tmp.add(curr_gp + "_withPrimers.bed")
-        filterBED(args.input_design_with_primers, curr_gp_regions, curr_gp_regions_with_prim)
-        curr_gp_regions_with_prim_4_col = tmp.add(curr_gp + "_withPrimers_4col.bed")
-        filterBED(args.input_design_with_primers, curr_gp_regions, curr_gp_regions_with_prim_4_col, 4)
-        curr_gp_regions_wout_prim = tmp.add(curr_gp + "_woutPrimers.bed")
-        filterBED(args.input_design_wout_primers, curr_gp_regions, curr_gp_regions_wout_prim)
-
-        # Add RG on BAM
-        curr_gp_aln_new_RG = tmp.add(curr_gp + "_RG.bam")
-        AddRGOnBAM(curr_gp_aln, curr_gp_aln_new_RG, "ILLUMINA", library_name, library_name).submit(args.output_log)
-        tmp.files.append(curr_gp_aln_new_RG + ".bai")
-        SamtoolsIndex(curr_gp_aln_new_RG).submit(args.output_log)
-
-        # Call variants
-        curr_gp_vcf = tmp.add(curr_gp + ".vcf")
-        VarDictFct(
-            args.input_genome,
-            curr_gp_regions_with_prim_4_col,
-            curr_gp_aln_new_RG, curr_gp_vcf,
-            args.output_log,
-            tmp,
-            args.min_alt_freq,
-            args.min_alt_count,
-            args.min_base_qual,
-            args.vardict_call
-        )
-
-        # Filters variants located on primers
-        curr_gp_clean_vcf = tmp.add(curr_gp + "_clean.vcf")
-        FilterVCFPrimers(args.input_genome, curr_gp_regions_with_prim, curr_gp_vcf, curr_gp_clean_vcf).submit(args.output_log)
-
-        # Store current group files
-        groups.append({
-            "name": curr_gp,
-            "aln": curr_gp_aln,
-            "vcf": curr_gp_clean_vcf,
-            "design_wout_prim": curr_gp_regions_wout_prim,
-            "design_with_prim": curr_gp_regions_with_prim
-        })
+    SplitBAMByRG(args.input_non_overlapping_design, args.input_aln, out_bam_pattern, {"LB": library_name, "PL": "ILLUMINA", "SM": library_name}, True).submit(args.output_log)  # One RG by group: the reads of the group are one library for VarDict and GatherOverlappingRegions
+
+    # Split design by group
+    design_by_group = {
+        gp: {
+            "with_prim": tmp.add(gp + "_withPrimers.bed"),
+            "with_prim_4_col": tmp.add(gp + "_withPrimers_4col.bed"),
+            "wout_prim": tmp.add(gp + "_woutPrimers.bed")
+        } for gp in groups_names
+    }
+    splitBEDByGroup(
+        args.input_design_with_primers,
+        amplicons_by_group,
+        [
+            ({gp: design["with_prim"] for gp, design in design_by_group.items()}, None),
+            ({gp: design["with_prim_4_col"] for gp, design in design_by_group.items()}, 4)
+        ]
+    )
+    splitBEDByGroup(args.input_design_wout_primers, amplicons_by_group, [({gp: design["wout_prim"] for gp, design in design_by_group.items()}, None)])
+
+    # Variant calling by group
+    with ThreadPoolExecutor(max_workers=args.nb_jobs) as executor:
+        futures = [
+            executor.submit(processGroup, curr_gp, gp_alignment[idx_gp], design_by_group[curr_gp], args, tmp)
+            for idx_gp, curr_gp in enumerate(groups_names)
+        ]
+        groups = [curr_future.result() for curr_future in futures]
 
     # Merge overlapping amplicons
     out_gather = tmp.add("gatherOverlapping.vcf")
@@ -19,7 +19,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.2.0'
+__version__ = '1.3.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -27,6 +27,7 @@ import os
 import json
 import numpy
 import argparse
+from depthStore import DepthStoreReader, isDepthStore
 
 
 ########################################################################
@@ -107,6 +108,18 @@ def setDepths(depths_file, selected_areas):
             for idx in sorted(achieved_idx, reverse=True):
                 del opened_area[idx]
 
+def setDepthsFromStore(depths_file, selected_areas):
+    """
+    @summary: Adds the list of depths for each area in selected_areas. These depths are stored with the key "data". Only the chunks of the store overlapping areas are read.
+    @param depths_file: [str] The path to the depths by position (format: depths store). The file must only contains one sample.
+    @param selected_areas: [list] The list of area. Each area is represented by a dictionary with this format: { "region":"chr1", "start":501, "end":608, "name":"gene_98" }.
+    """
+    with DepthStoreReader(depths_file) as reader:
+        if len(reader.samples) != 1:
+            raise ValueError("The depths store {} must contain only one sample.".format(depths_file))
+        for curr_area in selected_areas:
+            curr_area["data"] = reader.get(curr_area["region"], curr_area["start"], curr_area["end"])[0].tolist()
+
 def writeOutputTSV(out_path, area_depths, percentile_step):
     """
     @summary: Writes depths distribution for each area and each sample in TSV format.
@@ -185,7 +198,7 @@ if __name__ == "__main__":
     parser.add_argument('-v', '--version', action='version', version=__version__)
     parser.add_argument('-s', '--percentile-step', type=int, default=5, help='Only the depths for this percentile and his multiples are retained. For example, with 25 only the minimum, the 1st quartile, the 2nd quartile, the 3rd quartile and the maximum depths are retained. [Default: %(default)s]')
     group_input = parser.add_argument_group('Inputs')  # Inputs
-    group_input.add_argument('-c', '--inputs-depths', nargs='+', required=True, help='The path to the depths by position (format: samtools depth output). Each file represents only one sample. The file must contains every positions in selected areas (see samtools depth -a option for positions with 0 reads).')
+    group_input.add_argument('-c', '--inputs-depths', nargs='+', required=True, help='The path to the depths by position (format: samtools depth output or depths store). Each file represents only one sample. The file must contains every positions in selected areas (see samtools depth -a option for positions with 0 reads).')
     group_input.add_argument('-r', '--input-regions', required=True, help='Path to the list of evaluated regions (format: BED).')
     group_output = parser.add_argument_group('Outputs')  # Outputs
     group_output.add_argument('-o', '--output-metrics', default="depths_distrib.json", help='The path to outputted file (format: JSON or TSV according to the extension).')
@@ -197,7 +210,10 @@ if __name__ == "__main__":
     # Get coverage by area in samples
     for spl_file in args.inputs_depths:
         spl_name = os.path.basename(spl_file)
-        setDepths(spl_file, selected_areas)
+        if isDepthStore(spl_file):
+            setDepthsFromStore(spl_file, selected_areas)
+        else:
+            setDepths(spl_file, selected_areas)
         for curr_area in selected_areas:
             # Transform depths to distribution
             if "data" not in curr_area:
@@ -0,0 +1,136 @@
+#
+# Copyright (C) 2021 IUCT-O
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Classes to write files with large buffers and multithreaded gzip compression shared by scripts."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import gzip
+from collections import deque
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class BufferedWriter:
+    """
+    Text or bytes writer with large buffer. When the path ends with ".gz", each flushed buffer is written as a gzip member (the concatenation of members is a valid gzip file). The compression of members can be delegated to a pool of threads (zlib releases the GIL) while the order of members is kept.
+
+    :Example:
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            with BufferedWriter("out.fastq.gz", executor) as writer:
+                writer.write("@read1\\nACGT\\n+\\nIIII\\n")
+    """
+
+    def __init__(self, filepath, executor=None, buffer_size=1048576, compression_level=6):
+        """
+        Build and return an instance of BufferedWriter.
+
+        :param filepath: Path to the output file.
+        :type filepath: str
+        :param executor: Pool of threads used to compress members. With None the compression is done in the current thread.
+        :type executor: concurrent.futures.Executor
+        :param buffer_size: Number of characters kept in memory before flush.
+        :type buffer_size: int
+        :param compression_level: Compression level used with gzip.
+        :type compression_level: int
+        :return: The new instance.
+        :rtype: BufferedWriter
+        """
+        self.filepath = filepath
+        self.executor = executor
+        self.buffer_size = buffer_size
+        self.compression_level = compression_level
+        self.is_gzip = filepath.endswith(".gz")
+        self._buffer = list()
+        self._buffer_length = 0
+        self._pending = deque()
+        self._handle = open(filepath, "wb")
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _writePending(self, wait=False):
+        """
+        Write members already compressed in the order of submission.
+
+        :param wait: If True, wait the end of all compressions.
+        :type wait: bool
+        """
+        while len(self._pending) != 0 and (wait or self._pending[0].done() or len(self._pending) > 4):  # Memory is limited to few buffers by file
+            self._handle.write(self._pending.popleft().result())
+
+    def close(self):
+        """Flush buffer and close file handle."""
+        if getattr(self, "_handle", None) is not None:
+            self.flush()
+            self._writePending(True)
+            if self.is_gzip and self._handle.tell() == 0:  # Empty file is a valid gzip
+                self._handle.write(gzip.compress(b""))
+            self._handle.close()
+            self._handle = None
+
+    def flush(self):
+        """Write the buffer content."""
+        if self._buffer_length != 0:
+            data = b"".join(self._buffer) if isinstance(self._buffer[0], bytes) else "".join(self._buffer).encode()
+            self._buffer = list()
+            self._buffer_length = 0
+            if not self.is_gzip:
+                self._handle.write(data)
+            elif self.executor is None:
+                self._handle.write(gzip.compress(data, self.compression_level))
+            else:
+                self._pending.append(
+                    self.executor.submit(gzip.compress, data, self.compression_level)
+                )
+                self._writePending()
+
+    def writeRaw(self, data):
+        """
+        Write data without buffering and compression after the previous contents. It is used to copy members already compressed from another gzip file.
+
+        :param data: The data.
+        :type data: bytes
+        """
+        self.flush()
+        self._writePending(True)
+        self._handle.write(data)
+
+    def write(self, content):
+        """
+        Add content in buffer. All the contents written in one file must have the same type.
+
+        :param content: The text to write.
+        :type content: str or bytes
+        """
+        self._buffer.append(content)
+        self._buffer_length += len(content)
+        if self._buffer_length >= self.buffer_size:
+            self.flush()
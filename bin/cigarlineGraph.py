@@ -19,11 +19,16 @@
 __author__ = 'Frederic Escudie - Plateforme genomique Toulouse'
 __copyright__ = 'Copyright (C) 2009 INRA'
 __license__ = 'GNU General Public License'
-__version__ = '2.4.0'
+__version__ = '2.5.0'
 __email__ = 'support.genopole@toulouse.inra.fr'
 __status__ = 'prod'
 
 import argparse,re,sys
+from multiprocessing import Pool
+
+
+STATUS = ['match', 'mismatch', 'clipping', 'insertion', 'undef']
+ON_READ_OPERATIONS = {0: 'M', 1: 'I', 4: 'S', 5: 'H', 7: '=', 8: 'X'} # Codes of pysam CIGAR operations present on read
 
 
 def cigar2statesRead (sam_line_obj):
@@ -390,6 +395,209 @@ def setSubplotLegend (graph, title, x_min, x_max):
     graph.set_xlim( x_min, x_max )
 
 
+def getMDStatus(md):
+    """
+      Returns the status of the aligned positions in the MD field. The
+      parsing rules are the same as getPositionSatus.
+      @param md : the MD field.
+      @return   : [['match', 12], ['mismatch', 1], ['match', 5], ...]
+    """
+    status_runs = []
+    prec = ""
+    isDel = False
+    for md_char in md:
+        if md_char.isdigit():
+            isDel = False
+            prec += md_char
+        elif md_char in "ATGCNatgcn" and not isDel:
+            if prec != "":
+                status_runs.append(['match', int(prec)])
+                prec = ""
+            status_runs.append(['mismatch', 1])
+        elif md_char == "^":
+            if prec != "":
+                status_runs.append(['match', int(prec)])
+                prec = ""
+            isDel = True
+    if prec != "":
+        status_runs.append(['match', int(prec)])
+    return status_runs
+
+
+def getSegmentsStatus(cigartuples, md, is_reverse, seq_length, query_name=""):
+    """
+      Returns the status of the positions on read grouped in segments. The
+      status are the same as getPositionSatus and the perfect alignment is
+      processed as in sumStatus.
+      @param cigartuples : the CIGAR operations from pysam.
+      @param md          : the MD field.
+      @param is_reverse  : True if the query is reverse.
+      @param seq_length  : the length of SEQ field.
+      @param query_name  : the name of the query used in warnings.
+      @return            : the list of segments and the positions with
+                           undefined status [[('clipping', 0, 5),
+                           ('match', 5, 150)], [12, 13]]
+    """
+    # Perfect alignment
+    if len(cigartuples) == 1 and cigartuples[0][0] == 0 and md.isdigit():
+        return [('match', 0, seq_length)], []
+    # Operations on read
+    cigar_runs = [[ON_READ_OPERATIONS[op], length] for op, length in cigartuples if op in ON_READ_OPERATIONS and length != 0]
+    read_length = sum(length for op, length in cigar_runs)
+    # Start clipping
+    segments = []
+    pos = 0
+    run_idx = 0
+    while run_idx < len(cigar_runs) and cigar_runs[run_idx][0] in "SH":
+        segments.append(['clipping', pos, pos + cigar_runs[run_idx][1]])
+        pos += cigar_runs[run_idx][1]
+        run_idx += 1
+    # Positions in MD field: the insertions are not in MD
+    md_runs = getMDStatus(md)
+    run_offset = 0
+    for status, md_length in md_runs:
+        while md_length > 0:
+            if run_idx >= len(cigar_runs):
+                raise Exception("The MD field {} is longer than the alignment {}.".format(md, cigartuples))
+            op, length = cigar_runs[run_idx]
+            nb_pos = length - run_offset
+            if op == "I":
+                status_on_run = 'insertion'
+            else:
+                status_on_run = status
+                nb_pos = min(nb_pos, md_length)
+                md_length -= nb_pos
+            segments.append([status_on_run, pos, pos + nb_pos])
+            pos += nb_pos
+            run_offset += nb_pos
+            if run_offset == length:
+                run_idx += 1
+                run_offset = 0
+    # Positions after MD field
+    undef_positions = []
+    while run_idx < len(cigar_runs):
+        op, length = cigar_runs[run_idx]
+        nb_pos = length - run_offset
+        if op in "SH":
+            segments.append(['clipping', pos, pos + nb_pos])
+        elif op == "I":
+            segments.append(['insertion', pos, pos + nb_pos])
+        else:
+            segments.append(['undef', pos, pos + nb_pos])
+            undef_positions.extend(range(pos, pos + nb_pos))
+        pos += nb_pos
+        run_idx += 1
+        run_offset = 0
+    # Merge adjacent segments with the same status
+    merged_segments = []
+    for status, start, end in segments:
+        if len(merged_segments) != 0 and merged_segments[-1][0] == status:
+            merged_segments[-1][2] = end
+        else:
+            merged_segments.append([status, start, end])
+    # Reverse status
+    if is_reverse:
+        merged_segments = [[status, read_length - end, read_length - start] for status, start, end in reversed(merged_segments)]
+    return [tuple(elt) for elt in merged_segments], undef_positions
+
+
+def countAlignmentPatterns(aln_path, region=None):
+    """
+      Returns the number of aligned reads by alignment pattern (read
+      number, CIGAR, MD, strand, SEQ length and name). The name is only kept
+      for the alignments with undefined positions (see getPositionSatus).
+      @param aln_path : the alignment file path (format: BAM or SAM).
+      @param region   : the reference name of the processed reads. With
+                        None all the reads are processed.
+      @return         : {(1, ((0, 150),), '150', False, 150, ''): 12, ...}
+    """
+    import pysam
+    count_by_pattern = {}
+    has_undef_by_aln = {}
+    with pysam.AlignmentFile(aln_path, check_sq=False) as FH_aln:
+        reads = FH_aln.fetch(until_eof=True) if region is None else FH_aln.fetch(region)
+        for read in reads:
+            #If the read is aligned
+            if read.reference_id != -1 and read.cigartuples is not None:
+                cigartuples = tuple(read.cigartuples)
+                md = read.get_tag("MD")
+                if (cigartuples, md) not in has_undef_by_aln:
+                    has_undef_by_aln[(cigartuples, md)] = hasUndefPositions(cigartuples, md)
+                pattern = (
+                    2 if read.is_read2 else 1,
+                    cigartuples,
+                    md,
+                    read.is_reverse,
+                    read.query_length if read.query_length != 0 else 1, # SEQ "*" has a length of 1 in sumStatus
+                    read.query_name if has_undef_by_aln[(cigartuples, md)] else ""
+                )
+                count_by_pattern[pattern] = count_by_pattern.get(pattern, 0) + 1
+    return count_by_pattern
+
+
+def hasUndefPositions(cigartuples, md):
+    """
+      Returns True if the alignment has aligned positions on read missing in
+      MD field.
+      @param cigartuples : the CIGAR operations from pysam.
+      @param md          : the MD field.
+      @return            : boolean
+    """
+    nb_aligned = sum(length for op, length in cigartuples if op in (0, 7, 8))
+    nb_in_md = sum(length for status, length in getMDStatus(md))
+    return nb_in_md < nb_aligned
+
+
+def sumStatusFromAln(aln_path, nb_jobs=1):
+    """
+      Sum by position the status of reads from an alignment file read with
+      pysam. The reads with the same alignment pattern are processed once
+      and their counts are added in a matrix (status x positions) by slices.
+      With an indexed file the references are processed in parallel.
+      @param aln_path : the alignment file path (format: BAM or SAM).
+      @param nb_jobs  : the number of processes.
+      @return         : the count by position for each read number in the
+                        same format as sumStatus. {read1 : [], read2 : []}
+    """
+    import numpy
+    import pysam
+    #Count alignment patterns
+    count_by_pattern = {}
+    with pysam.AlignmentFile(aln_path, check_sq=False) as FH_aln:
+        regions = list(FH_aln.references) if FH_aln.has_index() else []
+    if nb_jobs > 1 and len(regions) > 1:
+        with Pool(processes=nb_jobs) as pool:
+            for region_count in pool.starmap(countAlignmentPatterns, [(aln_path, region) for region in regions]):
+                for pattern, count in region_count.items():
+                    count_by_pattern[pattern] = count_by_pattern.get(pattern, 0) + count
+    else:
+        count_by_pattern = countAlignmentPatterns(aln_path)
+    #Sum status in matrices
+    segments_by_pattern = {}
+    nb_pos_by_read = {1: 0, 2: 0}
+    for pattern, count in count_by_pattern.items():
+        read_number, cigartuples, md, is_reverse, seq_length, query_name = pattern
+        segments, undef_positions = getSegmentsStatus(cigartuples, md, is_reverse, seq_length, query_name)
+        for pos in undef_positions:
+            for idx in range(count):
+                sys.stderr.write("[WARNING] " + query_name + " the position " + str(pos) + " in the read isn't in MD field.\n")
+        segments_by_pattern[pattern] = segments
+        if len(segments) != 0:
+            nb_pos_by_read[read_number] = max(nb_pos_by_read[read_number], max(end for status, start, end in segments))
+    matrix_by_read = {read_number: numpy.zeros((len(STATUS), nb_pos), dtype=numpy.int64) for read_number, nb_pos in nb_pos_by_read.items()}
+    for pattern, count in count_by_pattern.items():
+        matrix = matrix_by_read[pattern[0]]
+        for status, start, end in segments_by_pattern[pattern]:
+            matrix[STATUS.index(status), start:end] += count
+    #Convert to the format of sumStatus
+    nb_by_pos = {}
+    for read_number, matrix in matrix_by_read.items():
+        nb_by_pos["read" + str(read_number)] = [
+            {status: int(nb) for status, nb in zip(STATUS, matrix[:, pos])} for pos in range(matrix.shape[1])
+        ]
+    return nb_by_pos
+
+
 if __name__ == '__main__':
     
     parser = argparse.ArgumentParser(
@@ -406,9 +614,13 @@ Example :
   - Create one graph and count for reads 1 and one graph and count for reads 2
     samtools view hg18.bam | %(prog)s -i - -o r1.png r2.png -t r1.csv r2.csv --readsplit
   - Create one graph and count for reads
-    samtools view hg18.bam | %(prog)s -i - -o all.png -t all.csv'''))
+    samtools view hg18.bam | %(prog)s -i - -o all.png -t all.csv
+  - Create one graph and count for reads with the alignment file read by pysam and the references processed in parallel (the file must be indexed)
+    %(prog)s -a hg18.bam -j 4 -o all.png -t all.csv'''))
     
     parser.add_argument("-i", "--input", type=argparse.FileType('r'), default=sys.stdin, help="The alignment file. If you use directly a SAM on input (ex : %(prog)s -i hg18.sam -o hg18_all.png) the file does must not contain header section")
+    parser.add_argument("-a", "--input-aln", help="The alignment file read with pysam instead of SAM lines from --input (format: BAM or SAM). The reads with the same CIGAR and MD are processed once. The MD tag is required.")
+    parser.add_argument("-j", "--nb-jobs", type=int, default=1, help="The number of processes used with --input-aln on indexed file: the references are processed in parallel (default=1)")
     parser.add_argument("-t", "--txt_output", nargs='*', type=argparse.FileType('w'), default=[], help="The file(s) with count")
     parser.add_argument("-o", "--img_output", nargs='*', type=argparse.FileType('w'), default=[], help="The graph(s)")
     parser.add_argument("--readsplit", action="store_true", help="If specified, reads statstics are splitted in two outputs (reads 1 and reads 2)")
@@ -434,11 +646,12 @@ Example :
     if args.readsplit and ( (args.txt_output and len(args.txt_output)!= 2) or (args.img_output and len(args.img_output)!= 2) ):
         raise ValueError("[ERROR] Incorrect number of output files : with --readsplit option you need 2 output files.")
     
-    #Init count
-    nb_by_pos = {'read1':[],'read2':[]}
-
     #Sum by position the status of reads
-    sumStatus( args.input, nb_by_pos )
+    if args.input_aln is not None:
+        nb_by_pos = sumStatusFromAln( args.input_aln, args.nb_jobs )
+    else:
+        nb_by_pos = {'read1':[],'read2':[]}
+        sumStatus( args.input, nb_by_pos )
 
     #Write txt output
     if len(args.txt_output)==2 :
@@ -3,16 +3,168 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2020 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.0'
+__version__ = '1.1.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
 from anacore.abstractFile import isGzip
+from bufferedIO import BufferedWriter
+from concurrent.futures import ThreadPoolExecutor
 import argparse
-import gzip
 import logging
 import os
+import struct
 import sys
+import zlib
+
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getGzipLastByte(in_path, chunk_size=4194304):
+    """
+    Return the last byte of the decompressed content. For BGZF files only the last block containing data is decompressed. For the others gzip files the decompression starts from the last member containing data (members are found from the end of the file with their magic number and validated by their decompression): only a file with one member is completely decompressed.
+
+    :param in_path: Path to the file (format: gzip).
+    :type in_path: str
+    :param chunk_size: Number of bytes read by block.
+    :type chunk_size: int
+    :return: The last byte or None if the file is empty.
+    :rtype: bytes
+    """
+    last_block = getBGZFLastBlock(in_path)
+    if last_block is not None:
+        data = b"" if len(last_block) == 0 else zlib.decompress(last_block, 31)
+        return data[-1:] if len(data) != 0 else None
+    with open(in_path, "rb") as reader:
+        for offset in iterGzipMembersOffsets(reader, chunk_size):
+            reader.seek(offset)
+            last_byte = None
+            decompressor = None
+            try:
+                raw_data = reader.read(chunk_size)
+                while raw_data:
+                    if decompressor is None:
+                        decompressor = zlib.decompressobj(31)
+                    data = decompressor.decompress(raw_data)
+                    if len(data) != 0:
+                        last_byte = data[-1:]
+                    raw_data = b""
+                    if decompressor.eof:  # Next member in multi-members gzip
+                        raw_data = decompressor.unused_data
+                        decompressor = None
+                    if not raw_data:
+                        raw_data = reader.read(chunk_size)
+            except zlib.error:  # Magic number in compressed data
+                decompressor = False
+            if decompressor is None and (last_byte is not None or offset == 0):  # Valid members until the end of the file
+                return last_byte
+    raise IOError('The file "{}" is not a valid gzip.'.format(in_path))
+
+
+def getBGZFLastBlock(in_path):
+    """
+    Return the last block containing data in BGZF file. Blocks are found by their size stored in headers without decompression.
+
+    :param in_path: Path to the file (format: gzip).
+    :type in_path: str
+    :return: The last block containing data, an empty bytes if the file does not contain data or None if the file is not a BGZF.
+    :rtype: bytes
+    """
+    last_block = b""
+    with open(in_path, "rb") as handle:
+        block_header = handle.read(18)
+        while len(block_header) != 0:
+            if len(block_header) < 18 or block_header[:4] != b"\x1f\x8b\x08\x04" or block_header[10:16] != b"\x06\x00BC\x02\x00":
+                return None
+            block_size = struct.unpack("<H", block_header[16:18])[0] + 1
+            handle.seek(block_size - 22, 1)
+            block_isize = handle.read(4)
+            if len(block_isize) < 4:
+                return None
+            if block_isize != b"\x00\x00\x00\x00":
+                handle.seek(-block_size, 1)
+                last_block = handle.read(block_size)
+            block_header = handle.read(18)
+    return last_block
+
+
+def iterGzipChunks(in_path, chunk_size=4194304):
+    """
+    Return a generator on decompressed blocks of the file. All the members of multi-members gzip are decompressed.
+
+    :param in_path: Path to the file (format: gzip).
+    :type in_path: str
+    :param chunk_size: Number of compressed bytes read by block.
+    :type chunk_size: int
+    :return: Generator on decompressed blocks.
+    :rtype: generator
+    """
+    with open(in_path, "rb") as reader:
+        decompressor = zlib.decompressobj(31)
+        raw_data = reader.read(chunk_size)
+        while raw_data:
+            data = decompressor.decompress(raw_data)
+            raw_data = b""
+            if decompressor.eof:  # Next member in multi-members gzip
+                raw_data = decompressor.unused_data
+                decompressor = zlib.decompressobj(31)
+            if len(data) != 0:
+                yield data
+            if not raw_data:
+                raw_data = reader.read(chunk_size)
+
+
+def iterGzipMembersOffsets(reader, chunk_size=4194304):
+    """
+    Return a generator on the offsets of the gzip magic number in file from the end to the start. They are the possible starts of members.
+
+    :param reader: File handle opened in binary mode.
+    :type reader: file
+    :param chunk_size: Number of bytes read by block.
+    :type chunk_size: int
+    :return: Generator on offsets.
+    :rtype: generator
+    """
+    magic = b"\x1f\x8b\x08"
+    end = reader.seek(0, 2)
+    while end > 0:
+        start = max(0, end - chunk_size)
+        reader.seek(start)
+        data = reader.read(end - start + len(magic) - 1)  # Magic number can overlap the end of the block
+        pos = data.rfind(magic)
+        while pos != -1:
+            if pos < end - start:
+                yield start + pos
+            pos = data.rfind(magic, 0, pos)
+        end = start
+
+
+def iterRawChunks(in_path, chunk_size=4194304, end_offset=0):
+    """
+    Return a generator on blocks of bytes of the file.
+
+    :param in_path: Path to the file.
+    :type in_path: str
+    :param chunk_size: Number of bytes read by block.
+    :type chunk_size: int
+    :param end_offset: Number of bytes ignored at the end of the file.
+    :type end_offset: int
+    :return: Generator on blocks.
+    :rtype: generator
+    """
+    remaining = os.path.getsize(in_path) - end_offset
+    with open(in_path, "rb") as reader:
+        while remaining > 0:
+            data = reader.read(min(chunk_size, remaining))
+            if len(data) == 0:
+                break
+            remaining -= len(data)
+            yield data
 
 
 ########################################################################
@@ -22,12 +174,15 @@ import sys
 ########################################################################
 if __name__ == "__main__":
     # Manage parameters
-    parser = argparse.ArgumentParser(description='Concatenate text files.')
+    parser = argparse.ArgumentParser(description='Concatenate text files. When the output and an input are gzip, the members of this input are copied without decompression.')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')
-    group_input.add_argument('-i', '--inputs', required=True, nargs='+', help='Pathes to files.')
+    group_input.add_argument('-i', '--inputs', required=True, nargs='+', help='Pathes to files. When the output is gzip, the end of each gzip input except the last one is decompressed to know if it ends with a new line: the whole file is decompressed for gzip with only one member (example: produced by the gzip command) while only the last block or member is decompressed for BGZF and multi-members gzip.')
     group_output = parser.add_argument_group('Outputs')
     group_output.add_argument('-o', '--output', required=True, help='Path to the concatenated file.')
+    group_output.add_argument('-b', '--block-size', default=1048576, type=int, help='Size of the blocks compressed independently when the output path ends with ".gz". [Default: %(default)s]')
+    group_output.add_argument('-c', '--compression-threads', default=1, type=int, help='Number of threads used to compress blocks when the output path ends with ".gz". [Default: %(default)s]')
+    group_output.add_argument('-l', '--compression-level', default=6, type=int, choices=range(1, 10), help='Compression level of blocks when the output path ends with ".gz". [Default: %(default)s]')
     args = parser.parse_args()
 
     # Logger
@@ -37,23 +192,38 @@ if __name__ == "__main__":
     log.info("Command: " + " ".join(sys.argv))
 
     # Process
-    out_open_fct = open
-    out_mode = "w"
-    if args.output.endswith('.gz'):
-        out_open_fct = gzip.open
-        out_mode = "wt"
-    with out_open_fct(args.output, out_mode) as writer:
-        last_line = "\n"
-        for curr_in_file in args.inputs:
-            if not last_line.endswith("\n"):
-                writer.write("\n")  # Start new line for a new file
-            in_open_fct = open
-            in_mode = "r"
-            if isGzip(curr_in_file):
-                in_open_fct = gzip.open
-                in_mode = "rt"
-            with in_open_fct(curr_in_file, in_mode) as reader:
-                for line in reader:
-                    writer.write(line)
-                    last_line = line
+    executor = None if args.compression_threads < 2 else ThreadPoolExecutor(args.compression_threads)
+    try:
+        with BufferedWriter(args.output, executor, args.block_size, args.compression_level) as writer:
+            last_byte = b"\n"
+            for idx_in, curr_in_file in enumerate(args.inputs):
+                if last_byte != b"\n":
+                    writer.write(b"\n")  # Start new line for a new file
+                file_last_byte = None
+                if isGzip(curr_in_file):
+                    if writer.is_gzip:  # Copy members
+                        is_last_file = idx_in == len(args.inputs) - 1
+                        end_offset = 0
+                        if not is_last_file:
+                            file_last_byte = getGzipLastByte(curr_in_file)
+                            with open(curr_in_file, "rb") as reader:
+                                if os.path.getsize(curr_in_file) > len(BGZF_EOF):
+                                    reader.seek(-len(BGZF_EOF), 2)
+                                    if reader.read() == BGZF_EOF:  # Remove end of file marker before the next file
+                                        end_offset = len(BGZF_EOF)
+                        for data in iterRawChunks(curr_in_file, args.block_size, end_offset):
+                            writer.writeRaw(data)
+                    else:
+                        for data in iterGzipChunks(curr_in_file, args.block_size):
+                            writer.write(data)
+                            file_last_byte = data[-1:]
+                else:
+                    for data in iterRawChunks(curr_in_file, args.block_size):
+                        writer.write(data)
+                        file_last_byte = data[-1:]
+                if file_last_byte is not None:
+                    last_byte = file_last_byte
+    finally:
+        if executor is not None:
+            executor.shutdown()
     log.info("End of job")
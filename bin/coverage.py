@@ -19,16 +19,21 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.0'
+__version__ = '2.1.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
-import os
-import time
-import logging
+from alignmentIO import addIOArguments, openAlignmentReader
+from anacore.bed import getAreas
+from depthStore import DEFAULT_EXCLUDE_FLAGS, DepthStoreWriter, getAlignmentsDepths, getMergedRegions
+from multiprocessing import Pool
 import argparse
-import subprocess
-from subprocess import Popen, PIPE
+import logging
+import numpy
+import os
+import sys
+
+WORKER_CONTEXT = dict()  # Reader and filters used by processRegion in the current process
 
 
 ########################################################################
@@ -36,209 +41,263 @@ from subprocess import Popen, PIPE
 # FUNCTIONS
 #
 ########################################################################
-class TmpFiles:
+def getOutputFormat(out_path):
     """
-    @summary: Manager for temporary files.
-    @note:
-        tmpFiles = TmpFiles(out_dir)
-        try:
-            ...
-            tmp_seq = tmpFiles.add("toto.fasta")
-            ...
-            tmp_log = tmpFiles.add("log.txt")
-            ...
-        finaly:
-            tmpFiles.deleteAll()
+    Return the output format from the extension of the file: "store" for ".dps", "bedgraph" for ".bedgraph" and ".bdg" and "depth" for others.
+
+    :param out_path: Path to the output file.
+    :type out_path: str
+    :return: The output format.
+    :rtype: str
     """
-    def __init__(self, tmp_dir, prefix=None):
-        """
-        @param tmp_dir: [str] The temporary directory path.
-        @param prefix: [str] The prefix added to each temporary file [default: <TIMESTAMP>_<PID>].
-        """
-        if prefix is None:
-            prefix = str(time.time()) + "_" + str(os.getpid())
-        self.files = list()
-        self.dirs = list()
-        self.tmp_dir = tmp_dir
-        self.prefix = prefix
-
-    def add(self, filename, prefix=None, dir=None):
-        """
-        @summary: Add a temporary file.
-        @param filename: The filename without prefix.
-        @param prefix: The prefix added [default: TmpFiles.prefix].
-        @param dir: The directory path [default: TmpFiles.tmp_dir].
-        @return: [str] The filepath.
-        """
-        # Default
-        if prefix is None:
-            prefix = self.prefix
-        if dir is None:
-            dir = self.tmp_dir
-        # Process
-        filepath = os.path.join(dir, prefix + "_" + filename)
-        self.files.append(filepath)
-        return filepath
-
-    def delete(self, filepath):
-        """
-        @summary: Deletes the specified temporary file.
-        @param filepath: [str] The file path to delete.
-        """
-        self.files.remove(filepath)
-        if os.path.exists(filepath): os.remove(filepath)
-
-    def deleteAll(self):
-        """
-        @summary: Deletes all temporary files.
-        """
-        all_tmp_files = [tmp_file for tmp_file in self.files]
-        for tmp_file in all_tmp_files:
-            self.delete(tmp_file)
-
-
-class Cmd:
+    out_path = out_path.lower()
+    if out_path.endswith(".dps"):
+        return "store"
+    if out_path.endswith(".bedgraph") or out_path.endswith(".bdg"):
+        return "bedgraph"
+    return "depth"
+
+
+def getRuns(depths):
     """
-    @summary : Command wrapper.
+    Return the runs of identical depths.
+
+    :param depths: Depths by position.
+    :type depths: numpy.array
+    :return: Start (0-based), end (excluded) and depth of each run.
+    :rtype: (list, list, list)
     """
-    def __init__(self, program, description, exec_parameters, version_parameters=None):
-        """
-        @param exec_parameters: [str] The parameters to execute the program. Two possibles syntaxes.
-                                If the parameter contains the string '##PROGRAM##', this tag will be replaced by the program parameter before submit.
-                                Otherwise the parameters will be added after the program in command line.
-        @param version_parameters: [str] The parameters to get the program version. Two possibles syntaxes.
-                                   If the parameter contains the string '##PROGRAM##', this tag will be replaced by the program parameter before submit.
-                                   Otherwise the parameters will be added after the program in command line.
-        """
-        self.program = program
-        self.description = description
-        self.exec_parameters = exec_parameters
-        self.version_parameters = version_parameters
-
-    def get_cmd(self):
-        """
-        @summary : Returns the command line.
-        @return : [str] The command line.
-        """
-        cmd = None
-        if '##PROGRAM##' in self.exec_parameters:
-            cmd = self.exec_parameters.replace('##PROGRAM##', self.program)
-        else:
-            cmd = self.program + ' ' + self.exec_parameters
-        return cmd
-
-    def get_version(self, location='stderr'):
-        """
-        @summary : Returns the program version number.
-        @param location : [str] If the version command returns the version number on 'stdout' or on 'stderr'.
-        @return : [str] version number if this is possible, otherwise this method return 'unknown'.
-        """
-        if self.version_parameters is None:
-            return "unknown"
-        else:
-            try:
-                cmd = self.program + ' ' + self.version_parameters
-                if '##PROGRAM##' in self.exec_parameters:
-                    cmd = self.version_parameters.replace('##PROGRAM##', self.program)
-                p = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE)
-                stdout, stderr = p.communicate()
-                if location == 'stderr':
-                    return stderr.strip()
-                else:
-                    return stdout.strip()
-            except:
-                raise Exception("Version cannot be retrieve for the software '" + self.program + "'.")
-
-    def parser(self, log_file):
-        """
-        @summary : Parse the command results to add information in log_file.
-        @log_file : [str] Path to the sample process log file.
-        """
-        pass
-
-    def submit(self, log_file=None):
-        """
-        @summary : Launch command, trace this action in log and parse results.
-        @log_file : [str] Path to the sample process log file.
-        """
-        # Log
-        if log_file is not None:
-            logger.info('[' + self.__class__.__name__ + '] DESCRIPTION ' + self.description + ' (' + os.path.basename(self.program) + ' version : ' + self.get_version() + ')')
-            logger.info('[' + self.__class__.__name__ + '] COMMAND ' + self.get_cmd())
-            logger.info('[' + self.__class__.__name__ + '] START')
-        # Process
-        subprocess.check_output(self.get_cmd(), shell=True)
-        # Log
-        if log_file is not None:
-            logger.info('[' + self.__class__.__name__ + '] END')
-            # Post-process results
-            self.parser(log_file)
-
-"""
-class SamtoolsDepthAnalysis(Analysis):
-    #fait découpe et iter si thread > 1
-    cmd = list()
-    for idx_path, aln_map_path in aln_map_paths:
-        cmd.append(
-            SamtoolsDepthCmd(
-                aln_map_path,
-                output_path,
-                *args,
-                **kwargs
-            )
+    is_run_start = numpy.ones(len(depths), dtype=bool)
+    is_run_start[1:] = depths[1:] != depths[:-1]
+    starts = numpy.flatnonzero(is_run_start)
+    ends = numpy.append(starts[1:], len(depths))
+    return starts.tolist(), ends.tolist(), depths[starts].tolist()
+
+
+def getWorkUnits(regions, window_size):
+    """
+    Return regions split in windows of maximum size. They are the units processed in parallel.
+
+    :param regions: The list of regions (chrom, start, end, name) with 1-based positions.
+    :type regions: list
+    :param window_size: Maximum length of one unit.
+    :type window_size: int
+    :return: The list of units (chrom, start, end, name).
+    :rtype: list
+    """
+    units = list()
+    for chrom, start, end, name in regions:
+        for win_start in range(start, end + 1, window_size):
+            units.append((chrom, win_start, min(end, win_start + window_size - 1), name))
+    return units
+
+
+def getCoveredContigs(aln_path, exclude_flags=DEFAULT_EXCLUDE_FLAGS, min_mapq=0, io_threads=1):
+    """
+    Return the names of the contigs with at least one read counted in depths. samtools depth -a reports only these contigs.
+
+    :param aln_path: Path to the alignments file (format: BAM). It must be indexed.
+    :type aln_path: str
+    :param exclude_flags: Reads with one of these flags are skipped.
+    :type exclude_flags: int
+    :param min_mapq: Reads with a mapping quality lower than this value are skipped.
+    :type min_mapq: int
+    :param io_threads: Number of threads used to decompress the alignments file.
+    :type io_threads: int
+    :return: The names of the covered contigs.
+    :rtype: set
+    """
+    covered_contigs = set()
+    with openAlignmentReader(aln_path, io_threads) as reader:
+        for chrom in reader.references:
+            for read in reader.fetch(chrom):
+                if read.flag & exclude_flags == 0 and read.mapping_quality >= min_mapq:
+                    covered_contigs.add(chrom)
+                    break
+    return covered_contigs
+
+
+def initWorker(aln_path, io_threads, exclude_flags, min_mapq, output_format, max_depth=0):
+    """
+    Open the alignments file once by process and store parameters used by processRegion.
+
+    :param aln_path: Path to the alignments file (format: BAM). It must be indexed.
+    :type aln_path: str
+    :param io_threads: Number of threads used to decompress the alignments file.
+    :type io_threads: int
+    :param exclude_flags: Reads with one of these flags are skipped.
+    :type exclude_flags: int
+    :param min_mapq: Reads with a mapping quality lower than this value are skipped.
+    :type min_mapq: int
+    :param output_format: The output format: "depth", "bedgraph", "regions" or "store".
+    :type output_format: str
+    :param max_depth: Depths above this value are reported with this value. With 0 depths are not limited.
+    :type max_depth: int
+    """
+    if WORKER_CONTEXT.get("reader") is not None:
+        WORKER_CONTEXT["reader"].close()
+    WORKER_CONTEXT["reader"] = openAlignmentReader(aln_path, io_threads)
+    WORKER_CONTEXT["exclude_flags"] = exclude_flags
+    WORKER_CONTEXT["min_mapq"] = min_mapq
+    WORKER_CONTEXT["output_format"] = output_format
+    WORKER_CONTEXT["max_depth"] = max_depth
+
+
+def formatRegion(region, depths, output_format, max_depth=0):
+    """
+    Return coverage of the region in the format expected by the writer.
+
+    :param region: The region (chrom, start, end, name) with 1-based positions.
+    :type region: tuple
+    :param depths: Depths by position on the region.
+    :type depths: numpy.array
+    :param output_format: The output format: "depth", "bedgraph", "regions" or "store".
+    :type output_format: str
+    :param max_depth: Depths above this value are reported with this value. With 0 depths are not limited.
+    :type max_depth: int
+    :return: The lines for "depth" and "regions" formats, the runs for "bedgraph" format and the depths for "store" format.
+    :rtype: str or tuple
+    """
+    chrom, start, end, name = region
+    if max_depth:
+        depths = numpy.minimum(depths, max_depth)
+    if output_format == "depth":
+        prefix = chrom + "\t"
+        return "".join([prefix + str(pos) + "\t" + str(depth) + "\n" for pos, depth in zip(range(start, end + 1), depths.tolist())])
+    if output_format == "regions":
+        return "{}\t{}\t{}\t{}\t{}\t{:.2f}\t{}\t{}\t{}\n".format(
+            chrom, start - 1, end, "" if name is None else name, len(depths),
+            depths.mean(), depths.min(), numpy.median(depths), depths.max()
         )
-    submit(cmd)
-"""
-
-class SamtoolsViewCmd(Cmd):
-    def __init__(self, aln_map_path, output_path, filter=None):
-        # Options
-        self.output = output_path
-        filter_opt = ""
-        if filter is not None:
-            filter_opt = "-F " + filter + " "
-        # Cmd
-        Cmd.__init__(self,
-                     "samtools",
-                     "Filter alignment",
-                     "view -bh " + filter_opt + aln_map_path + " > " + self.output,
-                     "--version")
-
-    def get_version(self):
-        """
-        @summary: Returns the program version number.
-        @return: version number if this is possible, otherwise this method return 'unknown'.
-        """
-        res = [line.strip() for line in Cmd.get_version(self, 'stdout').decode().split("\n")]
-        return " ".join(res[:-1])
-
-class SamtoolsDepthCmd(Cmd):
-    def __init__(self, aln_map_path, output_path, bed=None, skip_zero=False, max_depth=100000):
-        # Options
-        self.output = output_path
-        depth_opt = ""
-        depth_opt = "-d " + str(max_depth) + " "
-        bed_opt = ""
-        if bed is not None:
-            bed_opt = "-b " + bed + " "
-        skip_zero_opt = ""
-        if not skip_zero:
-            skip_zero_opt = "-a "
-        # Cmd
-        Cmd.__init__(self,
-                     "samtools",
-                     "Coverage depth by position",
-                     "depth " + skip_zero_opt + depth_opt + bed_opt + aln_map_path + " > " + self.output,
-                     "--version")
-
-    def get_version(self):
-        """
-        @summary: Returns the program version number.
-        @return: version number if this is possible, otherwise this method return 'unknown'.
-        """
-        res = [line.strip() for line in Cmd.get_version(self, 'stdout').decode().split("\n")]
-        return " ".join(res[:-1])
+    if output_format == "bedgraph":
+        return (chrom, start) + getRuns(depths)
+    return chrom, start, depths
+
+
+def iterContigsDepths(reader, exclude_flags=DEFAULT_EXCLUDE_FLAGS, min_mapq=0):
+    """
+    Return an iterator on depths by position of each contig with at least one counted read, from one pass on all the alignments. The file must be sorted by coordinate and only one contig is kept in memory. This function is used when the alignments file is not indexed.
+
+    :param reader: The reader on alignments file.
+    :type reader: pysam.AlignmentFile
+    :param exclude_flags: Reads with one of these flags are skipped.
+    :type exclude_flags: int
+    :param min_mapq: Reads with a mapping quality lower than this value are skipped.
+    :type min_mapq: int
+    :return: Iterator on (contig name, depths by position on the complete contig) in order of the file.
+    :rtype: iterator
+    """
+    curr_chrom = None
+    diff = None
+    processed = set()
+    for read in reader.fetch(until_eof=True):
+        if read.reference_id >= 0 and read.flag & exclude_flags == 0 and read.mapping_quality >= min_mapq:
+            if read.reference_name != curr_chrom:
+                if curr_chrom is not None:
+                    yield curr_chrom, numpy.cumsum(diff[:-1]).astype(numpy.uint32)
+                    processed.add(curr_chrom)
+                curr_chrom = read.reference_name
+                if curr_chrom in processed:
+                    raise Exception('The alignments file "{}" must be sorted by coordinate or indexed.'.format(reader.filename.decode()))
+                diff = numpy.zeros(reader.get_reference_length(curr_chrom) + 1, dtype=numpy.int32)
+            for block_start, block_end in read.get_blocks():  # 0-based, end excluded
+                diff[block_start] += 1
+                diff[block_end] -= 1
+    if curr_chrom is not None:
+        yield curr_chrom, numpy.cumsum(diff[:-1]).astype(numpy.uint32)
+
 
+def iterStreamedResults(aln_path, units, io_threads=1, exclude_flags=DEFAULT_EXCLUDE_FLAGS, min_mapq=0, output_format="depth", max_depth=0, skip_uncovered=False):
+    """
+    Return an iterator on coverage of the units in the format expected by the writer, from one pass on all the alignments (see iterContigsDepths). It replaces processRegion when the alignments file is not indexed.
+
+    :param aln_path: Path to the alignments file (format: BAM). It must be sorted by coordinate.
+    :type aln_path: str
+    :param units: The list of units (chrom, start, end, name) with 1-based positions.
+    :type units: list
+    :param io_threads: Number of threads used to decompress the alignments file.
+    :type io_threads: int
+    :param exclude_flags: Reads with one of these flags are skipped.
+    :type exclude_flags: int
+    :param min_mapq: Reads with a mapping quality lower than this value are skipped.
+    :type min_mapq: int
+    :param output_format: The output format: "depth", "bedgraph", "regions" or "store".
+    :type output_format: str
+    :param max_depth: Depths above this value are reported with this value. With 0 depths are not limited.
+    :type max_depth: int
+    :param skip_uncovered: If True the units on contigs without any counted read are skipped.
+    :type skip_uncovered: bool
+    :return: Iterator on results in order of units.
+    :rtype: iterator
+    """
+    units_idx_by_chrom = dict()
+    for idx, (chrom, start, end, name) in enumerate(units):
+        units_idx_by_chrom.setdefault(chrom, list()).append(idx)
+    results = dict()
+    next_idx = 0
+    with openAlignmentReader(aln_path, io_threads) as reader:
+        rank_by_chrom = {name: rank for rank, name in enumerate(reader.references)}
+        finished_rank = -1  # Contigs with a lower or equal rank have been processed (file sorted by coordinate)
+        for chrom, depths in iterContigsDepths(reader, exclude_flags, min_mapq):
+            for idx in units_idx_by_chrom.get(chrom, []):
+                unit_chrom, start, end, name = units[idx]
+                unit_depths = numpy.zeros(end - start + 1, dtype=numpy.uint32)
+                sub_depths = depths[start - 1:end]
+                unit_depths[:len(sub_depths)] = sub_depths
+                results[idx] = formatRegion(units[idx], unit_depths, output_format, max_depth)
+            finished_rank = rank_by_chrom[chrom]
+            # Return results available in order of units
+            while next_idx < len(units) and (next_idx in results or rank_by_chrom.get(units[next_idx][0], len(rank_by_chrom)) < finished_rank):
+                if next_idx in results:
+                    yield results.pop(next_idx)
+                elif not skip_uncovered:  # Contig without counted reads
+                    yield formatRegion(units[next_idx], numpy.zeros(units[next_idx][2] - units[next_idx][1] + 1, dtype=numpy.uint32), output_format)
+                next_idx += 1
+    for idx in range(next_idx, len(units)):
+        if idx in results:
+            yield results.pop(idx)
+        elif not skip_uncovered:  # Contig without counted reads
+            yield formatRegion(units[idx], numpy.zeros(units[idx][2] - units[idx][1] + 1, dtype=numpy.uint32), output_format)
+
+
+def processRegion(region):
+    """
+    Return coverage of the region in the format expected by the writer. This function is used in sub-processes initialized by initWorker.
+
+    :param region: The region (chrom, start, end, name) with 1-based positions.
+    :type region: tuple
+    :return: The lines for "depth" and "regions" formats, the runs for "bedgraph" format and the depths for "store" format.
+    :rtype: str or tuple
+    """
+    chrom, start, end, name = region
+    depths = getAlignmentsDepths(WORKER_CONTEXT["reader"], chrom, start, end, WORKER_CONTEXT["exclude_flags"], WORKER_CONTEXT["min_mapq"])
+    return formatRegion(region, depths, WORKER_CONTEXT["output_format"], WORKER_CONTEXT["max_depth"])
+
+
+def writeBedGraph(out_path, results):
+    """
+    Write runs of identical depths in bedGraph. Runs split on units limits are merged.
+
+    :param out_path: Path to the output file (format: bedGraph).
+    :type out_path: str
+    :param results: Iterator on (chrom, start, runs starts, runs ends, runs depths) in order of positions.
+    :type results: iterator
+    """
+    with open(out_path, "w") as handle:
+        pending = None  # [chrom, start, end, depth] with BED coordinates
+        for chrom, start, runs_starts, runs_ends, runs_depths in results:
+            offset = start - 1
+            for run_start, run_end, depth in zip(runs_starts, runs_ends, runs_depths):
+                run_start += offset
+                run_end += offset
+                if pending is not None and pending[0] == chrom and pending[2] == run_start and pending[3] == depth:
+                    pending[2] = run_end
+                else:
+                    if pending is not None:
+                        handle.write("{}\t{}\t{}\t{}\n".format(*pending))
+                    pending = [chrom, run_start, run_end, depth]
+        if pending is not None:
+            handle.write("{}\t{}\t{}\t{}\n".format(*pending))
 
 
 ########################################################################
@@ -248,27 +307,81 @@ class SamtoolsDepthCmd(Cmd):
 ########################################################################
 if __name__ == "__main__":
     # Manage parameters
-    parser = argparse.ArgumentParser(description='Computes the depth at each position or region.')
+    parser = argparse.ArgumentParser(description='Computes the depth at each position or region. Depths are computed from the aligned blocks of reads: deletions and skipped regions are not counted (same as samtools depth).')
+    parser.add_argument('-a', '--all-contigs', action='store_true', help='With the output format "depth", the positions of contigs without any counted read are also reported (same as samtools depth -aa). By default these contigs are skipped (same as samtools depth -a).')
+    parser.add_argument('-d', '--max-depth', type=int, default=100000, help='Depths above this value are reported with this value. Use 0 for no limit. samtools depth -d limits the number of reads loaded at one position: on positions above the limit its depths can be slightly different. [Default: %(default)s]')
+    parser.add_argument('-e', '--exclude-flags', type=int, default=DEFAULT_EXCLUDE_FLAGS, help='Reads with one of these flags are skipped. [Default: %(default)s (unmapped, secondary, QC failed and duplicate)]')
+    parser.add_argument('-f', '--output-format', choices=["bedgraph", "depth", "regions", "store"], help='Format of the output: "depth" for depth at each position in TSV (same as samtools depth -a -d 100000, see --all-contigs and --max-depth), "bedgraph" for runs of identical depth, "regions" for summary by region of the BED (length, mean, min, median and max) and "store" for depths store (see depthStore.py). [Default: from the extension of the output: ".dps" for store, ".bedgraph" and ".bdg" for bedgraph and depth for others]')
+    parser.add_argument('-j', '--nb-jobs', type=int, default=1, help='Number of regions processed in parallel. [Default: %(default)s]')
+    parser.add_argument('-q', '--min-mapq', type=int, default=0, help='Reads with a mapping quality lower than this value are skipped. [Default: %(default)s]')
+    parser.add_argument('-w', '--window-size', type=int, default=1000000, help='Regions longer than this value are split in several units of work. [Default: %(default)s]')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')  # Inputs
-    group_input.add_argument('-i', '--input-bam', required=True, help='The alignment file processed (format: BAM).')
-    group_input.add_argument('-b', '--input-bed', help='Compute depth at list of positions or regions in specified file (format: BED).')
+    group_input.add_argument('-i', '--input-bam', required=True, help='The alignment file processed (format: BAM). If it is not indexed, it must be sorted by coordinate and it is read in only one pass without parallelism (one contig at a time in memory).')
+    group_input.add_argument('-b', '--input-bed', help='Compute depth at list of positions or regions in specified file (format: BED). [Default: all positions of all contigs]')
     group_output = parser.add_argument_group('Outputs')  # outputs
-    group_output.add_argument('-o', '--output-cov', required=True, help='The coverage file (format: TSV).')
+    group_output.add_argument('-o', '--output-cov', required=True, help='The coverage file (format: see --output-format).')
+    addIOArguments(parser, with_output=False)
     args = parser.parse_args()
+    if args.output_format is None:
+        args.output_format = getOutputFormat(args.output_cov)
+    if args.output_format == "regions" and args.input_bed is None:
+        parser.error('The output format "regions" requires "--input-bed".')
 
     # Logger
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s -- [%(name)s][pid:%(process)d][%(levelname)s] -- %(message)s')
-    logger = logging.getLogger(os.path.basename(__file__))
+    logging.basicConfig(format='%(asctime)s -- [%(filename)s][pid:%(process)d][%(levelname)s] -- %(message)s')
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.INFO)
+    log.info("Command: " + " ".join(sys.argv))
+
+    # Get regions
+    with openAlignmentReader(args.input_bam) as reader:
+        contigs_length = dict(zip(reader.references, reader.lengths))
+        is_indexed = reader.has_index()
+    if not is_indexed:
+        log.warning("The alignments file is not indexed: it is read in one pass and option --nb-jobs is ignored.")
+    if args.input_bed is None:
+        regions = [(chrom, 1, length, None) for chrom, length in contigs_length.items()]
+    else:
+        areas = getAreas(args.input_bed)
+        if args.output_format == "regions":  # Summary by region of the BED
+            regions = [(area.chrom, area.start, area.end, area.name) for area in areas]
+        else:  # Overlapping regions are merged to output each position once
+            regions = [elt + (None,) for elt in getMergedRegions([(area.chrom, area.start, area.end) for area in areas], list(contigs_length))]
+    if args.output_format == "depth" and not args.all_contigs and is_indexed:
+        covered_contigs = getCoveredContigs(args.input_bam, args.exclude_flags, args.min_mapq, args.io_threads)
+        regions = [elt for elt in regions if elt[0] in covered_contigs]
+    units = regions if args.output_format == "regions" else getWorkUnits(regions, args.window_size)
+    log.info("{} units of work on {} regions".format(len(units), len(regions)))
 
     # Process coverage
-    out_dir = os.path.split(args.output_cov)[0]
-    tmpFiles = TmpFiles(out_dir)
+    worker_params = (args.input_bam, args.io_threads, args.exclude_flags, args.min_mapq, args.output_format, args.max_depth)
+    pool = None
+    if not is_indexed:
+        skip_uncovered = args.output_format == "depth" and not args.all_contigs
+        results = iterStreamedResults(args.input_bam, units, args.io_threads, args.exclude_flags, args.min_mapq, args.output_format, args.max_depth, skip_uncovered)
+    elif args.nb_jobs > 1:
+        pool = Pool(args.nb_jobs, initWorker, worker_params)
+        results = pool.imap(processRegion, units, chunksize=max(1, min(64, len(units) // (args.nb_jobs * 4))))
+    else:
+        initWorker(*worker_params)
+        results = map(processRegion, units)
     try:
-        tmp_bam = tmpFiles.add("filtered.bam")
-        SamtoolsViewCmd(args.input_bam, tmp_bam, "256").submit(logger)
-        SamtoolsDepthCmd(tmp_bam, args.output_cov, args.input_bed).submit(logger)
+        if args.output_format == "store":
+            sample = os.path.basename(args.input_bam).split(".")[0]
+            with DepthStoreWriter(args.output_cov, [sample], contigs_length) as writer:
+                for chrom, start, depths in results:
+                    writer.write(chrom, start, depths)
+        elif args.output_format == "bedgraph":
+            writeBedGraph(args.output_cov, results)
+        else:
+            with open(args.output_cov, "w") as handle:
+                if args.output_format == "regions":
+                    handle.write("#Chromosome\tStart\tEnd\tName\tLength\tMean_depth\tMin_depth\tMedian_depth\tMax_depth\n")
+                for lines in results:
+                    handle.write(lines)
     finally:
-        tmpFiles.deleteAll()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    log.info("End of job")
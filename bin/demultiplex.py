@@ -19,7 +19,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.0'
+__version__ = '2.0.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -27,8 +27,9 @@ __status__ = 'prod'
 import os
 import re
 import argparse
-import subprocess
-from anacore.sequenceIO import FastqIO
+from concurrent.futures import ThreadPoolExecutor
+from bufferedIO import BufferedWriter
+from demultiplexer import AnchoredBarcodesMatcher, iterPairs, recordToString
 
 
 ########################################################################
@@ -54,32 +55,6 @@ def getBarcodes(in_barcodes):
                 })
     return barcodes
 
-def get_seq_ids(fastq_path):
-    ids = list()
-    with FastqIO(fastq_path) as FH:
-        for record in FH:
-            ids.append(record.id)
-    return ids
-
-def pickSequences(in_path, out_path, retained_ids):
-    dict_retained_ids = {curr_id: 1 for curr_id in retained_ids}
-    with FastqIO(out_path, "w") as FH_out:
-        with FastqIO(in_path) as FH_in:
-            for record in FH_in:
-                if record.id in dict_retained_ids:
-                    FH_out.write(record)
-
-def cutadapt(in_fastq, out_fastq, adapter_seq, error_rate=0.1):
-    cmd = [
-        "cutadapt",
-        "--error-rate", str(error_rate),
-        "-g", adapter_seq,
-        "--discard-untrimmed",
-        "-o", out_fastq,
-        in_fastq
-    ]
-    subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
-
 def getLibNameFromReadPath(fastq_path):
     library_name = os.path.basename(fastq_path).split(".")[0]
     if re.search('_[rR][1-2]$', library_name):
@@ -101,6 +76,7 @@ if __name__ == "__main__":
     # Manage parameters
     parser = argparse.ArgumentParser(description='**************************************.')
     parser.add_argument('-e', '--error-rate', default=0.1, type=float, help='************************************. [Default: %(default)s]')
+    parser.add_argument('-t', '--compression-threads', default=1, type=int, help='Number of threads used to compress outputs with gzip. [Default: %(default)s]')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs') # Inputs
     group_input.add_argument('-b', '--barcodes', required=True, help='************ (format: TSV).')
@@ -109,6 +85,7 @@ if __name__ == "__main__":
     group_output = parser.add_argument_group('Outputs') # Outputs
     group_output.add_argument('-o', '--output-filename-pattern', help='**********************.')
     group_output.add_argument('-d', '--output-dir', default=os.getcwd(), help='**********************. [Default: %(default)s]')
+    group_output.add_argument('-l', '--compression-level', default=6, type=int, choices=range(1, 10), help='Compression level of outputs when their filename pattern ends with ".gz". [Default: %(default)s]')
     args = parser.parse_args()
 
     # Set output variables
@@ -119,41 +96,40 @@ if __name__ == "__main__":
     barcodes = getBarcodes(args.barcodes)
 
     # Demultiplex
-    ids_by_barcodes = dict()
-    for curr_barcode in barcodes:
-        ampl_out_R1 = os.path.join(args.output_dir, args.output_filename_pattern.replace("<R>", "R1").replace("<AMPLI>", curr_barcode["id"]))
-        ampl_out_R2 = os.path.join(args.output_dir, args.output_filename_pattern.replace("<R>", "R2").replace("<AMPLI>", curr_barcode["id"]))
-
-        # Find adapter
-        cutadapt_out_R1 = os.path.join(args.output_dir, "tmp_" + args.output_filename_pattern.replace("<R>", "R1").replace("<AMPLI>", curr_barcode["id"]))
-        cutadapt_out_R2 = os.path.join(args.output_dir, "tmp_" + args.output_filename_pattern.replace("<R>", "R2").replace("<AMPLI>", curr_barcode["id"]))
-        cutadapt(args.R1_path, cutadapt_out_R1, "^" + curr_barcode["fwd"], args.error_rate)
-        cutadapt(args.R2_path, cutadapt_out_R2, "^" + curr_barcode["rvs"], args.error_rate)
-
-        # Select reads for the amplicon
-        R1 = set(get_seq_ids(cutadapt_out_R1))
-        R2 = set(get_seq_ids(cutadapt_out_R2))
-        retained_ids = R1.intersection(R2)
-        ids_by_barcodes[curr_barcode["id"]] = retained_ids
-
-        # Filter
-        pickSequences(args.R1_path, ampl_out_R1, retained_ids)
-        pickSequences(args.R2_path, ampl_out_R2, retained_ids)
-
-        # Clean
-        os.remove(cutadapt_out_R1)
-        os.remove(cutadapt_out_R2)
-
-        print(curr_barcode["id"], len(retained_ids), curr_barcode["fwd"], curr_barcode["rvs"], sep="\t")
-
-    # Check ambiguous
-    ids = dict()
-    non_uniq = dict()
-    for barcode in ids_by_barcodes:
-        for seq_id in ids_by_barcodes[barcode]:
-            if seq_id in ids:
-                if seq_id not in non_uniq:
-                    non_uniq[seq_id] = 1
-                non_uniq[seq_id] += 1
-            ids[seq_id] = 1
-    print("Ambiguous", len(non_uniq), sep="\t")
+    executor = None if args.compression_threads < 2 else ThreadPoolExecutor(args.compression_threads)
+    writers = list()
+    try:
+        for curr_barcode in barcodes:
+            writers.append([
+                BufferedWriter(
+                    os.path.join(args.output_dir, args.output_filename_pattern.replace("<R>", curr_R).replace("<AMPLI>", curr_barcode["id"])),
+                    executor,
+                    compression_level=args.compression_level
+                ) for curr_R in ["R1", "R2"]
+            ])
+        fwd_matcher = AnchoredBarcodesMatcher([elt["fwd"] for elt in barcodes], args.error_rate)
+        rvs_matcher = AnchoredBarcodesMatcher([elt["rvs"] for elt in barcodes], args.error_rate)
+        count_by_barcode = [0 for elt in barcodes]
+        nb_ambiguous = 0
+        for R1, R2 in iterPairs(args.R1_path, args.R2_path):
+            R1_matches = fwd_matcher.getMatches(R1[2])
+            if len(R1_matches) != 0:
+                R2_matches = rvs_matcher.getMatches(R2[2])
+                retained_barcodes = [idx for idx in R1_matches if idx in R2_matches]
+                if len(retained_barcodes) > 1:
+                    nb_ambiguous += 1
+                for barcode_idx in retained_barcodes:
+                    count_by_barcode[barcode_idx] += 1
+                    writers[barcode_idx][0].write(recordToString(R1))
+                    writers[barcode_idx][1].write(recordToString(R2))
+    finally:
+        for R1_writer, R2_writer in writers:
+            R1_writer.close()
+            R2_writer.close()
+        if executor is not None:
+            executor.shutdown()
+
+    # Display counts
+    for curr_barcode, count in zip(barcodes, count_by_barcode):
+        print(curr_barcode["id"], count, curr_barcode["fwd"], curr_barcode["rvs"], sep="\t")
+    print("Ambiguous", nb_ambiguous, sep="\t")
@@ -0,0 +1,351 @@
+#
+# Copyright (C) 2021 IUCT-O
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Classes to demultiplex reads pairs on barcodes in one pass shared by scripts."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.2.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import gzip
+import itertools
+from anacore.sequenceIO import isGzip
+
+
+IUPAC = {
+    "A": "A", "C": "C", "G": "G", "T": "T",
+    "R": "AG", "Y": "CT", "S": "CG", "W": "AT", "K": "GT", "M": "AC",
+    "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG", "N": "ACGT"
+}
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class AnchoredBarcodesMatcher:
+    """
+    Find the barcodes anchored at the start of reads with the same rules as cutadapt with an anchored 5' adapter ("-g ^BARCODE"): the whole barcode must be aligned from the first nucleotide of the read with at most int(error_rate * length) substitutions, insertions or deletions. IUPAC codes in barcodes are wildcards and they are not counted in length used for the maximum number of errors. A N in read is a mismatch.
+
+    For barcodes accepting few errors, all the sequences at the allowed edit distance are precomputed in a lookup table. Otherwise the barcode is split in max_errors + 1 segments and at least one of them must be found without error near its position in read (pigeonhole principle): the candidates selected by this lookup are checked with an edit distance banded on the maximum number of errors. In both cases results are cached by read prefix.
+
+    :Example:
+        matcher = AnchoredBarcodesMatcher(["ACGTACGTAC", "TTGACCAGTA"], 0.1)
+        matcher.getMatches("ACGTCGTACGGATTAGA")  # {0: 1}
+    """
+
+    def __init__(self, barcodes, error_rate=0.1, max_table_errors=1, max_cache_size=1000000):
+        """
+        Build and return an instance of AnchoredBarcodesMatcher.
+
+        :param barcodes: The barcodes sequences.
+        :type barcodes: list
+        :param error_rate: Maximum allowed error rate (number of errors divided by the length of the barcode).
+        :type error_rate: float
+        :param max_table_errors: Barcodes with a maximum number of errors above this value are not precomputed in lookup table.
+        :type max_table_errors: int
+        :param max_cache_size: Maximum number of read prefixes kept in cache.
+        :type max_cache_size: int
+        :return: The new instance.
+        :rtype: AnchoredBarcodesMatcher
+        """
+        self.barcodes = [elt.upper() for elt in barcodes]
+        self.error_rate = error_rate
+        self.max_cache_size = max_cache_size
+        self.max_errors = [int(error_rate * (len(elt) - elt.count("N"))) for elt in self.barcodes]
+        self.window = max([len(elt) + errors for elt, errors in zip(self.barcodes, self.max_errors)], default=0)
+        self._allowed = [[set(IUPAC[nt]) for nt in elt] for elt in self.barcodes]
+        self._table = dict()
+        self._table_lengths = set()
+        self._not_in_table = list()
+        for barcode_idx, barcode in enumerate(self.barcodes):
+            if self.max_errors[barcode_idx] > max_table_errors:
+                self._not_in_table.append(barcode_idx)
+            else:
+                for variant, nb_errors in getVariants(barcode, self.max_errors[barcode_idx]).items():
+                    errors_by_barcode = self._table.setdefault(variant, dict())
+                    errors_by_barcode[barcode_idx] = min(nb_errors, errors_by_barcode.get(barcode_idx, nb_errors))
+                    self._table_lengths.add(len(variant))
+        self._table_lengths = sorted(self._table_lengths)
+        self._segments = dict()
+        self._unfiltered = list()
+        for barcode_idx in self._not_in_table:
+            segments = getSegments(self.barcodes[barcode_idx], self.max_errors[barcode_idx] + 1)
+            if segments is None:
+                self._unfiltered.append(barcode_idx)
+            else:
+                for start, length, sequences in segments:
+                    idx_by_seq = self._segments.setdefault((start, length, self.max_errors[barcode_idx]), dict())
+                    for seq in sequences:
+                        idx_by_seq.setdefault(seq, set()).add(barcode_idx)
+        self._cache = dict()
+
+    def getBest(self, sequence):
+        """
+        Return index of the best barcode at the start of the sequence with the same rules as cutadapt: the barcode with the most matches in its alignment and then with the fewest errors. Remaining ties are resolved with the order of barcodes.
+
+        :param sequence: The read sequence.
+        :type sequence: str
+        :return: Index of the barcode or None if no barcode matches.
+        :rtype: int
+        """
+        matches = self.getMatches(sequence)
+        if len(matches) < 2:
+            return next(iter(matches), None)
+        prefix = sequence[:self.window].upper()
+        alignments = {idx: getAnchoredAlignment(self._allowed[idx], prefix, self.max_errors[idx]) for idx in matches}
+        return min(alignments, key=lambda idx: (-alignments[idx][0], alignments[idx][1], idx))
+
+    def getMatches(self, sequence):
+        """
+        Return the barcodes found at the start of the sequence with their number of errors.
+
+        :param sequence: The read sequence.
+        :type sequence: str
+        :return: By index of barcode the minimum number of errors.
+        :rtype: dict
+        """
+        prefix = sequence[:self.window].upper()
+        matches = self._cache.get(prefix)
+        if matches is None:
+            matches = dict()
+            for length in self._table_lengths:
+                if length > len(prefix):
+                    break
+                errors_by_barcode = self._table.get(prefix[:length])
+                if errors_by_barcode is not None:
+                    for barcode_idx, nb_errors in errors_by_barcode.items():
+                        if nb_errors < matches.get(barcode_idx, nb_errors + 1):
+                            matches[barcode_idx] = nb_errors
+            candidates = set(self._unfiltered)
+            for (start, length, max_shift), idx_by_seq in self._segments.items():
+                for pos in range(max(0, start - max_shift), start + max_shift + 1):
+                    candidates.update(idx_by_seq.get(prefix[pos:pos + length], ()))
+            for barcode_idx in candidates:
+                nb_errors = getAnchoredDistance(self._allowed[barcode_idx], prefix, self.max_errors[barcode_idx])
+                if nb_errors is not None:
+                    matches[barcode_idx] = nb_errors
+            if len(self._cache) >= self.max_cache_size:
+                self._cache = dict()
+            self._cache[prefix] = matches
+        return matches
+
+
+def getAnchoredDistance(allowed, sequence, max_errors):
+    """
+    Return the minimum number of edit operations to align all the barcode on a prefix of the sequence. Only the diagonals reachable with max_errors are computed.
+
+    :param allowed: By position of the barcode the set of nucleotids accepted in read.
+    :type allowed: list
+    :param sequence: The read sequence.
+    :type sequence: str
+    :param max_errors: Maximum number of errors.
+    :type max_errors: int
+    :return: Number of errors or None if it is greater than max_errors.
+    :rtype: int
+    """
+    out_of_band = max_errors + 1
+    nb_cols = min(len(sequence), len(allowed) + max_errors) + 1
+    prev_row = [min(col_idx, out_of_band) for col_idx in range(nb_cols)]
+    for row_idx, allowed_nt in enumerate(allowed, 1):
+        row = [out_of_band] * nb_cols
+        row[0] = min(row_idx, out_of_band)
+        for col_idx in range(max(1, row_idx - max_errors), min(nb_cols, row_idx + out_of_band)):
+            row[col_idx] = min(
+                prev_row[col_idx - 1] + (0 if sequence[col_idx - 1] in allowed_nt else 1),  # Match or substitution
+                prev_row[col_idx] + 1,  # Deletion in read
+                row[col_idx - 1] + 1,  # Insertion in read
+                out_of_band
+            )
+        if min(row) > max_errors:
+            return None
+        prev_row = row
+    nb_errors = min(prev_row)
+    return nb_errors if nb_errors <= max_errors else None
+
+
+def getAnchoredAlignment(allowed, sequence, max_errors):
+    """
+    Return the number of matches and the number of errors of the alignment of all the barcode on a prefix of the sequence selected as cutadapt does: each cell of the dynamic programming keeps the path with the minimum number of errors (match or substitution first, then deletion and then insertion) and the end of the alignment in sequence is the one with the most matches and then with the fewest errors. Only the diagonals reachable with max_errors are computed.
+
+    :param allowed: By position of the barcode the set of nucleotids accepted in read.
+    :type allowed: list
+    :param sequence: The read sequence.
+    :type sequence: str
+    :param max_errors: Maximum number of errors.
+    :type max_errors: int
+    :return: Number of matches and number of errors or None if the number of errors is greater than max_errors for all the prefixes.
+    :rtype: (int, int)
+    """
+    out_of_band = (max_errors + 1, 0)
+    nb_cols = min(len(sequence), len(allowed) + max_errors) + 1
+    prev_row = [(col_idx, 0) if col_idx <= max_errors else out_of_band for col_idx in range(nb_cols)]
+    for row_idx, allowed_nt in enumerate(allowed, 1):
+        row = [out_of_band] * nb_cols
+        row[0] = (row_idx, 0) if row_idx <= max_errors else out_of_band
+        for col_idx in range(max(1, row_idx - max_errors), min(nb_cols, row_idx + max_errors + 1)):
+            diag_errors, diag_matches = prev_row[col_idx - 1]
+            if sequence[col_idx - 1] in allowed_nt:  # Match
+                cell = (diag_errors, diag_matches + 1)
+            else:
+                deletion = prev_row[col_idx]  # Deletion in read
+                insertion = row[col_idx - 1]  # Insertion in read
+                if diag_errors <= deletion[0] and diag_errors <= insertion[0]:  # Substitution
+                    cell = (diag_errors + 1, diag_matches)
+                elif deletion[0] <= insertion[0]:
+                    cell = (deletion[0] + 1, deletion[1])
+                else:
+                    cell = (insertion[0] + 1, insertion[1])
+            row[col_idx] = cell if cell[0] <= max_errors else out_of_band
+        prev_row = row
+    best = None
+    for nb_errors, nb_matches in prev_row:
+        if nb_errors <= max_errors and (best is None or nb_matches > best[0] or (nb_matches == best[0] and nb_errors < best[1])):
+            best = (nb_matches, nb_errors)
+    return best
+
+
+def getSegments(barcode, nb_segments, max_expansion=64):
+    """
+    Return the barcode split in contiguous segments with the sequences of each segment after expansion of IUPAC codes.
+
+    :param barcode: The barcode sequence.
+    :type barcode: str
+    :param nb_segments: Number of segments.
+    :type nb_segments: int
+    :param max_expansion: Maximum number of sequences for one segment.
+    :type max_expansion: int
+    :return: List of (start, length, sequences) or None if the barcode is too short or contains too many wildcards.
+    :rtype: list
+    """
+    if nb_segments > len(barcode):
+        return None
+    segments = list()
+    for segment_idx in range(nb_segments):
+        start = segment_idx * len(barcode) // nb_segments
+        end = (segment_idx + 1) * len(barcode) // nb_segments
+        nb_sequences = 1
+        for nt in barcode[start:end]:
+            nb_sequences *= len(IUPAC[nt])
+        if nb_sequences > max_expansion:
+            return None
+        segments.append((
+            start,
+            end - start,
+            ["".join(elt) for elt in itertools.product(*[IUPAC[nt] for nt in barcode[start:end]])]
+        ))
+    return segments
+
+
+def getVariants(barcode, max_errors, alphabet="ACGTN"):
+    """
+    Return all the sequences at an edit distance lower or equal than max_errors from the barcode. IUPAC codes in barcode are expanded.
+
+    :param barcode: The barcode sequence.
+    :type barcode: str
+    :param max_errors: Maximum number of substitutions, insertions or deletions.
+    :type max_errors: int
+    :param alphabet: Nucleotids used in substitutions and insertions.
+    :type alphabet: str
+    :return: By sequence the edit distance from the barcode.
+    :rtype: dict
+    """
+    distance_by_seq = {"".join(elt): 0 for elt in itertools.product(*[IUPAC[nt] for nt in barcode])}
+    last_level = list(distance_by_seq)
+    for nb_errors in range(1, max_errors + 1):
+        new_level = list()
+        for seq in last_level:
+            for pos in range(len(seq) + 1):
+                edited = list()
+                if pos < len(seq):
+                    edited.append(seq[:pos] + seq[pos + 1:])  # Deletion
+                    edited.extend(seq[:pos] + nt + seq[pos + 1:] for nt in alphabet if nt != seq[pos])  # Substitution
+                edited.extend(seq[:pos] + nt + seq[pos:] for nt in alphabet)  # Insertion
+                for variant in edited:
+                    if variant not in distance_by_seq:
+                        distance_by_seq[variant] = nb_errors
+                        new_level.append(variant)
+        last_level = new_level
+    return distance_by_seq
+
+
+def iterPairs(R1_path, R2_path):
+    """
+    Return a generator on reads pairs from two synchronized fastq files. Headers are parsed like anacore.sequenceIO.FastqIO.
+
+    :param R1_path: Path to the R1 file (format: fastq).
+    :type R1_path: str
+    :param R2_path: Path to the R2 file (format: fastq).
+    :type R2_path: str
+    :return: Generator of pairs of records. Each record is a tuple (id, description, sequence, quality).
+    :rtype: generator
+    """
+    handles = [gzip.open(path, "rt") if isGzip(path) else open(path) for path in (R1_path, R2_path)]
+    try:
+        records = [iterRecords(handle) for handle in handles]
+        for R1, R2 in itertools.zip_longest(*records):
+            if R1 is None or R2 is None:
+                raise IOError('The files "{}" and "{}" do not contain the same number of reads.'.format(R1_path, R2_path))
+            if R1[0] != R2[0]:
+                raise IOError('The reads "{}" and "{}" are not in the same order in "{}" and "{}".'.format(R1[0], R2[0], R1_path, R2_path))
+            yield R1, R2
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def iterRecords(handle):
+    """
+    Return a generator on records of fastq handle.
+
+    :param handle: The file handle.
+    :type handle: file
+    :return: Generator of tuples (id, description, sequence, quality).
+    :rtype: generator
+    """
+    for header, sequence, separator, quality in itertools.zip_longest(*[handle] * 4, fillvalue=""):
+        header = header.strip()
+        if header == "":  # Empty line at the end of file
+            continue
+        fields = header[1:].split(None, 1)
+        yield (
+            fields[0],
+            fields[1] if len(fields) == 2 else None,
+            sequence.strip(),
+            quality.strip()
+        )
+
+
+def recordToString(record):
+    """
+    Return the record in fastq format as written by anacore.sequenceIO.FastqIO.
+
+    :param record: The tuple (id, description, sequence, quality).
+    :type record: tuple
+    :return: The record lines.
+    :rtype: str
+    """
+    seq_id, description, sequence, quality = record
+    return "@{}{}\n{}\n+\n{}\n".format(
+        seq_id,
+        "" if description is None else " " + description,
+        sequence,
+        quality
+    )
@@ -0,0 +1,500 @@
+#
+# Copyright (C) 2021 IUCT-O
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Classes and functions to store depths by position in a compact binary file with random access by region, shared by scripts."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import json
+import zlib
+import numpy
+import struct
+from collections import OrderedDict
+from alignmentIO import openAlignmentReader
+
+MAGIC = b"DPSTORE1"
+DEFAULT_EXCLUDE_FLAGS = 0x704  # Same as samtools depth: UNMAP, SECONDARY, QCFAIL and DUP
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class DepthStoreWriter:
+    """
+    Writer of depths by position for one or several samples. Depths of each contig are stored in fixed size chunks of uint32 by sample. Each chunk is delta encoded and compressed with zlib. The index of chunks and the list of stored regions are written at the end of the file.
+
+    Layout of the file: magic, chunks, index (JSON), offset of the index (uint64 little-endian) and magic. The index is written only by close(): if the writing is interrupted by an exception in a with block (or the writer is never closed) the partial file is removed by abort().
+
+    :Example:
+        with DepthStoreWriter("depths.dps", ["splA", "splB"], {"chr1": 248956422}) as writer:
+            writer.write("chr1", 10001, depths)  # depths is a numpy array of shape (nb_samples, nb_positions)
+    """
+
+    def __init__(self, filepath, samples, contigs_length=None, chunk_size=65536, compression_level=6):
+        """
+        Build and return an instance of DepthStoreWriter.
+
+        :param filepath: Path to the file.
+        :type filepath: str
+        :param samples: Names of the samples in order of depths rows.
+        :type samples: list
+        :param contigs_length: By contig name its length. It is used to keep the order and the length of contigs. Other contigs are added in order of writing.
+        :type contigs_length: dict
+        :param chunk_size: Number of positions by chunk.
+        :type chunk_size: int
+        :param compression_level: zlib compression level (0-9).
+        :type compression_level: int
+        :return: The new instance.
+        :rtype: DepthStoreWriter
+        """
+        self.filepath = filepath
+        self.samples = list(samples)
+        self.chunk_size = chunk_size
+        self.compression_level = compression_level
+        self._contigs = OrderedDict()
+        if contigs_length is not None:
+            for name, length in contigs_length.items():
+                self._contigs[name] = {"name": name, "length": length, "regions": [], "chunks": []}
+        self._curr_contig = None
+        self._curr_chunk_idx = None
+        self._curr_chunk = None
+        self.file_handle = open(filepath, "wb")
+        self.file_handle.write(MAGIC)
+
+    def __del__(self):
+        self.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _flushChunk(self):
+        """Write the current chunk in file."""
+        if self._curr_chunk is None:
+            return
+        deltas = self._curr_chunk.copy()
+        deltas[:, 1:] = numpy.diff(self._curr_chunk, axis=1)  # uint32 wrap around is reversed by cumsum in reader
+        data = zlib.compress(deltas.astype("<u4").tobytes(), self.compression_level)
+        offset = self.file_handle.tell()
+        self.file_handle.write(data)
+        self._contigs[self._curr_contig]["chunks"].append([self._curr_chunk_idx, offset, len(data)])
+        self._curr_chunk_idx = None
+        self._curr_chunk = None
+
+    def abort(self):
+        """Close file handle and remove the partial file. It does nothing if the writer is already closed."""
+        if getattr(self, "file_handle", None) is None:
+            return
+        self.file_handle.close()
+        self.file_handle = None
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+
+    def close(self):
+        """Write the index and close file handle."""
+        if getattr(self, "file_handle", None) is None:
+            return
+        self._flushChunk()
+        for contig in self._contigs.values():
+            if contig["length"] is None:
+                contig["length"] = 0 if len(contig["regions"]) == 0 else contig["regions"][-1][1]
+        index = {
+            "samples": self.samples,
+            "chunk_size": self.chunk_size,
+            "contigs": list(self._contigs.values())
+        }
+        index_offset = self.file_handle.tell()
+        self.file_handle.write(json.dumps(index).encode())
+        self.file_handle.write(struct.pack("<Q", index_offset) + MAGIC)
+        self.file_handle.close()
+        self.file_handle = None
+
+    def write(self, chrom, start, depths):
+        """
+        Write depths of successive positions. Positions of one contig must be written in ascending order without overlap and all the positions of one contig must be written before the next contig.
+
+        :param chrom: The contig name.
+        :type chrom: str
+        :param start: Position of the first depth (1-based).
+        :type start: int
+        :param depths: Depths by sample and by position: shape (nb_samples, nb_positions). A one dimension array can be used with only one sample.
+        :type depths: numpy.array
+        """
+        depths = numpy.asarray(depths, dtype=numpy.uint32)
+        if depths.ndim == 1:
+            depths = depths.reshape(1, -1)
+        if depths.shape[0] != len(self.samples):
+            raise ValueError("Depths must contain {} rows (one by sample) instead of {}.".format(len(self.samples), depths.shape[0]))
+        nb_pos = depths.shape[1]
+        if nb_pos == 0:
+            return
+        # Manage contig
+        if chrom != self._curr_contig:
+            self._flushChunk()
+            if chrom not in self._contigs:
+                self._contigs[chrom] = {"name": chrom, "length": None, "regions": [], "chunks": []}
+            elif len(self._contigs[chrom]["regions"]) != 0:
+                raise ValueError("All the depths of the contig {} must be written before the next contig.".format(chrom))
+            self._curr_contig = chrom
+        # Manage regions
+        regions = self._contigs[chrom]["regions"]
+        end = start + nb_pos - 1
+        if len(regions) != 0 and start <= regions[-1][1]:
+            raise ValueError("Depths on {}:{}-{} must be written in ascending order without overlap.".format(chrom, start, end))
+        if len(regions) != 0 and start == regions[-1][1] + 1:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+        # Fill chunks
+        offset = 0
+        pos = start - 1  # 0-based
+        while offset < nb_pos:
+            chunk_idx = pos // self.chunk_size
+            if chunk_idx != self._curr_chunk_idx:
+                self._flushChunk()
+                self._curr_chunk_idx = chunk_idx
+                self._curr_chunk = numpy.zeros((len(self.samples), self.chunk_size), dtype=numpy.uint32)
+            chunk_offset = pos - chunk_idx * self.chunk_size
+            nb_copied = min(self.chunk_size - chunk_offset, nb_pos - offset)
+            self._curr_chunk[:, chunk_offset:chunk_offset + nb_copied] = depths[:, offset:offset + nb_copied]
+            offset += nb_copied
+            pos += nb_copied
+
+
+class DepthStoreReader:
+    """
+    Reader on depths store produced by DepthStoreWriter. Only the chunks overlapping the requested regions are read and decoded chunks are kept in a LRU cache.
+
+    :Example:
+        with DepthStoreReader("depths.dps") as reader:
+            depths = reader.get("chr1", 10001, 10100)  # numpy array of shape (nb_samples, 100)
+    """
+
+    def __init__(self, filepath, max_chunks=64):
+        """
+        Build and return an instance of DepthStoreReader.
+
+        :param filepath: Path to the file.
+        :type filepath: str
+        :param max_chunks: Maximum number of decoded chunks kept in memory.
+        :type max_chunks: int
+        :return: The new instance.
+        :rtype: DepthStoreReader
+        """
+        self.filepath = filepath
+        self.max_chunks = max_chunks
+        self._chunks = OrderedDict()
+        self.file_handle = open(filepath, "rb")
+        if self.file_handle.read(len(MAGIC)) != MAGIC:
+            raise IOError("The file {} is not a depths store.".format(filepath))
+        self.file_handle.seek(-(8 + len(MAGIC)), 2)
+        if self.file_handle.read(8 + len(MAGIC))[8:] != MAGIC:
+            raise IOError("The depths store {} is truncated.".format(filepath))
+        self.file_handle.seek(-(8 + len(MAGIC)), 2)
+        index_offset = struct.unpack("<Q", self.file_handle.read(8))[0]
+        index_end = self.file_handle.tell() - 8
+        self.file_handle.seek(index_offset)
+        index = json.loads(self.file_handle.read(index_end - index_offset).decode())
+        self.samples = index["samples"]
+        self.chunk_size = index["chunk_size"]
+        self.contigs = OrderedDict()
+        for contig in index["contigs"]:
+            contig["chunks"] = {chunk_idx: (offset, size) for chunk_idx, offset, size in contig["chunks"]}
+            self.contigs[contig["name"]] = contig
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _getChunk(self, chrom, chunk_idx):
+        """
+        Return the decoded depths of the chunk or None if the chunk does not contain any stored position.
+
+        :param chrom: The contig name.
+        :type chrom: str
+        :param chunk_idx: Index of the chunk on the contig (0-based).
+        :type chunk_idx: int
+        :return: Depths by sample and by position of the chunk.
+        :rtype: numpy.array
+        """
+        key = (chrom, chunk_idx)
+        if key in self._chunks:
+            self._chunks.move_to_end(key)
+        else:
+            chunk_pos = self.contigs[chrom]["chunks"].get(chunk_idx) if chrom in self.contigs else None
+            depths = None
+            if chunk_pos is not None:
+                self.file_handle.seek(chunk_pos[0])
+                deltas = numpy.frombuffer(zlib.decompress(self.file_handle.read(chunk_pos[1])), dtype="<u4")
+                depths = numpy.cumsum(deltas.reshape(len(self.samples), self.chunk_size), axis=1, dtype=numpy.uint32)
+            self._chunks[key] = depths
+            if len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+        return self._chunks[key]
+
+    def close(self):
+        """Close file handle and clear cache."""
+        if getattr(self, "file_handle", None) is not None:
+            self.file_handle.close()
+            self.file_handle = None
+        self._chunks = OrderedDict()
+
+    def get(self, chrom, start, end):
+        """
+        Return depths on the region. Positions not stored have a depth of 0.
+
+        :param chrom: The contig name.
+        :type chrom: str
+        :param start: The start position of the region (1-based).
+        :type start: int
+        :param end: The end position of the region (1-based).
+        :type end: int
+        :return: Depths by sample and by position: shape (nb_samples, end - start + 1).
+        :rtype: numpy.array
+        """
+        start = max(start, 1)
+        depths = numpy.zeros((len(self.samples), max(0, end - start + 1)), dtype=numpy.uint32)
+        if start > end:
+            return depths
+        for chunk_idx in range((start - 1) // self.chunk_size, (end - 1) // self.chunk_size + 1):
+            chunk = self._getChunk(chrom, chunk_idx)
+            if chunk is not None:
+                chunk_start = chunk_idx * self.chunk_size + 1
+                sub_start = max(start, chunk_start)
+                sub_end = min(end, chunk_start + self.chunk_size - 1)
+                depths[:, sub_start - start:sub_end - start + 1] = chunk[:, sub_start - chunk_start:sub_end - chunk_start + 1]
+        return depths
+
+    def getRegions(self, chrom=None):
+        """
+        Return the regions stored in file.
+
+        :param chrom: Return only regions on this contig. Default: all contigs.
+        :type chrom: str
+        :return: The list of regions (chrom, start, end) with 1-based positions.
+        :rtype: list
+        """
+        contigs = self.contigs.values() if chrom is None else [self.contigs[chrom]] if chrom in self.contigs else []
+        return [(contig["name"], start, end) for contig in contigs for start, end in contig["regions"]]
+
+    def iterBlocks(self, regions=None):
+        """
+        Return an iterator on depths of the regions. Regions are split on chunks boundaries to limit memory usage on large regions.
+
+        :param regions: The list of regions (chrom, start, end) with 1-based positions. Default: all the regions stored in file.
+        :type regions: list
+        :return: Generator of (chrom, start, end, depths) where depths has the shape (nb_samples, end - start + 1).
+        :rtype: generator
+        """
+        if regions is None:
+            regions = self.getRegions()
+        for chrom, start, end in regions:
+            block_start = max(start, 1)
+            while block_start <= end:
+                block_end = min(end, ((block_start - 1) // self.chunk_size + 1) * self.chunk_size)
+                yield chrom, block_start, block_end, self.get(chrom, block_start, block_end)
+                block_start = block_end + 1
+
+    def length(self, chrom):
+        """
+        Return the length of the contig.
+
+        :param chrom: The contig name.
+        :type chrom: str
+        :return: The length of the contig.
+        :rtype: int
+        """
+        return self.contigs[chrom]["length"]
+
+
+def getAlignmentsDepths(reader, chrom, start, end, exclude_flags=DEFAULT_EXCLUDE_FLAGS, min_mapq=0):
+    """
+    Return depths by position on the region from the aligned blocks of reads (deletions and skipped regions are not counted, as samtools depth without -J).
+
+    :param reader: The reader on alignments file.
+    :type reader: pysam.AlignmentFile
+    :param chrom: The contig name.
+    :type chrom: str
+    :param start: The start position of the region (1-based).
+    :type start: int
+    :param end: The end position of the region (1-based).
+    :type end: int
+    :param exclude_flags: Reads with one of these flags are skipped.
+    :type exclude_flags: int
+    :param min_mapq: Reads with a mapping quality lower than this value are skipped.
+    :type min_mapq: int
+    :return: Depths by position.
+    :rtype: numpy.array
+    """
+    length = end - start + 1
+    blocks_starts = list()
+    blocks_ends = list()
+    for read in reader.fetch(chrom, start - 1, end):
+        if read.flag & exclude_flags == 0 and read.mapping_quality >= min_mapq:
+            for block_start, block_end in read.get_blocks():  # 0-based, end excluded
+                blocks_starts.append(block_start)
+                blocks_ends.append(block_end)
+    if len(blocks_starts) == 0:
+        return numpy.zeros(length, dtype=numpy.uint32)
+    # Blocks outside the region are clipped on the region limits where their start and end cancel each other
+    blocks_starts = numpy.clip(numpy.array(blocks_starts, dtype=numpy.int64) - (start - 1), 0, length)
+    blocks_ends = numpy.clip(numpy.array(blocks_ends, dtype=numpy.int64) - (start - 1), 0, length)
+    diff = numpy.bincount(blocks_starts, minlength=length + 1) - numpy.bincount(blocks_ends, minlength=length + 1)
+    return numpy.cumsum(diff[:-1]).astype(numpy.uint32)
+
+
+def getMergedRegions(regions, contigs_order):
+    """
+    Return regions sorted by contig and start and where overlapping or adjacent regions are merged.
+
+    :param regions: The list of regions (chrom, start, end) with 1-based positions.
+    :type regions: list
+    :param contigs_order: The contigs names in expected order. Contigs missing in this list are placed after the others.
+    :type contigs_order: list
+    :return: The list of merged regions (chrom, start, end).
+    :rtype: list
+    """
+    rank_by_contig = {name: idx for idx, name in enumerate(contigs_order)}
+    merged = list()
+    for chrom, start, end in sorted(regions, key=lambda elt: (rank_by_contig.get(elt[0], len(rank_by_contig)), elt[0], elt[1], elt[2])):
+        if len(merged) != 0 and merged[-1][0] == chrom and start <= merged[-1][2] + 1:
+            merged[-1][2] = max(merged[-1][2], end)
+        else:
+            merged.append([chrom, start, end])
+    return [tuple(elt) for elt in merged]
+
+
+def isDepthStore(filepath):
+    """
+    Return True if the file is a complete depths store: it starts and ends with the magic number.
+
+    :param filepath: Path to the file.
+    :type filepath: str
+    :return: True if the file is a depths store.
+    :rtype: bool
+    """
+    with open(filepath, "rb") as handle:
+        if handle.read(len(MAGIC)) != MAGIC:
+            return False
+        handle.seek(0, 2)
+        if handle.tell() < 2 * len(MAGIC) + 8:
+            return False
+        handle.seek(-len(MAGIC), 2)
+        return handle.read(len(MAGIC)) == MAGIC
+
+
+def writeFromAlignments(aln_paths, out_path, samples, regions=None, exclude_flags=DEFAULT_EXCLUDE_FLAGS, min_mapq=0, io_threads=1, chunk_size=65536, window_size=1048576):
+    """
+    Write depths store directly from alignments files. Regions are processed by windows to limit memory usage on whole contigs.
+
+    :param aln_paths: Paths to the alignments files (format: BAM) in order of samples. They must be indexed.
+    :type aln_paths: list
+    :param out_path: Path to the outputted file.
+    :type out_path: str
+    :param samples: Names of the samples in order of alignments files.
+    :type samples: list
+    :param regions: The list of regions (chrom, start, end) with 1-based positions. Default: all positions of all contigs.
+    :type regions: list
+    :param exclude_flags: Reads with one of these flags are skipped.
+    :type exclude_flags: int
+    :param min_mapq: Reads with a mapping quality lower than this value are skipped.
+    :type min_mapq: int
+    :param io_threads: Number of threads used to decompress each alignments file.
+    :type io_threads: int
+    :param chunk_size: Number of positions by chunk in store.
+    :type chunk_size: int
+    :param window_size: Number of positions processed in one step.
+    :type window_size: int
+    """
+    readers = [openAlignmentReader(path, io_threads) for path in aln_paths]
+    try:
+        contigs_length = OrderedDict(zip(readers[0].references, readers[0].lengths))
+        if regions is None:
+            regions = [(chrom, 1, length) for chrom, length in contigs_length.items()]
+        else:
+            regions = getMergedRegions(regions, list(contigs_length))
+        with DepthStoreWriter(out_path, samples, contigs_length, chunk_size) as writer:
+            for chrom, start, end in regions:
+                end = min(end, contigs_length[chrom])
+                for win_start in range(start, end + 1, window_size):
+                    win_end = min(end, win_start + window_size - 1)
+                    writer.write(
+                        chrom,
+                        win_start,
+                        numpy.vstack([getAlignmentsDepths(reader, chrom, win_start, win_end, exclude_flags, min_mapq) for reader in readers])
+                    )
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+def writeFromDepthFile(in_path, out_path, samples, contigs_length=None, chunk_size=65536, batch_size=65536):
+    """
+    Convert samtools depth output to depths store.
+
+    :param in_path: Path to the samtools depth output (format: TSV). Lines starting with "#" are skipped.
+    :type in_path: str
+    :param out_path: Path to the outputted file.
+    :type out_path: str
+    :param samples: Names of the samples in order of depths columns.
+    :type samples: list
+    :param contigs_length: By contig name its length. Default: the length of each contig is its last position in file.
+    :type contigs_length: dict
+    :param chunk_size: Number of positions by chunk in store.
+    :type chunk_size: int
+    :param batch_size: Maximum number of positions sent in one write.
+    :type batch_size: int
+    """
+    with DepthStoreWriter(out_path, samples, contigs_length, chunk_size) as writer:
+        with open(in_path) as handle:
+            run_chrom = None
+            run_start = None
+            prev_pos = None
+            run_depths = list()
+            for line in handle:
+                if line.startswith("#"):
+                    continue
+                fields = line.rstrip("\r\n").split("\t")
+                chrom = fields[0]
+                pos = int(fields[1])
+                if chrom != run_chrom or pos != prev_pos + 1 or len(run_depths) == batch_size:
+                    if len(run_depths) != 0:
+                        writer.write(run_chrom, run_start, numpy.array(run_depths, dtype=numpy.uint32).T)
+                    run_chrom = chrom
+                    run_start = pos
+                    run_depths = list()
+                run_depths.append([int(elt) for elt in fields[2:]])
+                prev_pos = pos
+            if len(run_depths) != 0:
+                writer.write(run_chrom, run_start, numpy.array(run_depths, dtype=numpy.uint32).T)
@@ -3,7 +3,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2018 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.1.0'
+__version__ = '1.2.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -13,7 +13,9 @@ import json
 import numpy
 import logging
 import argparse
+from anacore.bed import getAreas
 from anacore.sv import SVIO
+from depthStore import DepthStoreReader, getMergedRegions, isDepthStore
 
 
 ########################################################################
@@ -56,6 +58,42 @@ def loadFromDepthFile(in_path, samples):
     return depths_list, count_by_spl
 
 
+def loadFromDepthStore(in_path, samples=None, targets=None):
+    """
+    Load depths classes and count from depths store (see depthStore.py). Only the chunks overlapping the targets are read.
+
+    :param in_path: Path to the depths store.
+    :type in_path: str
+    :param samples: The list of samples names in order of depths rows. Default: the samples names stored in file.
+    :type samples: list
+    :param targets: The list of regions (chrom, start, end) with 1-based positions. Default: all the regions stored in file.
+    :type targets: list
+    :return: The list of depths and by sample the list of counts.
+    :rtype: list, dict
+    """
+    with DepthStoreReader(in_path) as reader:
+        if samples is None:
+            samples = reader.samples
+        elif len(samples) != len(reader.samples):
+            raise ValueError("The depths store {} contains {} samples instead of {}.".format(in_path, len(reader.samples), len(samples)))
+        if targets is not None:
+            targets = getMergedRegions(targets, list(reader.contigs))
+        count_by_depth = [numpy.zeros(0, dtype=numpy.int64) for curr_spl in samples]
+        for chrom, start, end, depths in reader.iterBlocks(targets):
+            for spl_idx, spl_depths in enumerate(depths):
+                block_count = numpy.bincount(spl_depths)
+                if len(block_count) > len(count_by_depth[spl_idx]):
+                    block_count[:len(count_by_depth[spl_idx])] += count_by_depth[spl_idx]
+                    count_by_depth[spl_idx] = block_count
+                else:
+                    count_by_depth[spl_idx][:len(block_count)] += block_count
+    max_len = max(len(elt) for elt in count_by_depth)
+    count_by_depth = numpy.vstack([numpy.pad(elt, (0, max_len - len(elt))) for elt in count_by_depth])
+    depths_list = numpy.flatnonzero(count_by_depth.sum(axis=0))
+    count_by_spl = {curr_spl: count_by_depth[spl_idx, depths_list].tolist() for spl_idx, curr_spl in enumerate(samples)}
+    return depths_list.tolist(), count_by_spl
+
+
 def getDistribution(values, percentile_step=25, precision=4):
     """
     Return the distribution of values (min, max and percentiles).
@@ -262,16 +300,22 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Produce depths metrics (distribution, count by depth and targets under threshold) from the samtools depth output.')
     parser.add_argument('-m', '--min-depth', type=int, default=30, help='Depth threshold used to return the count of nucleotids under this value.')
     parser.add_argument('-p', '--percentiles-step', type=int, default=5, help='The distribution of depths contains this percentile and his multiples.')
-    parser.add_argument('-s', '--samples', required=True, nargs='+', help='The samples names in same order of the depth columns in "--input-depths".')
+    parser.add_argument('-s', '--samples', nargs='+', help='The samples names in same order of the depth columns in "--input-depths". This parameter is required with depths file in TSV. [Default: samples names stored in depths store]')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')  # Inputs
-    group_input.add_argument('-i', '--input-depths', required=True, help='The path to the depths file (format: TSV). This have the same format as samtools depth output and must be processed with -aa option.')
+    group_input.add_argument('-i', '--input-depths', required=True, help='The path to the depths file (format: TSV or depths store). The TSV have the same format as samtools depth output and must be processed with -aa option. The depths store is produced by coverage.py or depthsToStore.py.')
+    group_input.add_argument('-r', '--input-targets', help='The path to the targeted regions (format: BED). Only the depths on these regions are read in depths store. [Default: all the regions stored]')
     group_output = parser.add_argument_group('Outputs')  # Outputs
     group_output.add_argument('-j', '--output-json', help='The path to the outputted file (format: JSON).')
     group_output.add_argument('-t', '--output-tsv', help='The path to the outputted file (format: TSV).')
     args = parser.parse_args()
     if args.output_tsv is None and args.output_json is None:
         parser.error('At least one of the output parameters is required.')
+    is_store = isDepthStore(args.input_depths)
+    if not is_store and args.samples is None:
+        parser.error('The parameter "--samples" is required with depths file in TSV.')
+    if not is_store and args.input_targets is not None:
+        parser.error('The parameter "--input-targets" can only be used with depths store.')
 
     # Logger
     logging.basicConfig(format='%(asctime)s -- [%(filename)s][pid:%(process)d][%(levelname)s] -- %(message)s')
@@ -280,7 +324,13 @@ if __name__ == "__main__":
     log.info("Command: " + " ".join(sys.argv))
 
     # Process
-    depths_list, count_by_spl = loadFromDepthFile(args.input_depths, args.samples)
+    if is_store:
+        targets = None
+        if args.input_targets is not None:
+            targets = [(area.chrom, area.start, area.end) for area in getAreas(args.input_targets)]
+        depths_list, count_by_spl = loadFromDepthStore(args.input_depths, args.samples, targets)
+    else:
+        depths_list, count_by_spl = loadFromDepthFile(args.input_depths, args.samples)
     sequencing_by_spl = getSequencingMetrics(depths_list, count_by_spl)
     distrib_by_spl = getDistribMetrics(depths_list, count_by_spl, args.percentiles_step)
     threshold_by_spl = getThresholdMetrics(depths_list, count_by_spl, args.min_depth)
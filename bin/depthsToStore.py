@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+from depthStore import writeFromDepthFile
+import argparse
+import logging
+import os
+import sys
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getContigsLength(in_fai):
+    """
+    Return by contig name its length from the faidx index.
+
+    :param in_fai: Path to the index of the reference (format: fai).
+    :type in_fai: str
+    :return: By contig name its length.
+    :rtype: dict
+    """
+    contigs_length = dict()
+    with open(in_fai) as handle:
+        for line in handle:
+            fields = line.split("\t")
+            contigs_length[fields[0]] = int(fields[1])
+    return contigs_length
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Convert samtools depth output to depths store. This binary file is compressed and can be read by region in depthsMetrics.py and areaCoverage.py.')
+    parser.add_argument('-c', '--chunk-size', type=int, default=65536, help='Number of positions by chunk in store. [Default: %(default)s]')
+    parser.add_argument('-s', '--samples', required=True, nargs='+', help='The samples names in same order of the depth columns in "--input-depths".')
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    group_input = parser.add_argument_group('Inputs')  # Inputs
+    group_input.add_argument('-i', '--input-depths', required=True, help='The path to the depths file (format: TSV). This have the same format as samtools depth output.')
+    group_input.add_argument('-f', '--input-fai', help='The path to the index of the reference used to keep contigs order and length (format: fai). [Default: contigs are ordered as in depths file and their length is their last position]')
+    group_output = parser.add_argument_group('Outputs')  # Outputs
+    group_output.add_argument('-o', '--output-store', required=True, help='The path to the outputted file (format: depths store).')
+    args = parser.parse_args()
+
+    # Logger
+    logging.basicConfig(format='%(asctime)s -- [%(filename)s][pid:%(process)d][%(levelname)s] -- %(message)s')
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.INFO)
+    log.info("Command: " + " ".join(sys.argv))
+
+    # Process
+    contigs_length = None if args.input_fai is None else getContigsLength(args.input_fai)
+    writeFromDepthFile(args.input_depths, args.output_store, args.samples, contigs_length, args.chunk_size)
+    log.info("End of job")
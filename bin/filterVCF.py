@@ -3,7 +3,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.5.0'
+__version__ = '1.6.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -14,6 +14,7 @@ import logging
 import argparse
 from anacore.filters import filtersFromDict
 from anacore.vcf import VCFIO
+from jobProfiler import addProfilingArguments, JobProfiler
 
 
 ########################################################################
@@ -30,6 +31,7 @@ if __name__ == "__main__":
     group_input.add_argument('-i', '--input-variants', required=True, help='The path to the variants file (format: VCF).')
     group_output = parser.add_argument_group('Outputs')  # Outputs
     group_output.add_argument('-o', '--output-variants', required=True, help='The path to the outputted variants file (format: VCF).')
+    addProfilingArguments(parser)
     args = parser.parse_args()
 
     # Logger
@@ -39,22 +41,27 @@ if __name__ == "__main__":
     log.info("Command: " + " ".join(sys.argv))
 
     # Process
-    filters = None
-    with open(args.input_filters) as data_file:
-        filters = filtersFromDict(json.load(data_file))
-    nb_kept = 0
-    nb_variants = 0
-    with VCFIO(args.output_variants, "w") as FH_out:
-        with VCFIO(args.input_variants) as FH_in:
-            # Header
-            FH_out.copyHeader(FH_in)
-            FH_out.writeHeader()
-            # Records
-            for record in FH_in:
-                nb_variants += 1
-                if filters.eval(record):
-                    nb_kept += 1
-                    FH_out.write(record)
+    with JobProfiler.fromArgs(args, log) as profiler:
+        filters = None
+        with profiler.phase("load_filters"):
+            with open(args.input_filters) as data_file:
+                filters = filtersFromDict(json.load(data_file))
+        nb_kept = 0
+        nb_variants = 0
+        with profiler.phase("filter_variants") as phase:
+            with VCFIO(args.output_variants, "w") as FH_out:
+                with VCFIO(args.input_variants) as FH_in:
+                    # Header
+                    FH_out.copyHeader(FH_in)
+                    FH_out.writeHeader()
+                    # Records
+                    for record in FH_in:
+                        nb_variants += 1
+                        if filters.eval(record):
+                            nb_kept += 1
+                            FH_out.write(record)
+            phase.count("variants", nb_variants)
+            phase.count("kept", nb_kept)
     # Log process
     log.info(
         "{:.2%} of variants have been removed ({}/{})".format(
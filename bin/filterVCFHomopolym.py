@@ -19,7 +19,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2019 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.0'
+__version__ = '1.1.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -28,7 +28,7 @@ import sys
 import logging
 import argparse
 from anacore.vcf import VCFIO, HeaderFilterAttr
-from anacore.sequenceIO import IdxFastaIO
+from mmapSequenceIO import MmapIdxFastaIO
 
 
 ########################################################################
@@ -41,7 +41,7 @@ def isOnHomopolymer(FH_fasta_idx, record, homopolym_length):
     Return True is the variant is adjacent to an homopolymer.
 
     :param FH_fasta_idx: File handle to the reference file.
-    :type FH_fasta_idx: anacore.sequenceIO.IdxFastaIO
+    :type FH_fasta_idx: mmapSequenceIO.MmapIdxFastaIO
     :param record: The variant.
     :type record: anacore.vcf.VCFRecord
     :param homopolym_length: The variant is flagged as adjacent to an homopolymer if the previous or next nucleotid is repeated at least this number of times.
@@ -50,19 +50,19 @@ def isOnHomopolymer(FH_fasta_idx, record, homopolym_length):
     is_on_homopolym = False
     # Check the downstream
     after_start = int(record.refEnd()) + 1
-    after_end = after_start + homopolym_length - 1
-    after = FH_fasta_idx.getSub(record.chrom, after_start, after_end).upper()
-    after_nt = set(after)
-    if len(after_nt) == 1:
-        is_on_homopolym = True
+    after_end = min(after_start + homopolym_length - 1, FH_fasta_idx.length(record.chrom))
+    if after_start <= after_end:
+        after_len = FH_fasta_idx.getHomopolymerLength(record.chrom, after_start)
+        if after_len >= after_end - after_start + 1:
+            is_on_homopolym = True
     # Check the upstream
     if not is_on_homopolym:
         before_end = int(record.refStart() + 0.5) - 1
-        before_start = before_end - homopolym_length + 1
-        before = FH_fasta_idx.getSub(record.chrom, before_start, before_end).upper()
-        before_nt = set(before)
-        if len(before_nt) == 1:
-            is_on_homopolym = True
+        before_start = max(before_end - homopolym_length + 1, 1)
+        if before_start <= before_end:
+            before_len = FH_fasta_idx.getHomopolymerLength(record.chrom, before_end, False)
+            if before_len >= before_end - before_start + 1:
+                is_on_homopolym = True
     return is_on_homopolym
 
 
@@ -95,7 +95,7 @@ if __name__ == "__main__":
     # Process
     nb_variants = 0
     nb_filtered = 0
-    with IdxFastaIO(args.input_reference) as FH_ref:
+    with MmapIdxFastaIO(args.input_reference) as FH_ref:
         with VCFIO(args.input_variants, "r") as FH_in:
             with VCFIO(args.output_variants, "w") as FH_out:
                 # Header
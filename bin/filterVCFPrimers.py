@@ -19,16 +19,16 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.1.0'
+__version__ = '1.2.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
 import argparse
-from copy import deepcopy
 from anacore.bed import BEDIO
-from anacore.sequenceIO import FastaIO
 from anacore.region import Region, RegionList
-from anacore.vcf import VCFIO, getAlleleRecord, HeaderFilterAttr
+from anacore.vcf import VCFIO, VCFRecord, getAlleleRecord, HeaderFilterAttr
+from mmapSequenceIO import getFastaReader
+from regionsIndex import RegionsIndex
 
 
 ########################################################################
@@ -36,31 +36,40 @@ from anacore.vcf import VCFIO, getAlleleRecord, HeaderFilterAttr
 # FUNCTIONS
 #
 ########################################################################
-def canBeMovedToInterest(overlapped_region, ref_seq, variant):
+def canBeMovedToInterest(overlapped_region, seq_handler, variant):
     """
     @summary: Returns True if the variant can be moved out of the primer toward the interest region. This movement keeps the same alternative sequence.
     @param overlapped_region: [Region] The primer. It must contains a location annotation: "upstream" if it is the first primer of the amplicon in reference strand '+' orientation and "downstream" otherwise.
-    @param ref_seq: [str] The reference sequence.
+    @param seq_handler: [MmapIdxFastaIO|InMemoryFastaIO] The reader on reference sequences.
     @param variant: [VCFRecord] The variant.
     @return: [bool] True if the variant can be moved out of the primer toward the interest region.
+    @note: The movement is evaluated on a window containing the primer and the variant. This window is large enough to move the variant out of the primer if it is possible.
     """
+    # Get window on reference
+    margin = len(variant.ref) + len(variant.alt[0]) + 1
+    win_start = max(1, min(overlapped_region.start, variant.pos) - margin)
+    win_end = max(overlapped_region.end, variant.pos + len(variant.ref)) + margin
+    win_seq = seq_handler.getSub(variant.chrom, win_start, win_end)
+    win_variant = VCFRecord(variant.chrom, variant.pos - win_start + 1, None, variant.ref, [variant.alt[0]])
+    # Evaluate movement
     can_be_moved = False
     if overlapped_region.annot["location"] == "upstream":
-        moved_variant = variant.getMostDownstream(ref_seq)
-        if moved_variant.pos > overlapped_region.end:
+        moved_variant = win_variant.getMostDownstream(win_seq)
+        if moved_variant.pos + win_start - 1 > overlapped_region.end:
             can_be_moved = True
     else:
-        moved_variant = variant.getMostUpstream(ref_seq)
+        moved_variant = win_variant.getMostUpstream(win_seq)
+        moved_pos = moved_variant.pos + win_start - 1
         if variant.isInsertion():
             if moved_variant.ref == "-":  # The standardization is ok
-                if moved_variant.pos <= overlapped_region.start:  # Positions can be equals in case where the insertion end the interest area
+                if moved_pos <= overlapped_region.start:  # Positions can be equals in case where the insertion end the interest area
                     can_be_moved = True
             else:  # The standardization has failed
-                if moved_variant.pos + len(moved_variant.ref) - 1 < overlapped_region.start:
+                if moved_pos + len(moved_variant.ref) - 1 < overlapped_region.start:
                     can_be_moved = True
         elif variant.isDeletion():
             if len(moved_variant.alt[0].replace("-", "")):  # The standardization is ok
-                if moved_variant.pos + len(variant.ref) - 1 < overlapped_region.start:
+                if moved_pos + len(variant.ref) - 1 < overlapped_region.start:
                     can_be_moved = True
     return can_be_moved
 
@@ -103,20 +112,6 @@ def getPrimersByChr(in_regions):
             primers_by_chr[record.chrom].append(downstream_primer)
     return primers_by_chr
 
-def getSeqRecord(in_seq, selected_id):
-    """
-    @summary: Returns the selected sequence object from the sequences file.
-    @param in_seq: [str] Path to the sequences file (format: fasta).
-    @param selected_id: [str] The ID of the selected sequence.
-    @return: [Sequence] The selected sequence object.
-    """
-    selected_record = None
-    with FastaIO(in_seq) as FH_in:
-        for record in FH_in:
-            if record.id == selected_id:
-                selected_record = record
-    return selected_record
-
 def getVariantRegion(variant):
     """
     @summary: Returns region object corresponding to the variant.
@@ -124,7 +119,7 @@ def getVariantRegion(variant):
     @return: [Region] The region object corresponding to the variant.
     @warnings: This function can only be used on variant with only one alternative allele.
     """
-    std_variant = deepcopy(variant)
+    std_variant = VCFRecord(variant.chrom, variant.pos, None, variant.ref, [variant.alt[0]])  # Only alleles are normalized: the complete record is not copied
     std_variant.normalizeSingleAllele()
     return Region(
         std_variant.pos,
@@ -144,37 +139,35 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Removes variants located on amplicons primers. The variants defined on primers but with possibility to be move on zone of interest with the same consequences are kept.')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')  # Inputs
-    group_input.add_argument('-i', '--input-variants', required=True, help='Path to the variants file (format: VCF). This file should be sorted by coordinates otherwise the execution time will be dramatically increased.')
+    group_input.add_argument('-i', '--input-variants', required=True, help='Path to the variants file (format: VCF).')
     group_input.add_argument('-r', '--input-regions', required=True, help='Path to the amplicons design with their primers (format: BED). The zone of interest is defined by thickStart and thickEnd. The amplicons must not have any overlap between them.')
-    group_input.add_argument('-s', '--input-sequences', required=True, help='Path to the reference sequences file (format: fasta). The reference used to discover variants.')
+    group_input.add_argument('-s', '--input-sequences', required=True, help='Path to the reference sequences file (format: fasta). The reference used to discover variants. If the faidx index does not exist the file is indexed in memory.')
     group_output = parser.add_argument_group('Outputs')  # Outputs
     group_output.add_argument('-o', '--output-variants', default="filtered.vcf", help='Path to the outputted variants file (format: VCF). [Default: %(default)s]')
     args = parser.parse_args()
 
     # Process
     checkAmpliconsOverlap(args.input_regions)
-    primers_by_chr = getPrimersByChr(args.input_regions)
-    chr_seq = None
-    with VCFIO(args.input_variants) as FH_in:
-        with VCFIO(args.output_variants, "w") as FH_out:
-            # Header
-            FH_out.copyHeader(FH_in)
-            FH_out.filter["PRIM"] = HeaderFilterAttr('PRIM', 'The variant is located on an amplicon primer (amplicon desgin: ' + args.input_regions + ').')
-            FH_out.writeHeader()
-            # Records
-            for record in FH_in:
-                for alt_idx, alt in enumerate(record.alt):
-                    is_kept = True
-                    alt_record = getAlleleRecord(FH_in, record, alt_idx)
-                    alt_region = getVariantRegion(alt_record)
-                    overlapped_primers = primers_by_chr[alt_record.chrom].getOverlapped(alt_region)
-                    if len(overlapped_primers) > 0:  # The variant overlaps a primer or variant is an insertion just before the downstream primer
-                        is_kept = False
-                        if len(overlapped_primers) == 1:  # Variants over 2 primers are removed
-                            if alt_record.isIndel():
-                                if chr_seq is None or chr_seq.id != alt_record.chrom:
-                                    chr_seq = getSeqRecord(args.input_sequences, alt_record.chrom)
-                                if canBeMovedToInterest(overlapped_primers[0], chr_seq.string, alt_record):
-                                    is_kept = True
-                    if is_kept:
-                        FH_out.write(alt_record)
+    primers_idx = RegionsIndex(getPrimersByChr(args.input_regions))
+    with getFastaReader(args.input_sequences) as FH_seq:
+        with VCFIO(args.input_variants) as FH_in:
+            with VCFIO(args.output_variants, "w") as FH_out:
+                # Header
+                FH_out.copyHeader(FH_in)
+                FH_out.filter["PRIM"] = HeaderFilterAttr('PRIM', 'The variant is located on an amplicon primer (amplicon desgin: ' + args.input_regions + ').')
+                FH_out.writeHeader()
+                # Records
+                for record in FH_in:
+                    for alt_idx, alt in enumerate(record.alt):
+                        is_kept = True
+                        alt_record = getAlleleRecord(FH_in, record, alt_idx)
+                        alt_region = getVariantRegion(alt_record)
+                        overlapped_primers = primers_idx.getOverlapped(alt_region.reference.name, alt_region.start, alt_region.end)
+                        if len(overlapped_primers) > 0:  # The variant overlaps a primer or variant is an insertion just before the downstream primer
+                            is_kept = False
+                            if len(overlapped_primers) == 1:  # Variants over 2 primers are removed
+                                if alt_record.isIndel():
+                                    if canBeMovedToInterest(overlapped_primers[0], FH_seq, alt_record):
+                                        is_kept = True
+                        if is_kept:
+                            FH_out.write(alt_record)
@@ -19,7 +19,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '2.1.1'
+__version__ = '2.2.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -28,8 +28,9 @@ import sys
 import logging
 import argparse
 from anacore.vcf import VCFIO, VCFRecord, HeaderFilterAttr
-from anacore.sequenceIO import IdxFastaIO
 from anacore.bed import getSortedAreasByChr
+from mmapSequenceIO import getShiftedVariant, MmapIdxFastaIO
+from regionsIndex import RegionsIndex
 
 
 ########################################################################
@@ -37,47 +38,67 @@ from anacore.bed import getSortedAreasByChr
 # FUNCTIONS
 #
 ########################################################################
-def isOverlapping(regions_by_chr, variant, seq_handler):
+def getNormalizedCoord(record):
     """
-    Return True if the variant overlap one region in regions_by_chr.
+    Return start and end of a normalized record (see anacore.vcf.VCFRecord.normalizeSingleAllele). This function is equivalent to refStart() and refEnd() without copy of the record.
 
-    :param regions_by_chr: By chromosome the list of selected regions. Each list of region is sorted firstly by start position (1-based) and secondly by end position (1-based).
-    :type regions_by_chr: dict
+    :param record: The normalized variant.
+    :type record: anacore.vcf.VCFRecord
+    :return: The first and the last position on reference affected by the alternative allele. For an insertion between two nucleotids the value will be: first nucleotids pos + 0.5.
+    :rtype: (float, float)
+    """
+    if record.ref == VCFRecord.getEmptyAlleleMarker():
+        return record.pos - 0.5, record.pos - 0.5
+    return record.pos, record.pos + len(record.ref) - 1
+
+
+def getShiftedCoord(variant, ref_reader, upstream=True, padding=200):
+    """
+    Return start and end of the variant moved to the most upstream or downstream position. The move is done by mmapSequenceIO.getShiftedVariant on a window of the reference.
+
+    :param variant: The evaluated variant.
+    :type variant: anacore.vcf.VCFRecord
+    :param ref_reader: The reader on reference sequences.
+    :type ref_reader: mmapSequenceIO.MmapIdxFastaIO
+    :param upstream: If True the variant is moved to the most upstream position otherwise it is moved to the most downstream position.
+    :type upstream: bool
+    :param padding: Initial number of nucleotids read before (upstream) or after (downstream) the variant.
+    :type padding: int
+    :return: The first and the last position on reference affected by the moved alternative allele.
+    :rtype: (float, float)
+    """
+    moved = getShiftedVariant(VCFRecord(variant.chrom, variant.pos, None, variant.ref, [variant.alt[0]]), ref_reader, upstream, padding)
+    return getNormalizedCoord(moved)
+
+
+def isOverlapping(targets_idx, variant, ref_reader):
+    """
+    Return True if the variant overlap one target. For indels, the most upstream and the most downstream positions are also evaluated.
+
+    :param targets_idx: The index on selected regions.
+    :type targets_idx: regionsIndex.RegionsIndex
     :param variant: The evaluated variant.
     :type variant: anacore.vcf.VCFRecord
-    :param seq_handler: The file handler on reference sequences file.
-    :type seq_handler: anacore.sequenceIO.IdxFastaIO
+    :param ref_reader: The reader on reference sequences.
+    :type ref_reader: mmapSequenceIO.MmapIdxFastaIO
     :return: True if the variant overlap one region in regions_by_chr.
     :rtype: bool
     """
-    is_overlapping = False
-    if variant.chrom in regions_by_chr:
-        # Standard coordinates
-        variant_start = variant.refStart()
-        variant_end = variant.refEnd()
-        for region in regions_by_chr[variant.chrom]:
-            if variant_end >= region.start and variant_start <= region.end:
-                is_overlapping = True
-        if not is_overlapping and variant.isIndel():
-            chrom_seq = seq_handler.get(variant.chrom).string
-            # Upstream coordinates
-            up_variant = variant.getMostUpstream(chrom_seq)
-            if up_variant.pos != variant.pos or up_variant.ref != variant.ref.replace(VCFRecord.getEmptyAlleleMarker(), ""):
-                variant_start = up_variant.refStart()
-                variant_end = up_variant.refEnd()
-                for region in regions_by_chr[variant.chrom]:
-                    if variant_end >= region.start and variant_start <= region.end:
-                        is_overlapping = True
-            # Downstream coordinates
-            if not is_overlapping:
-                down_variant = variant.getMostDownstream(chrom_seq)
-                if down_variant.pos != variant.pos or down_variant.ref != variant.ref.replace(VCFRecord.getEmptyAlleleMarker(), ""):
-                    variant_start = down_variant.refStart()
-                    variant_end = down_variant.refEnd()
-                    for region in regions_by_chr[variant.chrom]:
-                        if variant_end >= region.start and variant_start <= region.end:
-                            is_overlapping = True
-    return is_overlapping
+    if variant.chrom not in targets_idx:
+        return False
+    # Standard coordinates
+    if targets_idx.hasOverlap(variant.chrom, variant.refStart(), variant.refEnd()):
+        return True
+    if variant.isIndel():
+        # Upstream coordinates
+        up_start, up_end = getShiftedCoord(variant, ref_reader, True)
+        if targets_idx.hasOverlap(variant.chrom, up_start, up_end):
+            return True
+        # Downstream coordinates
+        down_start, down_end = getShiftedCoord(variant, ref_reader, False)
+        if targets_idx.hasOverlap(variant.chrom, down_start, down_end):
+            return True
+    return False
 
 
 ########################################################################
@@ -107,8 +128,8 @@ if __name__ == "__main__":
     # Process
     nb_variants = 0
     nb_kept = 0
-    kept_by_chr = getSortedAreasByChr(args.input_targets)
-    with IdxFastaIO(args.input_reference, use_cache=True) as FH_seq:
+    targets_idx = RegionsIndex(getSortedAreasByChr(args.input_targets))
+    with MmapIdxFastaIO(args.input_reference) as ref_reader:
         with VCFIO(args.input_variants) as FH_in:
             with VCFIO(args.output_variants, "w") as FH_out:
                 # Writes header
@@ -119,7 +140,7 @@ if __name__ == "__main__":
                 for variant in FH_in:
                     nb_variants += 1
                     overlap_targets = False
-                    if isOverlapping(kept_by_chr, variant, FH_seq):
+                    if isOverlapping(targets_idx, variant, ref_reader):
                         nb_kept += 1
                         overlap_targets = True
                     if args.mode == "remove":
@@ -19,7 +19,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2019 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '0.1.0'
+__version__ = '0.2.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'dev'
 
@@ -29,6 +29,7 @@ import sys
 import yaml
 import copy
 import logging
+import itertools
 import argparse
 import hgvs.posedit
 import hgvs.location
@@ -37,6 +38,10 @@ import hgvs.sequencevariant
 import hgvs.dataproviders.uta
 from anacore.annotVcf import AnnotVCFIO
 from anacore.sv import HashedSVIO
+from multiprocessing import Pool
+from persistentCache import PersistentCache
+
+WORKER_CONTEXT = dict()  # Assembly mapper used by getTranscripts and getHGVSCAndP in the current process
 
 
 ########################################################################
@@ -109,6 +114,175 @@ def getHGVSGFromVCFRec(record, chr_accession=None, alt=None):
     )
 
 
+def getHGVSCAndP(params):
+    """
+    Return HGVSc and HGVSp of the variant on the transcript. This function uses the mapper of the current process (see initWorker).
+
+    :param params: HGVSg and transcript accession.
+    :type params: (hgvs.sequencevariant.SequenceVariant, str)
+    :return: HGVSc and HGVSp. HGVSc is None if the variant cannot be mapped on the transcript and HGVSp is None if HGVSc cannot be mapped on protein.
+    :rtype: list
+    """
+    hgvs_g, transcript = params
+    str_hgvs_c = None
+    str_hgvs_p = None
+    try:
+        hgvs_c = WORKER_CONTEXT["mapper"].g_to_c(hgvs_g, transcript)
+        str_hgvs_c = str(hgvs_c)
+        str_hgvs_p = str(WORKER_CONTEXT["mapper"].c_to_p(hgvs_c))
+    except hgvs.exceptions.HGVSUsageError:
+        pass
+    return [str_hgvs_c, str_hgvs_p]
+
+
+def getTranscripts(hgvs_g):
+    """
+    Return the transcripts overlapping the variant. This function uses the mapper of the current process (see initWorker).
+
+    :param hgvs_g: HGVSg.
+    :type hgvs_g: hgvs.sequencevariant.SequenceVariant
+    :return: Transcripts accessions.
+    :rtype: list
+    """
+    return list(WORKER_CONTEXT["mapper"].relevant_transcripts(hgvs_g))
+
+
+def initWorker(assembly_version, input_UTA_config=None):
+    """
+    Open one connection to UTA by process and store the assembly mapper used by getTranscripts and getHGVSCAndP.
+
+    :param assembly_version: Human genome assembly version.
+    :type assembly_version: str
+    :param input_UTA_config: Path to the configuration file for connexion to the UTA database (format: YAML). [Default: Connection to UTA public database]
+    :type input_UTA_config: str
+    """
+    WORKER_CONTEXT["mapper"] = getAssemblyMapper(assembly_version, input_UTA_config)
+
+
+def resolveHGVS(records, acc_by_chrom, annotations_field, assembly_version, transcripts_cache, mappings_cache, map_fct=map):
+    """
+    Return HGVSg by record and allele, transcripts by HGVSg and HGVSc and HGVSp by HGVSg and transcript for all the records of the batch. Duplicated variants are resolved once and only the variants missing in caches are sent to the mapper.
+
+    :param records: The batch of records.
+    :type records: list
+    :param acc_by_chrom: Chromosome RefSeq accession by chromosome name. [Default: the chromosome name in VCF is the RefSeq accession]
+    :type acc_by_chrom: dict
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :param assembly_version: Human genome assembly version.
+    :type assembly_version: str
+    :param transcripts_cache: Cache of transcripts by (assembly, HGVSg).
+    :type transcripts_cache: persistentCache.PersistentCache
+    :param mappings_cache: Cache of [HGVSc, HGVSp] by (assembly, HGVSg, transcript).
+    :type mappings_cache: persistentCache.PersistentCache
+    :param map_fct: The function used to apply the mapper on the missing variants (example: multiprocessing.Pool.map).
+    :type map_fct: function
+    :return: HGVSg by allele for each record, transcripts by transcript base accession for each HGVSg and [HGVSc, HGVSp] by (HGVSg, transcript).
+    :rtype: (list, dict, dict)
+    """
+    # HGVSg by allele
+    hgvs_by_rec = list()
+    hgvs_g_by_str = dict()
+    for record in records:
+        if len(record.alt) > 1:
+            raise Exception("The record {} is multi-allelic.".format(record.getName()))
+        chr_acc = record.chrom if acc_by_chrom is None else acc_by_chrom[record.chrom]
+        std_record = record
+        if record.isIndel():
+            std_record = copy.deepcopy(record)
+            std_record.normalizeSingleAllele()
+        hgvs_by_allele = dict()
+        for annot in record.info[annotations_field]:
+            if annot["Allele"] not in hgvs_by_allele:
+                hgvs_g = getHGVSGFromVCFRec(std_record, chr_acc, annot["Allele"])
+                hgvs_by_allele[annot["Allele"]] = hgvs_g
+                hgvs_g_by_str[str(hgvs_g)] = hgvs_g
+        hgvs_by_rec.append(hgvs_by_allele)
+    # Transcripts by HGVSg
+    transcripts_by_key = transcripts_cache.getOrCompute(
+        {(assembly_version, str_hgvs_g): hgvs_g for str_hgvs_g, hgvs_g in hgvs_g_by_str.items()},
+        getTranscripts,
+        map_fct
+    )
+    transcripts_by_hgvs_g = {
+        str_hgvs_g: {tr.split(".")[0]: tr for tr in transcripts_by_key[(assembly_version, str_hgvs_g)]} for str_hgvs_g in hgvs_g_by_str
+    }
+    # HGVSc and HGVSp by HGVSg and transcript
+    params_by_key = dict()
+    for record, hgvs_by_allele in zip(records, hgvs_by_rec):
+        for annot in record.info[annotations_field]:
+            str_hgvs_g = str(hgvs_by_allele[annot["Allele"]])
+            curr_tr_id = annot["Feature"].split(".")[0]
+            transcripts = transcripts_by_hgvs_g[str_hgvs_g]
+            if curr_tr_id in transcripts:
+                key = (assembly_version, str_hgvs_g, transcripts[curr_tr_id])
+                params_by_key[key] = (hgvs_g_by_str[str_hgvs_g], transcripts[curr_tr_id])
+    mappings_by_key = mappings_cache.getOrCompute(params_by_key, getHGVSCAndP, map_fct)
+    mappings = {key[1:]: value for key, value in mappings_by_key.items()}
+    return hgvs_by_rec, transcripts_by_hgvs_g, mappings
+
+
+def updateRecord(record, hgvs_by_allele, transcripts_by_hgvs_g, mappings, annotations_field):
+    """
+    Fix or add HGVSg, HGVSc and HGVSp in annotations of the record.
+
+    :param record: The record.
+    :type record: anacore.annotVcf.VCFRecord
+    :param hgvs_by_allele: HGVSg by allele of the record.
+    :type hgvs_by_allele: dict
+    :param transcripts_by_hgvs_g: By HGVSg the transcripts accessions by transcript base accession.
+    :type transcripts_by_hgvs_g: dict
+    :param mappings: [HGVSc, HGVSp] by (HGVSg, transcript).
+    :type mappings: dict
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :return: If HGVSg, one HGVSc and one HGVSp have been fixed.
+    :rtype: (bool, bool, bool)
+    """
+    is_fixed_HGVSg = False
+    is_fixed_HGVSc = False
+    is_fixed_HGVSp = False
+    for annot in record.info[annotations_field]:
+        # Trace
+        old = {
+            "g": "" if "HGVSg" not in annot or annot["HGVSg"] is None else annot["HGVSg"],
+            "c": "" if "HGVSc" not in annot or annot["HGVSc"] is None else annot["HGVSc"],
+            "p": "" if "HGVSp" not in annot or annot["HGVSp"] is None else annot["HGVSp"]
+        }
+        # HGVSg
+        str_hgvs_g = str(hgvs_by_allele[annot["Allele"]])
+        new_hgvs_g = str_hgvs_g
+        if not(old["g"] == "" and new_hgvs_g.endswith(":g.?")):
+            if new_hgvs_g.endswith("="):
+                match = re.search(r"\d([ATGCN]+>[ATGCN]+)$", old["c"])
+                new_hgvs_g = new_hgvs_g.replace("=", match.group(1))
+            annot["HGVSg"] = new_hgvs_g
+            if old["g"] != new_hgvs_g:
+                is_fixed_HGVSg = True
+        # HGVSc or HGVSp
+        transcripts = transcripts_by_hgvs_g[str_hgvs_g]
+        curr_tr_id = annot["Feature"].split(".")[0]
+        if curr_tr_id in transcripts:
+            annot["HGVSg"] = str_hgvs_g
+            annot["HGVSc"] = ""
+            annot["HGVSp"] = ""
+            str_hgvs_c, str_hgvs_p = mappings[(str_hgvs_g, transcripts[curr_tr_id])]
+            if str_hgvs_c is not None:
+                if not(old["c"] == "" and str_hgvs_c.endswith(":c.?")):
+                    if str_hgvs_c.endswith("="):
+                        match = re.search(r"\d([ATGCN]+>[ATGCN]+)$", old["c"])
+                        str_hgvs_c = str_hgvs_c.replace("=", match.group(1))
+                    annot["HGVSc"] = str_hgvs_c
+                    if old["c"] != str_hgvs_c:
+                        is_fixed_HGVSc = True
+                if str_hgvs_p is not None:
+                    if not(old["p"] == "" and str_hgvs_p.endswith(":p.?")):
+                        annot["HGVSp"] = str_hgvs_p
+                        if old["p"] != str_hgvs_p:
+                            is_fixed_HGVSp = True
+    return is_fixed_HGVSg, is_fixed_HGVSc, is_fixed_HGVSp
+
+
 ########################################################################
 #
 # MAIN
@@ -119,10 +293,13 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Fix or add HGVSg, HGVSc and HGVSp on variants annotations. The HGVS used are based on biocommons/hgvs.')
     parser.add_argument('-s', '--assembly-version', default="GRCh38", help='Human genome assembly version used in alignment, variants calling and variants annotation. [Default: %(default)s]')
     parser.add_argument('-a', '--annotations-field', default="ANN", help='Field used to store annotations. [Default: %(default)s]')
+    parser.add_argument('-b', '--batch-size', type=int, default=1000, help='Number of records resolved together: duplicated variants in batch are mapped once. [Default: %(default)s]')
+    parser.add_argument('-j', '--nb-jobs', type=int, default=1, help='Number of processes used to query UTA. Each process uses its own connection. [Default: %(default)s]')
     group_input = parser.add_argument_group('Inputs')  # Inputs
     group_input.add_argument('-i', '--input-variants', required=True, help='Path to the variants file (format: VCF).')
     group_input.add_argument('-u', '--input-UTA-config', help='Path to the configuration file for connexion to the UTA database (format: YAML). It must contain dialect, login, password, host, port and database. [Default: Connection to UTA public database]')
     group_input.add_argument('-c', '--input-assembly-accessions', help='Path to the file describing link between chromosome name and RefSeq accession (format: TSV). The header must contain: sequence_id<tab>...<tab>RefSeq_accession where sequence_id is the name of the chromosome in CHROM column of the VCF. [Default: the chromosome name in VCF is the RefSeq accession]')
+    group_input.add_argument('-d', '--input-cache', help='Path to the cache of mappings shared between executions (format: SQLite). It is created if it does not exist. This file must be removed when UTA or seqrepo are updated. [Default: mappings are only cached in memory]')
     group_input.add_argument('-r', '--input-sequence-repository', help='Path to the HGVS seqrepo. [Default: Connection to the public database or the use the repository specified in environment variable $HGVS_SEQREPO_DIR]')
     group_output = parser.add_argument_group('Outputs')  # Outputs
     group_input.add_argument('-o', '--output-variants', required=True, help='Path to the merged variants file (format: VCF).')
@@ -144,98 +321,52 @@ if __name__ == "__main__":
     # Connect to HGVS mapper
     if args.input_sequence_repository is not None:
         os.environ["HGVS_SEQREPO_DIR"] = args.input_sequence_repository
-    hgvs_mapper = getAssemblyMapper(args.assembly_version, args.input_UTA_config)
+    pool = None
+    map_fct = map
+    if args.nb_jobs > 1:  # Each process uses its own connection
+        pool = Pool(args.nb_jobs, initWorker, (args.assembly_version, args.input_UTA_config))
+        map_fct = pool.map
+    else:
+        initWorker(args.assembly_version, args.input_UTA_config)
 
     # Write
     nb_records = {"analysed": 0, "fixed_HGVSg": 0, "fixed_HGVSc": 0, "fixed_HGVSp": 0}
-    with AnnotVCFIO(args.output_variants, "w", annot_field=args.annotations_field) as FH_out:
-        with AnnotVCFIO(args.input_variants, annot_field=args.annotations_field) as FH_in:
-            # Header
-            FH_out.copyHeader(FH_in)
-            if "HGVSg" not in FH_out.ANN_titles:
-                FH_out.ANN_titles.append("HGVSg")
-            if "HGVSc" not in FH_out.ANN_titles:
-                FH_out.ANN_titles.append("HGVSc")
-            if "HGVSp" not in FH_out.ANN_titles:
-                FH_out.ANN_titles.append("HGVSp")
-            FH_out.writeHeader()
-            # Records
-            for record in FH_in:
-                nb_records["analysed"] += 1
-                if len(record.alt) > 1:
-                    raise Exception("The record {} is multi-allelic.".format(record.getName()))
-                chr_acc = acc_by_chrom[record.chrom] if args.input_assembly_accessions else record.chrom
-                hgvs_by_allele = {}
-                std_record = None
-                if record.isIndel():
-                    std_record = copy.deepcopy(record)
-                    std_record.normalizeSingleAllele()
-                # Get HGVSg by annotation allele
-                for annot in record.info[args.annotations_field]:
-                    if annot["Allele"] not in hgvs_by_allele:
-                        hgvs_g = None
-                        if std_record is None:  # is substit
-                            hgvs_g = getHGVSGFromVCFRec(record, chr_acc, annot["Allele"])
-                        else:  # is inDel
-                            hgvs_g = getHGVSGFromVCFRec(std_record, chr_acc, annot["Allele"])
-                        hgvs_by_allele[annot["Allele"]] = {
-                            "HGVSg": hgvs_g,
-                            "transcripts": {tr.split(".")[0]: tr for tr in hgvs_mapper.relevant_transcripts(hgvs_g)},
-                        }
-                # Update annotations
-                is_fixed_HGVSg = False
-                is_fixed_HGVSc = False
-                is_fixed_HGVSp = False
-                for annot in record.info[args.annotations_field]:
-                    # Trace
-                    old = {
-                        "g": "" if "HGVSg" not in annot or annot["HGVSg"] is None else annot["HGVSg"],
-                        "c": "" if "HGVSc" not in annot or annot["HGVSc"] is None else annot["HGVSc"],
-                        "p": "" if "HGVSp" not in annot or annot["HGVSp"] is None else annot["HGVSp"]
-                    }
-                    # HGVSg
-                    hgvs_g = hgvs_by_allele[annot["Allele"]]["HGVSg"]
-                    str_hgvs_g = str(hgvs_g)
-                    if not(old["g"] == "" and str_hgvs_g.endswith(":g.?")):
-                        if str_hgvs_g.endswith("="):
-                            match = re.search("\d([ATGCN]+>[ATGCN]+)$", old["c"])
-                            str_hgvs_g = str_hgvs_g.replace("=", match.group(1))
-                        annot["HGVSg"] = str_hgvs_g
-                        if old["g"] != str_hgvs_g:
-                            is_fixed_HGVSg = True
-                    # HGVSc or HGVSp
-                    transcripts = hgvs_by_allele[annot["Allele"]]["transcripts"]
-                    curr_tr_id = annot["Feature"].split(".")[0]
-                    if curr_tr_id in transcripts:
-                        annot["HGVSg"] = str(hgvs_g)
-                        annot["HGVSc"] = ""
-                        annot["HGVSp"] = ""
-                        try:
-                            hgvs_c = hgvs_mapper.g_to_c(hgvs_g, transcripts[curr_tr_id])
-                            str_hgvs_c = str(hgvs_c)
-                            if not(old["c"] == "" and str_hgvs_c.endswith(":c.?")):
-                                if str_hgvs_c.endswith("="):
-                                    match = re.search("\d([ATGCN]+>[ATGCN]+)$", old["c"])
-                                    str_hgvs_c = str_hgvs_c.replace("=", match.group(1))
-                                annot["HGVSc"] = str_hgvs_c
-                                if old["c"] != str_hgvs_c:
-                                    is_fixed_HGVSc = True
-                            hgvs_p = hgvs_mapper.c_to_p(hgvs_c)
-                            str_hgvs_p = str(hgvs_p)
-                            if not(old["p"] == "" and str_hgvs_p.endswith(":p.?")):
-                                annot["HGVSp"] = str_hgvs_p
-                                if old["p"] != str_hgvs_p:
-                                    is_fixed_HGVSp = True
-                        except hgvs.exceptions.HGVSUsageError:
-                            pass
-                # Trace results
-                if is_fixed_HGVSg:
-                    nb_records["fixed_HGVSg"] += 1
-                if is_fixed_HGVSc:
-                    nb_records["fixed_HGVSc"] += 1
-                if is_fixed_HGVSp:
-                    nb_records["fixed_HGVSp"] += 1
-                FH_out.write(record)
+    try:
+        with PersistentCache(args.input_cache, "transcripts") as transcripts_cache:
+            with PersistentCache(args.input_cache, "mappings") as mappings_cache:
+                with AnnotVCFIO(args.output_variants, "w", annot_field=args.annotations_field) as FH_out:
+                    with AnnotVCFIO(args.input_variants, annot_field=args.annotations_field) as FH_in:
+                        # Header
+                        FH_out.copyHeader(FH_in)
+                        if "HGVSg" not in FH_out.ANN_titles:
+                            FH_out.ANN_titles.append("HGVSg")
+                        if "HGVSc" not in FH_out.ANN_titles:
+                            FH_out.ANN_titles.append("HGVSc")
+                        if "HGVSp" not in FH_out.ANN_titles:
+                            FH_out.ANN_titles.append("HGVSp")
+                        FH_out.writeHeader()
+                        # Records
+                        records = list()
+                        for record in itertools.chain(FH_in, [None]):
+                            if record is not None:
+                                records.append(record)
+                            if len(records) == args.batch_size or (record is None and len(records) != 0):
+                                hgvs_by_rec, transcripts_by_hgvs_g, mappings = resolveHGVS(
+                                    records, acc_by_chrom if args.input_assembly_accessions else None, args.annotations_field,
+                                    args.assembly_version, transcripts_cache, mappings_cache, map_fct
+                                )
+                                for curr_rec, hgvs_by_allele in zip(records, hgvs_by_rec):
+                                    nb_records["analysed"] += 1
+                                    is_fixed = updateRecord(curr_rec, hgvs_by_allele, transcripts_by_hgvs_g, mappings, args.annotations_field)
+                                    for fixed_type, curr_is_fixed in zip(["fixed_HGVSg", "fixed_HGVSc", "fixed_HGVSp"], is_fixed):
+                                        if curr_is_fixed:
+                                            nb_records[fixed_type] += 1
+                                    FH_out.write(curr_rec)
+                                records = list()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
     # Log
     log.info("{}/{} variants have been fixed on HGVSg.".format(nb_records["fixed_HGVSg"], nb_records["analysed"]))
     log.info("{}/{} variants have been fixed on one of their HGVSc.".format(nb_records["fixed_HGVSc"], nb_records["analysed"]))
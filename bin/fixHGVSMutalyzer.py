@@ -3,20 +3,25 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2019 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.2.0'
+__version__ = '1.3.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
 import re
 import os
 import sys
+import time
 import logging
 import argparse
 import requests
+import itertools
+import threading
 import urllib.parse
 from anacore.annotVcf import AnnotVCFIO
 from anacore.sv import HashedSVIO
 from anacore.hgvs import HGVS, RunMutalyzerDescription, RunMutalyzerLegend
+from concurrent.futures import ThreadPoolExecutor
+from persistentCache import PersistentCache
 
 
 ########################################################################
@@ -121,6 +126,183 @@ def getConsistentHGVS(new_hgvs_str, old_hgvs_str):
     return final_hgvs_str
 
 
+class MutalyzerClient:
+    """
+    Client for runMutalyzerLight. Requests are sent concurrently by a pool of threads where each thread reuses its own keep-alive session. The rate of requests can be limited and the responses are stored in cache by (build, HGVSg).
+
+    :Example:
+        with MutalyzerClient("https://mutalyzer.nl", "GRCh38", nb_jobs=4) as client:
+            res_data_by_hgvs = client.getResponses(["NC_000004.12:g.54727447C>T", ...])
+    """
+
+    def __init__(self, url, assembly, proxy_url=None, nb_jobs=4, max_rate=None, cache=None, timeout=120):
+        """
+        Build and return an instance of MutalyzerClient.
+
+        :param url: URL to the mutalyzer server.
+        :type url: str
+        :param assembly: Human genome assembly version.
+        :type assembly: str
+        :param proxy_url: URL to the proxy server.
+        :type proxy_url: str
+        :param nb_jobs: Maximum number of simultaneous requests.
+        :type nb_jobs: int
+        :param max_rate: Maximum number of requests by second. Default: no limit.
+        :type max_rate: float
+        :param cache: Cache of responses. Default: responses are only cached in memory.
+        :type cache: persistentCache.PersistentCache
+        :param timeout: Maximum time in seconds waiting the server.
+        :type timeout: float
+        :return: The new instance.
+        :rtype: MutalyzerClient
+        """
+        self.url = url
+        self.assembly = assembly
+        self.proxies = None if proxy_url is None else {"https": proxy_url, "http": proxy_url}
+        self.nb_jobs = nb_jobs
+        self.min_interval = 0 if max_rate is None else 1 / max_rate
+        self.cache = PersistentCache() if cache is None else cache
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(nb_jobs)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._next_request_time = 0
+        self._sessions = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _getSession(self):
+        """
+        Return the session of the current thread.
+
+        :return: The session.
+        :rtype: requests.Session
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            if self.proxies is not None:
+                session.proxies.update(self.proxies)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _waitRate(self):
+        """Wait until the rate limit allows the next request."""
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_request_time - now
+            self._next_request_time = max(now, self._next_request_time) + self.min_interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def close(self):
+        """Stop threads and close sessions."""
+        self._executor.shutdown()
+        for session in self._sessions:
+            session.close()
+        self._sessions = list()
+
+    def getResponses(self, hgvs_g_list):
+        """
+        Return by HGVSg the response of runMutalyzerLight. Duplicates are removed and only the HGVSg missing in cache are requested.
+
+        :param hgvs_g_list: The HGVSg.
+        :type hgvs_g_list: list
+        :return: By HGVSg the response.
+        :rtype: dict
+        """
+        res_by_key = self.cache.getOrCompute(
+            {(self.assembly, hgvs_g): hgvs_g for hgvs_g in hgvs_g_list},
+            self.request,
+            self._executor.map
+        )
+        return {key[1]: res_data for key, res_data in res_by_key.items()}
+
+    def getURL(self, hgvs_g):
+        """
+        Return the URL of the request for the HGVSg.
+
+        :param hgvs_g: The HGVSg.
+        :type hgvs_g: str
+        :return: The URL.
+        :rtype: str
+        """
+        param_assembly = urllib.parse.quote(self.assembly, safe='')
+        param_hgvsg = urllib.parse.quote(hgvs_g, safe='')
+        param_fields = urllib.parse.quote(",".join(["legend", "proteinDescriptions", "transcriptDescriptions", "genomicDescription"]), safe='')
+        return '{}/json/runMutalyzerLight?build={};variant={};extra={}'.format(self.url, param_assembly, param_hgvsg, param_fields)
+
+    def request(self, hgvs_g):
+        """
+        Return the response of runMutalyzerLight for the HGVSg.
+
+        :param hgvs_g: The HGVSg.
+        :type hgvs_g: str
+        :return: The response.
+        :rtype: dict
+        """
+        url_request = self.getURL(hgvs_g)
+        logging.getLogger(os.path.basename(__file__)).debug(url_request)
+        self._waitRate()
+        response = self._getSession().get(url_request, timeout=self.timeout)
+        if response.status_code != 200:
+            raise Exception("Request {} has failed.".format(url_request))
+        return response.json()
+
+
+def updateRecord(record, HGVS_by_tr, annotations_field="ANN"):
+    """
+    Update HGVSg, HGVSc and HGVSp in annotations of the record from the HGVS returned by mutalyzer. Annotations coming from collocated alternative alleles are removed.
+
+    :param record: Annotated VCF record.
+    :type record: anacore.annotVcf.VCFRecord
+    :param HGVS_by_tr: HGVSg, HGVSc/n and HGVSp by transcript base RefSeq accession (see getHGVSByTr).
+    :type HGVS_by_tr: dict
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :return: If HGVSg, one HGVSc and one HGVSp have been fixed and if the record contained collocated annotations.
+    :rtype: (bool, bool, bool, bool)
+    """
+    is_fixed_HGVSg = False
+    is_fixed_HGVSc = False
+    is_fixed_HGVSp = False
+    contains_colloc_annot = False
+    new_annot = []
+    for annot in record.info[annotations_field]:
+        if annot["Allele"] != record.alt[0]:  # Annotation come from a collocated alternative allele
+            contains_colloc_annot = True
+        else:  # Annotation come from the alternative allele
+            tr_base_acc = annot["Feature"].split(".")[0]
+            if tr_base_acc in HGVS_by_tr:
+                # Trace
+                old = {
+                    "g": "" if "HGVSg" not in annot or annot["HGVSg"] is None else annot["HGVSg"],
+                    "c": "" if "HGVSc" not in annot or annot["HGVSc"] is None else annot["HGVSc"],
+                    "p": "" if "HGVSp" not in annot or annot["HGVSp"] is None else annot["HGVSp"]
+                }
+                # HGVSg
+                annot["HGVSg"] = getConsistentHGVS(HGVS_by_tr[tr_base_acc]["HGVSg"], old["g"])
+                if old["g"] != annot["HGVSg"]:
+                    is_fixed_HGVSg = True
+                # HGVSc
+                annot["HGVSc"] = getConsistentHGVS(HGVS_by_tr[tr_base_acc]["HGVSc"], old["c"])
+                if old["c"] != annot["HGVSc"]:
+                    is_fixed_HGVSc = True
+                # HGVSp
+                annot["HGVSp"] = getConsistentHGVS(HGVS_by_tr[tr_base_acc]["HGVSp"], old["p"])
+                if old["p"] != annot["HGVSp"]:
+                    is_fixed_HGVSp = True
+            new_annot.append(annot)
+    record.info[annotations_field] = new_annot
+    return is_fixed_HGVSg, is_fixed_HGVSc, is_fixed_HGVSp, contains_colloc_annot
+
+
 class LoggerAction(argparse.Action):
     """Manages logger level parameters (The value "INFO" becomes logging.info and so on)."""
 
@@ -148,14 +330,18 @@ if __name__ == "__main__":
     # Manage parameters
     parser = argparse.ArgumentParser(description='Fix or add HGVSg, HGVSc and HGVSp on variants annotations. The HGVS used are based on mutalyzer.')
     parser.add_argument('-a', '--annotations-field', default="ANN", help='Field used to store annotations. [Default: %(default)s]')
+    parser.add_argument('-b', '--batch-size', type=int, default=1000, help='Number of records read before sending their requests. [Default: %(default)s]')
+    parser.add_argument('-j', '--nb-jobs', type=int, default=4, help='Maximum number of simultaneous requests to mutalyzer. [Default: %(default)s]')
     parser.add_argument('-l', '--logging-level', default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], action=LoggerAction, help='The logger level. [Default: %(default)s]')
     parser.add_argument('-m', '--mutalyzer-url', default="https://mutalyzer.nl", help='URL to the mutalizer server. [Default: %(default)s]')
+    parser.add_argument('-r', '--max-rate', type=float, help='Maximum number of requests by second. [Default: no limit]')
     parser.add_argument('-p', '--proxy-url', help='URL to the proxy server if the http(s) connexions are only allowed through a proxy.')
     parser.add_argument('-s', '--assembly-version', default="GRCh38", help='Human genome assembly version used in alignment, variants calling and variants annotation. [Default: %(default)s]')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')  # Inputs
     group_input.add_argument('-i', '--input-variants', required=True, help='Path to the variants file (format: VCF).')
     group_input.add_argument('-c', '--input-assembly-accessions', help='Path to the file describing link between chromosome name and RefSeq accession (format: TSV). The header must contain: sequence_id<tab>...<tab>RefSeq_accession where sequence_id is the name of the chromosome in CHROM column of the VCF. [Default: the chromosome name in VCF is the RefSeq accession]')
+    group_input.add_argument('-d', '--input-cache', help='Path to the cache of mutalyzer responses shared between executions (format: SQLite). It is created if it does not exist. This file must be removed when mutalyzer is updated. [Default: responses are only cached in memory]')
     group_output = parser.add_argument_group('Outputs')  # Outputs
     group_input.add_argument('-o', '--output-variants', required=True, help='Path to the merged variants file (format: VCF).')
     args = parser.parse_args()
@@ -175,7 +361,9 @@ if __name__ == "__main__":
 
     # Write
     nb_records = {"analysed": 0, "fixed_HGVSg": 0, "fixed_HGVSc": 0, "fixed_HGVSp": 0, "contains_colloc_annot": 0}
-    with AnnotVCFIO(args.output_variants, "w", annot_field=args.annotations_field) as FH_out:
+    cache = PersistentCache(args.input_cache, "runMutalyzerLight")
+    client = MutalyzerClient(args.mutalyzer_url, args.assembly_version, args.proxy_url, args.nb_jobs, args.max_rate, cache)
+    with cache, client, AnnotVCFIO(args.output_variants, "w", annot_field=args.annotations_field) as FH_out:
         with AnnotVCFIO(args.input_variants, annot_field=args.annotations_field) as FH_in:
             # Header
             FH_out.copyHeader(FH_in)
@@ -187,78 +375,39 @@ if __name__ == "__main__":
                 FH_out.ANN_titles.append("HGVSp")
             FH_out.writeHeader()
             # Records
-            param_assembly = urllib.parse.quote(args.assembly_version, safe='')
-            for record in FH_in:
-                nb_records["analysed"] += 1
-                if len(record.alt) > 1:
-                    raise Exception("The record {} is multi-allelic.".format(record.getName()))
-                # Get info from mutalyzer
-                old_HGVSg = getHGVSgFromRec(record, acc_by_chrom, FH_in.annot_field)
-                if old_HGVSg is None:
-                    log.warning("The variant {} does not contain any HGVSg.".format(record.getName()))
-                else:
-                    param_hgvsg = urllib.parse.quote(old_HGVSg, safe='')
-                    param_fields = urllib.parse.quote(",".join(["legend", "proteinDescriptions", "transcriptDescriptions", "genomicDescription"]), safe='')
-                    url_request = '{}/json/runMutalyzerLight?build={};variant={};extra={}'.format(args.mutalyzer_url, param_assembly, param_hgvsg, param_fields)
-                    log.debug(url_request)
-                    response = requests.get(
-                        url_request,
-                        proxies=(None if args.proxy_url is None else {"https": args.proxy_url, "http": args.proxy_url})
-                    )
-                    if response.status_code != 200:
-                        raise Exception("Request {} has failed.".format(url_request))
-                    res_data = response.json()
-                    if res_data["errors"] != 0:
-                        log.warning("The variant {} cannot be standardized by mutalyzer because: {}".format(record.getName(), res_data["messages"]))
-                    else:
-                        # Store all HGVS by transcript base accession
-                        mutalyzer_tr = {elt["id"].split(".")[0] for elt in res_data["legend"] if "id" in elt and not elt["id"].startswith("ENS")}
-                        annot_tr = {annot["Feature"].split(".")[0] for annot in record.info[args.annotations_field] if not annot["Feature"].startswith("ENS")}
-                        if len(annot_tr - mutalyzer_tr) != 0:
-                            log.warning("All the transcripts annotated for variant {} cannot be found in used version of mutalyzer. Missing transcripts: {}".format(record.getName(), sorted(annot_tr - mutalyzer_tr)))
-                        HGVS_by_tr = getHGVSByTr(res_data)
-                        # Update annotations
-                        is_fixed_HGVSg = False
-                        is_fixed_HGVSc = False
-                        is_fixed_HGVSp = False
-                        contains_colloc_annot = False
-                        new_annot = []
-                        for annot in record.info[args.annotations_field]:
-                            if annot["Allele"] != record.alt[0]:  # Annotation come from a collocated alternative allele
-                                contains_colloc_annot = True
-                            else:  # Annotation come from the alternative allele
-                                tr_base_acc = annot["Feature"].split(".")[0]
-                                if tr_base_acc in HGVS_by_tr:
-                                    # Trace
-                                    old = {
-                                        "g": "" if "HGVSg" not in annot or annot["HGVSg"] is None else annot["HGVSg"],
-                                        "c": "" if "HGVSc" not in annot or annot["HGVSc"] is None else annot["HGVSc"],
-                                        "p": "" if "HGVSp" not in annot or annot["HGVSp"] is None else annot["HGVSp"]
-                                    }
-                                    # HGVSg
-                                    annot["HGVSg"] = getConsistentHGVS(HGVS_by_tr[tr_base_acc]["HGVSg"], old["g"])
-                                    if old["g"] != annot["HGVSg"]:
-                                        is_fixed_HGVSg = True
-                                    # HGVSc
-                                    annot["HGVSc"] = getConsistentHGVS(HGVS_by_tr[tr_base_acc]["HGVSc"], old["c"])
-                                    if old["c"] != annot["HGVSc"]:
-                                        is_fixed_HGVSc = True
-                                    # HGVSp
-                                    annot["HGVSp"] = getConsistentHGVS(HGVS_by_tr[tr_base_acc]["HGVSp"], old["p"])
-                                    if old["p"] != annot["HGVSp"]:
-                                        is_fixed_HGVSp = True
-                                new_annot.append(annot)
-                        record.info[args.annotations_field] = new_annot
-                        # Trace results
-                        if is_fixed_HGVSg:
-                            nb_records["fixed_HGVSg"] += 1
-                        if is_fixed_HGVSc:
-                            nb_records["fixed_HGVSc"] += 1
-                        if is_fixed_HGVSp:
-                            nb_records["fixed_HGVSp"] += 1
-                        if contains_colloc_annot:
-                            nb_records["contains_colloc_annot"] += 1
-                FH_out.write(record)
+            records = list()
+            for record in itertools.chain(FH_in, [None]):
+                if record is not None:
+                    records.append(record)
+                if len(records) == args.batch_size or (record is None and len(records) != 0):
+                    # Get info from mutalyzer
+                    old_HGVSg_by_rec = [getHGVSgFromRec(curr_rec, acc_by_chrom, FH_in.annot_field) for curr_rec in records]
+                    res_data_by_HGVSg = client.getResponses([elt for elt in old_HGVSg_by_rec if elt is not None])
+                    # Update records in order
+                    for curr_rec, old_HGVSg in zip(records, old_HGVSg_by_rec):
+                        nb_records["analysed"] += 1
+                        if len(curr_rec.alt) > 1:
+                            raise Exception("The record {} is multi-allelic.".format(curr_rec.getName()))
+                        if old_HGVSg is None:
+                            log.warning("The variant {} does not contain any HGVSg.".format(curr_rec.getName()))
+                        else:
+                            res_data = res_data_by_HGVSg[old_HGVSg]
+                            if res_data["errors"] != 0:
+                                log.warning("The variant {} cannot be standardized by mutalyzer because: {}".format(curr_rec.getName(), res_data["messages"]))
+                            else:
+                                # Store all HGVS by transcript base accession
+                                mutalyzer_tr = {elt["id"].split(".")[0] for elt in res_data["legend"] if "id" in elt and not elt["id"].startswith("ENS")}
+                                annot_tr = {annot["Feature"].split(".")[0] for annot in curr_rec.info[args.annotations_field] if not annot["Feature"].startswith("ENS")}
+                                if len(annot_tr - mutalyzer_tr) != 0:
+                                    log.warning("All the transcripts annotated for variant {} cannot be found in used version of mutalyzer. Missing transcripts: {}".format(curr_rec.getName(), sorted(annot_tr - mutalyzer_tr)))
+                                HGVS_by_tr = getHGVSByTr(res_data)
+                                # Update annotations
+                                is_fixed = updateRecord(curr_rec, HGVS_by_tr, args.annotations_field)
+                                for count_type, curr_is_fixed in zip(["fixed_HGVSg", "fixed_HGVSc", "fixed_HGVSp", "contains_colloc_annot"], is_fixed):
+                                    if curr_is_fixed:
+                                        nb_records[count_type] += 1
+                        FH_out.write(curr_rec)
+                    records = list()
     # Log
     if nb_records["contains_colloc_annot"] != 0:
         log.warning("{}/{} variants contain collocated annotation removed during the process.".format(nb_records["contains_colloc_annot"], nb_records["analysed"]))
@@ -19,15 +19,16 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2018 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.1'
+__version__ = '1.1.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
 import json
 import copy
+import zlib
 import argparse
-from anacore.sequenceIO import FastqIO
-from anacore.illumina import getInfFromSeqDesc
+from collections import Counter, deque
+from multiprocessing import Pool
 
 
 ########################################################################
@@ -35,25 +36,122 @@ from anacore.illumina import getInfFromSeqDesc
 # FUNCTIONS
 #
 ########################################################################
-def getCountByBarcode(in_seq):
+def countChunk(chunk, phase):
     """
-    Return the number of reads by barcode in the fastq file.
+    Return the number of reads by barcode in a block of complete fastq lines.
+
+    :param chunk: Complete lines from a fastq file.
+    :type chunk: bytes
+    :param phase: Number of lines before the chunk in file modulo 4.
+    :type phase: int
+    :return: The number of reads by barcode (bytes). An empty barcode is counted with b"".
+    :rtype: collections.Counter
+    """
+    headers = chunk.split(b"\n")[(4 - phase) % 4::4]
+    if len(headers) != 0 and headers[-1] == b"":  # Empty line at the end of file
+        headers.pop()
+    invalid = next((header for header in headers if header[:1] != b"@" or b" " not in header), None)
+    if invalid is not None:
+        raise IOError("The header {} is not an Illumina's header with description.".format(invalid.decode()))
+    # Illumina's description: 1:Y:18:ATCACG
+    return Counter(header[header.rfind(b":") + 1:] for header in headers)
+
+def countFile(in_path, chunk_size=16777216):
+    """
+    Return the number of reads by barcode in one fastq file.
+
+    :param in_path: The path to the sequence file (format: fastq).
+    :type in_path: str
+    :param chunk_size: Number of bytes read by block in file.
+    :type chunk_size: int
+    :return: The number of reads by barcode (bytes). An empty barcode is counted with b"".
+    :rtype: collections.Counter
+    """
+    count_by_barcode = Counter()
+    for chunk, phase in iterChunks([in_path], chunk_size):
+        count_by_barcode.update(countChunk(chunk, phase))
+    return count_by_barcode
+
+def getCountByBarcode(in_seq, nb_jobs=1, chunk_size=16777216):
+    """
+    Return the number of reads by barcode in the fastq file. With several processes, files are shared between processes when there are several inputs (decompression is parallelized), otherwise chunks of the file are counted in parallel.
 
     :param in_seq: The path to the sequence file (format: fastq).
     :type in_seq: int
+    :param nb_jobs: Number of processes.
+    :type nb_jobs: int
+    :param chunk_size: Number of bytes read by block in files.
+    :type chunk_size: int
     :return: The number of reads by barcode.
     :rtype: dict
     """
-    count_by_barcode = dict()
+    count_by_barcode = Counter()
+    if nb_jobs < 2:
+        for curr_seq in in_seq:
+            count_by_barcode.update(countFile(curr_seq, chunk_size))
+    else:
+        pool = Pool(min(nb_jobs, len(in_seq)) if len(in_seq) > 1 else nb_jobs)
+        try:
+            if len(in_seq) > 1:  # Shard by file
+                for curr_count in pool.starmap(countFile, [(curr_seq, chunk_size) for curr_seq in in_seq]):
+                    count_by_barcode.update(curr_count)
+            else:  # Shard by chunk
+                pending = deque()
+                for chunk, phase in iterChunks(in_seq, chunk_size):
+                    pending.append(pool.apply_async(countChunk, (chunk, phase)))
+                    if len(pending) >= 2 * nb_jobs:  # Memory is limited to few chunks by process
+                        count_by_barcode.update(pending.popleft().get())
+                while len(pending) != 0:
+                    count_by_barcode.update(pending.popleft().get())
+        finally:
+            pool.terminate()
+            pool.join()
+    return {(None if barcode == b"" else barcode.decode()): count for barcode, count in count_by_barcode.items()}
+
+def iterChunks(in_seq, chunk_size=16777216):
+    """
+    Return a generator on blocks of complete lines from fastq files. Gzip files are decompressed by raw blocks.
+
+    :param in_seq: The path to the sequence file (format: fastq).
+    :type in_seq: int
+    :param chunk_size: Number of bytes read by block.
+    :type chunk_size: int
+    :return: Generator of tuples (chunk, phase) where phase is the number of lines before the chunk in file modulo 4.
+    :rtype: generator
+    """
     for curr_seq in in_seq:
-        with FastqIO(curr_seq) as FH_in:
-            for record in FH_in:
-                barcode = getInfFromSeqDesc(record.description)["barcode"]
-                if barcode not in count_by_barcode:
-                    count_by_barcode[barcode] = 1
+        with open(curr_seq, "rb") as reader:
+            is_gzip = reader.read(2) == b"\x1f\x8b"
+            reader.seek(0)
+            decompressor = zlib.decompressobj(31) if is_gzip else None
+            phase = 0
+            remaining = b""
+            is_end = False
+            while not is_end:
+                data = reader.read(chunk_size)
+                is_end = len(data) == 0
+                if is_gzip:
+                    raw_data = data
+                    data = b""
+                    while raw_data:
+                        data += decompressor.decompress(raw_data)
+                        raw_data = b""
+                        if decompressor.eof:  # Next member in multi-members gzip
+                            raw_data = decompressor.unused_data
+                            decompressor = zlib.decompressobj(31)
+                data = remaining + data
+                if is_end:
+                    if len(data) != 0:  # Last line without end of line
+                        yield data, phase
                 else:
-                    count_by_barcode[barcode] += 1
-    return count_by_barcode
+                    last_line_end = data.rfind(b"\n")
+                    if last_line_end == -1:
+                        remaining = data
+                    else:
+                        chunk = data[:last_line_end]
+                        remaining = data[last_line_end + 1:]
+                        yield chunk, phase
+                        phase = (phase + chunk.count(b"\n") + 1) % 4
 
 def getTopN(count_by_key, nb_top, is_desc=True):
     """
@@ -131,6 +229,7 @@ def writeSV(data, out_path, separator="\t"):
 if __name__ == "__main__":
     # Manage parameters
     parser = argparse.ArgumentParser(description="Count the number o sequences by barcode in fastq file(s).")
+    parser.add_argument('-j', '--nb-jobs', type=int, default=1, help='The number of processes used to count reads. [Default: %(default)s]')
     parser.add_argument('-m', '--nb-max', type=int, help='The maximum number of barcodes to report. With this option only the top N of most represented barcodes are detailed on output the others are merged inone group.')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')  # Inputs
@@ -144,7 +243,7 @@ if __name__ == "__main__":
         parser.error('"--output-json" and/or "--output-tsv" must be specified.')
 
     # Process
-    count_by_barcode = getCountByBarcode(args.inputs_seq)
+    count_by_barcode = getCountByBarcode(args.inputs_seq, args.nb_jobs)
     data = {
         "count_by_barcode": count_by_barcode,
         "total_count": sum([count for barcode, count in count_by_barcode.items()]),
@@ -0,0 +1,344 @@
+#
+# Copyright (C) 2021 IUCT-O
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Classes and functions to record resources used by each phase of a script (wall time, CPU time, peak RSS, records counts and I/O bytes) in a JSON report, with optional cProfile and tracemalloc dumps."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import json
+import time
+import cProfile
+import datetime
+import resource
+import tracemalloc
+
+PROFILE_ENV = {
+    "output": "ANACORE_UTILS_PROFILE_OUTPUT",
+    "cprofile": "ANACORE_UTILS_PROFILE_CPROFILE",
+    "tracemalloc": "ANACORE_UTILS_PROFILE_TRACEMALLOC"
+}
+
+
+def addProfilingArguments(parser):
+    """
+    Add to the parser the arguments used to enable the profiling of the script. Their default values come from environment variables (see PROFILE_ENV) to enable profiling without changing the command.
+
+    :param parser: The parser of the script.
+    :type parser: argparse.ArgumentParser
+    """
+    group_profiling = parser.add_argument_group('Profiling')
+    group_profiling.add_argument('--profile-output', default=os.environ.get(PROFILE_ENV["output"]), help='Path to the report on resources used by each phase of the script (format: JSON). It can be set with the environment variable {}. [Default: no report]'.format(PROFILE_ENV["output"]))
+    group_profiling.add_argument('--profile-cprofile', default=os.environ.get(PROFILE_ENV["cprofile"]), help='Path to the cProfile statistics of the script (format: pstats). It can be set with the environment variable {}. [Default: no profiling]'.format(PROFILE_ENV["cprofile"]))
+    group_profiling.add_argument('--profile-tracemalloc', type=int, default=int(os.environ.get(PROFILE_ENV["tracemalloc"], 0)), help='Number of lines allocating the largest memory blocks reported by tracemalloc in the report. Tracing memory allocations slows down the script. It can be set with the environment variable {}. [Default: %(default)s]'.format(PROFILE_ENV["tracemalloc"]))
+
+
+def getIOCounters():
+    """
+    Return the number of bytes read and written by the process (all I/O: files, pipes and sockets). Counters come from /proc and are None on systems without procfs.
+
+    :return: Number of bytes read and number of bytes written.
+    :rtype: (int, int)
+    """
+    read_bytes = None
+    written_bytes = None
+    try:
+        with open("/proc/self/io") as reader:
+            for line in reader:
+                key, value = line.split(":")
+                if key == "rchar":
+                    read_bytes = int(value)
+                elif key == "wchar":
+                    written_bytes = int(value)
+    except (OSError, ValueError):
+        pass
+    return read_bytes, written_bytes
+
+
+def getPeakRSS():
+    """
+    Return the peak of resident set size of the process since its start or since the last resetPeakRSS().
+
+    :return: Peak resident set size in kilobytes.
+    :rtype: int
+    """
+    try:
+        with open("/proc/self/status") as reader:
+            for line in reader:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # ru_maxrss is in kilobytes on Linux
+
+
+def resetPeakRSS():
+    """
+    Reset the peak of resident set size of the process to its current value. This operation needs Linux 4.0 or later.
+
+    :return: True if the peak has been reset.
+    :rtype: bool
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as writer:
+            writer.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def getCPUTime():
+    """
+    Return the CPU time (user and system) consumed by the process and its terminated children.
+
+    :return: The CPU time in seconds.
+    :rtype: float
+    """
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return self_usage.ru_utime + self_usage.ru_stime + children_usage.ru_utime + children_usage.ru_stime
+
+
+class Phase:
+    """Resources used by one step of a script. Phases can be nested: the counts go to the innermost phase and the peaks of an inner phase are included in the peaks of the outer phase."""
+
+    def __init__(self, profiler, name):
+        """
+        Build and return an instance of Phase.
+
+        :param profiler: The profiler owning the phase.
+        :type profiler: JobProfiler
+        :param name: Name of the phase.
+        :type name: str
+        :return: The new instance.
+        :rtype: Phase
+        """
+        self.profiler = profiler
+        self.name = name
+        self.counts = {}
+        self.parent = None
+        self._start = None
+        self._peak_rss = 0  # Peak of the phase before the last reset by an inner phase
+        self._tracemalloc_peak = 0  # Peak of the phase before the last reset by an inner phase
+        self.report = None
+
+    def __enter__(self):
+        self.parent = self.profiler._phase
+        self.profiler._phases_stack.append(self)
+        if self.profiler.is_enabled:
+            self._peak_rss = 0
+            self._tracemalloc_peak = 0
+            if self.profiler._tracemalloc_top and hasattr(tracemalloc, "reset_peak"):  # Python >= 3.9
+                if self.parent is not None:  # Peak of the outer phase before the reset
+                    self.parent._tracemalloc_peak = max(self.parent._tracemalloc_peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+            peak_rss = getPeakRSS()  # Peak before the phase
+            self.profiler._peak_rss = max(self.profiler._peak_rss, peak_rss)
+            if self.parent is not None:
+                self.parent._peak_rss = max(self.parent._peak_rss, peak_rss)
+            is_reset = resetPeakRSS()
+            self._start = {
+                "wall_time": time.perf_counter(),
+                "cpu_time": getCPUTime(),
+                "io": getIOCounters(),
+                "peak_rss_is_local": is_reset
+            }
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler._phases_stack.pop()
+        if self.profiler.is_enabled:
+            read_bytes, written_bytes = getIOCounters()
+            peak_rss = max(self._peak_rss, getPeakRSS())
+            self.profiler._peak_rss = max(self.profiler._peak_rss, peak_rss)
+            if self.parent is not None:
+                self.parent._peak_rss = max(self.parent._peak_rss, peak_rss)
+            self.report = {
+                "name": self.name,
+                "parent": None if self.parent is None else self.parent.name,
+                "wall_time_s": round(time.perf_counter() - self._start["wall_time"], 4),
+                "cpu_time_s": round(getCPUTime() - self._start["cpu_time"], 4),
+                "peak_rss_mb": round(peak_rss / 1024, 2),
+                "peak_rss_scope": "phase" if self._start["peak_rss_is_local"] else "process",
+                "read_bytes": None if read_bytes is None else read_bytes - self._start["io"][0],
+                "written_bytes": None if written_bytes is None else written_bytes - self._start["io"][1],
+                "counts": self.counts
+            }
+            if self.profiler._tracemalloc_top:
+                tracemalloc_peak = max(self._tracemalloc_peak, tracemalloc.get_traced_memory()[1])
+                if self.parent is not None:
+                    self.parent._tracemalloc_peak = max(self.parent._tracemalloc_peak, tracemalloc_peak)
+                self.report["tracemalloc_peak_mb"] = round(tracemalloc_peak / 1048576, 2)
+            self.profiler.phases.append(self.report)
+
+    def count(self, key, value=1):
+        """
+        Increment a records counter of the phase.
+
+        :param key: Name of the counter (example: "variants").
+        :type key: str
+        :param value: Added value.
+        :type value: int
+        """
+        self.counts[key] = self.counts.get(key, 0) + value
+
+
+class JobProfiler:
+    """
+    Record resources used by each phase of a script and write them in a JSON report. When no output is provided the profiler is disabled and phases only keep their counts.
+
+    Usage:
+        with JobProfiler.fromArgs(args, log) as profiler:
+            with profiler.phase("load"):
+                ...
+            with profiler.phase("filter") as phase:
+                for record in reader:
+                    phase.count("records")
+    """
+
+    def __init__(self, out_path=None, cprofile_path=None, tracemalloc_top=0, command=None, log=None):
+        """
+        Build and return an instance of JobProfiler.
+
+        :param out_path: Path to the report (format: JSON). With None no report is written.
+        :type out_path: str
+        :param cprofile_path: Path to the cProfile statistics (format: pstats). With None the script is not profiled by cProfile.
+        :type cprofile_path: str
+        :param tracemalloc_top: Number of lines allocating the largest memory blocks in the report. With 0 tracemalloc is not used.
+        :type tracemalloc_top: int
+        :param command: The command line of the script.
+        :type command: str
+        :param log: Logger of the script.
+        :type log: logging.Logger
+        :return: The new instance.
+        :rtype: JobProfiler
+        """
+        self.out_path = out_path
+        self.cprofile_path = cprofile_path
+        self.command = " ".join(sys.argv) if command is None else command
+        self.log = log
+        self.phases = []
+        self.is_enabled = out_path is not None or cprofile_path is not None
+        self._tracemalloc_top = tracemalloc_top if self.is_enabled else 0
+        self._cprofile = None
+        self._phases_stack = []  # Current phase and its outer phases
+        self._peak_rss = 0
+        self._start = None
+
+    @staticmethod
+    def fromArgs(args, log=None):
+        """
+        Return a profiler configured by the arguments added with addProfilingArguments().
+
+        :param args: The namespace extract from the script arguments.
+        :type args: argparse.Namespace
+        :param log: Logger of the script.
+        :type log: logging.Logger
+        :return: The profiler.
+        :rtype: JobProfiler
+        """
+        return JobProfiler(args.profile_output, args.profile_cprofile, args.profile_tracemalloc, log=log)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def _phase(self):
+        """Return the innermost phase in progress or None."""
+        return self._phases_stack[-1] if len(self._phases_stack) != 0 else None
+
+    def count(self, key, value=1):
+        """
+        Increment a records counter of the current phase.
+
+        :param key: Name of the counter (example: "variants").
+        :type key: str
+        :param value: Added value.
+        :type value: int
+        """
+        if self._phase is not None:
+            self._phase.count(key, value)
+
+    def open(self):
+        """Start the measures on the job."""
+        if self.is_enabled:
+            if self._tracemalloc_top:
+                tracemalloc.start()
+            self._start = {
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "wall_time": time.perf_counter(),
+                "cpu_time": getCPUTime(),
+                "io": getIOCounters()
+            }
+            if self.cprofile_path is not None:
+                self._cprofile = cProfile.Profile()
+                self._cprofile.enable()
+
+    def close(self):
+        """Stop the measures, write the cProfile statistics and the JSON report."""
+        if not self.is_enabled or self._start is None:
+            return
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_path)
+            self._cprofile = None
+        read_bytes, written_bytes = getIOCounters()
+        report = {
+            "command": self.command,
+            "pid": os.getpid(),
+            "start": self._start["date"],
+            "wall_time_s": round(time.perf_counter() - self._start["wall_time"], 4),
+            "cpu_time_s": round(getCPUTime() - self._start["cpu_time"], 4),
+            "peak_rss_mb": round(max(self._peak_rss, getPeakRSS()) / 1024, 2),  # The peak can be reset by phases
+            "read_bytes": None if read_bytes is None else read_bytes - self._start["io"][0],
+            "written_bytes": None if written_bytes is None else written_bytes - self._start["io"][1],
+            "phases": self.phases,
+            "cprofile": self.cprofile_path
+        }
+        if self._tracemalloc_top:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            report["tracemalloc"] = [
+                {"location": "{}:{}".format(stat.traceback[0].filename, stat.traceback[0].lineno), "size_mb": round(stat.size / 1048576, 3), "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:self._tracemalloc_top]
+            ]
+        self._start = None
+        if self.out_path is not None:
+            with open(self.out_path, "w") as writer:
+                json.dump(report, writer, indent=2)
+            if self.log is not None:
+                self.log.info("Profiling report written in {}".format(self.out_path))
+
+    def phase(self, name):
+        """
+        Return a context manager measuring the resources used by its block.
+
+        :param name: Name of the phase.
+        :type name: str
+        :return: The phase.
+        :rtype: Phase
+        """
+        return Phase(self, name)
@@ -19,14 +19,14 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.3.1'
+__version__ = '1.4.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
 import re
 import warnings
 import argparse
-from anacore.sequenceIO import *
+from primersLocator import findPatterns, getSmallestAmplicon
 
 
 ########################################################################
@@ -90,11 +90,12 @@ def getAmpliconsFromManifest(manifest_path):
                     amplicons.append(fields)
     return amplicons
 
-def getAmplicons(reference_path, manifest_path):
+def getAmplicons(reference_path, manifest_path, nb_jobs=1):
     """
     @summary: Returns the list of amplicons from a Illumina's manifest.
     @param reference_path: [str] Path to the genome assembly where the amplicon have been defined.
     @param manifest_path: [str] Path to the manifest.
+    @param nb_jobs: [int] Number of chromosomes processed in parallel.
     @return: [list] The amplicons objects.
     """
     complete_amplicons = list()
@@ -119,51 +120,36 @@ def getAmplicons(reference_path, manifest_path):
         )
 
     # Find amplicons coord
-    FH_ref = SequenceFileReader.factory(reference_path)
-    try:
-        for record in FH_ref:
-            record.id = "chr" + record.id ################################################### TODO: clean management for region_prefix
-            if record.id in amplicons_by_chr:
-                chr_str = record.string.upper()
-                for ampli in amplicons_by_chr[record.id]:
-                    up_primer = ampli.up_primer
-                    down_primer = ampli.down_primer
-                    if ampli.strand == "-":
-                        up_primer = revcom(ampli.down_primer)
-                        down_primer = revcom(ampli.up_primer)
-                    # Find positions on chr
-                    upstream_matches = list()
-                    up_pattern = re.compile(up_primer)
-                    for curr_match in up_pattern.finditer(chr_str):
-                        upstream_matches.append({"start": curr_match.start()+1, "end": curr_match.end()})
-                    downstream_matches = list()
-                    down_pattern = re.compile(down_primer)
-                    for curr_match in down_pattern.finditer(chr_str):
-                        downstream_matches.append({"start": curr_match.start()+1, "end": curr_match.end()})
-                    if len(upstream_matches) == 0 or len(downstream_matches) == 0:
-                        raise Exception("The primers '" + up_primer + "' and '" + down_primer + "' cannot be found in " + record.id)
-                    # Check multiple target in chr
-                    if len(upstream_matches) > 1:
-                        match_list = ", ".join(["{}:{}-{}".format(record.id, curr_match["start"], curr_match["end"]) for curr_match in upstream_matches])
-                        warnings.warn("The primer '" + up_primer + "' is found multiple twice in " + record.id + " (" + match_list + ")")
-                    if len(downstream_matches) > 1:
-                        match_list = ", ".join(["{}:{}-{}".format(record.id, curr_match["start"], curr_match["end"]) for curr_match in downstream_matches])
-                        warnings.warn("The primer '" + down_primer + "' is found multiple twice in " + record.id + " (" + match_list + ")")
-                    # Select smaller amplified fragment
-                    prev_length = None
-                    for curr_up in upstream_matches:
-                        for curr_down in downstream_matches:
-                            curr_length = curr_down["start"] - curr_up["end"]
-                            if curr_length >= 0:
-                                if prev_length is None or prev_length > curr_length:
-                                    prev_length = curr_length
-                                    ampli.start = curr_up["start"]
-                                    ampli.end = curr_down["end"]
-                amplicons_on_chr = sorted(amplicons_by_chr[record.id], key=lambda ampl: (ampl.start, ampl.end))
-                complete_amplicons.extend(amplicons_on_chr)
-                del(amplicons_by_chr[record.id])
-    finally:
-        FH_ref.close()
+    patterns_by_chr = dict()
+    for chr, amplicons_on_chr in amplicons_by_chr.items():
+        if chr.startswith("chr"):  # TODO: clean management for region_prefix
+            patterns_by_chr[chr[3:]] = {
+                pattern for ampli in amplicons_on_chr for pattern in (ampli.up_primer, ampli.down_primer, revcom(ampli.up_primer), revcom(ampli.down_primer))
+            }
+    for record_id, hits_by_pattern in findPatterns(reference_path, patterns_by_chr, nb_jobs):
+        record_id = "chr" + record_id
+        for ampli in amplicons_by_chr[record_id]:
+            up_primer = ampli.up_primer
+            down_primer = ampli.down_primer
+            if ampli.strand == "-":
+                up_primer = revcom(ampli.down_primer)
+                down_primer = revcom(ampli.up_primer)
+            # Find positions on chr
+            upstream_matches = hits_by_pattern[up_primer]
+            downstream_matches = hits_by_pattern[down_primer]
+            if len(upstream_matches) == 0 or len(downstream_matches) == 0:
+                raise Exception("The primers '" + up_primer + "' and '" + down_primer + "' cannot be found in " + record_id)
+            # Check multiple target in chr
+            if len(upstream_matches) > 1:
+                match_list = ", ".join(["{}:{}-{}".format(record_id, start, end) for start, end in upstream_matches])
+                warnings.warn("The primer '" + up_primer + "' is found multiple twice in " + record_id + " (" + match_list + ")")
+            if len(downstream_matches) > 1:
+                match_list = ", ".join(["{}:{}-{}".format(record_id, start, end) for start, end in downstream_matches])
+                warnings.warn("The primer '" + down_primer + "' is found multiple twice in " + record_id + " (" + match_list + ")")
+            # Select smaller amplified fragment
+            ampli.start, ampli.end = getSmallestAmplicon(upstream_matches, downstream_matches)
+        amplicons_on_chr = sorted(amplicons_by_chr[record_id], key=lambda ampl: (ampl.start, ampl.end))
+        complete_amplicons.extend(amplicons_on_chr)
 
     return(complete_amplicons)
 
@@ -176,6 +162,7 @@ def getAmplicons(reference_path, manifest_path):
 if __name__ == "__main__":
     # Manage parameters
     parser = argparse.ArgumentParser(description="Converts an Illumina's amplicons manifest in BED format.")
+    parser.add_argument('-j', '--nb-jobs', type=int, default=1, help='Number of chromosomes processed in parallel. [Default: %(default)s]')
     parser.add_argument('-p', '--without-primers', action='store_true', help='Start and end position include only interest area (primers are excluded).')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')  # Inputs
@@ -185,7 +172,7 @@ if __name__ == "__main__":
     group_output.add_argument('-o', '--output-BED', default="amplicons.bed", help='The amplicons description (format: BED). [Default: %(default)s]')
     args = parser.parse_args()
 
-    amplicons = getAmplicons(args.input_genome, args.input_manifest)
+    amplicons = getAmplicons(args.input_genome, args.input_manifest, args.nb_jobs)
     with open(args.output_BED, "w") as FH_out:
         if args.without_primers:
             for ampl in amplicons:
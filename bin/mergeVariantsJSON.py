@@ -19,15 +19,103 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2019 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.1'
+__version__ = '1.1.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
 import os
 import sys
-import json
+import heapq
 import logging
 import argparse
+from variantsJSONIO import iterVariantsJSON, VariantsJSONWriter
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getMergedVariants(in_paths):
+    """
+    Return variants of all files with supports of identical variants merged. All the variants are loaded in memory and they are returned in order of first occurrence.
+
+    :param in_paths: Pathes to the variants files (format: JSON or NDJSON).
+    :type in_paths: list
+    :return: The merged variants.
+    :rtype: list
+    """
+    variants_by_id = {}
+    for curr_json in in_paths:
+        for curr_var in iterVariantsJSON(curr_json):
+            curr_var_id = "{}:{}={}/{}".format(
+                curr_var["coord"]["region"],
+                curr_var["coord"]["pos"],
+                curr_var["coord"]["ref"],
+                curr_var["coord"]["alt"]
+            )
+            if curr_var_id not in variants_by_id:
+                variants_by_id[curr_var_id] = curr_var
+            else:
+                for curr_support in curr_var["supports"]:
+                    variants_by_id[curr_var_id]["supports"].append(curr_support)
+    return [curr_var for curr_id, curr_var in variants_by_id.items()]
+
+
+def iterMergedSortedVariants(in_paths, regions_order=None):
+    """
+    Return a generator on variants of all files with supports of identical variants merged. Files must be sorted by region and position with regions in the same order, variants on the same position can be in any order (example: multi-allelic records in the order of ALT). Only the variants of the current position are kept in memory and variants are returned sorted by position and then by reference and alternative alleles.
+
+    :param in_paths: Pathes to the variants files (format: JSON or NDJSON).
+    :type in_paths: list
+    :param regions_order: Order of regions in files. Regions missing in this list are ranked in order of first occurrence in the heads of files.
+    :type regions_order: list
+    :return: Generator on merged variants.
+    :rtype: generator
+    """
+    rank_by_region = {} if regions_order is None else {region: rank for rank, region in enumerate(regions_order)}
+
+    def getPosKey(variant):
+        coord = variant["coord"]
+        if coord["region"] not in rank_by_region:
+            rank_by_region[coord["region"]] = len(rank_by_region)
+        return (rank_by_region[coord["region"]], coord["pos"])
+
+    readers = [iterVariantsJSON(curr_path) for curr_path in in_paths]
+    heap = []  # Current variant by file: (position key, file index, variant)
+    for idx_in, reader in enumerate(readers):
+        variant = next(reader, None)
+        if variant is not None:
+            heap.append((getPosKey(variant), idx_in, variant))
+    heapq.heapify(heap)
+    while len(heap) != 0:
+        pos_key = heap[0][0]
+        variant_by_allele = {}
+        while len(heap) != 0 and heap[0][0] == pos_key:  # All the variants of the current position
+            key, idx_in, variant = heap[0]
+            # Replace by the next variant of the same file
+            next_variant = next(readers[idx_in], None)
+            if next_variant is None:
+                heapq.heappop(heap)
+            else:
+                next_key = getPosKey(next_variant)
+                if next_key < key:
+                    raise Exception(
+                        'The variants in "{}" are not sorted by position or their regions are not in the same order as in the others files: {}:{} is after {}:{}.'.format(
+                            in_paths[idx_in],
+                            next_variant["coord"]["region"], next_variant["coord"]["pos"],
+                            variant["coord"]["region"], variant["coord"]["pos"]
+                        )
+                    )
+                heapq.heapreplace(heap, (next_key, idx_in, next_variant))
+            # Merge identical variants
+            allele = (variant["coord"]["ref"], variant["coord"]["alt"])
+            if allele in variant_by_allele:
+                variant_by_allele[allele]["supports"].extend(variant["supports"])
+            else:
+                variant_by_allele[allele] = variant
+        for allele in sorted(variant_by_allele):
+            yield variant_by_allele[allele]
 
 
 ########################################################################
@@ -38,11 +126,14 @@ import argparse
 if __name__ == "__main__":
     # Manage parameters
     parser = argparse.ArgumentParser(description='Merge variants JSON coming from different sources.')
+    parser.add_argument('-s', '--sorted-inputs', action='store_true', help='The inputs are sorted by region and position with regions in the same order. Variants on the same position can be in any order. They are merged in stream and the output is sorted.')
+    parser.add_argument('-r', '--regions-order', nargs='+', help='Order of regions in sorted inputs. By default, regions are ranked in order of first occurrence in the heads of inputs.')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')
-    group_input.add_argument('-i', '--inputs-variants', nargs='+', required=True, help='Pathes to the variants files (format: JSON).')
+    group_input.add_argument('-i', '--inputs-variants', nargs='+', required=True, help='Pathes to the variants files (format: JSON or NDJSON).')
     group_output = parser.add_argument_group('Outputs')
     group_output.add_argument('-o', '--output-variants', help='Path to the outputted variant file (format: JSON).')
+    group_output.add_argument('-f', '--output-format', default="json", choices=["json", "ndjson"], help='Format of the outputted file: "json" for a list of variants and "ndjson" for one variant by line. [Default: %(default)s]')
     args = parser.parse_args()
 
     # Logger
@@ -51,28 +142,14 @@ if __name__ == "__main__":
     log.setLevel(logging.INFO)
     log.info("Command: " + " ".join(sys.argv))
 
-    # Load variants
-    log.info("Load and compare variants.")
-    variants_by_id = {}
-    for curr_json in args.inputs_variants:
-        with open(curr_json) as FH_in:
-            variants = json.load(FH_in)
-            for curr_var in variants:
-                curr_var_id = "{}:{}={}/{}".format(
-                    curr_var["coord"]["region"],
-                    curr_var["coord"]["pos"],
-                    curr_var["coord"]["ref"],
-                    curr_var["coord"]["alt"]
-                )
-                if curr_var_id not in variants_by_id:
-                    variants_by_id[curr_var_id] = curr_var
-                else:
-                    for curr_support in curr_var["supports"]:
-                        variants_by_id[curr_var_id]["supports"].append(curr_support)
-
-    # Write output
-    log.info("Write output.")
-    variants = [curr_var for curr_id, curr_var in variants_by_id.items()]
-    with open(args.output_variants, "w") as FH_out:
-        json.dump(variants, FH_out)
+    # Merge and write variants
+    with VariantsJSONWriter(args.output_variants, (args.output_format == "ndjson")) as FH_out:
+        if args.sorted_inputs:
+            log.info("Merge sorted variants in stream.")
+            variants = iterMergedSortedVariants(args.inputs_variants, args.regions_order)
+        else:
+            log.info("Load and compare variants.")
+            variants = getMergedVariants(args.inputs_variants)
+        for curr_var in variants:
+            FH_out.write(curr_var)
     log.info("End of job")
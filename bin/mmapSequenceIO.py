@@ -0,0 +1,468 @@
+#
+# Copyright (C) 2021 IUCT-O
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Classes for fast random access on reference sequences files shared by scripts."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.3.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import mmap
+import numpy
+from copy import copy
+from collections import OrderedDict
+from anacore.sequence import Sequence
+from anacore.sequenceIO import Faidx, FaidxRecord, FastaIO
+from anacore.vcf import VCFRecord
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getFaidxRecords(filepath):
+    """
+    Return by sequence ID the faidx record built from one scan of the fasta file. This function is used when the index file does not exist.
+
+    :param filepath: Path to the fasta file.
+    :type filepath: str
+    :return: By sequence ID the faidx record.
+    :rtype: dict
+    """
+    records = {}
+    curr_record = None
+    offset = 0
+    with open(filepath, "rb") as handle:
+        for line in handle:
+            if line.startswith(b">"):
+                curr_record = FaidxRecord(line[1:].split()[0].decode(), 0, offset + len(line), None, None)
+                records[curr_record.name] = curr_record
+            elif curr_record is not None:
+                line_bases = len(line.rstrip(b"\r\n"))
+                if curr_record.line_bases is None:
+                    curr_record.line_bases = line_bases
+                    curr_record.line_width = len(line)
+                curr_record.length += line_bases
+            offset += len(line)
+    for record in records.values():
+        if record.line_bases is None:  # Empty sequence
+            record.line_bases = 0
+            record.line_width = 0
+    return records
+
+
+def isGzipFile(filepath):
+    """
+    Return True if the file starts with the gzip magic number (gzip and bgzip files).
+
+    :param filepath: Path to the file.
+    :type filepath: str
+    :return: True if the file is compressed with gzip.
+    :rtype: bool
+    """
+    with open(filepath, "rb") as handle:
+        return handle.read(2) == b"\x1f\x8b"
+
+
+def getFastaReader(filepath):
+    """
+    Return the reader adapted to the fasta file: MmapIdxFastaIO for uncompressed file and InMemoryFastaIO for gzipped file.
+
+    :param filepath: Path to the fasta file (compressed or not).
+    :type filepath: str
+    :return: The reader.
+    :rtype: MmapIdxFastaIO or InMemoryFastaIO
+    """
+    if isGzipFile(filepath):
+        return InMemoryFastaIO(filepath)
+    return MmapIdxFastaIO(filepath)
+
+
+def getShiftedVariant(record, seq_handler, upstream=True, padding=200):
+    """
+    Return the most upstream or the most downstream variant that can have the same alternative sequence of the record (see anacore.vcf.VCFRecord.getMostUpstream and getMostDownstream). Only a window around the variant is read from the reference and this window is enlarged while the move reaches its limit. The result is the same as the move on the complete chromosome.
+
+    :param record: The variant with only one alternative allele.
+    :type record: anacore.vcf.VCFRecord
+    :param seq_handler: The reader on reference sequences.
+    :type seq_handler: MmapIdxFastaIO or InMemoryFastaIO
+    :param upstream: If True the variant is moved to the most upstream position otherwise it is moved to the most downstream position.
+    :type upstream: bool
+    :param padding: Initial number of nucleotids read before (upstream) or after (downstream) the variant.
+    :type padding: int
+    :return: The normalized moved variant.
+    :rtype: anacore.vcf.VCFRecord
+    """
+    chrom_len = seq_handler.length(record.chrom)
+    while True:
+        if upstream:
+            win_start = max(1, record.pos - padding)
+            win_end = min(chrom_len, record.pos + len(record.ref) - 1)
+        else:
+            win_start = max(1, record.pos - 1)
+            win_end = min(chrom_len, record.pos + len(record.ref) + padding)
+        win_record = copy(record)
+        win_record.pos = record.pos - win_start + 1
+        win_record._normalized = None
+        win_seq = seq_handler.getSub(record.chrom, win_start, win_end)
+        if upstream:
+            moved = win_record.getMostUpstream(win_seq)
+            is_on_limit = win_start > 1 and moved.pos <= 1
+        else:
+            moved = win_record.getMostDownstream(win_seq)
+            moved_end = moved.pos - 1 if moved.ref == VCFRecord.getEmptyAlleleMarker() else moved.pos + len(moved.ref) - 1
+            is_on_limit = win_end < chrom_len and moved_end >= len(win_seq)
+        if not is_on_limit:
+            break
+        padding *= 2
+    moved.pos += win_start - 1
+    return moved
+
+
+def getRunLengths(seq):
+    """
+    Return for each position of the sequence the length of the homopolymer starting at this position (downstream) and ending at this position (upstream). The comparison is case insensitive.
+
+    :param seq: The sequence.
+    :type seq: str
+    :return: Downstream lengths and upstream lengths.
+    :rtype: (numpy.array, numpy.array)
+    """
+    nt = numpy.frombuffer(seq.upper().encode(), dtype=numpy.uint8)
+    is_run_start = numpy.ones(len(nt), dtype=bool)
+    is_run_start[1:] = nt[1:] != nt[:-1]
+    run_starts = numpy.flatnonzero(is_run_start)
+    run_ends = numpy.append(run_starts[1:], len(nt))  # Exclusive
+    run_idx = numpy.cumsum(is_run_start) - 1
+    positions = numpy.arange(len(nt))
+    downstream = run_ends[run_idx] - positions
+    upstream = positions - run_starts[run_idx] + 1
+    return downstream, upstream
+
+
+class InMemoryFastaIO:
+    """
+    Reader on fasta file (compressed or not) where all the sequences are loaded in memory at the opening. This class has the same reading interface as MmapIdxFastaIO and it is used for files that cannot be memory-mapped (gzip).
+
+    :Example:
+        with InMemoryFastaIO("genome.fa.gz") as reader:
+            reader.getSub("chr1", 10000, 10100)
+            reader.getHomopolymerLength("chr1", 10050)
+    """
+
+    def __init__(self, filepath):
+        """
+        Build and return an instance of InMemoryFastaIO.
+
+        :param filepath: Path to the file.
+        :type filepath: str
+        :return: The new instance.
+        :rtype: InMemoryFastaIO
+        """
+        self.filepath = filepath
+        self.index = OrderedDict()
+        self._sequences = {}
+        with FastaIO(filepath) as reader:
+            for record in reader:
+                self.index[record.id] = FaidxRecord(record.id, len(record.string), None, None, None)
+                self._sequences[record.id] = record.string
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Release sequences."""
+        self._sequences = {}
+
+    def get(self, id):
+        """
+        Return the sequence.
+
+        :param id: The sequence ID.
+        :type id: str
+        :return: The sequence selected.
+        :rtype: anacore.sequence.Sequence
+        """
+        return Sequence(id, self._sequences[id])
+
+    def getHomopolymerLength(self, id, pos, downstream=True):
+        """
+        Return the number of successive identical nucleotids (case insensitive) from the position.
+
+        :param id: The sequence ID.
+        :type id: str
+        :param pos: The start position of the inspection (1-based).
+        :type pos: int
+        :param downstream: If True the homopolymer starts at pos and is extended toward the end of the sequence otherwise it ends at pos and is extended toward the start of the sequence.
+        :type downstream: bool
+        :return: The homopolymer length.
+        :rtype: int
+        """
+        seq = self._sequences[id]
+        if not 1 <= pos <= len(seq):
+            return 0
+        homopolym_nt = seq[pos - 1].upper()
+        step = 1 if downstream else -1
+        idx = pos - 1
+        while 0 <= idx < len(seq) and seq[idx].upper() == homopolym_nt:
+            idx += step
+        return abs(idx - (pos - 1))
+
+    def getSub(self, id, start, end=None):
+        """
+        Return the selected sub of the sequence. Positions out of the sequence are ignored.
+
+        :param id: The sequence ID.
+        :type id: str
+        :param start: The start position of the selected sub-sequence (1-based).
+        :type start: int
+        :param end: The end position of the selected sub-sequence (1-based). Default: The end of the sequence.
+        :type end: int
+        :return: The sequence selected.
+        :rtype: str
+        """
+        seq = self._sequences[id]
+        start = max(start, 1)
+        end = len(seq) if end is None else min(end, len(seq))
+        if start > end:
+            return ""
+        return seq[start - 1:end]
+
+    def length(self, id):
+        """
+        Return the length of the sequence.
+
+        :param id: The sequence ID.
+        :type id: str
+        :return: The length of the sequence.
+        :rtype: int
+        """
+        return self.index[id].length
+
+
+class MmapIdxFastaIO:
+    """
+    Reader on fasta file indexed with faidx. The file is memory-mapped and sub-sequences are retrieved from a LRU cache of fixed size blocks. This class can be used in place of anacore.sequenceIO.IdxFastaIO for reading.
+
+    :Example:
+        with MmapIdxFastaIO("genome.fa") as reader:
+            reader.getSub("chr1", 10000, 10100)
+            reader.getHomopolymerLength("chr1", 10050)
+    """
+
+    def __init__(self, filepath, fai_path=None, use_cache=False, block_size=65536, max_blocks=64, index=None):
+        """
+        Build and return an instance of MmapIdxFastaIO.
+
+        :param filepath: Path to the file.
+        :type filepath: str
+        :param fai_path: Path to the fai file. If this file does not exist the index is built in memory.
+        :type fai_path: str
+        :param use_cache: If True the last sequence retrieved with get is kept in memory to speed-up successive call to get() for the same sequence.
+        :type use_cache: bool
+        :param block_size: Number of nucleotids by cached block.
+        :type block_size: int
+        :param max_blocks: Maximum number of blocks kept in memory.
+        :type max_blocks: int
+        :param index: By sequence ID the faidx record. It is used to share an index already loaded (for example with sub-processes) without reading it again.
+        :type index: dict
+        :return: The new instance.
+        :rtype: MmapIdxFastaIO
+        """
+        if isGzipFile(filepath):
+            raise IOError('The file "{}" is compressed. Sequences must be in an uncompressed fasta file to be memory-mapped.'.format(filepath))
+        self.filepath = filepath
+        self.fai_path = filepath + ".fai" if fai_path is None else fai_path
+        self.use_cache = use_cache
+        self.cached = None  # cached sequence
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        if index is not None:
+            self.index = index
+        elif os.path.exists(self.fai_path):
+            self.index = Faidx(self.fai_path).readById()
+        else:
+            self.index = getFaidxRecords(filepath)
+        self._blocks = OrderedDict()
+        self.file_handle = open(filepath, "rb")
+        self._mmap = mmap.mmap(self.file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _getBlock(self, id, block_idx):
+        """
+        Return the cache entry of the block: [sequence, downstream run lengths, upstream run lengths]. Run lengths are computed on demand (see getHomopolymerLength).
+
+        :param id: The sequence ID.
+        :type id: str
+        :param block_idx: Index of the block on the sequence (0-based).
+        :type block_idx: int
+        :return: The cache entry.
+        :rtype: list
+        """
+        key = (id, block_idx)
+        if key in self._blocks:
+            self._blocks.move_to_end(key)
+        else:
+            block_start = block_idx * self.block_size + 1
+            block_end = min(block_start + self.block_size - 1, self.index[id].length)
+            self._blocks[key] = [self._read(id, block_start, block_end), None, None]
+            if len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+        return self._blocks[key]
+
+    def _read(self, id, start, end):
+        """
+        Return the selected sub of the sequence directly from the memory-mapped file.
+
+        :param id: The sequence ID.
+        :type id: str
+        :param start: The start position of the selected sub-sequence (1-based). It must be valid on the sequence.
+        :type start: int
+        :param end: The end position of the selected sub-sequence (1-based). It must be valid on the sequence.
+        :type end: int
+        :return: The sequence selected.
+        :rtype: str
+        """
+        if start > end:  # Empty sequence
+            return ""
+        seq_idx = self.index[id]
+        endline_marker_len = seq_idx.line_width - seq_idx.line_bases
+        read_start = seq_idx.offset + start - 1 + ((start - 1) // seq_idx.line_bases) * endline_marker_len
+        read_end = seq_idx.offset + end - 1 + ((end - 1) // seq_idx.line_bases) * endline_marker_len
+        raw = self._mmap[read_start:read_end + 1]
+        if endline_marker_len != 0:
+            raw = raw.replace(b"\n", b"").replace(b"\r", b"")
+        return raw.decode()
+
+    def close(self):
+        """Close file handles and clear cache."""
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        if getattr(self, "file_handle", None) is not None:
+            self.file_handle.close()
+            self.file_handle = None
+        self._blocks = OrderedDict()
+        self.cached = None
+
+    def get(self, id):
+        """
+        Return the sequence from file.
+
+        :param id: The sequence ID.
+        :type id: str
+        :return: The sequence selected from the file.
+        :rtype: anacore.sequence.Sequence
+        """
+        if self.cached is not None and self.cached.id == id:
+            return self.cached
+        selected = Sequence(id, self._read(id, 1, self.index[id].length))
+        if self.use_cache:
+            self.cached = selected
+        return selected
+
+    def getHomopolymerLength(self, id, pos, downstream=True):
+        """
+        Return the number of successive identical nucleotids (case insensitive) from the position. Run lengths are computed once by cached block.
+
+        :param id: The sequence ID.
+        :type id: str
+        :param pos: The start position of the inspection (1-based).
+        :type pos: int
+        :param downstream: If True the homopolymer starts at pos and is extended toward the end of the sequence otherwise it ends at pos and is extended toward the start of the sequence.
+        :type downstream: bool
+        :return: The homopolymer length.
+        :rtype: int
+        """
+        homopolym_len = 0
+        homopolym_nt = None
+        seq_len = self.index[id].length
+        while 1 <= pos <= seq_len:
+            block_idx = (pos - 1) // self.block_size
+            block = self._getBlock(id, block_idx)
+            if block[1] is None:
+                block[1], block[2] = getRunLengths(block[0])
+            offset = pos - 1 - block_idx * self.block_size
+            curr_nt = block[0][offset].upper()
+            if homopolym_nt is not None and curr_nt != homopolym_nt:
+                break
+            homopolym_nt = curr_nt
+            if downstream:
+                run_len = int(block[1][offset])
+                homopolym_len += run_len
+                if offset + run_len < len(block[0]):  # The homopolymer ends in block
+                    break
+                pos += run_len
+            else:
+                run_len = int(block[2][offset])
+                homopolym_len += run_len
+                if offset - run_len >= 0:  # The homopolymer starts in block
+                    break
+                pos -= run_len
+        return homopolym_len
+
+    def getSub(self, id, start, end=None):
+        """
+        Return the selected sub of the sequence. Positions out of the sequence are ignored.
+
+        :param id: The sequence ID.
+        :type id: str
+        :param start: The start position of the selected sub-sequence (1-based).
+        :type start: int
+        :param end: The end position of the selected sub-sequence (1-based). Default: The end of the sequence.
+        :type end: int
+        :return: The sequence selected.
+        :rtype: str
+        """
+        seq_len = self.index[id].length
+        start = max(start, 1)
+        end = seq_len if end is None else min(end, seq_len)
+        if start > end:
+            return ""
+        first_block = (start - 1) // self.block_size
+        last_block = (end - 1) // self.block_size
+        if last_block - first_block >= self.max_blocks:  # Large sub-sequence does not pollute cache
+            return self._read(id, start, end)
+        seq = "".join(self._getBlock(id, idx)[0] for idx in range(first_block, last_block + 1))
+        offset = first_block * self.block_size
+        return seq[start - 1 - offset:end - offset]
+
+    def length(self, id):
+        """
+        Return the length of the sequence.
+
+        :param id: The sequence ID.
+        :type id: str
+        :return: The length of the sequence.
+        :rtype: int
+        """
+        return self.index[id].length
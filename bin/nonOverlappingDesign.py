@@ -19,10 +19,11 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.1.0'
+__version__ = '1.2.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
+import heapq
 import argparse
 
 
@@ -31,31 +32,43 @@ import argparse
 # FUNCTIONS
 #
 ########################################################################
-def getNonOverlappingThread(selected_areas):
+def getNonOverlappingThread(selected_areas, balanced=False, min_nb_groups=None):
     """
-    @summary: Splits the list of regions in sub-lists of non-overlapping regions and returns them.
+    @summary: Splits the list of regions in sub-lists of non-overlapping regions and returns them. Areas sorted by coordinates are assigned in O(log k) to a group without overlap: groups are managed in a min-heap of busy groups keyed by the end of their last area and a min-heap of free groups. By default each area is placed in the first free group (the number of groups is the minimum). In balanced mode each area is placed in the free group containing the smallest number of areas to spread areas evenly between groups.
     @param selected_areas: [list] The selected areas. Each area is represented by a dictionary with this format: {"region":"chr1", "start":501, "end":608, "id":"gene_98"}.
+    @param balanced: [bool] If True the areas are spread evenly between groups.
+    @param min_nb_groups: [int] In balanced mode, the minimum number of groups. It is used to increase parallelism in downstream processing. By default the minimum number of groups without overlap is used.
     @return: [list] Each element of the list is a list of non-overlapping regions.
     """
     sorted_selected_areas = sorted(selected_areas, key=lambda x: (x["region"], x["start"], x["end"]))
-    non_overlapping_threads = [[
-        sorted_selected_areas[0]
-    ]]
-    for curr_area in sorted_selected_areas[1:]:
-        thread_idx = 0
-        is_valid_thread = False
-        while thread_idx < len(non_overlapping_threads) and not is_valid_thread:
-            is_valid_thread = hasNoOverlap(curr_area, non_overlapping_threads[thread_idx][-1])
-            thread_idx += 1
-        if is_valid_thread:
-            non_overlapping_threads[thread_idx - 1].append(
-                curr_area
-            )
+    nb_groups = 0
+    if balanced:
+        nb_groups = len(getNonOverlappingThread(sorted_selected_areas))
+        if min_nb_groups is not None:
+            nb_groups = max(nb_groups, min_nb_groups)
+    non_overlapping_threads = [list() for thread_idx in range(nb_groups)]
+    free_threads = [(0, thread_idx) for thread_idx in range(nb_groups)]  # Heap of (number of areas in balanced mode, thread index)
+    busy_threads = list()  # Heap of (end of the last area, thread index)
+    prev_region = None
+    for curr_area in sorted_selected_areas:
+        # Release threads without overlap with the current area
+        if curr_area["region"] != prev_region:  # New chromosome: all threads are free
+            for last_end, thread_idx in busy_threads:
+                heapq.heappush(free_threads, (len(non_overlapping_threads[thread_idx]) if balanced else 0, thread_idx))
+            busy_threads = list()
+            prev_region = curr_area["region"]
+        while len(busy_threads) != 0 and busy_threads[0][0] < curr_area["start"]:
+            last_end, thread_idx = heapq.heappop(busy_threads)
+            heapq.heappush(free_threads, (len(non_overlapping_threads[thread_idx]) if balanced else 0, thread_idx))
+        # Add area in thread
+        if len(free_threads) != 0:
+            thread_idx = heapq.heappop(free_threads)[1]
         else:
-            non_overlapping_threads.append([
-                curr_area
-            ])
-    return non_overlapping_threads
+            thread_idx = len(non_overlapping_threads)
+            non_overlapping_threads.append(list())
+        non_overlapping_threads[thread_idx].append(curr_area)
+        heapq.heappush(busy_threads, (curr_area["end"], thread_idx))
+    return [thread for thread in non_overlapping_threads if len(thread) != 0]
 
 def getSelectedArea(input_panel, margin):
     """
@@ -91,6 +104,20 @@ def hasNoOverlap(area_A, area_B):
         has_no_overlap = True
     return has_no_overlap
 
+def writeDesign(non_overlapping_threads, out_path):
+    """
+    @summary: Writes the groups of non-overlapping areas.
+    @param non_overlapping_threads: [list] Each element of the list is a list of non-overlapping regions (see getNonOverlappingThread).
+    @param out_path: [str] Path to the list of amplicons (format: TSV). The first column is the ID of the amplicon and the second is the name of the group.
+    """
+    with open(out_path, "w") as FH_design:
+        FH_design.write("#Area\tNon-overlapping_group\n")
+        for thread_idx, thread in enumerate(non_overlapping_threads):
+            for area in thread:
+                FH_design.write(
+                    '{0}\t{1}\n'.format(area["id"], "grp" + str(thread_idx))
+                )
+
 
 ########################################################################
 #
@@ -100,6 +127,8 @@ def hasNoOverlap(area_A, area_B):
 if __name__ == "__main__":
     # Manage parameters
     parser = argparse.ArgumentParser(description='Writes non-overlapping areas groups from a BED file.')
+    parser.add_argument('-b', '--balanced', action='store_true', help='Spread areas evenly between groups. This is used to balance the groups processed in parallel by downstream tools.')
+    parser.add_argument('-n', '--min-nb-groups', type=int, help='In balanced mode, the minimum number of groups. By default the minimum number of groups without overlap is used.')
     parser.add_argument('-m', '--margin', default=0, type=int, help='The minimum distance between two areas in same group. With 0 the group contains non-overlapping areas. With 5 the areas in the same group are non-overlapping but also separated by at least 5 nucleotids. This option is used when the sequencing adapter cannot be totally removed to prevent overlap between primer of one area and the adapters of an other. [Default: %(default)s]')
     group_input = parser.add_argument_group('Inputs')  # Inputs
     group_input.add_argument('-i', '--input-panel', required=True, help='Path to the list of selected areas (format: BED). Each area must have an unique ID in the name field.')
@@ -111,13 +140,7 @@ if __name__ == "__main__":
     selected_areas = getSelectedArea(args.input_panel, args.margin)
 
     # Split overlapping area
-    non_overlapping_threads = getNonOverlappingThread(selected_areas)
+    non_overlapping_threads = getNonOverlappingThread(selected_areas, args.balanced, args.min_nb_groups)
 
     # Write split design
-    with open(args.output_design, "w") as FH_design:
-        FH_design.write("#Area\tNon-overlapping_group\n")
-        for thread_idx, thread in enumerate(non_overlapping_threads):
-            for area in non_overlapping_threads[thread_idx]:
-                FH_design.write(
-                    '{0}\t{1}\n'.format(area["id"], "grp" + str(thread_idx))
-                )
+    writeDesign(non_overlapping_threads, args.output_design)
@@ -19,7 +19,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.4.0'
+__version__ = '1.5.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -28,7 +28,7 @@ import sys
 import logging
 import argparse
 from anacore.vcf import VCFIO, getAlleleRecord, HeaderInfoAttr
-from anacore.sequenceIO import FastaIO
+from mmapSequenceIO import getFastaReader, getShiftedVariant
 
 
 ########################################################################
@@ -36,23 +36,6 @@ from anacore.sequenceIO import FastaIO
 # FUNCTIONS
 #
 ########################################################################
-def getSeqByChr(genome_path):
-    """
-    Return by chromosome name the sequence of this chromosome.
-
-    :param genome_path: Path to the genome file (format: fasta).
-    :type genome_path: str
-    :return: By chromosome name the sequence of this chromosome in uppercase.
-    :rtype: dict
-    """
-    genome_by_chr = dict()
-    FH_seq = FastaIO(genome_path)
-    for record in FH_seq:
-        genome_by_chr[record.id] = record.string.upper()
-    FH_seq.close()
-    return genome_by_chr
-
-
 def normAndMove(genome_path, in_variant_file, out_variant_file, trace_unstandard):
     """
     Write in a new file the normalized version of each variant. The normalization constists in three steps:
@@ -60,7 +43,7 @@ def normAndMove(genome_path, in_variant_file, out_variant_file, trace_unstandard
       2- In each allele the empty allele marker is replaced by a dot and alternative and reference allele are reduced to the minimal string (example: ATG/A becomes TG/. ; AAGC/ATAC becomes AG/TA.).
       3- The allele is replaced by the most upstream allele that can have the same alternative sequence (example: a deletion in homopolymer is moved to first nucleotid of this homopolymer).
 
-    :param genome_path: Path to the genome file (format: fasta).
+    :param genome_path: Path to the genome file (format: fasta). If the faidx index does not exist it is built in memory. A gzipped genome is loaded in memory.
     :type genome_path: str
     :param in_variant_file: Path to the variants file (format: VCF).
     :type in_variant_file: str
@@ -69,22 +52,21 @@ def normAndMove(genome_path, in_variant_file, out_variant_file, trace_unstandard
     :param trace_unstandard: True if you want to keep the trace of the variant before standardization in INFO.
     :type trace_unstandard: bool
     """
-    genome_by_chr = getSeqByChr(genome_path)
-    with VCFIO(out_variant_file, "w") as FH_out:
-        with VCFIO(in_variant_file) as FH_in:
-            # Header
-            FH_out.copyHeader(FH_in)
-            if trace_unstandard:
-                FH_out.info["UNSTD"] = HeaderInfoAttr("UNSTD", type="String", number="1", description="The variant id (chromosome:position=reference/alternative) before standardization.")
-            FH_out.writeHeader()
-            # Records
-            for record in FH_in:
-                curr_chrom = genome_by_chr[record.chrom]
-                for alt_idx, alt in enumerate(record.alt):
-                    alt_record = getAlleleRecord(FH_in, record, alt_idx)
-                    if trace_unstandard:
-                        alt_record.info["UNSTD"] = "{}:{}={}/{}".format(alt_record.chrom, alt_record.pos, alt_record.ref, "/".join(alt_record.alt))
-                    FH_out.write(alt_record.getMostUpstream(curr_chrom))
+    with getFastaReader(genome_path) as FH_seq:
+        with VCFIO(out_variant_file, "w") as FH_out:
+            with VCFIO(in_variant_file) as FH_in:
+                # Header
+                FH_out.copyHeader(FH_in)
+                if trace_unstandard:
+                    FH_out.info["UNSTD"] = HeaderInfoAttr("UNSTD", type="String", number="1", description="The variant id (chromosome:position=reference/alternative) before standardization.")
+                FH_out.writeHeader()
+                # Records
+                for record in FH_in:
+                    for alt_idx, alt in enumerate(record.alt):
+                        alt_record = getAlleleRecord(FH_in, record, alt_idx)
+                        if trace_unstandard:
+                            alt_record.info["UNSTD"] = "{}:{}={}/{}".format(alt_record.chrom, alt_record.pos, alt_record.ref, "/".join(alt_record.alt))
+                        FH_out.write(getShiftedVariant(alt_record, FH_seq))
 
 
 def normOnly(in_variant_file, out_variant_file, trace_unstandard):
@@ -0,0 +1,179 @@
+#
+# Copyright (C) 2021 IUCT-O
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Classes to store results of costly requests (databases, web services) in a persistent cache shared between executions of scripts."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import json
+import sqlite3
+import hashlib
+import threading
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class PersistentCache:
+    """
+    Content-addressed cache stored in a SQLite table. Keys are tuples of JSON serializable elements (example: ("GRCh38", "NC_000007.14:g.140753336A>T")) and values must be JSON serializable. The same file can be shared by several tables and by several processes.
+
+    :Example:
+        with PersistentCache("cache.sqlite", "transcripts") as cache:
+            transcripts_by_key = cache.getOrCompute(
+                {(assembly, hgvs): hgvs for hgvs in variants},
+                getTranscripts  # Called only on keys missing in cache
+            )
+    """
+
+    def __init__(self, filepath=None, table="cache", batch_size=500):
+        """
+        Build and return an instance of PersistentCache.
+
+        :param filepath: Path to the SQLite file. It is created if it does not exist. With None the cache is only kept in memory.
+        :type filepath: str
+        :param table: Name of the table used in file.
+        :type table: str
+        :param batch_size: Maximum number of keys by query.
+        :type batch_size: int
+        :return: The new instance.
+        :rtype: PersistentCache
+        """
+        if not table.isidentifier():
+            raise ValueError('The table name "{}" is invalid.'.format(table))
+        self.filepath = filepath
+        self.table = table
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(":memory:" if filepath is None else filepath, timeout=60, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, value TEXT)".format(table))
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close connection to the file."""
+        if getattr(self, "_connection", None) is not None:
+            self._connection.close()
+            self._connection = None
+
+    def get(self, key, default=None):
+        """
+        Return the value stored for the key.
+
+        :param key: The key.
+        :type key: tuple
+        :param default: Value returned if the key is not in cache.
+        :type default: *
+        :return: The value.
+        :rtype: *
+        """
+        return self.getMany([key]).get(key, default)
+
+    @staticmethod
+    def getHash(key):
+        """
+        Return the identifier of the key in table.
+
+        :param key: The key.
+        :type key: tuple
+        :return: The SHA-256 of the JSON serialization of the key.
+        :rtype: str
+        """
+        return hashlib.sha256(json.dumps(key, separators=(",", ":")).encode()).hexdigest()
+
+    def getMany(self, keys):
+        """
+        Return by key the values stored in cache. Keys missing in cache are not returned.
+
+        :param keys: The keys.
+        :type keys: list
+        :return: By key the value.
+        :rtype: dict
+        """
+        key_by_hash = {self.getHash(key): key for key in keys}
+        hashes = list(key_by_hash)
+        value_by_key = dict()
+        with self._lock:
+            for batch_start in range(0, len(hashes), self.batch_size):
+                batch = hashes[batch_start:batch_start + self.batch_size]
+                query = "SELECT key, value FROM {} WHERE key IN ({})".format(self.table, ",".join("?" * len(batch)))
+                for hash, value in self._connection.execute(query, batch):
+                    value_by_key[key_by_hash[hash]] = json.loads(value)
+        return value_by_key
+
+    def getOrCompute(self, params_by_key, fct, map_fct=map):
+        """
+        Return by key the value stored in cache or computed with fct(params) for the keys missing in cache. Computed values are stored in cache.
+
+        :param params_by_key: By key the parameter given to fct. The dictionary is used to remove duplicates before any call to fct.
+        :type params_by_key: dict
+        :param fct: The function called to compute missing values.
+        :type fct: function
+        :param map_fct: The function used to apply fct on all the missing parameters (example: multiprocessing.Pool.map).
+        :type map_fct: function
+        :return: By key the value.
+        :rtype: dict
+        """
+        value_by_key = self.getMany(params_by_key)
+        missing_keys = [key for key in params_by_key if key not in value_by_key]
+        if len(missing_keys) != 0:
+            computed = dict(zip(
+                missing_keys,
+                map_fct(fct, [params_by_key[key] for key in missing_keys])
+            ))
+            self.setMany(computed)
+            value_by_key.update(self.getMany(missing_keys))  # Values are returned after serialization as stored in cache
+        return value_by_key
+
+    def set(self, key, value):
+        """
+        Store the value for the key.
+
+        :param key: The key.
+        :type key: tuple
+        :param value: The value.
+        :type value: *
+        """
+        self.setMany({key: value})
+
+    def setMany(self, value_by_key):
+        """
+        Store values in one transaction.
+
+        :param value_by_key: By key the value.
+        :type value_by_key: dict
+        """
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO {} (key, value) VALUES (?, ?)".format(self.table),
+                    [(self.getHash(key), json.dumps(value)) for key, value in value_by_key.items()]
+                )
@@ -19,16 +19,262 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.1.0'
+__version__ = '1.2.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
+import os
 import sys
+import math
+import numpy
+import sqlite3
+import hashlib
 import logging
 import argparse
+import itertools
+import tempfile
 from anacore.sequenceIO import SequenceFileReader, FastaIO, FastqIO
 
 
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class MemoryIdsIndex:
+    """Selected IDs loaded in a dictionary."""
+
+    def __init__(self, ids_path):
+        """
+        Build and return an instance of MemoryIdsIndex.
+
+        :param ids_path: Path to the file containing the selected IDs (format: TXT). One ID by line.
+        :type ids_path: str
+        :return: The new instance.
+        :rtype: MemoryIdsIndex
+        """
+        self.is_found_by_id = {curr_id: False for curr_id in iterIds(ids_path)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Release index."""
+        self.is_found_by_id = None
+
+    def contains(self, ids):
+        """
+        Return for each ID if it is in index.
+
+        :param ids: The IDs evaluated.
+        :type ids: list
+        :return: For each ID True if it is in index.
+        :rtype: list
+        """
+        flags = list()
+        for curr_id in ids:
+            is_in = curr_id in self.is_found_by_id
+            if is_in:
+                self.is_found_by_id[curr_id] = True
+            flags.append(is_in)
+        return flags
+
+    def getMissing(self):
+        """
+        Return IDs in index never found by contains().
+
+        :return: The missing IDs.
+        :rtype: list
+        """
+        return [curr_id for curr_id, is_found in self.is_found_by_id.items() if not is_found]
+
+
+class SortedIdsIndex(MemoryIdsIndex):
+    """Selected IDs read in stream by a merge-join with the sequences. IDs and sequences must be sorted by name in the same order (for example: LC_ALL=C sort) and the memory used does not depend on the number of IDs."""
+
+    def __init__(self, ids_path):
+        """
+        Build and return an instance of SortedIdsIndex.
+
+        :param ids_path: Path to the file containing the selected IDs (format: TXT). One ID by line.
+        :type ids_path: str
+        :return: The new instance.
+        :rtype: SortedIdsIndex
+        """
+        self.ids_path = ids_path
+        self._ids = iterIds(ids_path)
+        self._current = None
+        self._current_is_found = False
+        self._last_query = None
+        self._missing = list()
+        self._nextId()
+
+    def _nextId(self):
+        """Move to the next distinct ID in file and store the current ID in missing if it has not been found."""
+        if self._current is not None and not self._current_is_found:
+            self._missing.append(self._current)
+        previous = self._current
+        self._current = next(self._ids, None)
+        while self._current is not None and self._current == previous:  # Skip duplicates
+            self._current = next(self._ids, None)
+        if previous is not None and self._current is not None and self._current < previous:
+            raise IOError('The IDs in "{}" are not sorted: "{}" is after "{}".'.format(self.ids_path, self._current, previous))
+        self._current_is_found = False
+
+    def close(self):
+        """Close IDs file."""
+        if self._ids is not None:
+            self._ids.close()
+            self._ids = None
+
+    def contains(self, ids):
+        """
+        Return for each ID if it is in index. IDs must be sorted and must be greater or equal than IDs provided in previous calls.
+
+        :param ids: The IDs evaluated.
+        :type ids: list
+        :return: For each ID True if it is in index.
+        :rtype: list
+        """
+        flags = list()
+        for curr_id in ids:
+            if self._last_query is not None and curr_id < self._last_query:
+                raise IOError('The sequences are not sorted by ID: "{}" is after "{}".'.format(curr_id, self._last_query))
+            self._last_query = curr_id
+            while self._current is not None and self._current < curr_id:
+                self._nextId()
+            is_in = self._current == curr_id
+            if is_in:
+                self._current_is_found = True
+            flags.append(is_in)
+        return flags
+
+    def getMissing(self):
+        """
+        Return IDs in index never found by contains(). The remaining IDs are read.
+
+        :return: The missing IDs.
+        :rtype: list
+        """
+        while self._current is not None:
+            self._nextId()
+        return self._missing
+
+
+class BloomIdsIndex(MemoryIdsIndex):
+    """Selected IDs stored in a SQLite file and pre-screened by a Bloom filter kept in memory: only IDs passing the Bloom filter are searched in the file. The memory used is about 1.2 byte by ID with the default false positive rate."""
+
+    def __init__(self, ids_path, tmp_folder=tempfile.gettempdir(), false_positive_rate=0.01, batch_size=500):
+        """
+        Build and return an instance of BloomIdsIndex.
+
+        :param ids_path: Path to the file containing the selected IDs (format: TXT). One ID by line.
+        :type ids_path: str
+        :param tmp_folder: Path to the folder used for the SQLite file.
+        :type tmp_folder: str
+        :param false_positive_rate: The false positive rate of the Bloom filter.
+        :type false_positive_rate: float
+        :param batch_size: Maximum number of IDs by query.
+        :type batch_size: int
+        :return: The new instance.
+        :rtype: BloomIdsIndex
+        """
+        self.batch_size = batch_size
+        # Exact set
+        fd, self.db_path = tempfile.mkstemp(dir=tmp_folder, prefix="pickSequences_", suffix=".sqlite")
+        os.close(fd)
+        self._connection = sqlite3.connect(self.db_path)
+        self._connection.execute("PRAGMA journal_mode = OFF")
+        self._connection.execute("PRAGMA synchronous = OFF")
+        self._connection.execute("CREATE TABLE ids (id TEXT PRIMARY KEY, is_found INTEGER) WITHOUT ROWID")
+        ids = iterIds(ids_path)
+        with self._connection:
+            for batch in iter(lambda: list(itertools.islice(ids, 100000)), []):
+                self._connection.executemany("INSERT OR IGNORE INTO ids (id, is_found) VALUES (?, 0)", [(curr_id,) for curr_id in batch])
+        nb_ids = self._connection.execute("SELECT COUNT(*) FROM ids").fetchone()[0]
+        # Bloom filter
+        self.nb_bits = max(64, int(-nb_ids * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.nb_hashes = max(1, round(self.nb_bits / max(1, nb_ids) * math.log(2)))
+        self._bits = numpy.zeros((self.nb_bits + 7) // 8, dtype=numpy.uint8)
+        cursor = self._connection.execute("SELECT id FROM ids")
+        for batch in iter(lambda: cursor.fetchmany(100000), []):
+            positions = self._getPositions([elt[0] for elt in batch])
+            numpy.bitwise_or.at(self._bits, positions >> 3, numpy.left_shift(1, positions & 7).astype(numpy.uint8))
+
+    def _getPositions(self, ids):
+        """
+        Return the bits used by the IDs in Bloom filter.
+
+        :param ids: The IDs.
+        :type ids: list
+        :return: Array of shape (nb_ids, nb_hashes) with the positions of bits.
+        :rtype: numpy.ndarray
+        """
+        digests = numpy.frombuffer(
+            b"".join(hashlib.blake2b(curr_id.encode(), digest_size=16).digest() for curr_id in ids),
+            dtype=numpy.uint64
+        ).reshape(-1, 2)
+        hashes_idx = numpy.arange(self.nb_hashes, dtype=numpy.uint64)
+        return (digests[:, :1] + hashes_idx * digests[:, 1:]) % numpy.uint64(self.nb_bits)  # Double hashing
+
+    def close(self):
+        """Close and remove SQLite file."""
+        if getattr(self, "_connection", None) is not None:
+            self._connection.close()
+            self._connection = None
+            os.remove(self.db_path)
+
+    def contains(self, ids):
+        """
+        Return for each ID if it is in index.
+
+        :param ids: The IDs evaluated.
+        :type ids: list
+        :return: For each ID True if it is in index.
+        :rtype: list
+        """
+        if len(ids) == 0:
+            return list()
+        positions = self._getPositions(ids)
+        in_bloom = numpy.all(self._bits[positions >> 3] & numpy.left_shift(1, positions & 7).astype(numpy.uint8), axis=1)
+        candidates = list({curr_id for curr_id, is_candidate in zip(ids, in_bloom) if is_candidate})
+        found = set()
+        for batch_start in range(0, len(candidates), self.batch_size):
+            batch = candidates[batch_start:batch_start + self.batch_size]
+            placeholders = ",".join("?" * len(batch))
+            found.update(elt[0] for elt in self._connection.execute("SELECT id FROM ids WHERE id IN ({})".format(placeholders), batch))
+            self._connection.execute("UPDATE ids SET is_found = 1 WHERE id IN ({})".format(placeholders), batch)
+        return [curr_id in found for curr_id in ids]
+
+    def getMissing(self):
+        """
+        Return IDs in index never found by contains().
+
+        :return: The missing IDs.
+        :rtype: list
+        """
+        return [elt[0] for elt in self._connection.execute("SELECT id FROM ids WHERE is_found = 0")]
+
+
+def iterIds(ids_path):
+    """
+    Return a generator on IDs in file. Empty lines are skipped.
+
+    :param ids_path: Path to the file containing the selected IDs (format: TXT). One ID by line.
+    :type ids_path: str
+    :return: Generator on IDs.
+    :rtype: generator
+    """
+    with open(ids_path) as FH_ids:
+        for line in FH_ids:
+            curr_id = line.strip()
+            if curr_id != "":
+                yield curr_id
+
+
 ########################################################################
 #
 # MAIN
@@ -37,6 +283,9 @@ from anacore.sequenceIO import SequenceFileReader, FastaIO, FastqIO
 if __name__ == "__main__":
     # Manage parameters
     parser = argparse.ArgumentParser(description="Filter sequence file on list of sequences IDs.")
+    parser.add_argument('-b', '--batch-size', default=10000, type=int, help='The number of sequences evaluated by batch. [Default: %(default)s]')
+    parser.add_argument('-e', '--engine', choices=["memory", "sorted", "bloom"], default="memory", help='The method used to search sequences in IDs. With "memory" IDs are loaded in memory. With "sorted" IDs and sequences must be sorted by name in the same order (LC_ALL=C sort) and they are read in stream. With "bloom" IDs are stored in a temporary SQLite file pre-screened by a Bloom filter. [Default: %(default)s]')
+    parser.add_argument('-f', '--tmp-folder', default=tempfile.gettempdir(), help='Path to the folder used for temporary files with engine "bloom". [Default: %(default)s]')
     parser.add_argument('-m', '--mode', choices=["select", "remove"], default="select", help='The sequences with IDs provided are selected (-- mode select) or removed (--mode remove). [Default: %(default)s]')
     parser.add_argument('-t', '--stringency', choices=["lenient", "strict"], default="strict", help='In strict mode the script raise an exception if at least one of the selected IDs is missing in sequences file. [Default: %(default)s]')
     parser.add_argument('-v', '--version', action='version', version=__version__)
@@ -54,33 +303,30 @@ if __name__ == "__main__":
     log.info("Command: " + " ".join(sys.argv))
     log.info("Version: " + str(__version__))
 
-    # Retrieve kept IDs
-    selected_ids = dict()
-    with open(args.input_ids) as FH_ids:
-        for line in FH_ids:
-            selected_ids[line.strip()] = 0
-
     # Filter sequence file
-    with SequenceFileReader.factory(args.input_sequences) as FH_seq:
-        out_cls = FastqIO if issubclass(FastqIO, FH_seq.__class__) else FastaIO
-        with out_cls(args.output_sequences, "w") as FH_out:
-            if args.mode == "select":
-                for record in FH_seq:
-                    if record.id in selected_ids:
-                        selected_ids[record.id] = 1
-                        FH_out.write(record)
-            else:
-                for record in FH_seq:
-                    if record.id in selected_ids:
-                        selected_ids[record.id] = 1
-                    else:
-                        FH_out.write(record)
+    if args.engine == "memory":
+        ids_index = MemoryIdsIndex(args.input_ids)
+    elif args.engine == "sorted":
+        ids_index = SortedIdsIndex(args.input_ids)
+    else:
+        ids_index = BloomIdsIndex(args.input_ids, args.tmp_folder)
+    with ids_index:
+        with SequenceFileReader.factory(args.input_sequences) as FH_seq:
+            out_cls = FastqIO if issubclass(FastqIO, FH_seq.__class__) else FastaIO
+            with out_cls(args.output_sequences, "w") as FH_out:
+                keep_selected = args.mode == "select"
+                records = list()
+                for record in itertools.chain(FH_seq, [None]):
+                    if record is not None:
+                        records.append(record)
+                    if len(records) == args.batch_size or (record is None and len(records) != 0):
+                        for curr_record, is_in in zip(records, ids_index.contains([elt.id for elt in records])):
+                            if is_in == keep_selected:
+                                FH_out.write(curr_record)
+                        records = list()
+        missing = ids_index.getMissing()
 
     # Check retrieved and missing sequences
-    missing = list()
-    for curr_id in selected_ids:
-        if selected_ids[curr_id] != 1:
-            missing.append(curr_id)
     if len(missing) != 0:
         msg = 'The following sequences cannot be found in  "{}": {}'.format(
             args.input_sequences, ", ".join(missing)
@@ -0,0 +1,275 @@
+#
+# Copyright (C) 2021 IUCT-O
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Classes and functions to locate all the primers of a panel on a genome in one scan by chromosome."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.1.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import re
+import numpy
+from bisect import bisect_left
+from multiprocessing import Pool
+from anacore.sequenceIO import FastaIO
+from mmapSequenceIO import isGzipFile, MmapIdxFastaIO
+
+NT_CODES = numpy.full(256, 4, dtype=numpy.uint8)  # Code of non-ACGT characters is 4
+for nt_idx, nt in enumerate("ACGT"):
+    NT_CODES[ord(nt)] = nt_idx
+    NT_CODES[ord(nt.lower())] = nt_idx
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class MultiPatternMatcher:
+    """
+    Find all occurrences of several literal patterns in one scan of the sequence. The first k nucleotids of each pattern are encoded in 2 bits by nucleotid and all the k-mers of the sequence are searched in these seeds with vectorized operations. Seeds hits are verified on the complete pattern. Patterns containing characters other than ACGT or shorter than k are searched with regular expressions.
+
+    The returned occurrences of one pattern are the same as re.finditer: they are sorted and they do not overlap.
+
+    :Example:
+        matcher = MultiPatternMatcher(["ACGTTGCA", "TTGCAAGT"])
+        hits_by_pattern = matcher.findAll(chrom_seq)  # {"ACGTTGCA": [(start, end), ...], "TTGCAAGT": [...]}
+    """
+
+    def __init__(self, patterns, max_seed_len=31, chunk_size=4000000):
+        """
+        Build and return an instance of MultiPatternMatcher.
+
+        :param patterns: The patterns. They are case insensitive.
+        :type patterns: iterable
+        :param max_seed_len: Maximum length of seeds (maximum 31 to store the 2 bits code in uint64).
+        :type max_seed_len: int
+        :param chunk_size: Number of nucleotids processed in one vectorized operation.
+        :type chunk_size: int
+        :return: The new instance.
+        :rtype: MultiPatternMatcher
+        """
+        self.patterns = sorted(set(elt.upper() for elt in patterns))
+        self.chunk_size = chunk_size
+        seedable = [elt for elt in self.patterns if re.fullmatch("[ACGT]+", elt)]
+        self.seed_len = min([len(elt) for elt in seedable] + [max_seed_len])
+        self.regexp_patterns = [elt for elt in self.patterns if elt not in set(seedable)]
+        patterns_by_seed = dict()
+        for pattern in seedable:
+            seed = getKmerCode(pattern[:self.seed_len])
+            patterns_by_seed.setdefault(seed, list()).append(pattern)
+        self.seeds = numpy.array(sorted(patterns_by_seed), dtype=numpy.uint64)
+        self.patterns_by_seed = patterns_by_seed
+
+    def _getSeedsHits(self, seq):
+        """
+        Return positions (0-based) where one of the seeds starts.
+
+        :param seq: The sequence.
+        :type seq: str
+        :return: Positions and their seeds codes.
+        :rtype: (numpy.array, numpy.array)
+        """
+        positions = list()
+        seeds = list()
+        overlap = self.seed_len - 1
+        for chunk_start in range(0, max(len(seq) - overlap, 0), self.chunk_size):
+            chunk = seq[chunk_start:chunk_start + self.chunk_size + overlap]
+            codes = NT_CODES[numpy.frombuffer(chunk.encode(), dtype=numpy.uint8)]
+            nb_kmers = len(codes) - overlap
+            # Windows without non-ACGT
+            invalid_cumsum = numpy.concatenate(([0], numpy.cumsum(codes == 4, dtype=numpy.int64)))
+            is_valid = invalid_cumsum[self.seed_len:] == invalid_cumsum[:nb_kmers]
+            # Kmers codes
+            kmers = numpy.zeros(nb_kmers, dtype=numpy.uint64)
+            codes = codes.astype(numpy.uint64) & numpy.uint64(3)
+            for offset in range(self.seed_len):
+                kmers = (kmers << numpy.uint64(2)) | codes[offset:offset + nb_kmers]
+            # Search kmers in seeds
+            seeds_idx = numpy.minimum(numpy.searchsorted(self.seeds, kmers), len(self.seeds) - 1)
+            is_hit = numpy.logical_and(is_valid, self.seeds[seeds_idx] == kmers)
+            hits_pos = numpy.flatnonzero(is_hit)
+            positions.append(hits_pos + chunk_start)
+            seeds.append(kmers[hits_pos])
+        if len(positions) == 0:
+            return numpy.array([], dtype=numpy.int64), numpy.array([], dtype=numpy.uint64)
+        return numpy.concatenate(positions), numpy.concatenate(seeds)
+
+    def findAll(self, seq):
+        """
+        Return by pattern the list of occurrences in the sequence.
+
+        :param seq: The sequence.
+        :type seq: str
+        :return: By pattern the list of occurrences. Each occurrence is a tuple (start, end) with 1-based positions.
+        :rtype: dict
+        """
+        seq = seq.upper()
+        hits_by_pattern = {pattern: list() for pattern in self.patterns}
+        # Seeded patterns
+        if len(self.seeds) != 0:
+            positions, seeds = self._getSeedsHits(seq)
+            for pos, seed in zip(positions.tolist(), seeds.tolist()):
+                for pattern in self.patterns_by_seed[seed]:
+                    if seq.startswith(pattern, pos):
+                        hits = hits_by_pattern[pattern]
+                        if len(hits) == 0 or pos >= hits[-1][1]:  # Occurrences do not overlap (see re.finditer)
+                            hits.append((pos + 1, pos + len(pattern)))
+        # Other patterns
+        for pattern in self.regexp_patterns:
+            for curr_match in re.finditer(re.escape(pattern), seq):
+                hits_by_pattern[pattern].append((curr_match.start() + 1, curr_match.end()))
+        return hits_by_pattern
+
+
+def _findOnChromosome(params):
+    """
+    Return hits of patterns on one chromosome. This function is used by findPatterns in sub-processes.
+
+    :param params: Path to the reference, faidx record of the chromosome and patterns.
+    :type params: (str, anacore.sequenceIO.FaidxRecord, list)
+    :return: Chromosome ID and by pattern the list of occurrences.
+    :rtype: (str, dict)
+    """
+    reference_path, chrom_idx, patterns = params
+    chrom = chrom_idx.name
+    with MmapIdxFastaIO(reference_path, index={chrom: chrom_idx}) as reader:
+        chrom_seq = reader.get(chrom).string
+    return chrom, MultiPatternMatcher(patterns).findAll(chrom_seq)
+
+
+def _findOnSequence(params):
+    """
+    Return hits of patterns on one sequence already loaded. This function is used by findPatterns in sub-processes for compressed reference.
+
+    :param params: Sequence ID, sequence and patterns.
+    :type params: (str, str, list)
+    :return: Sequence ID and by pattern the list of occurrences.
+    :rtype: (str, dict)
+    """
+    chrom, chrom_seq, patterns = params
+    return chrom, MultiPatternMatcher(patterns).findAll(chrom_seq)
+
+
+def _findOnCompressed(reference_path, patterns, nb_jobs=1):
+    """
+    Return by chromosome the occurrences of the patterns in a gzipped reference. The file is read sequentially and at most nb_jobs chromosomes are kept in memory at the same time.
+
+    :param reference_path: Path to the reference sequences (format: fasta.gz).
+    :type reference_path: str
+    :param patterns: The patterns searched on all the chromosomes or by chromosome ID the list of searched patterns (chromosomes missing in dict are skipped).
+    :type patterns: list or dict
+    :param nb_jobs: Number of chromosomes processed in parallel.
+    :type nb_jobs: int
+    :return: List of (chromosome ID, by pattern the list of occurrences) in order of reference file.
+    :rtype: list
+    """
+    hits = []
+    pool = Pool(nb_jobs) if nb_jobs > 1 else None
+    try:
+        batch = []
+        with FastaIO(reference_path) as reader:
+            for record in reader:
+                if isinstance(patterns, dict):
+                    if record.id in patterns:
+                        batch.append((record.id, record.string, patterns[record.id]))
+                else:
+                    batch.append((record.id, record.string, patterns))
+                if len(batch) == nb_jobs:
+                    hits.extend(pool.map(_findOnSequence, batch) if pool is not None else map(_findOnSequence, batch))
+                    batch = []
+        if len(batch) != 0:
+            hits.extend(pool.map(_findOnSequence, batch) if pool is not None else map(_findOnSequence, batch))
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return hits
+
+
+def findPatterns(reference_path, patterns, nb_jobs=1):
+    """
+    Return by chromosome the occurrences of the patterns. Each chromosome is read and scanned only once and chromosomes are processed in parallel.
+
+    :param reference_path: Path to the reference sequences (format: fasta or fasta.gz). If the faidx index does not exist it is built in memory. A gzipped reference is read sequentially instead of memory-mapped.
+    :type reference_path: str
+    :param patterns: The patterns searched on all the chromosomes or by chromosome ID the list of searched patterns (chromosomes missing in dict are skipped).
+    :type patterns: list or dict
+    :param nb_jobs: Number of chromosomes processed in parallel.
+    :type nb_jobs: int
+    :return: List of (chromosome ID, by pattern the list of occurrences) in order of reference file.
+    :rtype: list
+    """
+    if isGzipFile(reference_path):
+        hits = _findOnCompressed(reference_path, patterns, nb_jobs)
+    else:
+        with MmapIdxFastaIO(reference_path) as reader:
+            if isinstance(patterns, dict):
+                params = [(reference_path, chrom_idx, patterns[chrom]) for chrom, chrom_idx in reader.index.items() if chrom in patterns]
+            else:
+                params = [(reference_path, chrom_idx, patterns) for chrom_idx in reader.index.values()]
+        if nb_jobs > 1 and len(params) > 1:
+            with Pool(min(nb_jobs, len(params))) as pool:
+                hits = list(pool.imap(_findOnChromosome, params))
+        else:
+            hits = [_findOnChromosome(elt) for elt in params]
+    if len(hits) == 0:
+        raise Exception('No sequence has been scanned in the reference "{}": the file is empty or it does not contain any of the searched chromosomes.'.format(reference_path))
+    return hits
+
+
+def getKmerCode(kmer):
+    """
+    Return the 2 bits code of the k-mer.
+
+    :param kmer: The k-mer (only ACGT).
+    :type kmer: str
+    :return: The code.
+    :rtype: int
+    """
+    code = 0
+    for nt in kmer:
+        code = (code << 2) | int(NT_CODES[ord(nt)])
+    return code
+
+
+def getSmallestAmplicon(up_matches, down_matches):
+    """
+    Return coordinates of the smallest fragment between one upstream primer occurrence and one downstream primer occurrence. In case of equality, the first upstream occurrence is selected.
+
+    :param up_matches: Sorted occurrences (start, end) of the upstream primer.
+    :type up_matches: list
+    :param down_matches: Sorted occurrences (start, end) of the downstream primer.
+    :type down_matches: list
+    :return: Start of the upstream primer and end of the downstream primer (1-based) or (None, None) if no fragment exists.
+    :rtype: (int, int)
+    """
+    ampl_start = None
+    ampl_end = None
+    prev_length = None
+    down_starts = [elt[0] for elt in down_matches]
+    for up_start, up_end in up_matches:
+        down_idx = bisect_left(down_starts, up_end)  # First downstream occurrence after the upstream primer end
+        if down_idx < len(down_starts):
+            curr_length = down_starts[down_idx] - up_end
+            if prev_length is None or prev_length > curr_length:
+                prev_length = curr_length
+                ampl_start = up_start
+                ampl_end = down_matches[down_idx][1]
+    return ampl_start, ampl_end
+
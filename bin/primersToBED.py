@@ -19,15 +19,14 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2018 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.0'
+__version__ = '1.1.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
-import re
 import warnings
 import argparse
 from anacore.bed import BEDIO, BEDRecord
-from anacore.sequenceIO import FastaIO
+from primersLocator import findPatterns, getSmallestAmplicon
 
 
 ########################################################################
@@ -54,87 +53,76 @@ def getAmplicons(amplicons_path):
                 })
     return(amplicons)
 
-def getBEDRecords(ref_path, amplicons):
+def getBEDRecords(ref_path, amplicons, nb_jobs=1):
     for ampl in amplicons:
         ampl["found"] = False
+    # Primers on the two strands are searched in one scan by chromosome
+    patterns = set()
+    for ampli in amplicons:
+        patterns.update([ampli["f_primer"], ampli["r_primer"], revcom(ampli["f_primer"]), revcom(ampli["r_primer"])])
     bed_ampl = []
-    with FastaIO(ref_path) as FH_seq:
-        for record in FH_seq:
-            chr_id = record.id
-            chr_str = record.string.upper()
-            for ampli in amplicons:
-                # Primers are on strand +
-                up_primer = ampli["f_primer"].upper()
-                down_primer = ampli["r_primer"].upper()
-                start, end = findPosOnSequence(chr_id, chr_str, up_primer, down_primer)
-                if start is not None:
-                    ampli["found"] = True
-                    bed_ampl.append(
-                        BEDRecord(
-                            chr_id,
-                            start,
-                            end,
-                            ampli["name"],
-                            0,
-                            "+",
-                            start + len(up_primer),
-                            end - len(down_primer)
-                        )
+    for chr_id, hits_by_pattern in findPatterns(ref_path, sorted(patterns), nb_jobs):
+        for ampli in amplicons:
+            # Primers are on strand +
+            up_primer = ampli["f_primer"].upper()
+            down_primer = ampli["r_primer"].upper()
+            start, end = findPosOnSequence(chr_id, hits_by_pattern, up_primer, down_primer)
+            if start is not None:
+                ampli["found"] = True
+                bed_ampl.append(
+                    BEDRecord(
+                        chr_id,
+                        start,
+                        end,
+                        ampli["name"],
+                        0,
+                        "+",
+                        start + len(up_primer),
+                        end - len(down_primer)
                     )
-                # Primers are on strand -
-                up_primer = revcom(ampli["r_primer"].upper())
-                down_primer = revcom(ampli["f_primer"].upper())
-                start, end = findPosOnSequence(chr_id, chr_str, up_primer, down_primer)
-                if start is not None:
-                    ampli["found"] = True
-                    bed_ampl.append(
-                        BEDRecord(
-                            chr_id,
-                            start,
-                            end,
-                            ampli["name"],
-                            0,
-                            "-",
-                            start + len(up_primer),
-                            end - len(down_primer)
-                        )
+                )
+            # Primers are on strand -
+            up_primer = revcom(ampli["r_primer"].upper())
+            down_primer = revcom(ampli["f_primer"].upper())
+            start, end = findPosOnSequence(chr_id, hits_by_pattern, up_primer, down_primer)
+            if start is not None:
+                ampli["found"] = True
+                bed_ampl.append(
+                    BEDRecord(
+                        chr_id,
+                        start,
+                        end,
+                        ampli["name"],
+                        0,
+                        "-",
+                        start + len(up_primer),
+                        end - len(down_primer)
                     )
+                )
     for ampl in amplicons:
         if not ampl["found"]:
             warnings.warn('The amplicons {} with primers fwd:{}, rvs:{} cannot be found in {}.'.format(
                 ampl["name"], ampl["f_primer"], ampl["r_primer"], ref_path
             ))
+    if len(bed_ampl) == 0:
+        raise Exception('None of the amplicons can be found in {}.'.format(ref_path))
     return(bed_ampl)
 
-def findPosOnSequence(chr_id, chr_str, up_primer, down_primer):
+def findPosOnSequence(chr_id, hits_by_pattern, up_primer, down_primer):
     ampl_start = None
     ampl_end = None
-    upstream_matches = list()
-    up_pattern = re.compile(up_primer)
-    for curr_match in up_pattern.finditer(chr_str):
-        upstream_matches.append({"start": curr_match.start()+1, "end": curr_match.end()})
-    downstream_matches = list()
-    down_pattern = re.compile(down_primer)
-    for curr_match in down_pattern.finditer(chr_str):
-        downstream_matches.append({"start": curr_match.start()+1, "end": curr_match.end()})
+    upstream_matches = hits_by_pattern[up_primer]
+    downstream_matches = hits_by_pattern[down_primer]
     if len(upstream_matches) != 0 and len(downstream_matches) != 0:
         # Check multiple target in chr
         if len(upstream_matches) > 1:
-            match_list = ", ".join(["{}:{}-{}".format(chr_id, curr_match["start"], curr_match["end"]) for curr_match in upstream_matches])
+            match_list = ", ".join(["{}:{}-{}".format(chr_id, start, end) for start, end in upstream_matches])
             warnings.warn("The primer '" + up_primer + "' is found multiple twice in " + chr_id + " (" + match_list + ")")
         if len(downstream_matches) > 1:
-            match_list = ", ".join(["{}:{}-{}".format(chr_id, curr_match["start"], curr_match["end"]) for curr_match in downstream_matches])
+            match_list = ", ".join(["{}:{}-{}".format(chr_id, start, end) for start, end in downstream_matches])
             warnings.warn("The primer '" + down_primer + "' is found multiple twice in " + chr_id + " (" + match_list + ")")
         # Select smaller amplified fragment
-        prev_length = None
-        for curr_up in upstream_matches:
-            for curr_down in downstream_matches:
-                curr_length = curr_down["start"] - curr_up["end"]
-                if curr_length >= 0:
-                    if prev_length is None or prev_length > curr_length:
-                        prev_length = curr_length
-                        ampl_start = curr_up["start"]
-                        ampl_end = curr_down["end"]
+        ampl_start, ampl_end = getSmallestAmplicon(upstream_matches, downstream_matches)
     return(ampl_start, ampl_end)
 
 
@@ -146,6 +134,7 @@ def findPosOnSequence(chr_id, chr_str, up_primer, down_primer):
 if __name__ == "__main__":
     # Manage parameters
     parser = argparse.ArgumentParser(description="Converts amplicons list to BED.")
+    parser.add_argument('-j', '--nb-jobs', type=int, default=1, help='Number of chromosomes processed in parallel. [Default: %(default)s]')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')  # Inputs
     group_input.add_argument('-a', '--input-amplicons', required=True, help='Path to the definition of the amplicons (format: TSV). The columns are: Name, Forward_primer and Reverse_primer.')
@@ -155,7 +144,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     amplicons = getAmplicons(args.input_amplicons)
-    bed_records = getBEDRecords(args.input_reference, amplicons)
+    bed_records = getBEDRecords(args.input_reference, amplicons, args.nb_jobs)
     with BEDIO(args.output_BED, "w", 8) as FH_out:
         for record in bed_records:
             FH_out.write(record)
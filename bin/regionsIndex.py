@@ -0,0 +1,108 @@
+#
+# Copyright (C) 2021 IUCT-O
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Classes to find regions overlapping an interval by binary search, shared by scripts."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+from bisect import bisect_right
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class RegionsIndex:
+    """
+    Index on regions to find overlap in O(log n) by binary search on sorted starts and cumulative maximum of ends.
+
+    :Example:
+        regions_idx = RegionsIndex({"chr1": [Region(10, 20), Region(15, 30)]})
+        regions_idx.hasOverlap("chr1", 25, 40)  # True
+        regions_idx.getOverlapped("chr1", 25, 40)  # [Region(15, 30)]
+    """
+
+    def __init__(self, regions_by_chr):
+        """
+        Build and return an instance of RegionsIndex.
+
+        :param regions_by_chr: By chromosome the list of regions. Each region must have the attributes start and end (1-based).
+        :type regions_by_chr: dict
+        :return: The new instance.
+        :rtype: RegionsIndex
+        """
+        self.regions_by_chr = {}
+        self.starts_by_chr = {}
+        self.max_ends_by_chr = {}
+        for chrom, regions in regions_by_chr.items():
+            sorted_regions = sorted(regions, key=lambda x: (x.start, x.end))
+            max_ends = []
+            for region in sorted_regions:
+                max_ends.append(region.end if len(max_ends) == 0 else max(max_ends[-1], region.end))
+            self.regions_by_chr[chrom] = sorted_regions
+            self.starts_by_chr[chrom] = [region.start for region in sorted_regions]
+            self.max_ends_by_chr[chrom] = max_ends
+
+    def __contains__(self, chrom):
+        return chrom in self.starts_by_chr
+
+    def getOverlapped(self, chrom, start, end):
+        """
+        Return all the regions that have an overlap with the interval.
+
+        :param chrom: The chromosome name.
+        :type chrom: str
+        :param start: The start position of the interval (1-based).
+        :type start: float
+        :param end: The end position of the interval (1-based).
+        :type end: float
+        :return: Regions having an overlap with the interval. They are sorted by coordinates.
+        :rtype: list
+        """
+        overlapped = []
+        if chrom in self.regions_by_chr:
+            regions = self.regions_by_chr[chrom]
+            max_ends = self.max_ends_by_chr[chrom]
+            idx = bisect_right(self.starts_by_chr[chrom], end) - 1  # Last region starting before the end of interval
+            while idx >= 0 and max_ends[idx] >= start:
+                if regions[idx].end >= start:
+                    overlapped.append(regions[idx])
+                idx -= 1
+        return overlapped[::-1]
+
+    def hasOverlap(self, chrom, start, end):
+        """
+        Return True if the interval overlaps at least one region.
+
+        :param chrom: The chromosome name.
+        :type chrom: str
+        :param start: The start position of the interval (1-based).
+        :type start: float
+        :param end: The end position of the interval (1-based).
+        :type end: float
+        :return: True if the interval overlaps at least one region.
+        :rtype: bool
+        """
+        if chrom not in self.starts_by_chr:
+            return False
+        nb_candidates = bisect_right(self.starts_by_chr[chrom], end)  # Regions starting before the end of interval
+        return nb_candidates > 0 and self.max_ends_by_chr[chrom][nb_candidates - 1] >= start
@@ -3,17 +3,68 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2020 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.0'
+__version__ = '1.2.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
-from anacore.sequenceIO import FastqIO, Sequence
+from alignmentIO import addIOArguments, openAlignmentReader
+from bufferedIO import BufferedWriter
+from concurrent.futures import ThreadPoolExecutor
 import argparse
+import itertools
 import logging
+import numpy
 import os
-from pysam import AlignmentFile
 import sys
 
+DOUBLE_COMPLEMENT = str.maketrans("Uu", "Tt")  # Complement of complement in anacore.sequence.DNAAlphabet
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getFastqRecords(reads, args):
+    """
+    Return reads in fastq format with UMI in reads ID. The qualities of the batch are converted in one operation.
+
+    :param reads: The reads.
+    :type reads: list
+    :param args: The parsed arguments of the script (used: barcode_tag, qual_offset, reads_barcode, umi_qual_tag and umi_tag).
+    :type args: argparse.Namespace
+    :return: The record of each read. Each record is a bytes with the four lines.
+    :rtype: list
+    """
+    qualities = [curr_read.query_qualities for curr_read in reads]
+    for curr_read, curr_qual in zip(reads, qualities):
+        if curr_qual is None:
+            raise Exception('The read "{}" has no quality.'.format(curr_read.query_name))
+    qual_str = (numpy.frombuffer(b"".join(qualities), dtype=numpy.uint8) + numpy.uint8(args.qual_offset)).tobytes()
+    records = list()
+    qual_start = 0
+    for curr_read, curr_qual in zip(reads, qualities):
+        qual_end = qual_start + len(curr_qual)
+        barcode = args.reads_barcode
+        if barcode is None and curr_read.has_tag(args.barcode_tag):
+            barcode = curr_read.get_tag(args.barcode_tag).replace("-", "+")
+        sequence = curr_read.query_sequence
+        if curr_read.is_reverse:  # Reverse complement of the forward sequence
+            sequence = sequence.translate(DOUBLE_COMPLEMENT)
+        header = "@{}:{} {}:{}:0:{} {}={}\n{}\n+\n".format(
+            curr_read.query_name,
+            curr_read.get_tag(args.umi_tag),
+            "1" if curr_read.is_read1 else "2",
+            "Y" if curr_read.is_qcfail else "N",
+            "" if barcode is None else barcode,
+            args.umi_qual_tag,
+            curr_read.get_tag(args.umi_qual_tag),
+            sequence
+        )
+        records.append(b"".join([header.encode(), qual_str[qual_start:qual_end], b"\n"]))
+        qual_start = qual_end
+    return records
+
 
 ########################################################################
 #
@@ -29,12 +80,16 @@ if __name__ == "__main__":
     parser.add_argument('-r', '--reads-barcode', help='Reads barcode.')
     parser.add_argument('-t', '--umi-qual-tag', default="QX", help='Tag used in alignment file to store the UMI quality. [Default: %(default)s]')
     parser.add_argument('-u', '--umi-tag', default="RX", help='Tag used in alignment file to store the UMI. [Default: %(default)s]')
+    parser.add_argument('-s', '--batch-size', default=10000, type=int, help='The number of reads converted by batch. [Default: %(default)s]')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')
     group_input.add_argument('-i', '--input-aln', required=True, help='The path to the alignments file (format: BAM).')
     group_output = parser.add_argument_group('Outputs')
     group_output.add_argument('-o', '--output-reads', required=True, help='The path to the outputted reads file (format: FASTQ).')
     group_output.add_argument('-2', '--output-reads-2', help='The path to the outputted reads file R2 (format: FASTQ).')
+    group_output.add_argument('-c', '--compression-threads', default=1, type=int, help='Number of threads used to compress outputs when their path ends with ".gz". [Default: %(default)s]')
+    group_output.add_argument('-l', '--compression-level', default=6, type=int, choices=range(1, 10), help='Compression level of outputs when their path ends with ".gz". [Default: %(default)s]')
+    addIOArguments(parser, with_output=False)
     args = parser.parse_args()
 
     # Logger
@@ -44,58 +99,31 @@ if __name__ == "__main__":
     log.info("Command: " + " ".join(sys.argv))
 
     # Process
-    if args.output_reads_2:  # Write all reads in a pair of files (R1 and R2)
-        with FastqIO(args.output_reads_2, "w") as writer_r2:
-            with FastqIO(args.output_reads, "w") as writer_r1:
-                with AlignmentFile(args.input_aln, "rb", check_sq=False) as reader:
-                    for curr_read in reader.fetch(until_eof=True):
-                        if not curr_read.is_secondary and not curr_read.is_supplementary:
+    executor = None if args.compression_threads < 2 else ThreadPoolExecutor(args.compression_threads)
+    try:
+        with BufferedWriter(args.output_reads, executor, compression_level=args.compression_level) as writer_r1:
+            writer_r2 = writer_r1  # Write all reads in a unique file
+            if args.output_reads_2:  # Write all reads in a pair of files (R1 and R2)
+                writer_r2 = BufferedWriter(args.output_reads_2, executor, compression_level=args.compression_level)
+            try:
+                with openAlignmentReader(args.input_aln, args.io_threads, check_sq=False) as reader:
+                    reads = list()
+                    for curr_read in itertools.chain(reader.fetch(until_eof=True), [None]):
+                        if curr_read is not None and not curr_read.is_secondary and not curr_read.is_supplementary:
                             if args.keep_qc_failed or not curr_read.is_qcfail:
-                                barcode = args.reads_barcode
-                                if barcode is None and curr_read.has_tag(args.barcode_tag):
-                                    barcode = curr_read.get_tag(args.barcode_tag).replace("-", "+")
-                                description = "{}:{}:0:{} {}={}".format(
-                                    "1" if curr_read.is_read1 else "2",
-                                    "Y" if curr_read.is_qcfail else "N",
-                                    "" if barcode is None else barcode,
-                                    args.umi_qual_tag,
-                                    curr_read.get_tag(args.umi_qual_tag)
-                                )
-                                read = Sequence(
-                                    curr_read.query_name + ":" + curr_read.get_tag(args.umi_tag),
-                                    curr_read.get_forward_sequence(),
-                                    description,
-                                    "".join([chr(elt + args.qual_offset) for elt in curr_read.get_forward_qualities()])
-                                )
-                                if curr_read.is_reverse:
-                                    read = read.dnaRevCom()
-                                if curr_read.is_read1:
-                                    writer_r1.write(read)
-                                else:
-                                    writer_r2.write(read)
-    else:  # Write all reads in a unique file
-        with FastqIO(args.output_reads, "w") as writer:
-            with AlignmentFile(args.input_aln, "rb", check_sq=False) as reader:
-                for curr_read in reader.fetch(until_eof=True):
-                    if not curr_read.is_secondary and not curr_read.is_supplementary:
-                        if args.keep_qc_failed or not curr_read.is_qcfail:
-                            barcode = args.reads_barcode
-                            if barcode is None and curr_read.has_tag(args.barcode_tag):
-                                barcode = curr_read.get_tag(args.barcode_tag).replace("-", "+")
-                            description = "{}:{}:0:{} {}={}".format(
-                                "1" if curr_read.is_read1 else "2",
-                                "Y" if curr_read.is_qcfail else "N",
-                                "" if barcode is None else barcode,
-                                args.umi_qual_tag,
-                                curr_read.get_tag(args.umi_qual_tag)
-                            )
-                            read = Sequence(
-                                curr_read.query_name + ":" + curr_read.get_tag(args.umi_tag),
-                                curr_read.get_forward_sequence(),
-                                description,
-                                "".join([chr(elt + args.qual_offset) for elt in curr_read.get_forward_qualities()])
-                            )
-                            if curr_read.is_reverse:
-                                read = read.dnaRevCom()
-                            writer.write(read)
+                                reads.append(curr_read)
+                        if len(reads) == args.batch_size or (curr_read is None and len(reads) != 0):
+                            records = getFastqRecords(reads, args)
+                            if writer_r2 is writer_r1:
+                                writer_r1.write(b"".join(records))
+                            else:
+                                writer_r1.write(b"".join([rec for rec, curr_read in zip(records, reads) if curr_read.is_read1]))
+                                writer_r2.write(b"".join([rec for rec, curr_read in zip(records, reads) if not curr_read.is_read1]))
+                            reads = list()
+            finally:
+                if writer_r2 is not writer_r1:
+                    writer_r2.close()
+    finally:
+        if executor is not None:
+            executor.shutdown()
     log.info("End of job")
@@ -19,12 +19,214 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.2.0'
+__version__ = '2.1.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
+import io
+import os
+import re
+import sys
+import gzip
+import heapq
+import pysam
+import logging
 import argparse
-from anacore.vcf import VCFIO
+import tempfile
+from itertools import chain
+from operator import itemgetter
+from anacore.abstractFile import isGzip
+from anacore.vcf import VCFRecord
+
+RECORD_OVERHEAD = 300  # Approximative size in memory of the sort key and the list item for one record
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getContigsOrder(header_lines):
+    """
+    Return by contig name his rank in header.
+
+    :param header_lines: The header lines.
+    :type header_lines: list
+    :return: By contig name his rank in header.
+    :rtype: dict
+    """
+    rank_by_contig = dict()
+    for line in header_lines:
+        if line.startswith("##contig=<"):
+            match = re.search(r"[<,]ID=([^,>]+)", line)
+            if match is not None and match.group(1) not in rank_by_contig:
+                rank_by_contig[match.group(1)] = len(rank_by_contig)
+    return rank_by_contig
+
+
+def getMaxMemory(value):
+    """
+    Return number of bytes from a size with an optional unit (K, M or G).
+
+    :param value: The size. Example: 2G or 500M.
+    :type value: str
+    :return: The number of bytes.
+    :rtype: int
+    """
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([KMG]?)B?", value.strip().upper())
+    if match is None:
+        raise argparse.ArgumentTypeError('The size "{}" is invalid. Examples of valid values: 500M, 2G.'.format(value))
+    factor = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}[match.group(2)]
+    return int(float(match.group(1)) * factor)
+
+
+def getRecordKey(line, rank_by_contig):
+    """
+    Return sort key of the VCF line: (contig rank, contig, position, last position on reference, first alternative allele). Only the first columns are parsed. Contigs missing in header are placed after the others in lexicographic order.
+
+    :param line: The VCF line.
+    :type line: str
+    :param rank_by_contig: By contig name his rank in header.
+    :type rank_by_contig: dict
+    :return: The sort key.
+    :rtype: tuple
+    """
+    chrom, pos, variant_id, ref, alt = line.split("\t", 5)[:5]
+    alt = alt.split(",", 1)[0]
+    pos = int(pos)
+    normalized = VCFRecord(chrom, pos, None, ref, [alt])
+    normalized.normalizeSingleAllele()
+    if normalized.ref == VCFRecord.getEmptyAlleleMarker():
+        ref_end = normalized.pos - 0.5
+    else:
+        ref_end = normalized.pos + len(normalized.ref) - 1
+    return (rank_by_contig.get(chrom, len(rank_by_contig)), chrom, pos, ref_end, alt)
+
+
+def iterRun(run_path, rank_by_contig):
+    """
+    Return generator on (sort key, line) from a run file.
+
+    :param run_path: Path to the sorted run (format: VCF without header).
+    :type run_path: str
+    :param rank_by_contig: By contig name his rank in header.
+    :type rank_by_contig: dict
+    :return: Generator on (sort key, line).
+    :rtype: generator
+    """
+    with open(run_path) as handle:
+        for line in handle:
+            yield getRecordKey(line, rank_by_contig), line
+
+
+def mergeRuns(runs_paths, rank_by_contig, max_fan_in, tmp_folder):
+    """
+    Merge consecutive groups of runs in new temporary runs until their number is lower or equal to max_fan_in. The number of files opened at the same time is limited to max_fan_in. Groups are consecutive to keep the order of equal records. Merged runs files are removed.
+
+    :param runs_paths: Pathes to the sorted runs (format: VCF without header).
+    :type runs_paths: list
+    :param rank_by_contig: By contig name his rank in header.
+    :type rank_by_contig: dict
+    :param max_fan_in: Maximum number of runs merged at the same time.
+    :type max_fan_in: int
+    :param tmp_folder: Path to the folder used for temporary files.
+    :type tmp_folder: str
+    :return: Pathes to the remaining runs.
+    :rtype: list
+    """
+    if max_fan_in < 2:
+        raise ValueError("The maximum number of runs merged at the same time must be greater than 1.")
+    while len(runs_paths) > max_fan_in:
+        new_runs_paths = list()
+        try:
+            for start in range(0, len(runs_paths), max_fan_in):
+                group = runs_paths[start:start + max_fan_in]
+                if len(group) == 1:
+                    new_runs_paths.append(group[0])
+                else:
+                    with tempfile.NamedTemporaryFile(mode="w", dir=tmp_folder, prefix="sortVCF_", suffix=".vcf", delete=False) as handle:
+                        new_runs_paths.append(handle.name)
+                        runs = [iterRun(path, rank_by_contig) for path in group]
+                        handle.writelines(line for key, line in heapq.merge(*runs, key=itemgetter(0)))
+                    for path in group:
+                        os.remove(path)
+        except Exception:
+            for path in runs_paths + new_runs_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        runs_paths = new_runs_paths
+    return runs_paths
+
+
+def openVCF(filepath, mode="r"):
+    """
+    Return text handle on VCF file. Compressed output (filepath ends with ".gz") is written in BGZF to be indexable with tabix.
+
+    :param filepath: Path to the file.
+    :type filepath: str
+    :param mode: Mode to open the file ("r" or "w").
+    :type mode: str
+    :return: The file handle.
+    :rtype: file
+    """
+    if mode == "w":
+        if filepath.endswith(".gz"):
+            return io.TextIOWrapper(pysam.BGZFile(filepath, "wb"))
+        return open(filepath, "w")
+    if isGzip(filepath):
+        return gzip.open(filepath, "rt")
+    return open(filepath)
+
+
+def sortedLines(lines, rank_by_contig, max_memory, tmp_folder, max_fan_in=64):
+    """
+    Return generator on lines sorted by getRecordKey. Lines are sorted by runs fitting in max_memory, runs are spilled in temporary files and the final order is produced by a k-way merge. When there are more than max_fan_in runs, they are first merged by groups in several passes.
+
+    :param lines: The VCF records lines.
+    :type lines: iterable
+    :param rank_by_contig: By contig name his rank in header.
+    :type rank_by_contig: dict
+    :param max_memory: Maximum size in bytes of one run in memory.
+    :type max_memory: int
+    :param tmp_folder: Path to the folder used for temporary files.
+    :type tmp_folder: str
+    :param max_fan_in: Maximum number of temporary files opened at the same time during merge.
+    :type max_fan_in: int
+    :return: Generator on sorted lines.
+    :rtype: generator
+    """
+    runs_paths = list()
+    try:
+        run = list()
+        run_size = 0
+        for line in lines:
+            if line.strip() == "":  # Skip empty lines (for example the end of file)
+                continue
+            if not line.endswith("\n"):
+                line += "\n"
+            run.append((getRecordKey(line, rank_by_contig), line))
+            run_size += sys.getsizeof(line) + RECORD_OVERHEAD
+            if run_size >= max_memory:  # Spill run
+                run.sort(key=itemgetter(0))
+                with tempfile.NamedTemporaryFile(mode="w", dir=tmp_folder, prefix="sortVCF_", suffix=".vcf", delete=False) as handle:
+                    runs_paths.append(handle.name)
+                    handle.writelines(line for key, line in run)
+                run = list()
+                run_size = 0
+        run.sort(key=itemgetter(0))
+        if len(runs_paths) == 0:  # All lines fit in memory
+            for key, line in run:
+                yield line
+        else:  # k-way merge of runs
+            runs_paths = mergeRuns(runs_paths, rank_by_contig, max_fan_in, tmp_folder)
+            runs = [iterRun(path, rank_by_contig) for path in runs_paths] + [iter(run)]
+            for key, line in heapq.merge(*runs, key=itemgetter(0)):
+                yield line
+    finally:
+        for path in runs_paths:
+            if os.path.exists(path):
+                os.remove(path)
 
 
 ########################################################################
@@ -34,27 +236,41 @@ from anacore.vcf import VCFIO
 ########################################################################
 if __name__ == "__main__":
     # Manage parameters
-    parser = argparse.ArgumentParser(description='Sorts VCF by coordinates.')
+    parser = argparse.ArgumentParser(description='Sorts VCF by coordinates. Contigs are sorted in order of the header, and contigs missing in header are placed at the end in lexicographic order. Records are sorted by runs limited in memory and merged from temporary files.')
+    parser.add_argument('-m', '--max-memory', default="1G", type=getMaxMemory, help='Maximum memory used to store records before spilling them in temporary files. Examples: 500M, 2G. [Default: 1G]')
+    parser.add_argument('-f', '--max-fan-in', default=64, type=int, help='Maximum number of temporary files opened at the same time during merge. With more runs, they are merged in several passes. [Default: %(default)s]')
+    parser.add_argument('-t', '--tmp-folder', default=tempfile.gettempdir(), help='Path to the folder used for temporary files. [Default: %(default)s]')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')  # Inputs
     group_input.add_argument('-i', '--input-variants', required=True, help='The path to the variants file (format: VCF).')
     group_output = parser.add_argument_group('Outputs')  # Outputs
-    group_output.add_argument('-o', '--output-variants', required=True, help='The path to the outputted variants file (format: VCF).')
+    group_output.add_argument('-o', '--output-variants', required=True, help='The path to the outputted variants file (format: VCF). If the path ends with ".gz" the file is compressed with bgzip.')
+    group_output.add_argument('-x', '--tabix-index', action='store_true', help='Create the tabix index of the outputted variants file. The output must be compressed (path ends with ".gz").')
     args = parser.parse_args()
+    if args.tabix_index and not args.output_variants.endswith(".gz"):
+        parser.error('The option "--tabix-index" requires an output path ending with ".gz".')
+
+    # Logger
+    logging.basicConfig(format='%(asctime)s -- [%(filename)s][pid:%(process)d][%(levelname)s] -- %(message)s')
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.INFO)
+    log.info("Command: " + " ".join(sys.argv))
 
     # Process
-    with VCFIO(args.output_variants, "w") as FH_out:
-        with VCFIO(args.input_variants) as FH_in:
+    with openVCF(args.input_variants) as FH_in:
+        with openVCF(args.output_variants, "w") as FH_out:
             # Header
-            FH_out.copyHeader(FH_in)
-            FH_out.writeHeader()
+            header_lines = list()
+            line = FH_in.readline()
+            while line.startswith("#"):
+                header_lines.append(line)
+                line = FH_in.readline()
+            FH_out.writelines(header_lines)
             # Records
-            records_by_chr = dict()
-            for record in FH_in:
-                if record.chrom not in records_by_chr:
-                    records_by_chr[record.chrom] = list()
-                records_by_chr[record.chrom].append(record)
-            for chrom in sorted(records_by_chr):
-                sorted_records = sorted(records_by_chr[chrom], key=lambda x: (x.chrom, x.pos, x.refEnd(), x.alt[0]))
-                for record in sorted_records:
-                    FH_out.write(record)
+            records_lines = chain([line], FH_in)
+            rank_by_contig = getContigsOrder(header_lines)
+            for line in sortedLines(records_lines, rank_by_contig, args.max_memory, args.tmp_folder, args.max_fan_in):
+                FH_out.write(line)
+    if args.tabix_index:
+        pysam.tabix_index(args.output_variants, preset="vcf", force=True)
+    log.info("End of job")
@@ -3,12 +3,12 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2017 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.1.1'
+__version__ = '1.4.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
-import pysam
 import argparse
+from alignmentIO import addIOArguments, openAlignmentReader, openWriterFromArgs
 
 
 ########################################################################
@@ -20,6 +20,8 @@ if __name__ == "__main__":
     # Manage parameters
     parser = argparse.ArgumentParser(description='Splits one BAM in groups based on RG. Several RG can be merge in new group. Each new group becomes represented by one alignment file after split.')
     parser.add_argument('-r', '--remove-RG', action='store_true', help='With this parameter the RG are removed from the outputted alignments files.')
+    parser.add_argument('-u', '--update-RG', nargs='+', default=[], help='Tags values set in all the RG of the outputted alignments files. Each value has the format TAG:VALUE (example: "SM:splA PL:ILLUMINA"). This is used to set the sample of the alignments without rewriting them after the split.')
+    parser.add_argument('-m', '--merge-RG', action='store_true', help='With this parameter all the RG of each outputted alignments file are replaced by only one RG with ID "1" and the tags values of --update-RG (example: "--merge-RG --update-RG SM:splA LB:splA PL:ILLUMINA").')
     parser.add_argument('-t', '--RG-tag', default='LB', help='RG tag used in link between tag value and group (see input-design parameter). [Default: %(default)s]')
     parser.add_argument('-v', '--version', action='version', version=__version__)
     group_input = parser.add_argument_group('Inputs')  # Inputs
@@ -27,7 +29,16 @@ if __name__ == "__main__":
     group_input.add_argument('-d', '--input-design', required=True, help='The path to the file describing RG in each new group (format: TSV). First column is a value for a specific tag in RG, the second is the name of the new group.')
     group_output = parser.add_argument_group('Outputs')  # Outputs
     group_output.add_argument('-p', '--output-pattern', default="out_{GP}.bam", help='The path pattern for the outputted alignments files (format: BAM). In this path the keyword "{GP}" is replace by the group name for each group. [Default: %(default)s]')
+    addIOArguments(parser)
     args = parser.parse_args()
+    if args.remove_RG and args.merge_RG:
+        parser.error('The parameters --remove-RG and --merge-RG cannot be used together.')
+    RG_update = dict()
+    for tag_and_value in args.update_RG:
+        if ":" not in tag_and_value:
+            parser.error('The value "{}" for --update-RG is not in format TAG:VALUE.'.format(tag_and_value))
+        tag, value = tag_and_value.split(":", 1)
+        RG_update[tag] = value
 
     # Get panel regions
     groups_names = set()
@@ -40,7 +51,7 @@ if __name__ == "__main__":
                 groups_names.add(group)
 
     # Split BAM
-    with pysam.AlignmentFile(args.input_aln, "rb") as FH_in:
+    with openAlignmentReader(args.input_aln, args.io_threads) as FH_in:
         # Get new group by read group ID
         group_by_id = dict()
         for RG in FH_in.header["RG"]:
@@ -52,12 +63,14 @@ if __name__ == "__main__":
             new_header = FH_in.header.to_dict()
             if args.remove_RG:
                 new_header["RG"] = list()
+            elif args.merge_RG:
+                new_header["RG"] = [dict({"ID": "1"}, **RG_update)]
             else:
-                new_header["RG"] = [curr_RG for curr_RG in FH_in.header["RG"] if group_by_tag[curr_RG[args.RG_tag]] == group]
-            FH_by_group[group] = pysam.AlignmentFile(
+                new_header["RG"] = [dict(curr_RG, **RG_update) for curr_RG in FH_in.header["RG"] if group_by_tag[curr_RG[args.RG_tag]] == group]
+            FH_by_group[group] = openWriterFromArgs(
                 args.output_pattern.replace("{GP}", group),
-                "wb",
-                header=new_header
+                new_header,
+                args
             )
         # Parse reads
         for curr_read in FH_in.fetch(until_eof=True):
@@ -65,6 +78,8 @@ if __name__ == "__main__":
                 RG_id = curr_read.get_tag("RG")
                 if args.remove_RG:
                     curr_read.set_tag("RG", None)
+                elif args.merge_RG:
+                    curr_read.set_tag("RG", "1")
                 FH_by_group[group_by_id[RG_id]].write(curr_read)
         # Close FH
         for group in groups_names:
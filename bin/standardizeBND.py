@@ -3,7 +3,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2020 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.0'
+__version__ = '1.1.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -13,7 +13,7 @@ import logging
 import argparse
 from anacore.vcf import HeaderInfoAttr
 from anacore.fusion import BreakendVCFIO, getAltFromCoord, getCoordStr, getStrand
-from anacore.sequenceIO import IdxFastaIO
+from mmapSequenceIO import MmapIdxFastaIO
 
 
 ########################################################################
@@ -46,13 +46,32 @@ def replaceUnknownNt(record, seq_handler):
     :param record: The breakend record.
     :type record: anacore.vcf.VCFRecord
     :param seq_handler: Indexed reader for the reference genome used in fusion calling.
-    :type seq_handler: anacore.sequenceIO.IdxFastaIO
+    :type seq_handler: mmapSequenceIO.MmapIdxFastaIO
     """
     if record.ref == "N":
         record.ref = seq_handler.getSub(record.chrom, record.pos, record.pos)
     record.alt[0] = record.alt[0].replace("N", record.ref)
 
 
+def getFlankingSeq(record, seq_handler, padding):
+    """
+    Return sequences before and after the breakend. Both include the breakend nucleotid. They are extracted from only one window on reference.
+
+    :param record: The breakend record.
+    :type record: anacore.vcf.VCFRecord
+    :param seq_handler: Indexed reader for the reference genome used in fusion calling.
+    :type seq_handler: mmapSequenceIO.MmapIdxFastaIO
+    :param padding: Number of nucleotids before and after the breakend.
+    :type padding: int
+    :return: Sequence before the breakend and sequence after the breakend.
+    :rtype: (str, str)
+    """
+    window_start = max(record.pos - padding, 1)
+    window = seq_handler.getSub(record.chrom, window_start, record.pos + padding)
+    bnd_idx = record.pos - window_start
+    return window[:bnd_idx + 1], window[bnd_idx:]
+
+
 def fastStandardize(first, second, seq_handler, padding=50):
     """
     Each breakend of the pair is placed at the left most position, and the uncertainty is represented with the CIPOS tag. The ALT string is then constructed assuming this choice.
@@ -62,16 +81,14 @@ def fastStandardize(first, second, seq_handler, padding=50):
     :param second: The breakend of the second shard in fusion (acceptor).
     :type second: anacore.vcf.VCFRecord
     :param seq_handler: Indexed reader for the reference genome used in fusion calling.
-    :type seq_handler: anacore.sequenceIO.IdxFastaIO
+    :type seq_handler: mmapSequenceIO.MmapIdxFastaIO
     :param padding: Number of nucleotids to inspect before and after the breakends: upstream and downstream movements are limited to this number of nucleotids.
     :type padding: int
     """
     first_strand = getStrand(first, True)
     second_strand = getStrand(second, False)
-    before_first = seq_handler.getSub(first.chrom, max(first.pos - padding, 1), first.pos)
-    before_second = seq_handler.getSub(second.chrom, max(second.pos - padding, 1), second.pos)
-    after_first = seq_handler.getSub(first.chrom, first.pos, first.pos + padding)
-    after_second = seq_handler.getSub(second.chrom, second.pos, second.pos + padding)
+    before_first, after_first = getFlankingSeq(first, seq_handler, padding)
+    before_second, after_second = getFlankingSeq(second, seq_handler, padding)
     cipos_start = 0
     cipos_end = 0
     if first_strand == second_strand:  # Same strand
@@ -179,7 +196,7 @@ if __name__ == "__main__":
     log.info("Command: " + " ".join(sys.argv))
 
     # Process
-    with IdxFastaIO(args.input_genome) as genome_reader:
+    with MmapIdxFastaIO(args.input_genome) as genome_reader:
         with BreakendVCFIO(args.input_variants) as reader:
             with BreakendVCFIO(args.output_variants, "w") as writer:
                 writer.copyHeader(reader)
@@ -19,7 +19,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2019 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.0'
+__version__ = '1.1.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -29,7 +29,7 @@ import logging
 import argparse
 from anacore.vcf import VCFIO, getAlleleRecord, HeaderInfoAttr
 from anacore.annotVcf import AnnotVCFIO
-from anacore.sequenceIO import IdxFastaIO
+from mmapSequenceIO import MmapIdxFastaIO
 
 
 ########################################################################
@@ -42,7 +42,7 @@ def stdizeVCF(FH_ref, FH_in, FH_out, trace_unstandard=False, log=None):
     Split alternatives alleles in multi-lines, removes unecessary reference and alternative nucleotids, move indel to most upstream position and update alt allele in annotations.
 
     :param FH_ref: File handle to the reference file (format: fasta with faidx).
-    :type FH_ref: anacore.sequenceIO.IdxFastaIO
+    :type FH_ref: mmapSequenceIO.MmapIdxFastaIO
     :param FH_in: File handle to the variants file (format: VCF).
     :type FH_in: anacore.vcf.VCFIO
     :param FH_out: File handle to the standardized variants file (format: VCF).
@@ -116,7 +116,7 @@ if __name__ == "__main__":
     log.info("Command: " + " ".join(sys.argv))
 
     # Process
-    with IdxFastaIO(args.input_reference, use_cache=True) as FH_ref:
+    with MmapIdxFastaIO(args.input_reference) as FH_ref:
         if args.annotations_field is not None:
             with AnnotVCFIO(args.output_variants, "w", annot_field=args.annotations_field) as FH_out:
                 with AnnotVCFIO(args.input_variants, annot_field=args.annotations_field) as FH_in:
@@ -0,0 +1,159 @@
+#
+# Copyright (C) 2021 IUCT-O
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Classes and functions to read and write variants JSON record by record without keeping the whole document in memory."""
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.1.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import json
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def iterVariantsJSON(filepath, chunk_size=1048576):
+    """
+    Return a generator on the variants of the file. The file can be a JSON list or a NDJSON (one JSON by line). Only one variant and one chunk of the file are kept in memory.
+
+    :param filepath: Path to the variants file (format: JSON or NDJSON).
+    :type filepath: str
+    :param chunk_size: Number of characters read at once.
+    :type chunk_size: int
+    :return: Generator on variants.
+    :rtype: generator
+    """
+    decoder = json.JSONDecoder()
+    with open(filepath) as reader:
+        buffer = ""
+        start = 0
+        is_list = None
+        is_end = False
+        while True:
+            # Skip separators
+            while start < len(buffer) and buffer[start] in " \t\r\n,":
+                start += 1
+            if is_list is None and start < len(buffer):  # Type of document
+                is_list = (buffer[start] == "[")
+                if is_list:
+                    start += 1
+                continue
+            if start < len(buffer) and buffer[start] == "]":  # End of list
+                if not is_list:
+                    raise ValueError('The file "{}" is not a valid JSON list.'.format(filepath))
+                return
+            # Decode next variant
+            is_complete = False
+            if start < len(buffer):
+                try:
+                    variant, end = decoder.raw_decode(buffer, start)
+                    is_complete = end < len(buffer) or is_end or buffer[start] in "{[\""  # Number can be truncated by the end of the chunk
+                except json.JSONDecodeError:
+                    if is_end:
+                        raise
+            if is_complete:
+                yield variant
+                start = end
+            else:  # Incomplete variant
+                if is_end:
+                    if start < len(buffer) or is_list:
+                        raise ValueError('The file "{}" is truncated.'.format(filepath))
+                    return
+                chunk = reader.read(chunk_size)
+                is_end = (chunk == "")
+                buffer = buffer[start:] + chunk
+                start = 0
+
+
+class VariantsJSONWriter:
+    """
+    Write a list of variants in stream. In JSON format the output is byte-identical to json.dumps() on the complete list. In NDJSON format each variant is written on its own line. When an exception is raised in the with block, the partial file is removed.
+
+    :Example:
+        with VariantsJSONWriter("variants.json", sort_keys=True) as writer:
+            for variant in variants:
+                writer.write(variant)
+    """
+
+    def __init__(self, filepath, ndjson=False, sort_keys=False, default=None):
+        """
+        Build and return an instance of VariantsJSONWriter.
+
+        :param filepath: Path to the outputted file.
+        :type filepath: str
+        :param ndjson: With True the output is in NDJSON format (one JSON by line) instead of a JSON list.
+        :type ndjson: bool
+        :param sort_keys: With True the keys of dictionaries are sorted.
+        :type sort_keys: bool
+        :param default: Function called on objects that cannot otherwise be serialized (see json.dumps()).
+        :type default: function
+        :return: The new instance.
+        :rtype: VariantsJSONWriter
+        """
+        self.filepath = filepath
+        self.ndjson = ndjson
+        self.nb_written = 0
+        self._encoder = json.JSONEncoder(sort_keys=sort_keys, default=default)
+        self._handle = open(filepath, "w")
+        if not ndjson:
+            self._handle.write("[")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def abort(self):
+        """Close the file and remove the partial document. It does nothing if the writer is already closed."""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+            if os.path.exists(self.filepath):
+                os.remove(self.filepath)
+
+    def close(self):
+        """Write the end of the document and close the file."""
+        if self._handle is not None:
+            if not self.ndjson:
+                self._handle.write("]")
+            self._handle.close()
+            self._handle = None
+
+    def write(self, variant):
+        """
+        Write one variant.
+
+        :param variant: The variant.
+        :type variant: dict
+        """
+        if self.ndjson:
+            self._handle.write(self._encoder.encode(variant) + "\n")
+        else:
+            if self.nb_written != 0:
+                self._handle.write(", ")
+            self._handle.write(self._encoder.encode(variant))
+        self.nb_written += 1
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import json
+import uuid
+import tempfile
+import unittest
+import subprocess
+from anacore.vcf import VCFRecord, HeaderFormatAttr, HeaderInfoAttr
+from anacore.annotVcf import AnnotVCFIO
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class TestVCFToJSON(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_variants = os.path.join(tmp_folder, unique_id + ".vcf")
+        self.tmp_output = os.path.join(tmp_folder, unique_id + "_out.json")
+
+        # Create VCF
+        with AnnotVCFIO(self.tmp_variants, "w") as FH_var:
+            FH_var.ANN_titles = ["Allele", "Consequence", "SYMBOL", "Feature", "Feature_type", "HGVSc", "HGVSp", "Existing_variation", "AF", "EUR_AF", "gnomAD_AF", "gnomAD_NFE_AF", "CLIN_SIG"]
+            FH_var.info = {
+                "ANN": HeaderInfoAttr("ANN", "Consequence annotations from Ensembl VEP. Format: " + "|".join(FH_var.ANN_titles), type="String", number=".")
+            }
+            FH_var.format = {
+                "AD": HeaderFormatAttr("AD", "Allelic depths for the ref and alt alleles in the order listed.", type="Integer", number="R"),
+                "DP": HeaderFormatAttr("DP", "Total depth.", type="Integer", number="1")
+            }
+            FH_var.samples = ["splA"]
+            FH_var.writeHeader()
+            annot_1 = {
+                "Allele": "T", "Consequence": "missense_variant", "SYMBOL": "BRAF", "Feature": "ENST00000288602", "Feature_type": "Transcript",
+                "HGVSc": "ENST00000288602.6:c.1799T>A", "HGVSp": "ENSP00000288602.6:p.Val600Glu", "Existing_variation": "rs113488022&COSM476",
+                "AF": "0.01", "EUR_AF": "0.02", "gnomAD_AF": "0.001", "gnomAD_NFE_AF": "0.002", "CLIN_SIG": "pathogenic"
+            }
+            annot_2 = {key: None for key in FH_var.ANN_titles}
+            annot_2.update({"Allele": "G", "Consequence": "synonymous_variant", "SYMBOL": "BRAF", "Feature": "ENST00000288602", "Feature_type": "Transcript", "gnomAD_AF": "0.5&0.5"})
+            self.variants = [
+                VCFRecord("chr7", 140753336, None, "A", ["T"], 200, ["PASS"], {"ANN": [annot_1]}, ["AD", "DP"], {"splA": {"AD": [90, 10], "DP": 100}}),
+                VCFRecord("chr7", 140753340, "var_2", "C", ["T", "G"], None, ["lowAF"], {"ANN": [annot_1, annot_2]}, ["AD", "DP"], {"splA": {"AD": [80, 15, 5], "DP": 100}}),
+                VCFRecord("chr8", 1200, None, "CA", ["C"], 30, ["PASS"], {}, ["AD", "DP"], {"splA": {"AD": [10, 2], "DP": 12}})
+            ]
+            for record in self.variants:
+                FH_var.write(record)
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_variants, self.tmp_output]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testResults(self):
+        # JSON
+        cmd = [
+            "VCFToJSON.py",
+            "--assembly-id", "GRCh38",
+            "--calling-source", "caller",
+            "--input-variants", self.tmp_variants,
+            "--output-variants", self.tmp_output
+        ]
+        subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+        with open(self.tmp_output) as reader:
+            content = reader.read()
+        observed = json.loads(content)
+        self.assertEqual(content, json.dumps(observed, sort_keys=True))  # Same bytes as a dump of the whole list
+        self.assertEqual(
+            [(elt["coord"]["region"], elt["coord"]["pos"], elt["coord"]["ref"], elt["coord"]["alt"]) for elt in observed],
+            [("chr7", 140753336, "A", "T"), ("chr7", 140753340, "C", "T"), ("chr7", 140753340, "C", "G"), ("chr8", 1201, "A", "-")]
+        )
+        self.assertEqual(
+            observed[0]["supports"],
+            [{"filters": ["PASS"], "libraries": [{"alt_depth": 10, "depth": 100, "name": "splA"}], "quality": 200, "source": "caller"}]
+        )
+        self.assertEqual(
+            sorted([(elt["source"], elt["name"], elt["AF"]) for elt in observed[0]["pop_AF"]]),
+            [("1KG", "EUR", 0.02), ("gnomAD", "Global", 0.001), ("gnomAD", "NFE", 0.002)]
+        )
+        self.assertEqual(sorted(observed[0]["xref"]["dbSNP"]), ["rs113488022"])
+        self.assertEqual(observed[0]["annot"][0]["pathogenicity"], {"ClinVar": "pathogenic"})
+        self.assertEqual(observed[2]["pop_AF"], [{"source": "gnomAD", "name": "Global", "AF": 0.5}])
+        self.assertEqual(len(observed[2]["collocated_annot"]), 1)
+        self.assertEqual(observed[3]["annot"], [])
+        # NDJSON
+        subprocess.check_call(cmd + ["--output-format", "ndjson"], stderr=subprocess.DEVNULL)
+        with open(self.tmp_output) as reader:
+            self.assertEqual(reader.read(), "".join([json.dumps(elt, sort_keys=True) + "\n" for elt in observed]))
+
+    def testEmpty(self):
+        with AnnotVCFIO(self.tmp_variants) as reader:
+            with AnnotVCFIO(self.tmp_variants + ".tmp", "w") as writer:
+                writer.copyHeader(reader)
+                writer.writeHeader()
+        os.rename(self.tmp_variants + ".tmp", self.tmp_variants)
+        cmd = [
+            "VCFToJSON.py",
+            "--input-variants", self.tmp_variants,
+            "--output-variants", self.tmp_output
+        ]
+        subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+        with open(self.tmp_output) as reader:
+            self.assertEqual(reader.read(), "[]")
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import uuid
+import pysam
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def samToBam(in_sam, out_bam):
+    with pysam.AlignmentFile(in_sam, "r") as reader:
+        with pysam.AlignmentFile(out_bam, "wb", header=reader.header) as writer:
+            for record in reader:
+                writer.write(record)
+
+
+def bamToSam(in_bam, out_sam):
+    with pysam.AlignmentFile(in_bam, "rb") as reader:
+        with pysam.AlignmentFile(out_sam, "w", header=reader.header) as writer:
+            for record in reader:
+                writer.write(record)
+
+
+class TestAddRGOnBAMAutoIllu(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_in_sam = os.path.join(tmp_folder, unique_id + "_in.sam")
+        self.tmp_in_bam = os.path.join(tmp_folder, unique_id + "_in.bam")
+        self.tmp_out_bam = os.path.join(tmp_folder, unique_id + "_out.bam")
+        self.tmp_out_sam = os.path.join(tmp_folder, unique_id + "_out.sam")
+        self.tmp_dir = os.path.join(tmp_folder, unique_id + "_tmp")
+        os.makedirs(self.tmp_dir)
+
+        # Create input files
+        with open(self.tmp_in_sam, "w") as FH_out:
+            FH_out.write("""@HD	VN:1.0	SO:coordinate
+@SQ	SN:1	LN:248956422
+@RG	ID:spl1	LB:lib1	SM:spl1
+@RG	ID:spl2	LB:lib2	SM:spl2
+M70265:329:000000000-D5GLP:1:1101:15819:1970	0	1	36993275	42	10M	*	0	0	AGAGTGGATA	GFFEBGFFFF	RG:Z:spl1
+M70265:329:000000000-D5GLP:2:1101:17038:2070	0	1	36993275	42	10M	*	0	0	AGAGTGGATA	HHHGHHHHHH	RG:Z:spl1
+M70265:329:000000000-D5GLP:1:1102:5862:11858:ATGC+GGTA	0	1	36993280	42	10M	*	0	0	GGATAGTGAT	F4HHGHHGGH	RG:Z:spl2
+M70265:329:000000000-D5GLP:2:1102:19428:6706	0	1	36993281	42	10M	*	0	0	GATAGTGATT	HHHHHHHGGH	RG:Z:spl1
+M70265:329:000000000-D5GLP:1:1103:1942:706	0	1	36993290	42	10M	*	0	0	TGATTTTTAA	HHHHHHHGGH	RG:Z:spl1""")
+        samToBam(self.tmp_in_sam, self.tmp_in_bam)
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_in_sam, self.tmp_in_bam, self.tmp_out_bam, self.tmp_out_sam]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+        shutil.rmtree(self.tmp_dir)
+
+    def testResults(self):
+        expected = """@HD	VN:1.0	SO:coordinate
+@SQ	SN:1	LN:248956422
+@RG	ID:1	SM:spl1	LB:lib1	PU:000000000-D5GLP.1.ACGT	PL:ILLUMINA
+@RG	ID:2	SM:spl1	LB:lib1	PU:000000000-D5GLP.2.ACGT	PL:ILLUMINA
+@RG	ID:3	SM:spl2	LB:lib2	PU:000000000-D5GLP.1.ACGT	PL:ILLUMINA
+M70265:329:000000000-D5GLP:1:1101:15819:1970	0	1	36993275	42	10M	*	0	0	AGAGTGGATA	GFFEBGFFFF	RG:Z:1
+M70265:329:000000000-D5GLP:2:1101:17038:2070	0	1	36993275	42	10M	*	0	0	AGAGTGGATA	HHHGHHHHHH	RG:Z:2
+M70265:329:000000000-D5GLP:1:1102:5862:11858:ATGC+GGTA	0	1	36993280	42	10M	*	0	0	GGATAGTGAT	F4HHGHHGGH	RG:Z:3
+M70265:329:000000000-D5GLP:2:1102:19428:6706	0	1	36993281	42	10M	*	0	0	GATAGTGATT	HHHHHHHGGH	RG:Z:2
+M70265:329:000000000-D5GLP:1:1103:1942:706	0	1	36993290	42	10M	*	0	0	TGATTTTTAA	HHHHHHHGGH	RG:Z:1"""
+        for nb_threads in ["1", "2"]:
+            # Exec
+            cmd = [
+                "addRGOnBAMAutoIllu.py",
+                "--barcode", "ACGT",
+                "--io-threads", nb_threads,
+                "--tmp-folder", self.tmp_dir,
+                "--input-aln", self.tmp_in_bam,
+                "--output-aln", self.tmp_out_bam
+            ]
+            subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+            # Eval
+            bamToSam(self.tmp_out_bam, self.tmp_out_sam)
+            with open(self.tmp_out_sam) as reader:
+                observed = "".join(reader.readlines())
+            self.assertEqual(expected, observed.strip())
+            self.assertEqual(os.listdir(self.tmp_dir), [])
+        # Output on stdout: the temporary file is not written in the working directory
+        cmd = ["addRGOnBAMAutoIllu.py", "--barcode", "ACGT", "--input-aln", self.tmp_in_bam, "--output-aln", "-"]
+        with open(self.tmp_out_bam, "wb") as handle:
+            subprocess.check_call(cmd, stdout=handle, stderr=subprocess.DEVNULL, cwd=self.tmp_dir)
+        bamToSam(self.tmp_out_bam, self.tmp_out_sam)
+        with open(self.tmp_out_sam) as reader:
+            observed = "".join(reader.readlines())
+        self.assertEqual(expected, observed.strip())
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def testTemporaryRemovedOnError(self):
+        os.mkdir(self.tmp_out_bam)  # The final output cannot be written
+        try:
+            cmd = ["addRGOnBAMAutoIllu.py", "--tmp-folder", self.tmp_dir, "--input-aln", self.tmp_in_bam, "--output-aln", self.tmp_out_bam]
+            with self.assertRaises(subprocess.CalledProcessError):
+                subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+            self.assertEqual(os.listdir(self.tmp_dir), [])
+        finally:
+            os.rmdir(self.tmp_out_bam)
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
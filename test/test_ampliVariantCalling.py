@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import uuid
+import shutil
+import argparse
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+from ampliVariantCalling import Cmd, CmdPipeline, TmpFiles, processGroup, splitBEDByGroup
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def writeExecutable(path, content):
+    with open(path, "w") as writer:
+        writer.write("#!/bin/sh\n" + content)
+    os.chmod(path, 0o755)
+
+
+class TestSplitBEDByGroup(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_in = os.path.join(tmp_folder, unique_id + "_in.bed")
+        self.tmp_out = {
+            gp: {
+                "all": os.path.join(tmp_folder, unique_id + "_" + gp + ".bed"),
+                "4_col": os.path.join(tmp_folder, unique_id + "_" + gp + "_4col.bed")
+            } for gp in ["grp0", "grp1", "grp2"]
+        }
+
+        # Design
+        with open(self.tmp_in, "w") as writer:
+            writer.write(
+                "track name=panel\n" +
+                "chr1\t10\t60\tampl1\t0\t+\t20\t50\n" +
+                "chr1\t40\t90\tampl2\t0\t-\t50\t80\n" +
+                "chr1\t70\t120\tampl3\t0\t+\t80\t110\n" +
+                "chr2\t10\t60\tampl4\t0\t+\t20\t50\n" +
+                "chr2\t200\t260\tampl5\t0\t+\t210\t250\n"
+            )
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_in] + [path for curr_gp in self.tmp_out.values() for path in curr_gp.values()]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testSplit(self):
+        amplicons_by_group = {"grp0": ["ampl1", "ampl3", "ampl4"], "grp1": ["ampl2"], "grp2": []}  # ampl5 is in no group
+        splitBEDByGroup(
+            self.tmp_in,
+            amplicons_by_group,
+            [
+                ({gp: paths["all"] for gp, paths in self.tmp_out.items()}, None),
+                ({gp: paths["4_col"] for gp, paths in self.tmp_out.items()}, 4)
+            ]
+        )
+        expected = {
+            "grp0": {
+                "all": "track name=panel\nchr1\t10\t60\tampl1\t0\t+\t20\t50\nchr1\t70\t120\tampl3\t0\t+\t80\t110\nchr2\t10\t60\tampl4\t0\t+\t20\t50\n",
+                "4_col": "track name=panel\nchr1\t10\t60\tampl1\nchr1\t70\t120\tampl3\nchr2\t10\t60\tampl4\n"
+            },
+            "grp1": {
+                "all": "track name=panel\nchr1\t40\t90\tampl2\t0\t-\t50\t80\n",
+                "4_col": "track name=panel\nchr1\t40\t90\tampl2\n"
+            },
+            "grp2": {
+                "all": "track name=panel\n",
+                "4_col": "track name=panel\n"
+            }
+        }
+        observed = dict()
+        for gp, paths in self.tmp_out.items():
+            observed[gp] = dict()
+            for key, path in paths.items():
+                with open(path) as reader:
+                    observed[gp][key] = reader.read()
+        self.assertEqual(expected, observed)
+
+
+class TestCmdPipeline(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_in = os.path.join(tmp_folder, unique_id + "_in.txt")
+        self.tmp_out = os.path.join(tmp_folder, unique_id + "_out.txt")
+        self.tmp_log = os.path.join(tmp_folder, unique_id + "_log.txt")
+        with open(self.tmp_in, "w") as writer:
+            for idx in range(20000):
+                writer.write("line{}\n".format(idx))
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_in, self.tmp_out, self.tmp_log]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testSuccess(self):
+        CmdPipeline(
+            [
+                Cmd("cat", "Read.", self.tmp_in),
+                Cmd("grep", "Select.", "'5$'"),
+                Cmd("wc", "Count.", "-l > " + self.tmp_out)
+            ],
+            "Count lines ending with 5."
+        ).submit(self.tmp_log)
+        with open(self.tmp_out) as reader:
+            self.assertEqual(reader.read().strip(), "2000")
+        with open(self.tmp_log) as reader:
+            log = reader.read()
+        self.assertIn("\t\tcat " + self.tmp_in + " | grep '5$' | wc -l > " + self.tmp_out + "\n", log)
+        self.assertEqual(log.count(": return code 0,"), 3)
+
+    def testFailedReader(self):
+        # The last command fails and the writer of a large output is killed by SIGPIPE
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            CmdPipeline(
+                [
+                    Cmd("yes", "Write.", ""),
+                    Cmd("sh", "Fail.", "-c 'head -n 1 > /dev/null; exit 3'")
+                ],
+                "Fail on reader."
+            ).submit(self.tmp_log)
+        self.assertEqual(context.exception.returncode, 3)
+        self.assertEqual(context.exception.cmd, "sh -c 'head -n 1 > /dev/null; exit 3'")
+        with open(self.tmp_log) as reader:
+            log = reader.read()
+        self.assertIn("\t\tsh: return code 3,", log)
+
+    def testFailedWriter(self):
+        # The first command fails and the following commands succeed on the truncated stream
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            CmdPipeline(
+                [
+                    Cmd("cat", "Read.", "/not/exists.txt"),
+                    Cmd("cat", "Copy.", "> " + self.tmp_out)
+                ],
+                "Fail on writer."
+            ).submit()
+        self.assertEqual(context.exception.returncode, 1)
+        self.assertEqual(context.exception.cmd, "cat /not/exists.txt")
+
+
+class TestProcessGroup(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_dir = os.path.join(tmp_folder, unique_id)
+        os.makedirs(os.path.join(self.tmp_dir, "bin"))
+        self.tmp_files = TmpFiles(self.tmp_dir)
+        self.tmp_aln = os.path.join(self.tmp_dir, "grp0.bam")
+        self.tmp_genome = os.path.join(self.tmp_dir, "genome.fasta")
+        self.tmp_log = os.path.join(self.tmp_dir, "log.txt")
+        self.tmp_vardict_args = os.path.join(self.tmp_dir, "vardict_args.txt")
+        self.design = {
+            "with_prim": os.path.join(self.tmp_dir, "grp0_withPrimers.bed"),
+            "with_prim_4_col": os.path.join(self.tmp_dir, "grp0_withPrimers_4col.bed"),
+            "wout_prim": os.path.join(self.tmp_dir, "grp0_woutPrimers.bed")
+        }
+
+        # Inputs
+        with open(self.tmp_aln, "w") as writer:
+            writer.write("")
+        with open(self.tmp_genome, "w") as writer:
+            writer.write(">chr1\n" + "ACGTTGCAAC" * 6 + "\n")
+        with open(self.design["with_prim"], "w") as writer:
+            writer.write("chr1\t0\t60\tampl1\t0\t+\t10\t50\n")
+        with open(self.design["with_prim_4_col"], "w") as writer:
+            writer.write("chr1\t0\t60\tampl1\n")
+        with open(self.design["wout_prim"], "w") as writer:
+            writer.write("chr1\t10\t50\tampl1\n")
+
+        # Tools replaced by stubs
+        self.bin_dir = os.path.join(self.tmp_dir, "bin")
+        writeExecutable(
+            os.path.join(self.bin_dir, "samtools"),
+            'if [ "$1" = "--version" ]; then echo "samtools 1.9"; else touch "$2.bai"; fi\n'
+        )
+        writeExecutable(
+            os.path.join(self.bin_dir, "vardict-stub"),
+            'echo "$@" > ' + self.tmp_vardict_args + '\necho "ampl1\tsplA\tchr1\t5"\necho "ampl1\tsplA\tchr1\t25"\n'
+        )
+        writeExecutable(
+            os.path.join(self.bin_dir, "teststrandbias.R"),
+            'cat\n'
+        )
+        writeExecutable(
+            os.path.join(self.bin_dir, "var2vcf_valid.pl"),
+            'while read -r name spl chrom pos; do\n' +
+            '  [ -z "$header" ] && printf "##fileformat=VCFv4.1\\n#CHROM\\tPOS\\tID\\tREF\\tALT\\tQUAL\\tFILTER\\tINFO\\n" && header=1\n' +
+            '  printf "%s\\t%s\\t.\\tT\\tA\\t.\\tPASS\\t.\\n" "$chrom" "$pos"\n' +
+            'done\n'
+        )
+        self.ori_path = os.environ['PATH']
+        os.environ['PATH'] = self.bin_dir + os.pathsep + os.environ['PATH']
+
+        # Arguments
+        self.args = argparse.Namespace(
+            input_genome=self.tmp_genome,
+            output_log=self.tmp_log,
+            min_alt_freq=0.02,
+            min_alt_count=4,
+            min_base_qual=25,
+            vardict_call="vardict-stub"
+        )
+
+    def tearDown(self):
+        os.environ['PATH'] = self.ori_path
+        shutil.rmtree(self.tmp_dir)
+
+    def testProcessGroup(self):
+        group = processGroup("grp0", self.tmp_aln, self.design, self.args, self.tmp_files)
+        self.assertEqual(group["name"], "grp0")
+        self.assertEqual(group["aln"], self.tmp_aln)
+        self.assertEqual(group["design_with_prim"], self.design["with_prim"])
+        self.assertEqual(group["design_wout_prim"], self.design["wout_prim"])
+        self.assertTrue(os.path.exists(self.tmp_aln + ".bai"))
+        # VarDict uses design without extra columns
+        with open(self.tmp_vardict_args) as reader:
+            vardict_args = reader.read().strip().split(" ")
+        self.assertEqual(vardict_args[-1], self.design["with_prim_4_col"])
+        self.assertEqual(vardict_args[vardict_args.index("-b") + 1], self.tmp_aln)
+        # Variant in primer is removed
+        with open(group["vcf"]) as reader:
+            records = [line.split("\t")[:2] for line in reader if not line.startswith("#")]
+        self.assertEqual(records, [["chr1", "25"]])
+
+    def testFailedStep(self):
+        writeExecutable(
+            os.path.join(self.bin_dir, "teststrandbias.R"),
+            'cat > /dev/null; exit 2\n'
+        )
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            processGroup("grp0", self.tmp_aln, self.design, self.args, self.tmp_files)
+        self.assertEqual(context.exception.returncode, 2)
+        self.assertIn("teststrandbias.R", context.exception.cmd)
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
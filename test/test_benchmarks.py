@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import json
+import uuid
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BENCH_DIR = os.path.join(APP_DIR, "benchmarks")
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BENCH_DIR)
+sys.path.append(BIN_DIR)
+
+from jobProfiler import resetPeakRSS
+from runBenchmarks import execScenario
+from scenarios import Scenario
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def setupLargeState(inputs):
+    """Allocate and release 200MB before the run."""
+    data = bytearray(200 * 1048576)
+    data[::4096] = b"\x01" * len(data[::4096])  # Pages are really allocated
+    del data
+    return None
+
+
+def runSmall(inputs, state):
+    """Allocate 10MB."""
+    data = bytearray(10 * 1048576)
+    data[::4096] = b"\x01" * len(data[::4096])
+    return len(data)
+
+
+class TestBenchmarks(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_dir = os.path.join(tmp_folder, unique_id)
+        os.makedirs(self.tmp_dir)
+        self.tmp_current = os.path.join(self.tmp_dir, "current.json")
+        self.baseline = os.path.join(BENCH_DIR, "baseline.json")
+
+    def tearDown(self):
+        # Clean temporary files
+        shutil.rmtree(self.tmp_dir)
+
+    def testPeakRSSOfRun(self):
+        usage = execScenario(Scenario("test.setup", None, runSmall, setupLargeState), {})
+        self.assertGreater(usage["peak_rss_mb"], 10)
+        if resetPeakRSS():
+            self.assertLess(usage["peak_rss_mb"], 200)  # Memory used by setup is not included
+
+    def testRunAndCompare(self):
+        # Run
+        scenarios = ["cigarlineGraph.sumStatusFromAln", "illuCountBarcodes.getCountByBarcode"]
+        cmd = [
+            sys.executable, os.path.join(BENCH_DIR, "runBenchmarks.py"),
+            "--scale", "0.001",
+            "--repeats", "2",
+            "--scenarios"
+        ] + scenarios + [
+            "--work-dir", self.tmp_dir,
+            "--output", self.tmp_current
+        ]
+        subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
+        with open(self.tmp_current) as reader:
+            current = json.load(reader)
+        self.assertEqual(sorted(current["scenarios"]), scenarios)
+        for measures in current["scenarios"].values():
+            self.assertEqual(sorted(measures), ["cpu_time_s", "peak_rss_mb", "wall_time_s"])
+            self.assertTrue(all(len(values) == 2 for values in measures.values()))
+            self.assertTrue(all(value > 0 for value in measures["peak_rss_mb"]))
+        # Compare with itself
+        cmd = [sys.executable, os.path.join(BENCH_DIR, "compareBenchmarks.py"), "--input-baseline", self.tmp_current, "--input-current", self.tmp_current]
+        process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertEqual(process.returncode, 0)
+        rows = [line.split("\t") for line in process.stdout.decode().strip().split("\n")[1:]]
+        self.assertEqual([(row[0], row[1], row[-1]) for row in rows], [(name, metric, "ok") for name in scenarios for metric in ["wall_time_s", "peak_rss_mb"]])
+        # Compare with the committed baseline
+        with open(self.baseline) as reader:
+            baseline = json.load(reader)
+        cmd = [sys.executable, os.path.join(BENCH_DIR, "compareBenchmarks.py"), "--input-baseline", self.baseline, "--input-current", self.tmp_current]
+        process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertIn(process.returncode, [0, 1])  # 1 on regression
+        self.assertIn("[WARNING] Scales are different", process.stderr.decode())
+        rows = [line.split("\t") for line in process.stdout.decode().strip().split("\n")[1:]]
+        self.assertEqual(sorted(set(row[0] for row in rows)), sorted(baseline["scenarios"]))
+        status_by_scenario = {row[0]: row[-1] for row in rows}
+        for name in baseline["scenarios"]:
+            if name not in scenarios:
+                self.assertEqual(status_by_scenario[name], "missing")
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import gzip
+import uuid
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+
+from bufferedIO import BufferedWriter
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class TestBufferedWriter(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_txt = os.path.join(tmp_folder, unique_id + ".txt")
+        self.tmp_gz = os.path.join(tmp_folder, unique_id + ".txt.gz")
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_txt, self.tmp_gz]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testWrite(self):
+        lines = ["line{}\n".format(idx) for idx in range(1000)]
+        expected = "".join(lines)
+        for executor in [None, ThreadPoolExecutor(2)]:
+            # Text
+            with BufferedWriter(self.tmp_txt, executor, buffer_size=100) as writer:
+                for line in lines:
+                    writer.write(line)
+            with open(self.tmp_txt) as reader:
+                self.assertEqual(reader.read(), expected)
+            # Gzip with one member by buffer
+            with BufferedWriter(self.tmp_gz, executor, buffer_size=100) as writer:
+                for line in lines:
+                    writer.write(line.encode())
+            with gzip.open(self.tmp_gz, "rt") as reader:
+                self.assertEqual(reader.read(), expected)
+            with open(self.tmp_gz, "rb") as reader:
+                self.assertGreater(reader.read().count(b"\x1f\x8b\x08"), 10)
+            if executor is not None:
+                executor.shutdown()
+
+    def testWriteRaw(self):
+        with BufferedWriter(self.tmp_gz) as writer:
+            writer.write("first\n")
+            writer.writeRaw(gzip.compress(b"second\n"))
+            writer.write("third\n")
+        with gzip.open(self.tmp_gz, "rt") as reader:
+            self.assertEqual(reader.read(), "first\nsecond\nthird\n")
+
+    def testEmpty(self):
+        with BufferedWriter(self.tmp_gz):
+            pass
+        with gzip.open(self.tmp_gz, "rt") as reader:
+            self.assertEqual(reader.read(), "")
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import uuid
+import pysam
+import random
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getSimulatedAlignment(rand, ref_seq, read_len):
+    """
+    Return CIGAR, sequence, MD and start of a read simulated on the reference with clippings, substitutions, insertions and deletions.
+
+    :param rand: The random generator.
+    :type rand: random.Random
+    :param ref_seq: The reference sequence.
+    :type ref_seq: str
+    :param read_len: The length of the read.
+    :type read_len: int
+    :return: The CIGAR operations, the sequence, the MD and the start on reference.
+    :rtype: (list, str, str, int)
+    """
+    start = rand.randrange(len(ref_seq) - 2 * read_len)
+    ref_pos = start
+    cigar = []
+    seq = ""
+    md = ""
+    md_count = 0
+    clip_start = rand.choice([0, 0, 0, rand.randint(1, 10)])
+    if clip_start:
+        if rand.random() < 0.5:
+            cigar.append((4, clip_start))
+            seq += "".join(rand.choice("ACGT") for idx in range(clip_start))
+        else:
+            cigar.append((5, clip_start))
+    while len(seq) < read_len - 10:
+        event = rand.random()
+        if event < 0.05 and cigar and cigar[-1][0] == 0:  # Insertion
+            length = rand.randint(1, 4)
+            cigar.append((1, length))
+            seq += "".join(rand.choice("ACGT") for idx in range(length))
+        elif event < 0.1 and cigar and cigar[-1][0] == 0:  # Deletion
+            length = rand.randint(1, 4)
+            cigar.append((2, length))
+            md += str(md_count) + "^" + ref_seq[ref_pos:ref_pos + length]
+            md_count = 0
+            ref_pos += length
+        else:  # Match or substitution
+            length = rand.randint(1, 30)
+            for idx in range(length):
+                if rand.random() < 0.03:
+                    seq += rand.choice([nt for nt in "ACGT" if nt != ref_seq[ref_pos]])
+                    md += str(md_count) + ref_seq[ref_pos]
+                    md_count = 0
+                else:
+                    seq += ref_seq[ref_pos]
+                    md_count += 1
+                ref_pos += 1
+            if cigar and cigar[-1][0] == 0:
+                cigar[-1] = (0, cigar[-1][1] + length)
+            else:
+                cigar.append((0, length))
+    md += str(md_count)
+    clip_end = rand.choice([0, 0, 0, rand.randint(1, 10)])
+    if clip_end:
+        cigar.append((4, clip_end))
+        seq += "".join(rand.choice("ACGT") for idx in range(clip_end))
+    return cigar, seq, md, start
+
+
+class TestCigarlineGraph(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_unsorted = os.path.join(tmp_folder, unique_id + "_unsorted.bam")
+        self.tmp_aln = os.path.join(tmp_folder, unique_id + ".bam")
+        self.tmp_sam = os.path.join(tmp_folder, unique_id + ".sam")
+        self.tmp_out = [os.path.join(tmp_folder, "{}_{}.tsv".format(unique_id, idx)) for idx in range(4)]
+
+        # Alignments
+        rand = random.Random(42)
+        ref_by_chrom = {"chr1": "".join(rand.choice("ACGT") for idx in range(3000)), "chr2": "".join(rand.choice("ACGT") for idx in range(3000))}
+        header = {"HD": {"VN": "1.6", "SO": "unsorted"}, "SQ": [{"SN": chrom, "LN": len(seq)} for chrom, seq in ref_by_chrom.items()]}
+        with pysam.AlignmentFile(self.tmp_unsorted, "wb", header=header) as writer:
+            for idx in range(600):
+                chrom = rand.choice(list(ref_by_chrom))
+                read = pysam.AlignedSegment(writer.header)
+                read.query_name = "read{}".format(idx // 2)
+                read.flag = rand.choice([67, 131, 83, 147, 0, 16])
+                read.reference_id = writer.header.get_tid(chrom)
+                read.mapping_quality = 60
+                if idx % 3 == 0:  # Perfect alignment
+                    read_len = rand.randint(50, 150)
+                    read.reference_start = rand.randrange(len(ref_by_chrom[chrom]) - read_len)
+                    read.cigartuples = [(0, read_len)]
+                    read.query_sequence = ref_by_chrom[chrom][read.reference_start:read.reference_start + read_len]
+                    read.set_tag("MD", str(read_len))
+                else:
+                    cigar, seq, md, start = getSimulatedAlignment(rand, ref_by_chrom[chrom], rand.randint(50, 150))
+                    read.reference_start = start
+                    read.cigartuples = cigar
+                    read.query_sequence = seq
+                    read.set_tag("MD", md)
+                read.query_qualities = pysam.qualitystring_to_array("F" * len(read.query_sequence))
+                writer.write(read)
+            # Special cases
+            specials = [
+                # flag, cigar, seq, MD
+                (256, [(0, 40)], None, "40"),  # Secondary without sequence
+                (0, [(7, 5), (8, 1), (7, 4)], "ACGTACGTAC", "5A4"),  # Sequence match and mismatch operations
+                (16, [(4, 3), (0, 20), (1, 2), (0, 10)], "A" * 35, "12C6"),  # MD shorter than the alignment (undefined positions)
+                (128, [(5, 10), (0, 8), (2, 2), (0, 7), (5, 4)], "C" * 15, "3G0T3^AC7")
+            ]
+            for idx, (flag, cigar, seq, md) in enumerate(specials):
+                read = pysam.AlignedSegment(writer.header)
+                read.query_name = "special{}".format(idx)
+                read.flag = flag
+                read.reference_id = 0
+                read.reference_start = 100
+                read.mapping_quality = 60
+                read.cigartuples = cigar
+                if seq is not None:
+                    read.query_sequence = seq
+                read.set_tag("MD", md)
+                writer.write(read)
+            # Unmapped
+            read = pysam.AlignedSegment(writer.header)
+            read.query_name = "unmapped"
+            read.flag = 4
+            read.query_sequence = "ACGT"
+            writer.write(read)
+        pysam.sort("-o", self.tmp_aln, self.tmp_unsorted)
+        pysam.index(self.tmp_aln)
+        with pysam.AlignmentFile(self.tmp_aln) as reader:
+            with open(self.tmp_sam, "w") as writer:
+                for read in reader.fetch(until_eof=True):
+                    writer.write(read.to_string() + "\n")
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_unsorted, self.tmp_aln, self.tmp_aln + ".bai", self.tmp_sam] + self.tmp_out:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testSameAsSAMLines(self):
+        # Split by read number
+        subprocess.check_call(["cigarlineGraph.py", "--readsplit", "-i", self.tmp_sam, "-t", self.tmp_out[0], self.tmp_out[1]], stderr=subprocess.DEVNULL)
+        for nb_jobs in ["1", "2"]:
+            subprocess.check_call(["cigarlineGraph.py", "--readsplit", "-j", nb_jobs, "-a", self.tmp_aln, "-t", self.tmp_out[2], self.tmp_out[3]], stderr=subprocess.DEVNULL)
+            for expected_path, observed_path in [(self.tmp_out[0], self.tmp_out[2]), (self.tmp_out[1], self.tmp_out[3])]:
+                with open(expected_path) as expected_reader:
+                    with open(observed_path) as observed_reader:
+                        self.assertEqual(observed_reader.read(), expected_reader.read())
+        # All reads
+        expected_process = subprocess.run(["cigarlineGraph.py", "-i", self.tmp_sam, "-t", self.tmp_out[0]], stderr=subprocess.PIPE, check=True)
+        observed_process = subprocess.run(["cigarlineGraph.py", "-a", self.tmp_aln, "-t", self.tmp_out[2]], stderr=subprocess.PIPE, check=True)
+        self.assertEqual(observed_process.stderr, expected_process.stderr)  # Warnings on undefined positions
+        with open(self.tmp_out[0]) as expected_reader:
+            with open(self.tmp_out[2]) as observed_reader:
+                self.assertEqual(observed_reader.read(), expected_reader.read())
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import gzip
+import uuid
+import pysam
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+from concatenateTextFiles import getGzipLastByte
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class TestConcatenateTextFiles(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_plain = os.path.join(tmp_folder, unique_id + "_1.txt")
+        self.tmp_multi_members = os.path.join(tmp_folder, unique_id + "_2.txt.gz")
+        self.tmp_empty = os.path.join(tmp_folder, unique_id + "_3.txt")
+        self.tmp_bgzf_in = os.path.join(tmp_folder, unique_id + "_4.txt")
+        self.tmp_bgzf = os.path.join(tmp_folder, unique_id + "_4.txt.gz")
+        self.tmp_out_gz = os.path.join(tmp_folder, unique_id + "_out.txt.gz")
+        self.tmp_out = os.path.join(tmp_folder, unique_id + "_out.txt")
+
+        # Inputs
+        with open(self.tmp_plain, "w") as writer:
+            writer.write("line1\nline2")  # Without last end of line
+        with open(self.tmp_multi_members, "wb") as writer:
+            writer.write(gzip.compress(b"line3\n"))
+            writer.write(gzip.compress(b""))
+            writer.write(gzip.compress(b"line4\nline5"))  # Without last end of line
+        with open(self.tmp_empty, "w") as writer:
+            pass
+        with open(self.tmp_bgzf_in, "w") as writer:
+            writer.write("".join("line{}\n".format(idx) for idx in range(6, 20000)))
+        pysam.tabix_compress(self.tmp_bgzf_in, self.tmp_bgzf)
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_plain, self.tmp_multi_members, self.tmp_empty, self.tmp_bgzf_in, self.tmp_bgzf, self.tmp_out_gz, self.tmp_out]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testResults(self):
+        bgzf_content = "".join("line{}\n".format(idx) for idx in range(6, 20000))
+        inputs_and_expected = [
+            (
+                [self.tmp_plain, self.tmp_multi_members, self.tmp_empty, self.tmp_bgzf],
+                "line1\nline2\nline3\nline4\nline5\n\n" + bgzf_content  # The empty file does not reset the need of end of line
+            ),
+            (
+                [self.tmp_bgzf, self.tmp_multi_members, self.tmp_bgzf, self.tmp_plain],
+                bgzf_content + "line3\nline4\nline5\n" + bgzf_content + "line1\nline2"
+            ),
+            (
+                [self.tmp_empty],
+                ""
+            )
+        ]
+        for inputs, expected in inputs_and_expected:
+            for options in [[], ["--compression-threads", "2", "--block-size", "1000"]]:
+                # Plain output
+                cmd = ["concatenateTextFiles.py", "--inputs"] + inputs + ["--output", self.tmp_out] + options
+                subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+                with open(self.tmp_out) as reader:
+                    self.assertEqual(reader.read(), expected)
+                # Gzip output
+                cmd = ["concatenateTextFiles.py", "--inputs"] + inputs + ["--output", self.tmp_out_gz] + options
+                subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+                with gzip.open(self.tmp_out_gz, "rt") as reader:
+                    self.assertEqual(reader.read(), expected)
+
+    def testGetGzipLastByte(self):
+        for chunk_size in [2, 5, 4194304]:  # Magic numbers on several blocks
+            self.assertEqual(getGzipLastByte(self.tmp_multi_members, chunk_size), b"5")  # The last member is empty
+            self.assertEqual(getGzipLastByte(self.tmp_bgzf, chunk_size), b"\n")
+            for content, expected in [(b"", None), (b"line1\n", b"\n")]:  # One member
+                with open(self.tmp_out_gz, "wb") as writer:
+                    writer.write(gzip.compress(content))
+                self.assertEqual(getGzipLastByte(self.tmp_out_gz, chunk_size), expected)
+            # Magic number in compressed data of the last member
+            with open(self.tmp_out_gz, "wb") as writer:
+                writer.write(gzip.compress(b"line1\n"))
+                writer.write(gzip.compress(b"line2\x1f\x8b\x08\x00line3\x1f\x8b\x08line4", compresslevel=0))
+            self.assertEqual(getGzipLastByte(self.tmp_out_gz, chunk_size), b"4")
+            # Truncated file
+            with open(self.tmp_out_gz, "wb") as writer:
+                writer.write(gzip.compress(b"line1\nline2\n")[:-6])
+            with self.assertRaises(IOError):
+                getGzipLastByte(self.tmp_out_gz, chunk_size)
+
+    def testCopyMembers(self):
+        cmd = ["concatenateTextFiles.py", "--inputs", self.tmp_multi_members, self.tmp_bgzf, "--output", self.tmp_out_gz]
+        subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+        with open(self.tmp_multi_members, "rb") as reader:
+            multi_members_data = reader.read()
+        with open(self.tmp_bgzf, "rb") as reader:
+            bgzf_data = reader.read()
+        with open(self.tmp_out_gz, "rb") as reader:
+            observed = reader.read()
+        self.assertTrue(observed.startswith(multi_members_data))  # Compressed data are copied
+        self.assertTrue(observed.endswith(bgzf_data))
+        self.assertEqual(gzip.decompress(observed[len(multi_members_data):-len(bgzf_data)]), b"\n")  # Member added for the missing end of line
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import uuid
+import pysam
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class TestCoverage(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_aln = os.path.join(tmp_folder, unique_id + ".bam")
+        self.tmp_bed = os.path.join(tmp_folder, unique_id + ".bed")
+        self.tmp_out = os.path.join(tmp_folder, unique_id + "_out.tsv")
+
+        # Alignments
+        header = {"HD": {"VN": "1.0", "SO": "coordinate"}, "SQ": [{"SN": "chr1", "LN": 30}, {"SN": "chr2", "LN": 10}]}
+        reads = [
+            # name, flag, pos (1-based), cigar
+            ("r1", 0, 1, "10M"),  # 1-10
+            ("r4", 1024, 3, "5M"),  # Duplicate
+            ("r2", 0, 5, "3M2D3M"),  # 5-7 and 10-12
+            ("r3", 0, 8, "2S4M1I2M"),  # 8-13
+            ("r6", 0, 15, "2M5N3M"),  # 15-16 and 22-24
+            ("r5", 256, 20, "5M")  # Secondary
+        ]
+        with pysam.AlignmentFile(self.tmp_aln, "wb", header=header) as writer:
+            for name, flag, pos, cigar in reads:
+                record = pysam.AlignedSegment(writer.header)
+                record.query_name = name
+                record.flag = flag
+                record.reference_id = 0
+                record.reference_start = pos - 1
+                record.mapping_quality = 60
+                record.cigarstring = cigar
+                record.query_sequence = "A" * record.infer_query_length()
+                writer.write(record)
+        pysam.index(self.tmp_aln)
+        self.expected_depths = [1, 1, 1, 1, 2, 2, 2, 2, 2, 3, 2, 2, 1, 0, 1, 1, 0, 0, 0, 0, 0, 1, 1, 1, 0, 0, 0, 0, 0, 0]
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_aln, self.tmp_aln + ".bai", self.tmp_bed, self.tmp_out]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def getObserved(self, options):
+        cmd = ["coverage.py", "--input-bam", self.tmp_aln, "--output-cov", self.tmp_out] + options
+        subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+        with open(self.tmp_out) as reader:
+            return reader.read()
+
+    def testDepth(self):
+        # Contig without reads (chr2) is skipped as in samtools depth -a
+        expected = "".join(["chr1\t{}\t{}\n".format(idx + 1, depth) for idx, depth in enumerate(self.expected_depths)])
+        for options in [[], ["--nb-jobs", "2", "--window-size", "4"]]:
+            self.assertEqual(self.getObserved(options), expected)
+        expected += "".join(["chr2\t{}\t0\n".format(pos) for pos in range(1, 11)])
+        for options in [[], ["--nb-jobs", "2", "--window-size", "4"]]:
+            self.assertEqual(self.getObserved(["--all-contigs"] + options), expected)
+        # With regions
+        with open(self.tmp_bed, "w") as writer:
+            writer.write("chr1\t10\t13\nchr1\t8\t11\nchr2\t8\t10\n")
+        expected = "".join(["chr1\t{}\t{}\n".format(pos, self.expected_depths[pos - 1]) for pos in range(9, 14)])
+        for options in [[], ["--nb-jobs", "2", "--window-size", "2"]]:
+            self.assertEqual(self.getObserved(["--input-bed", self.tmp_bed] + options), expected)
+        expected += "chr2\t9\t0\nchr2\t10\t0\n"
+        for options in [[], ["--nb-jobs", "2", "--window-size", "2"]]:
+            self.assertEqual(self.getObserved(["--input-bed", self.tmp_bed, "--all-contigs"] + options), expected)
+        # Maximum depth
+        expected = "".join(["chr1\t{}\t{}\n".format(idx + 1, min(depth, 2)) for idx, depth in enumerate(self.expected_depths)])
+        self.assertEqual(self.getObserved(["--max-depth", "2"]), expected)
+
+    def testPreviousOutput(self):
+        # Output of the previous version: samtools view -F 256 | samtools depth -a -d 100000 [-b BED]
+        expected = """chr1	1	1
+chr1	2	1
+chr1	3	1
+chr1	4	1
+chr1	5	2
+chr1	6	2
+chr1	7	2
+chr1	8	2
+chr1	9	2
+chr1	10	3
+chr1	11	2
+chr1	12	2
+chr1	13	1
+chr1	14	0
+chr1	15	1
+chr1	16	1
+chr1	17	0
+chr1	18	0
+chr1	19	0
+chr1	20	0
+chr1	21	0
+chr1	22	1
+chr1	23	1
+chr1	24	1
+chr1	25	0
+chr1	26	0
+chr1	27	0
+chr1	28	0
+chr1	29	0
+chr1	30	0
+"""
+        self.assertEqual(self.getObserved([]), expected)
+        if shutil.which("samtools") is not None:
+            self.assertEqual(subprocess.check_output(["samtools", "depth", "-a", "-d", "100000", self.tmp_aln]).decode(), expected)
+        with open(self.tmp_bed, "w") as writer:
+            writer.write("chr1\t11\t14\nchr2\t0\t3\n")
+        expected = """chr1	12	2
+chr1	13	1
+chr1	14	0
+"""
+        self.assertEqual(self.getObserved(["--input-bed", self.tmp_bed]), expected)
+        if shutil.which("samtools") is not None:
+            self.assertEqual(subprocess.check_output(["samtools", "depth", "-a", "-d", "100000", "-b", self.tmp_bed, self.tmp_aln]).decode(), expected)
+
+    def testBedGraph(self):
+        with open(self.tmp_bed, "w") as writer:
+            writer.write("chr1\t0\t30\n")
+        expected = """chr1	0	4	1
+chr1	4	9	2
+chr1	9	10	3
+chr1	10	12	2
+chr1	12	13	1
+chr1	13	14	0
+chr1	14	16	1
+chr1	16	21	0
+chr1	21	24	1
+chr1	24	30	0
+"""
+        for options in [[], ["--nb-jobs", "2", "--window-size", "4"]]:
+            self.assertEqual(
+                self.getObserved(["--input-bed", self.tmp_bed, "--output-format", "bedgraph"] + options),
+                expected
+            )
+
+    def testRegions(self):
+        with open(self.tmp_bed, "w") as writer:
+            writer.write("chr1\t4\t10\tampliA\nchr1\t13\t16\tampliB\nchr1\t6\t8\tampliC\n")
+        expected = """#Chromosome	Start	End	Name	Length	Mean_depth	Min_depth	Median_depth	Max_depth
+chr1	4	10	ampliA	6	2.17	2	2.0	3
+chr1	13	16	ampliB	3	0.67	0	1.0	1
+chr1	6	8	ampliC	2	2.00	2	2.0	2
+"""
+        for options in [[], ["--nb-jobs", "2"]]:
+            self.assertEqual(
+                self.getObserved(["--input-bed", self.tmp_bed, "--output-format", "regions"] + options),
+                expected
+            )
+
+    def testNotIndexed(self):
+        with open(self.tmp_bed, "w") as writer:
+            writer.write("chr2\t2\t5\tampliD\nchr1\t4\t10\tampliA\nchr1\t13\t16\tampliB\nchr1\t6\t8\tampliC\n")
+        options_list = [
+            [],
+            ["--all-contigs", "--window-size", "4"],
+            ["--input-bed", self.tmp_bed],
+            ["--input-bed", self.tmp_bed, "--all-contigs", "--max-depth", "2"],
+            ["--input-bed", self.tmp_bed, "--output-format", "bedgraph"],
+            ["--input-bed", self.tmp_bed, "--output-format", "regions"]
+        ]
+        expected = [self.getObserved(options) for options in options_list]
+        os.remove(self.tmp_aln + ".bai")
+        observed = [self.getObserved(options + ["--nb-jobs", "2"]) for options in options_list]
+        self.assertEqual(observed, expected)
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import gzip
+import uuid
+import random
+import itertools
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+from demultiplexer import AnchoredBarcodesMatcher, getAnchoredAlignment, getAnchoredDistance, getVariants
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def isMatch(barcode_nt, read_nt):
+    """Return True if the nucleotid of the read is accepted by the nucleotid of the barcode. A N in barcode matches A, C, G and T but a N in read is always a mismatch."""
+    return read_nt == barcode_nt != "N" or (barcode_nt == "N" and read_nt in "ACGT")
+
+
+def anchoredDistance(barcode, sequence, whole_sequence=False, max_errors=None):
+    """Return the minimum edit distance between barcode and all the prefixes of the sequence (full dynamic programming). With max_errors, None is returned as soon as the distance is greater."""
+    prev_row = list(range(len(sequence) + 1))
+    for row_idx, nt in enumerate(barcode, 1):
+        row = [row_idx]
+        for col_idx in range(1, len(sequence) + 1):
+            row.append(min(
+                prev_row[col_idx - 1] + (0 if isMatch(nt, sequence[col_idx - 1]) else 1),
+                prev_row[col_idx] + 1,
+                row[col_idx - 1] + 1
+            ))
+        if max_errors is not None and min(row) > max_errors:
+            return None
+        prev_row = row
+    return prev_row[-1] if whole_sequence else min(prev_row)
+
+
+def anchoredAlignment(barcode, sequence):
+    """Return the number of matches and the number of errors of the alignment of barcode on a prefix of the sequence as cutadapt selects it (full dynamic programming): on each cell the minimum of errors with priority to the diagonal, then deletion and insertion in read, and at the end of the barcode the column with the most matches and then the fewest errors."""
+    prev_row = [(col_idx, 0) for col_idx in range(len(sequence) + 1)]
+    for row_idx, nt in enumerate(barcode, 1):
+        row = [(row_idx, 0)]
+        for col_idx in range(1, len(sequence) + 1):
+            diag, deletion, insertion = prev_row[col_idx - 1], prev_row[col_idx], row[col_idx - 1]
+            if isMatch(nt, sequence[col_idx - 1]):
+                row.append((diag[0], diag[1] + 1))
+            elif diag[0] <= deletion[0] and diag[0] <= insertion[0]:
+                row.append((diag[0] + 1, diag[1]))
+            elif deletion[0] <= insertion[0]:
+                row.append((deletion[0] + 1, deletion[1]))
+            else:
+                row.append((insertion[0] + 1, insertion[1]))
+        prev_row = row
+    nb_errors, nb_matches = min(prev_row, key=lambda cell: (-cell[1], cell[0]))
+    return nb_matches, nb_errors
+
+
+def getBestBarcode(matches, barcodes, sequence):
+    """Return index of the matching barcode with the most matches, then the fewest errors and then the first in order."""
+    alignments = {idx: anchoredAlignment(barcodes[idx], sequence[:len(barcodes[idx]) + 3]) for idx in matches}
+    return min(alignments, key=lambda idx: (-alignments[idx][0], alignments[idx][1], idx))
+
+
+def mutate(rand, sequence, nb_errors):
+    """Return sequence with nb_errors random substitutions, insertions or deletions."""
+    for idx in range(nb_errors):
+        pos = rand.randint(0, len(sequence) - 1)
+        operation = rand.choice(["sub", "ins", "del"])
+        if operation == "sub":
+            sequence = sequence[:pos] + rand.choice([nt for nt in "ACGT" if nt != sequence[pos]]) + sequence[pos + 1:]
+        elif operation == "ins":
+            sequence = sequence[:pos] + rand.choice("ACGT") + sequence[pos:]
+        else:
+            sequence = sequence[:pos] + sequence[pos + 1:]
+    return sequence
+
+
+class TestAnchoredBarcodesMatcher(unittest.TestCase):
+    def testGetVariants(self):
+        self.assertEqual(getVariants("AC", 0), {"AC": 0})
+        self.assertEqual(getVariants("AN", 0), {"AA": 0, "AC": 0, "AG": 0, "AT": 0})
+        variants = getVariants("ACG", 2)
+        expected = dict()
+        for length in range(1, 6):
+            for seq in itertools.product("ACGTN", repeat=length):
+                dist = anchoredDistance("ACG", "".join(seq), True)
+                if dist <= 2:
+                    expected["".join(seq)] = dist
+        self.assertEqual(variants, expected)
+
+    def testGetMatches(self):
+        rand = random.Random(42)
+        barcodes = ["".join(rand.choice("ACGT") for idx in range(rand.randint(8, 14))) for barcode_idx in range(20)]
+        reads = list()
+        for read_idx in range(250):
+            barcode = rand.choice(barcodes)
+            reads.append(mutate(rand, barcode, rand.randint(0, 3)) + "".join(rand.choice("ACGTN") for idx in range(20)))
+        reads.extend(["", "ACG", barcodes[0][:-1]])
+        for error_rate in [0.0, 0.1, 0.2]:
+            matchers = [  # With lookup table and with banded edit distance
+                AnchoredBarcodesMatcher(barcodes, error_rate, max_table_errors=2),
+                AnchoredBarcodesMatcher(barcodes, error_rate, max_table_errors=-1, max_cache_size=10)
+            ]
+            for read in reads:
+                expected = dict()
+                for barcode_idx, barcode in enumerate(barcodes):
+                    dist = anchoredDistance(barcode, read[:len(barcode) + 3])  # Alignment cannot contain more than 2 insertions
+                    if dist <= int(error_rate * len(barcode)):
+                        expected[barcode_idx] = dist
+                expected_best = None if len(expected) == 0 else getBestBarcode(expected, barcodes, read)
+                for matcher in matchers:
+                    self.assertEqual(matcher.getMatches(read), expected)
+                    self.assertEqual(matcher.getMatches(read.lower()), expected)  # From cache
+                    self.assertEqual(matcher.getBest(read), expected_best)
+        # Best
+        matcher = AnchoredBarcodesMatcher(["ACGTACGTAC", "ACGTACGTAA", "TTGACCAGTA"], 0.1)
+        self.assertEqual(matcher.getMatches("ACGTACGTACGGA"), {0: 0, 1: 1})
+        self.assertEqual(matcher.getBest("ACGTACGTACGGA"), 0)
+        self.assertEqual(matcher.getBest("ACGTACGTATGGA"), 0)  # Ties
+        self.assertEqual(matcher.getBest("TTGACCGGTT"), None)
+        # Wildcards
+        self.assertEqual(getAnchoredDistance([{"A"}, set("ACGT"), {"G"}], "ATGC", 0), 0)
+        self.assertEqual(AnchoredBarcodesMatcher(["ANNNNNNNNNG"], 0.1).getMatches("ATTTTTTTTTC"), {})
+
+    def testGetBest(self):
+        # Alignments
+        self.assertEqual(getAnchoredAlignment([set(nt) for nt in "ACGTTACGTT"], "ACGTTACGTACGGATT", 1), (9, 1))
+        self.assertEqual(getAnchoredAlignment([set(nt) for nt in "ACGTACGTAC"], "ACGTTACGTACGGATT", 1), (10, 1))
+        self.assertEqual(getAnchoredAlignment([set(nt) for nt in "ACGTACGTAC"], "ACGTACGTTCGG", 0), None)
+        # Insertion in read gives more matches than a substitution
+        matcher = AnchoredBarcodesMatcher(["ACGTTACGTT", "ACGTACGTAC"], 0.1)
+        self.assertEqual(matcher.getMatches("ACGTTACGTACGGATT"), {0: 1, 1: 1})
+        self.assertEqual(matcher.getBest("ACGTTACGTACGGATT"), 1)
+        # Barcodes with different lengths: the longest alignment has more matches
+        matcher = AnchoredBarcodesMatcher(["ACGTACGT", "ACGTACGTAC"], 0.1)
+        self.assertEqual(matcher.getBest("ACGTACGTACGG"), 1)
+        self.assertEqual(matcher.getMatches("ACGTACGTTCGG"), {0: 0, 1: 1})
+        self.assertEqual(matcher.getBest("ACGTACGTTCGG"), 1)  # 9 matches with 1 error is better than 8 matches without error
+        self.assertEqual(matcher.getBest("ACGTACGTGGGG"), 0)  # Only the shortest barcode is tolerated
+        # N in barcode matches any nucleotid but N in read is a mismatch
+        matcher = AnchoredBarcodesMatcher(["ACGNNNGTAC", "ACGTACGTAC"], 0.1)
+        self.assertEqual(matcher.getBest("ACGTTCGTACGG"), 0)
+        self.assertEqual(matcher.getMatches("ACGTNCGTACGG"), {1: 1})
+        self.assertEqual(matcher.getBest("ACGTNCGTACGG"), 1)
+
+
+class TestDemultiplex(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_dir = os.path.join(tmp_folder, unique_id)
+        os.mkdir(self.tmp_dir)
+        self.tmp_barcodes = os.path.join(self.tmp_dir, "barcodes.tsv")
+        self.tmp_fwd_barcodes = os.path.join(self.tmp_dir, "fwd_barcodes.fasta")
+        self.tmp_rvs_barcodes = os.path.join(self.tmp_dir, "rvs_barcodes.fasta")
+        self.tmp_R1 = os.path.join(self.tmp_dir, "lib_R1.fastq.gz")
+        self.tmp_R2 = os.path.join(self.tmp_dir, "lib_R2.fastq")
+        self.tmp_groups = os.path.join(self.tmp_dir, "groups.tsv")
+
+        # Barcodes
+        rand = random.Random(42)
+        self.barcodes = list()
+        for barcode_idx in range(96):
+            self.barcodes.append({
+                "id": "bc{}".format(barcode_idx),
+                "fwd": "".join(rand.choice("ACGT") for idx in range(10)),
+                "rvs": "".join(rand.choice("ACGT") for idx in range(rand.randint(10, 12)))
+            })
+        self.barcodes.append({"id": "bcDup", "fwd": self.barcodes[0]["fwd"], "rvs": self.barcodes[0]["rvs"][:-1] + "N"})  # Ambiguous
+        with open(self.tmp_barcodes, "w") as writer:
+            writer.write("#id\tfwd\trvs\n")
+            for barcode in self.barcodes:
+                writer.write("{}\t{}\t{}\n".format(barcode["id"], barcode["fwd"], barcode["rvs"]))
+        with open(self.tmp_fwd_barcodes, "w") as writer_fwd:
+            with open(self.tmp_rvs_barcodes, "w") as writer_rvs:
+                for barcode in self.barcodes[:-1]:
+                    writer_fwd.write(">{}\n{}\n".format(barcode["id"], barcode["fwd"]))
+                    writer_rvs.write(">{} desc\n{}\n".format(barcode["id"], barcode["rvs"]))
+
+        # Reads
+        self.reads = list()
+        for read_idx in range(1000):
+            barcode = rand.choice(self.barcodes)
+            if read_idx % 10 == 0:  # Pair with two different barcodes
+                fwd_barcode = rand.choice(self.barcodes)["fwd"]
+            else:
+                fwd_barcode = barcode["fwd"]
+            R1_seq = mutate(rand, fwd_barcode, rand.randint(0, 2)) + "".join(rand.choice("ACGTN") for idx in range(30))
+            R2_seq = mutate(rand, barcode["rvs"], rand.randint(0, 2)) + "".join(rand.choice("ACGT") for idx in range(30))
+            self.reads.append([
+                ("read{}".format(read_idx), "1:N:0:1" if read_idx % 3 else None, R1_seq, "".join(rand.choice("#FI") for idx in R1_seq)),
+                ("read{}".format(read_idx), "2:N:0:1" if read_idx % 3 else None, R2_seq, "".join(rand.choice("#FI") for idx in R2_seq))
+            ])
+        with gzip.open(self.tmp_R1, "wt") as writer_R1:
+            with open(self.tmp_R2, "w") as writer_R2:
+                for R1, R2 in self.reads:
+                    for writer, record in [(writer_R1, R1), (writer_R2, R2)]:
+                        writer.write("@{}{}\n{}\n+\n{}\n".format(record[0], "" if record[1] is None else " " + record[1], record[2], record[3]))
+
+        # Distances between reads and barcodes (maximum number of errors in tests is 2)
+        self.distances = list()
+        for R1, R2 in self.reads:
+            self.distances.append([
+                {idx: anchoredDistance(elt["fwd"], R1[2][:len(elt["fwd"]) + 3], max_errors=2) for idx, elt in enumerate(self.barcodes)},
+                {idx: anchoredDistance(elt["rvs"], R2[2][:len(elt["rvs"]) + 3], max_errors=2) for idx, elt in enumerate(self.barcodes)}
+            ])
+
+    @classmethod
+    def tearDownClass(self):
+        # Clean temporary files
+        shutil.rmtree(self.tmp_dir)
+
+    def getExpectedMatches(self, distance_by_barcode, barcodes, error_rate):
+        """Return by barcode index the number of errors for barcodes matching the start of the read."""
+        matches = dict()
+        for barcode_idx, barcode in enumerate(barcodes):
+            dist = distance_by_barcode[barcode_idx]
+            if dist is not None and dist <= int(error_rate * (len(barcode) - barcode.count("N"))):
+                matches[barcode_idx] = dist
+        return matches
+
+    def testDemultiplex(self):
+        for error_rate, options in [(0.1, []), (0.2, ["--compression-threads", "2"])]:
+            # Expected
+            expected_content = {barcode["id"]: ["", ""] for barcode in self.barcodes}
+            expected_count = {barcode["id"]: 0 for barcode in self.barcodes}
+            expected_ambiguous = 0
+            for (R1, R2), (R1_distances, R2_distances) in zip(self.reads, self.distances):
+                R1_matches = self.getExpectedMatches(R1_distances, [elt["fwd"] for elt in self.barcodes], error_rate)
+                R2_matches = self.getExpectedMatches(R2_distances, [elt["rvs"] for elt in self.barcodes], error_rate)
+                retained = [idx for idx in R1_matches if idx in R2_matches]
+                if len(retained) > 1:
+                    expected_ambiguous += 1
+                for barcode_idx in retained:
+                    barcode_id = self.barcodes[barcode_idx]["id"]
+                    expected_count[barcode_id] += 1
+                    for read_idx, record in enumerate([R1, R2]):
+                        expected_content[barcode_id][read_idx] += "@{}{}\n{}\n+\n{}\n".format(record[0], "" if record[1] is None else " " + record[1], record[2], record[3])
+            expected_stdout = "".join("{}\t{}\t{}\t{}\n".format(elt["id"], expected_count[elt["id"]], elt["fwd"], elt["rvs"]) for elt in self.barcodes)
+            expected_stdout += "Ambiguous\t{}\n".format(expected_ambiguous)
+            self.assertGreater(expected_ambiguous, 0)
+            # Observed
+            cmd = [
+                "demultiplex.py",
+                "--error-rate", str(error_rate),
+                "--barcodes", self.tmp_barcodes,
+                "--R1-path", self.tmp_R1,
+                "--R2-path", self.tmp_R2,
+                "--output-dir", self.tmp_dir
+            ] + options
+            observed_stdout = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode()
+            self.assertEqual(observed_stdout, expected_stdout)
+            for barcode in self.barcodes:
+                for read_idx, R in enumerate(["R1", "R2"]):
+                    with gzip.open(os.path.join(self.tmp_dir, "lib_{}_{}.fastq.gz".format(barcode["id"], R)), "rt") as reader:
+                        self.assertEqual(reader.read(), expected_content[barcode["id"]][read_idx])
+
+    def testDemultiplexGroups(self):
+        fwd_barcodes = [elt["fwd"] for elt in self.barcodes[:-1]]
+        rvs_barcodes = [elt["rvs"] for elt in self.barcodes[:-1]]
+        for error_rate in [0.01, 0.1]:
+            # Expected
+            expected = ""
+            for (R1, R2), (R1_distances, R2_distances) in zip(self.reads, self.distances):
+                R1_matches = self.getExpectedMatches(R1_distances, fwd_barcodes, error_rate)
+                R2_matches = self.getExpectedMatches(R2_distances, rvs_barcodes, error_rate)
+                if len(R1_matches) != 0 and len(R2_matches) != 0:
+                    fwd_idx = getBestBarcode(R1_matches, fwd_barcodes, R1[2])
+                    rvs_idx = getBestBarcode(R2_matches, rvs_barcodes, R2[2])
+                    if fwd_idx == rvs_idx:
+                        expected += "{}\t{}\n".format(R1[0], self.barcodes[fwd_idx]["id"])
+            # Observed
+            cmd = [
+                "demultiplexGroups.py",
+                "--error-rate", str(error_rate),
+                "--fwd-barcodes", self.tmp_fwd_barcodes,
+                "--rvs-barcodes", self.tmp_rvs_barcodes,
+                "--R1-path", self.tmp_R1,
+                "--R2-path", self.tmp_R2,
+                "--output-groups", self.tmp_groups
+            ]
+            subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+            with open(self.tmp_groups) as reader:
+                self.assertEqual(reader.read(), expected)
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import uuid
+import numpy
+import pysam
+import tempfile
+import unittest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+
+from depthStore import DepthStoreReader, DepthStoreWriter, isDepthStore, writeFromAlignments, writeFromDepthFile
+from depthsMetrics import loadFromDepthFile, loadFromDepthStore
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class TestDepthStore(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_depths = os.path.join(tmp_folder, unique_id + "_depths.tsv")
+        self.tmp_store = os.path.join(tmp_folder, unique_id + "_depths.dps")
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_depths, self.tmp_store]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testWriteRead(self):
+        rand = numpy.random.RandomState(42)
+        expected = {
+            "chr1": rand.randint(0, 5000, size=(2, 40)).astype(numpy.uint32),
+            "chr2": rand.randint(0, 5000, size=(2, 25)).astype(numpy.uint32)
+        }
+        expected["chr1"][:, 0] = 4294967295  # Max uint32 with wrap around in deltas
+        with DepthStoreWriter(self.tmp_store, ["splA", "splB"], {"chr2": 30, "chr1": 50}, chunk_size=7) as writer:
+            writer.write("chr2", 3, expected["chr2"][:, 2:10])
+            writer.write("chr2", 11, expected["chr2"][:, 10:11])
+            writer.write("chr2", 15, expected["chr2"][:, 14:25])
+            writer.write("chr1", 1, expected["chr1"][:, :30])
+            writer.write("chr1", 31, expected["chr1"][:, 30:])
+            with self.assertRaises(ValueError):  # Overlap
+                writer.write("chr1", 40, expected["chr1"][:, 39:])
+            with self.assertRaises(ValueError):  # Contig already written
+                writer.write("chr2", 30, [[1], [1]])
+        expected["chr2"][:, :2] = 0
+        expected["chr2"][:, 11:14] = 0
+        self.assertTrue(isDepthStore(self.tmp_store))
+        with DepthStoreReader(self.tmp_store, max_chunks=2) as reader:
+            self.assertEqual(reader.samples, ["splA", "splB"])
+            self.assertEqual(list(reader.contigs), ["chr2", "chr1"])
+            self.assertEqual([reader.length("chr2"), reader.length("chr1")], [30, 50])
+            self.assertEqual(
+                reader.getRegions(),
+                [("chr2", 3, 11), ("chr2", 15, 25), ("chr1", 1, 40)]
+            )
+            self.assertEqual(reader.getRegions("chr3"), [])
+            for chrom, chrom_depths in expected.items():
+                for start in range(1, chrom_depths.shape[1] + 1):
+                    for end in range(start, chrom_depths.shape[1] + 1):
+                        self.assertEqual(
+                            reader.get(chrom, start, end).tolist(),
+                            chrom_depths[:, start - 1:end].tolist()
+                        )
+            # Positions not stored
+            self.assertEqual(reader.get("chr1", 39, 43).tolist(), [[expected["chr1"][0, 38], expected["chr1"][0, 39], 0, 0, 0], [expected["chr1"][1, 38], expected["chr1"][1, 39], 0, 0, 0]])
+            self.assertEqual(reader.get("chr3", 1, 3).tolist(), [[0, 0, 0], [0, 0, 0]])
+            # Blocks
+            self.assertEqual(
+                [(chrom, start, end) for chrom, start, end, depths in reader.iterBlocks()],
+                [("chr2", 3, 7), ("chr2", 8, 11), ("chr2", 15, 21), ("chr2", 22, 25), ("chr1", 1, 7), ("chr1", 8, 14), ("chr1", 15, 21), ("chr1", 22, 28), ("chr1", 29, 35), ("chr1", 36, 40)]
+            )
+
+    def testAbort(self):
+        # Exception in writing
+        with self.assertRaises(ValueError):
+            with DepthStoreWriter(self.tmp_store, ["splA"], chunk_size=4) as writer:
+                writer.write("chr1", 1, [5, 6, 7, 8, 9])
+                writer.write("chr1", 3, [1, 1])  # Overlap
+        self.assertFalse(os.path.exists(self.tmp_store))
+        # Exception in conversion
+        with open(self.tmp_depths, "w") as handle:
+            handle.write("chr1\t1\t10\nchr1\t2\tinvalid\n")
+        with self.assertRaises(ValueError):
+            writeFromDepthFile(self.tmp_depths, self.tmp_store, ["splA"], batch_size=1)
+        self.assertFalse(os.path.exists(self.tmp_store))
+        # Writer never closed
+        writer = DepthStoreWriter(self.tmp_store, ["splA"], chunk_size=4)
+        writer.write("chr1", 1, [5, 6, 7, 8, 9])
+        del writer
+        self.assertFalse(os.path.exists(self.tmp_store))
+        # Truncated file
+        with DepthStoreWriter(self.tmp_store, ["splA"], chunk_size=4) as writer:
+            writer.write("chr1", 1, [5, 6, 7, 8, 9])
+        with open(self.tmp_store, "rb") as handle:
+            content = handle.read()
+        with open(self.tmp_store, "wb") as handle:
+            handle.write(content[:-20])
+        self.assertFalse(isDepthStore(self.tmp_store))
+        with self.assertRaises(IOError):
+            DepthStoreReader(self.tmp_store)
+
+    def testWriteFromDepthFile(self):
+        content = """chr1	3	10	0
+chr1	4	12	1
+chr1	5	12	0
+chr1	9	7	0
+chr2	1	0	5
+chr2	2	1	5
+"""
+        with open(self.tmp_depths, "w") as handle:
+            handle.write(content)
+        writeFromDepthFile(self.tmp_depths, self.tmp_store, ["splA", "splB"], chunk_size=2, batch_size=2)
+        with DepthStoreReader(self.tmp_store) as reader:
+            self.assertEqual(reader.getRegions(), [("chr1", 3, 5), ("chr1", 9, 9), ("chr2", 1, 2)])
+            observed = ""
+            for chrom, start, end, depths in reader.iterBlocks():
+                for pos_idx, pos in enumerate(range(start, end + 1)):
+                    observed += "{}\t{}\t{}\n".format(chrom, pos, "\t".join(str(elt) for elt in depths[:, pos_idx]))
+            self.assertEqual(observed, content)
+        # Metrics
+        self.assertEqual(
+            loadFromDepthStore(self.tmp_store),
+            loadFromDepthFile(self.tmp_depths, ["splA", "splB"])
+        )
+        self.assertEqual(
+            loadFromDepthStore(self.tmp_store, ["A", "B"], [("chr2", 2, 3), ("chr1", 4, 4)]),
+            ([0, 1, 5, 12], {"A": [1, 1, 0, 1], "B": [1, 1, 1, 0]})
+        )
+
+
+class TestWriteFromAlignments(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_aln = os.path.join(tmp_folder, unique_id + ".bam")
+        self.tmp_store = os.path.join(tmp_folder, unique_id + "_depths.dps")
+
+        # Alignments
+        header = {"HD": {"VN": "1.0", "SO": "coordinate"}, "SQ": [{"SN": "chr1", "LN": 30}, {"SN": "chr2", "LN": 10}]}
+        reads = [
+            # name, flag, pos (1-based), cigar
+            ("r1", 0, 1, "10M"),  # 1-10
+            ("r4", 1024, 3, "5M"),  # Duplicate
+            ("r2", 0, 5, "3M2D3M"),  # 5-7 and 10-12
+            ("r3", 0, 8, "2S4M1I2M"),  # 8-13
+            ("r6", 0, 15, "2M5N3M"),  # 15-16 and 22-24
+            ("r5", 256, 20, "5M")  # Secondary
+        ]
+        with pysam.AlignmentFile(self.tmp_aln, "wb", header=header) as writer:
+            for name, flag, pos, cigar in reads:
+                record = pysam.AlignedSegment(writer.header)
+                record.query_name = name
+                record.flag = flag
+                record.reference_id = 0
+                record.reference_start = pos - 1
+                record.mapping_quality = 60
+                record.cigarstring = cigar
+                record.query_sequence = "A" * record.infer_query_length()
+                writer.write(record)
+        pysam.index(self.tmp_aln)
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_aln, self.tmp_aln + ".bai", self.tmp_store]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def test(self):
+        expected = [1, 1, 1, 1, 2, 2, 2, 2, 2, 3, 2, 2, 1, 0, 1, 1, 0, 0, 0, 0, 0, 1, 1, 1, 0, 0, 0, 0, 0, 0]
+        # All contigs
+        writeFromAlignments([self.tmp_aln, self.tmp_aln], self.tmp_store, ["splA", "splB"], chunk_size=5, window_size=4)
+        with DepthStoreReader(self.tmp_store) as reader:
+            self.assertEqual(reader.getRegions(), [("chr1", 1, 30), ("chr2", 1, 10)])
+            self.assertEqual(reader.get("chr1", 1, 30).tolist(), [expected, expected])
+            self.assertEqual(reader.get("chr2", 1, 10).tolist(), [[0] * 10, [0] * 10])
+        # Selected regions
+        writeFromAlignments([self.tmp_aln], self.tmp_store, ["splA"], [("chr1", 11, 16), ("chr1", 9, 12), ("chr1", 28, 40)], chunk_size=5, window_size=4)
+        with DepthStoreReader(self.tmp_store) as reader:
+            self.assertEqual(reader.getRegions(), [("chr1", 9, 16), ("chr1", 28, 30)])
+            self.assertEqual(reader.get("chr1", 1, 30).tolist(), [[0] * 8 + expected[8:16] + [0] * 11 + expected[27:]])
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
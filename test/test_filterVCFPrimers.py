@@ -8,6 +8,7 @@ __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
 import os
+import gzip
 import uuid
 import tempfile
 import unittest
@@ -139,6 +140,34 @@ class FilterVCFPrimers(unittest.TestCase):
             sorted(observed)
         )
 
+    def testCompressedSequences(self):
+        # Compress fasta
+        with open(self.tmp_sequences, "rb") as FH_seq:
+            content = FH_seq.read()
+        with gzip.open(self.tmp_sequences, "wb") as FH_seq:
+            FH_seq.write(content)
+
+        # Create BED
+        with BEDIO(self.tmp_regions, "w", 8) as FH_reg:
+            ampl1 = BEDRecord("artificial_chr1", 5, 25, "ampl1", None, "+", 11, 20)
+            FH_reg.write(ampl1)
+            ampl2 = BEDRecord("artificial_chr2", 1, 11, "ampl2", None, "+", 3, 9)
+            FH_reg.write(ampl2)
+
+        # Execute command
+        subprocess.check_call(self.cmd, stderr=subprocess.DEVNULL)
+
+        # Validate results
+        expected = [curr_var.id for curr_var in self.variants if curr_var.info["ZOI"] == "yes"]
+        observed = list()
+        with VCFIO(self.tmp_output) as FH_results:
+            for record in FH_results:
+                observed.append(record.id)
+        self.assertEqual(
+            sorted(expected),
+            sorted(observed)
+        )
+
 
 ########################################################################
 #
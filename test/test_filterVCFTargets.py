@@ -3,11 +3,12 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2019 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.1.0'
+__version__ = '1.2.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
 import os
+import sys
 import uuid
 import tempfile
 import unittest
@@ -20,6 +21,10 @@ TEST_DIR = os.path.dirname(os.path.abspath(__file__))
 APP_DIR = os.path.dirname(TEST_DIR)
 BIN_DIR = os.path.join(APP_DIR, "bin")
 os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+sys.path.append(BIN_DIR)
+
+from filterVCFTargets import getNormalizedCoord, getShiftedCoord
+from mmapSequenceIO import MmapIdxFastaIO
 
 
 ########################################################################
@@ -144,6 +149,22 @@ artificial_chr2	11	80	11	12""")
             sorted(observed)
         )
 
+    def testShiftedCoordOnSmallWindows(self):
+        with MmapIdxFastaIO(self.tmp_sequences, block_size=4, max_blocks=2) as ref_reader:
+            chrom_seq = ref_reader.get("artificial_chr1").string
+            for variant in self.variants:
+                if variant.isIndel():
+                    up_record = VCFRecord(variant.chrom, variant.pos, None, variant.ref, [variant.alt[0]]).getMostUpstream(chrom_seq)
+                    self.assertEqual(
+                        getNormalizedCoord(up_record),
+                        getShiftedCoord(variant, ref_reader, True, 1)
+                    )
+                    down_record = VCFRecord(variant.chrom, variant.pos, None, variant.ref, [variant.alt[0]]).getMostDownstream(chrom_seq)
+                    self.assertEqual(
+                        getNormalizedCoord(down_record),
+                        getShiftedCoord(variant, ref_reader, False, 1)
+                    )
+
 
 ########################################################################
 #
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import re
+import sys
+import copy
+import uuid
+import types
+import tempfile
+import unittest
+import importlib.util
+from anacore.annotVcf import AnnotVCFIO
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def addHGVSStubs():
+    """Register in sys.modules the minimal hgvs modules used by fixHGVS when hgvs is not installed."""
+    class HGVSUsageError(Exception):
+        pass
+
+    class NARefAlt:
+        def __init__(self, ref=None, alt=None):
+            self.ref = ref
+            self.alt = alt
+
+        def __str__(self):
+            if self.ref is None:
+                return "ins" + self.alt
+            if self.alt is None:
+                return "del"
+            if len(self.ref) == 1 and len(self.alt) == 1:
+                return self.ref + ">" + self.alt
+            return "delins" + self.alt
+
+    class SimplePosition:
+        def __init__(self, base):
+            self.base = base
+
+        def __str__(self):
+            return str(self.base)
+
+    class Interval:
+        def __init__(self, start, end):
+            self.start = start
+            self.end = end
+
+        def __str__(self):
+            return str(self.start) if self.start.base == self.end.base else "{}_{}".format(self.start, self.end)
+
+    class PosEdit:
+        def __init__(self, pos, edit):
+            self.pos = pos
+            self.edit = edit
+
+        def __str__(self):
+            return str(self.pos) + str(self.edit)
+
+    class SequenceVariant:
+        def __init__(self, ac, type, posedit):
+            self.ac = ac
+            self.type = type
+            self.posedit = posedit
+
+        def __str__(self):
+            return "{}:{}.{}".format(self.ac, self.type, self.posedit)
+
+    content_by_module = {
+        "hgvs": {},
+        "hgvs.assemblymapper": {"AssemblyMapper": None},
+        "hgvs.dataproviders": {},
+        "hgvs.dataproviders.uta": {"connect": None},
+        "hgvs.edit": {"NARefAlt": NARefAlt},
+        "hgvs.exceptions": {"HGVSUsageError": HGVSUsageError},
+        "hgvs.location": {"Interval": Interval, "SimplePosition": SimplePosition},
+        "hgvs.posedit": {"PosEdit": PosEdit},
+        "hgvs.sequencevariant": {"SequenceVariant": SequenceVariant}
+    }
+    for name, content in content_by_module.items():
+        module = types.ModuleType(name)
+        for attr, value in content.items():
+            setattr(module, attr, value)
+        sys.modules[name] = module
+        if "." in name:
+            parent_name, child_name = name.rsplit(".", 1)
+            setattr(sys.modules[parent_name], child_name, module)
+
+
+if importlib.util.find_spec("hgvs") is None:
+    addHGVSStubs()
+
+import hgvs.exceptions
+from fixHGVS import WORKER_CONTEXT, getHGVSGFromVCFRec, resolveHGVS, updateRecord
+from persistentCache import PersistentCache
+
+
+class FakeMapper:
+    """Assembly mapper returning transcripts and HGVS from the HGVSg strings and counting calls."""
+
+    def __init__(self):
+        self.calls = {"relevant_transcripts": [], "g_to_c": [], "c_to_p": []}
+
+    def relevant_transcripts(self, hgvs_g):
+        self.calls["relevant_transcripts"].append(str(hgvs_g))
+        if str(hgvs_g).startswith("NC_000012"):
+            return ["NM_004985.4", "NM_033360.3"]
+        if str(hgvs_g).startswith("NC_000010"):
+            return ["NM_000314.6"]
+        return []
+
+    def g_to_c(self, hgvs_g, transcript):
+        self.calls["g_to_c"].append((str(hgvs_g), transcript))
+        if transcript == "NM_033360.3":
+            raise hgvs.exceptions.HGVSUsageError("Variant outside of the transcript")
+        return transcript + ":c." + str(hgvs_g).split(":g.")[1]
+
+    def c_to_p(self, hgvs_c):
+        self.calls["c_to_p"].append(str(hgvs_c))
+        if "ins" in str(hgvs_c):
+            raise hgvs.exceptions.HGVSUsageError("Non-coding variant")
+        return str(hgvs_c).split(":")[0].replace("NM_", "NP_") + ":p.(Gly12Phe)"
+
+
+def updatePerRecord(record, acc_by_chrom, annotations_field, mapper):
+    """Fix HGVS of the record with one call to the mapper by annotation as in versions without batch."""
+    chr_acc = acc_by_chrom[record.chrom]
+    hgvs_by_allele = {}
+    std_record = None
+    if record.isIndel():
+        std_record = copy.deepcopy(record)
+        std_record.normalizeSingleAllele()
+    for annot in record.info[annotations_field]:
+        if annot["Allele"] not in hgvs_by_allele:
+            hgvs_g = getHGVSGFromVCFRec(record if std_record is None else std_record, chr_acc, annot["Allele"])
+            hgvs_by_allele[annot["Allele"]] = {
+                "HGVSg": hgvs_g,
+                "transcripts": {tr.split(".")[0]: tr for tr in mapper.relevant_transcripts(hgvs_g)},
+            }
+    for annot in record.info[annotations_field]:
+        old = {
+            "g": "" if "HGVSg" not in annot or annot["HGVSg"] is None else annot["HGVSg"],
+            "c": "" if "HGVSc" not in annot or annot["HGVSc"] is None else annot["HGVSc"],
+            "p": "" if "HGVSp" not in annot or annot["HGVSp"] is None else annot["HGVSp"]
+        }
+        hgvs_g = hgvs_by_allele[annot["Allele"]]["HGVSg"]
+        str_hgvs_g = str(hgvs_g)
+        if not(old["g"] == "" and str_hgvs_g.endswith(":g.?")):
+            if str_hgvs_g.endswith("="):
+                match = re.search(r"\d([ATGCN]+>[ATGCN]+)$", old["c"])
+                str_hgvs_g = str_hgvs_g.replace("=", match.group(1))
+            annot["HGVSg"] = str_hgvs_g
+        transcripts = hgvs_by_allele[annot["Allele"]]["transcripts"]
+        curr_tr_id = annot["Feature"].split(".")[0]
+        if curr_tr_id in transcripts:
+            annot["HGVSg"] = str(hgvs_g)
+            annot["HGVSc"] = ""
+            annot["HGVSp"] = ""
+            try:
+                hgvs_c = mapper.g_to_c(hgvs_g, transcripts[curr_tr_id])
+                str_hgvs_c = str(hgvs_c)
+                if not(old["c"] == "" and str_hgvs_c.endswith(":c.?")):
+                    annot["HGVSc"] = str_hgvs_c
+                str_hgvs_p = str(mapper.c_to_p(hgvs_c))
+                if not(old["p"] == "" and str_hgvs_p.endswith(":p.?")):
+                    annot["HGVSp"] = str_hgvs_p
+            except hgvs.exceptions.HGVSUsageError:
+                pass
+
+
+class TestResolveHGVS(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_variants = os.path.join(tmp_folder, unique_id + ".vcf")
+
+        # Variants
+        with open(self.tmp_variants, "w") as writer:
+            writer.write("""##fileformat=VCFv4.1
+##INFO=<ID=ANN,Number=.,Type=String,Description="Consequence annotations from Ensembl VEP. Format: Allele|SYMBOL|Feature|HGVSc|HGVSp">
+#CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
+chr12	25245350	var1	C	A	.	PASS	ANN=A|KRAS|NM_004985.4|NM_004985.4%3Ac.35G>T|NP_004976.2%3Ap.(Gly12Val),A|KRAS|NM_033360.3||,A|KRAS|ENST00000256078.8||
+chr12	25245350	var2	C	A	.	PASS	ANN=A|KRAS|NM_004985.4||,A|KRAS|NM_033360.3||
+chr10	87933224	var3	T	TG	.	PASS	ANN=G|PTEN|NM_000314.6|NM_000314.6%3Ac.470dupG|
+chr12	25245350	var4	C	A	.	PASS	ANN=A|KRAS|NM_004985.4||
+chr7	140753336	var5	A	T	.	PASS	ANN=T|BRAF|NM_004333.6||
+""")
+        self.acc_by_chrom = {"chr7": "NC_000007.14", "chr10": "NC_000010.11", "chr12": "NC_000012.12"}
+
+    def tearDown(self):
+        WORKER_CONTEXT.pop("mapper", None)
+        # Clean temporary files
+        if os.path.exists(self.tmp_variants):
+            os.remove(self.tmp_variants)
+
+    def getRecords(self):
+        with AnnotVCFIO(self.tmp_variants) as reader:
+            return [record for record in reader]
+
+    def testResolve(self):
+        # Expected from per-record mapping
+        reference_mapper = FakeMapper()
+        expected = self.getRecords()
+        for record in expected:
+            updatePerRecord(record, self.acc_by_chrom, "ANN", reference_mapper)
+        self.assertEqual(len(reference_mapper.calls["relevant_transcripts"]), 5)
+        # Batch mapping
+        mapper = FakeMapper()
+        WORKER_CONTEXT["mapper"] = mapper
+        records = self.getRecords()
+        with PersistentCache(None, "transcripts") as transcripts_cache:
+            with PersistentCache(None, "mappings") as mappings_cache:
+                hgvs_by_rec, transcripts_by_hgvs_g, mappings = resolveHGVS(records[:3], self.acc_by_chrom, "ANN", "GRCh38", transcripts_cache, mappings_cache)
+                for record, hgvs_by_allele in zip(records[:3], hgvs_by_rec):
+                    updateRecord(record, hgvs_by_allele, transcripts_by_hgvs_g, mappings, "ANN")
+                # Duplicates are resolved once
+                self.assertEqual(
+                    sorted(mapper.calls["relevant_transcripts"]),
+                    ["NC_000010.11:g.87933224_87933225insG", "NC_000012.12:g.25245350C>A"]
+                )
+                self.assertEqual(
+                    sorted(mapper.calls["g_to_c"]),
+                    [
+                        ("NC_000010.11:g.87933224_87933225insG", "NM_000314.6"),
+                        ("NC_000012.12:g.25245350C>A", "NM_004985.4"),
+                        ("NC_000012.12:g.25245350C>A", "NM_033360.3")
+                    ]
+                )
+                self.assertEqual(len(mapper.calls["c_to_p"]), 2)
+                # Variants already in caches are not mapped again
+                hgvs_by_rec, transcripts_by_hgvs_g, mappings = resolveHGVS(records[3:], self.acc_by_chrom, "ANN", "GRCh38", transcripts_cache, mappings_cache)
+                for record, hgvs_by_allele in zip(records[3:], hgvs_by_rec):
+                    updateRecord(record, hgvs_by_allele, transcripts_by_hgvs_g, mappings, "ANN")
+                self.assertEqual(len(mapper.calls["relevant_transcripts"]), 3)
+                self.assertEqual(len(mapper.calls["g_to_c"]), 3)
+        # Same annotations as per-record mapping
+        self.assertEqual(
+            [record.info["ANN"] for record in records],
+            [record.info["ANN"] for record in expected]
+        )
+        self.assertEqual(
+            [(annot["HGVSg"], annot["HGVSc"], annot["HGVSp"]) for annot in records[0].info["ANN"]],
+            [
+                ("NC_000012.12:g.25245350C>A", "NM_004985.4:c.25245350C>A", "NP_004985.4:p.(Gly12Phe)"),
+                ("NC_000012.12:g.25245350C>A", "", ""),
+                ("NC_000012.12:g.25245350C>A", None, None)
+            ]
+        )
+
+    def testMultiAllelic(self):
+        WORKER_CONTEXT["mapper"] = FakeMapper()
+        records = self.getRecords()
+        records[0].alt.append("G")
+        with PersistentCache(None, "transcripts") as transcripts_cache:
+            with PersistentCache(None, "mappings") as mappings_cache:
+                with self.assertRaises(Exception):
+                    resolveHGVS(records, self.acc_by_chrom, "ANN", "GRCh38", transcripts_cache, mappings_cache)
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
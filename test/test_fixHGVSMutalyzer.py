@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import json
+import uuid
+import tempfile
+import unittest
+import threading
+import subprocess
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class MutalyzerStubHandler(BaseHTTPRequestHandler):
+    """Replay recorded responses of runMutalyzerLight by variant."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive
+    responses = {
+        "NC_000004.12:g.54727447C>T": {
+            "errors": 0,
+            "messages": [],
+            "genomicDescription": "NC_000004.12:g.54727447C>T",
+            "legend": [
+                {"name": "KIT_v001", "id": "NM_000222.2"},
+                {"name": "KIT_i001", "id": "NP_000213.1"},
+                {"name": "KIT_v002", "id": "NM_001093772.1"},
+                {"name": "KIT_i002", "id": "NP_001087241.1"}
+            ],
+            "transcriptDescriptions": [
+                "NC_000004.12(KIT_v001):c.1621C>T",
+                "NC_000004.12(KIT_v002):c.1609C>T"
+            ],
+            "proteinDescriptions": [
+                "NC_000004.12(KIT_i001):p.(Arg541Trp)",
+                "NC_000004.12(KIT_i002):p.(Arg537Trp)"
+            ]
+        },
+        "NC_000004.12:g.54727450del": {
+            "errors": 1,
+            "messages": [{"errorcode": "ERANGE", "message": "Position is out of range."}],
+            "genomicDescription": "",
+            "legend": [],
+            "transcriptDescriptions": [],
+            "proteinDescriptions": []
+        }
+    }
+
+    def do_GET(self):
+        params = dict(elt.split("=", 1) for elt in urllib.parse.urlparse(self.path).query.split(";"))
+        variant = urllib.parse.unquote(params["variant"])
+        with self.server.lock:
+            self.server.requested.append(variant)
+        content = json.dumps(self.responses[variant]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestFixHGVSMutalyzer(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_in_variants = os.path.join(tmp_folder, unique_id + "_in.vcf")
+        self.tmp_out_variants = os.path.join(tmp_folder, unique_id + "_out.vcf")
+        self.tmp_cache = os.path.join(tmp_folder, unique_id + "_cache.sqlite")
+
+        # Stub server
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MutalyzerStubHandler)
+        self.server.lock = threading.Lock()
+        self.server.requested = list()
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+
+        # Variants
+        with open(self.tmp_in_variants, "w") as writer:
+            writer.write("""##fileformat=VCFv4.1
+##INFO=<ID=ANN,Number=.,Type=String,Description="Consequence annotations from Ensembl VEP. Format: Allele|Feature|HGVSg|HGVSc|HGVSp">
+##contig=<ID=4,length=190214555>
+#CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
+4	54727447	varA	C	T	.	PASS	ANN=T|NM_000222.2|NC_000004.12:g.54727447C>T|NM_000222.2:c.1621C>T|NP_000213.1:p.Arg541Trp,T|NM_001093772.1|NC_000004.12:g.54727447C>T||,G|NM_000222.2|||
+4	54727447	varB	C	T	.	PASS	ANN=T|NM_000222.2|NC_000004.12:g.54727447C>T||
+4	54727450	varC	CA	C	.	PASS	ANN=-|NM_000222.2|NC_000004.12:g.54727450del||
+4	54727460	varD	G	A	.	PASS	ANN=A|NM_000222.2|||""")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        # Clean temporary files
+        for curr_file in [self.tmp_in_variants, self.tmp_out_variants, self.tmp_cache]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def test(self):
+        expected = [  # Colon is escaped in written INFO
+            "4	54727447	varA	C	T	.	PASS	ANN=T|NM_000222.2|NC_000004.12%3Ag.54727447C>T|NM_000222.2%3Ac.1621C>T|NP_000213.1%3Ap.(Arg541Trp),T|NM_001093772.1|NC_000004.12%3Ag.54727447C>T|NM_001093772.1%3Ac.1609C>T|NP_001087241.1%3Ap.(Arg537Trp)",
+            "4	54727447	varB	C	T	.	PASS	ANN=T|NM_000222.2|NC_000004.12%3Ag.54727447C>T|NM_000222.2%3Ac.1621C>T|NP_000213.1%3Ap.(Arg541Trp)",
+            "4	54727450	varC	CA	C	.	PASS	ANN=-|NM_000222.2|NC_000004.12%3Ag.54727450del||",
+            "4	54727460	varD	G	A	.	PASS	ANN=A|NM_000222.2|||"
+        ]
+        for batch_size, expected_requests in [(1, ["NC_000004.12:g.54727447C>T", "NC_000004.12:g.54727450del"]), (3, [])]:  # The second execution uses the cache
+            self.server.requested = list()
+            cmd = [
+                "fixHGVSMutalyzer.py",
+                "--batch-size", str(batch_size),
+                "--nb-jobs", "2",
+                "--mutalyzer-url", "http://127.0.0.1:{}".format(self.server.server_address[1]),
+                "--input-cache", self.tmp_cache,
+                "--input-variants", self.tmp_in_variants,
+                "--output-variants", self.tmp_out_variants
+            ]
+            subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+            with open(self.tmp_out_variants) as reader:
+                observed = [line.rstrip("\n") for line in reader if not line.startswith("#")]
+            self.assertEqual(observed, expected)
+            self.assertEqual(sorted(self.server.requested), expected_requests)
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import gzip
+import json
+import uuid
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+from illuCountBarcodes import countChunk, getCountByBarcode
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class TestIlluCountBarcodes(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_in_L1 = os.path.join(tmp_folder, unique_id + "_L001_R1.fastq.gz")
+        self.tmp_in_L2 = os.path.join(tmp_folder, unique_id + "_L002_R1.fastq")
+        self.tmp_out_json = os.path.join(tmp_folder, unique_id + "_out.json")
+        self.tmp_out_tsv = os.path.join(tmp_folder, unique_id + "_out.tsv")
+
+        # Reads
+        barcodes = ["ATCACG", "CGATGT", "ATCACG", "TTAGGC", "ATCACG", "CGATGT", "", "ATCACG+GGTA", "ATCACG"]
+        records = [
+            "@M70265:329:000000000-D5GLP:1:1101:{}:1000 1:N:0:{}\n{}\n+\n{}\n".format(idx, barcode, "ACGT" * (idx + 1), "@" * (4 * idx + 4))  # Quality starts with @
+            for idx, barcode in enumerate(barcodes)
+        ]
+        with open(self.tmp_in_L1, "wb") as writer:  # Multi-members gzip
+            writer.write(gzip.compress("".join(records[:2]).encode()))
+            writer.write(gzip.compress("".join(records[2:5]).encode()))
+        with open(self.tmp_in_L2, "w") as writer:
+            writer.write("".join(records[5:]).rstrip("\n"))  # Without last end of line
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_in_L1, self.tmp_in_L2, self.tmp_out_json, self.tmp_out_tsv]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testGetCountByBarcode(self):
+        expected = {"ATCACG": 4, "CGATGT": 2, "TTAGGC": 1, None: 1, "ATCACG+GGTA": 1}
+        for nb_jobs in [1, 2]:
+            for chunk_size in [5, 23, 16777216]:  # Chunks in the middle of records
+                observed = getCountByBarcode([self.tmp_in_L1, self.tmp_in_L2], nb_jobs, chunk_size)
+                self.assertEqual(observed, expected)
+                self.assertEqual(list(observed), list(expected))  # Order of first occurrence
+        # One file
+        expected = {"ATCACG": 3, "CGATGT": 1, "TTAGGC": 1}
+        for nb_jobs in [1, 2]:
+            for chunk_size in [5, 23, 16777216]:
+                self.assertEqual(getCountByBarcode([self.tmp_in_L1], nb_jobs, chunk_size), expected)
+
+    def testInvalidHeader(self):
+        valid = b"@read1 1:N:0:ATCACG\nACGT\n+\n@@@@\n"
+        self.assertEqual(countChunk(valid * 3, 0), {b"ATCACG": 3})
+        for invalid_header in [b"@read2", b"read2 1:N:0:ATCACG", b""]:  # Without description, without "@" and empty
+            chunk = valid + invalid_header + b"\nACGT\n+\n@@@@\n" + valid
+            with self.assertRaises(IOError) as context:
+                countChunk(chunk, 0)
+            self.assertIn("The header {} is not".format(invalid_header.decode()), str(context.exception))
+        # Second record in chunk
+        with open(self.tmp_in_L2, "w") as writer:
+            writer.write((valid + b"@read2\nACGT\n+\n@@@@\n").decode())
+        with self.assertRaises(IOError):
+            getCountByBarcode([self.tmp_in_L2])
+
+    def testScript(self):
+        cmd = [
+            "illuCountBarcodes.py",
+            "--nb-jobs", "2",
+            "--nb-max", "2",
+            "--inputs-seq", self.tmp_in_L1, self.tmp_in_L2,
+            "--output-json", self.tmp_out_json,
+            "--output-tsv", self.tmp_out_tsv
+        ]
+        subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+        with open(self.tmp_out_json) as reader:
+            self.assertEqual(
+                json.load(reader),
+                {"count_by_barcode": {"ATCACG": 4, "CGATGT": 2}, "limit_barcodes": 2, "nb_barcodes": 5, "total_count": 9}
+            )
+        with open(self.tmp_out_tsv) as reader:
+            self.assertEqual(
+                reader.read(),
+                "#Barcode\tNb_barcodes\tCount\nATCACG\t1\t4\nCGATGT\t1\t2\nothers_barcodes\t3\t3\n"
+            )
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
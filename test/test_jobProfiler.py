@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import json
+import uuid
+import pstats
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+from jobProfiler import JobProfiler, PROFILE_ENV, resetPeakRSS
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class TestJobProfiler(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_filters = os.path.join(tmp_folder, unique_id + "_filters.json")
+        self.tmp_variants = os.path.join(tmp_folder, unique_id + "_in.vcf")
+        self.tmp_output = os.path.join(tmp_folder, unique_id + "_out.vcf")
+        self.tmp_expected = os.path.join(tmp_folder, unique_id + "_expected.vcf")
+        self.tmp_report = os.path.join(tmp_folder, unique_id + "_report.json")
+        self.tmp_cprofile = os.path.join(tmp_folder, unique_id + "_stats.pstats")
+
+        # Filters
+        with open(self.tmp_filters, "w") as writer:
+            json.dump({"class": "Filter", "getter": "chrom", "action": "select", "aggregator": "nb:1", "operator": "==", "values": "chr1"}, writer)
+
+        # Variants
+        with open(self.tmp_variants, "w") as writer:
+            writer.write("##fileformat=VCFv4.2\n")
+            writer.write('##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Total depth">\n')
+            writer.write("##contig=<ID=chr1,length=100000>\n")
+            writer.write("##contig=<ID=chr2,length=100000>\n")
+            writer.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tsplA\n")
+            for chrom in ["chr1", "chr2"]:
+                for pos in range(100, 30100, 100):
+                    writer.write("{}\t{}\t.\tA\tT\t30\tPASS\t.\tDP\t{}\n".format(chrom, pos, pos % 700))
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_filters, self.tmp_variants, self.tmp_output, self.tmp_expected, self.tmp_report, self.tmp_cprofile]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def checkReport(self):
+        with open(self.tmp_report) as reader:
+            report = json.load(reader)
+        self.assertIn("filterVCF.py", report["command"])
+        self.assertEqual([curr_phase["name"] for curr_phase in report["phases"]], ["load_filters", "filter_variants"])
+        filter_phase = report["phases"][1]
+        self.assertEqual(filter_phase["counts"], {"variants": 600, "kept": 300})
+        self.assertGreaterEqual(filter_phase["read_bytes"], os.path.getsize(self.tmp_variants))
+        self.assertGreaterEqual(filter_phase["written_bytes"], os.path.getsize(self.tmp_output))
+        for curr_level in [report] + report["phases"]:
+            self.assertGreater(curr_level["wall_time_s"], 0)
+            self.assertGreaterEqual(curr_level["cpu_time_s"], 0)
+            self.assertGreater(curr_level["peak_rss_mb"], 0)
+        self.assertGreaterEqual(report["wall_time_s"], sum(curr_phase["wall_time_s"] for curr_phase in report["phases"]))
+        self.assertGreaterEqual(report["peak_rss_mb"], max(curr_phase["peak_rss_mb"] for curr_phase in report["phases"]))
+        return report
+
+    def testFilterVCF(self):
+        base_cmd = ["filterVCF.py", "--input-filters", self.tmp_filters, "--input-variants", self.tmp_variants]
+        env = {key: val for key, val in os.environ.items() if key not in PROFILE_ENV.values()}
+        # Without profiling
+        subprocess.check_call(base_cmd + ["--output-variants", self.tmp_expected], stderr=subprocess.DEVNULL, env=env)
+        with open(self.tmp_expected) as reader:
+            expected = reader.read()
+        self.assertEqual(expected.count("\nchr1\t"), 300)
+        self.assertEqual(expected.count("\nchr2\t"), 0)
+        # With options
+        cmd = base_cmd + ["--output-variants", self.tmp_output, "--profile-output", self.tmp_report, "--profile-cprofile", self.tmp_cprofile, "--profile-tracemalloc", "5"]
+        subprocess.check_call(cmd, stderr=subprocess.DEVNULL, env=env)
+        with open(self.tmp_output) as reader:
+            self.assertEqual(reader.read(), expected)
+        report = self.checkReport()
+        self.assertEqual(report["cprofile"], self.tmp_cprofile)
+        self.assertGreater(pstats.Stats(self.tmp_cprofile).total_calls, 0)
+        self.assertEqual(len(report["tracemalloc"]), 5)
+        self.assertTrue(all(curr_phase["tracemalloc_peak_mb"] > 0 for curr_phase in report["phases"]))
+        os.remove(self.tmp_report)
+        # With environment variable
+        env_profile = dict(env)
+        env_profile[PROFILE_ENV["output"]] = self.tmp_report
+        subprocess.check_call(base_cmd + ["--output-variants", self.tmp_output], stderr=subprocess.DEVNULL, env=env_profile)
+        with open(self.tmp_output) as reader:
+            self.assertEqual(reader.read(), expected)
+        report = self.checkReport()
+        self.assertIsNone(report["cprofile"])
+        self.assertNotIn("tracemalloc", report)
+
+    def testDisabled(self):
+        profiler = JobProfiler()
+        with profiler:
+            with profiler.phase("process") as phase:
+                phase.count("records", 2)
+                profiler.count("records")
+        self.assertFalse(profiler.is_enabled)
+        self.assertEqual(phase.counts, {"records": 3})
+        self.assertIsNone(phase.report)
+        self.assertEqual(profiler.phases, [])
+
+    def testNestedPhases(self):
+        profiler = JobProfiler(self.tmp_report, tracemalloc_top=1)
+        with profiler:
+            with profiler.phase("outer") as outer_phase:
+                profiler.count("records")
+                data = bytearray(100 * 1048576)
+                data[::4096] = b"\x01" * len(data[::4096])  # Pages are really allocated
+                del data
+                with profiler.phase("inner") as inner_phase:
+                    profiler.count("records", 2)
+                    data = bytearray(10 * 1048576)
+                    data[::4096] = b"\x01" * len(data[::4096])
+                    del data
+                profiler.count("records")  # The outer phase is restored
+            profiler.count("records")  # Out of phases
+        self.assertEqual(outer_phase.counts, {"records": 2})
+        self.assertEqual(inner_phase.counts, {"records": 2})
+        self.assertEqual([curr_phase["name"] for curr_phase in profiler.phases], ["inner", "outer"])
+        self.assertEqual([curr_phase["parent"] for curr_phase in profiler.phases], ["outer", None])
+        self.assertEqual(outer_phase.report["peak_rss_scope"], inner_phase.report["peak_rss_scope"])
+        self.assertGreaterEqual(outer_phase.report["peak_rss_mb"], 100)  # The peak before the inner phase is kept
+        self.assertGreaterEqual(outer_phase.report["tracemalloc_peak_mb"], 100)
+        self.assertLess(inner_phase.report["tracemalloc_peak_mb"], 100)
+        if resetPeakRSS():
+            self.assertEqual(outer_phase.report["peak_rss_scope"], "phase")
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
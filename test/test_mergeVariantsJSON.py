@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import json
+import uuid
+import random
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+from mergeVariantsJSON import getMergedVariants, iterMergedSortedVariants
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class TestMergeVariantsJSON(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_inputs = [os.path.join(tmp_folder, "{}_in{}.json".format(unique_id, idx)) for idx in range(4)]
+        self.tmp_output = os.path.join(tmp_folder, unique_id + "_out.json")
+
+        # Sorted inputs (the last is empty)
+        rand = random.Random(42)
+        regions = ["chr2", "chr1", "chrX"]  # Regions are not in lexicographic order
+        self.expected = {}
+        for idx_in, curr_path in enumerate(self.tmp_inputs):
+            variants = []
+            if idx_in != 3:
+                for region in regions:
+                    for pos in sorted(rand.sample(range(1, 60), 25)):
+                        for alt in sorted(rand.sample("ACGT", rand.randint(1, 2))):
+                            variants.append({
+                                "coord": {"region": region, "pos": pos, "ref": "N", "alt": alt},
+                                "supports": [{"source": "caller{}".format(idx_in)}]
+                            })
+                            key = (regions.index(region), pos, "N", alt)
+                            self.expected.setdefault(key, []).append({"source": "caller{}".format(idx_in)})
+            with open(curr_path, "w") as writer:
+                if idx_in == 1:  # NDJSON
+                    writer.write("".join(json.dumps(elt) + "\n" for elt in variants))
+                else:
+                    json.dump(variants, writer)
+        self.expected = [
+            {"coord": {"region": regions[key[0]], "pos": key[1], "ref": key[2], "alt": key[3]}, "supports": supports}
+            for key, supports in sorted(self.expected.items())
+        ]
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in self.tmp_inputs + [self.tmp_output]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testIterMergedSortedVariants(self):
+        # Streaming merge
+        observed = list(iterMergedSortedVariants(self.tmp_inputs))
+        self.assertEqual(observed, self.expected)
+        observed = list(iterMergedSortedVariants(self.tmp_inputs, ["chr2", "chr1"]))
+        self.assertEqual(observed, self.expected)
+        # Same variants and supports than in memory merge
+        in_memory = sorted(getMergedVariants(self.tmp_inputs), key=lambda elt: (["chr2", "chr1", "chrX"].index(elt["coord"]["region"]), elt["coord"]["pos"], elt["coord"]["alt"]))
+        self.assertEqual(observed, in_memory)
+        # Regions in a different order
+        with self.assertRaises(Exception):
+            list(iterMergedSortedVariants(self.tmp_inputs, ["chr1", "chr2", "chrX"]))
+        # Unsorted input
+        with open(self.tmp_inputs[3], "w") as writer:
+            json.dump([
+                {"coord": {"region": "chr2", "pos": 10, "ref": "N", "alt": "A"}, "supports": []},
+                {"coord": {"region": "chr2", "pos": 9, "ref": "N", "alt": "A"}, "supports": []}
+            ], writer)
+        with self.assertRaises(Exception):
+            list(iterMergedSortedVariants(self.tmp_inputs))
+
+    def testMultiAllelic(self):
+        # Multi-allelic positions are in the order of ALT and this order is different between inputs
+        variants_by_input = [
+            [("chr7", 10, "C", "T"), ("chr7", 10, "C", "A"), ("chr7", 12, "G", "T"), ("chr7", 12, "GA", "G")],
+            [("chr7", 10, "C", "A"), ("chr7", 10, "C", "T"), ("chr7", 10, "C", "G"), ("chr7", 11, "A", "C")],
+            [("chr7", 12, "GA", "G"), ("chr7", 12, "G", "T")],
+            []
+        ]
+        for curr_path, variants in zip(self.tmp_inputs, variants_by_input):
+            with open(curr_path, "w") as writer:
+                json.dump([
+                    {"coord": {"region": region, "pos": pos, "ref": ref, "alt": alt}, "supports": [{"source": os.path.basename(curr_path)}]}
+                    for region, pos, ref, alt in variants
+                ], writer)
+        sources = [os.path.basename(curr_path) for curr_path in self.tmp_inputs]
+        expected = [
+            (10, "C", "A", [sources[0], sources[1]]),
+            (10, "C", "G", [sources[1]]),
+            (10, "C", "T", [sources[0], sources[1]]),
+            (11, "A", "C", [sources[1]]),
+            (12, "G", "T", [sources[0], sources[2]]),
+            (12, "GA", "G", [sources[0], sources[2]])
+        ]
+        observed = [
+            (elt["coord"]["pos"], elt["coord"]["ref"], elt["coord"]["alt"], [support["source"] for support in elt["supports"]])
+            for elt in iterMergedSortedVariants(self.tmp_inputs)
+        ]
+        self.assertEqual(observed, expected)
+
+    def testScript(self):
+        for options in [[], ["--sorted-inputs"]]:
+            cmd = [
+                "mergeVariantsJSON.py",
+                "--inputs-variants"
+            ] + self.tmp_inputs + [
+                "--output-variants", self.tmp_output
+            ] + options
+            subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+            with open(self.tmp_output) as reader:
+                observed = json.load(reader)
+            if len(options) == 0:  # Order of first occurrence
+                observed = sorted(observed, key=lambda elt: (["chr2", "chr1", "chrX"].index(elt["coord"]["region"]), elt["coord"]["pos"], elt["coord"]["alt"]))
+            self.assertEqual(observed, self.expected)
+        # NDJSON
+        subprocess.check_call(cmd + ["--output-format", "ndjson"], stderr=subprocess.DEVNULL)
+        with open(self.tmp_output) as reader:
+            self.assertEqual([json.loads(line) for line in reader], self.expected)
+        # Failed merge does not leave a valid output
+        with open(self.tmp_inputs[3], "w") as writer:
+            json.dump([
+                {"coord": {"region": "chr2", "pos": 10, "ref": "N", "alt": "A"}, "supports": []},
+                {"coord": {"region": "chr2", "pos": 9, "ref": "N", "alt": "A"}, "supports": []}
+            ], writer)
+        for output_format in ["json", "ndjson"]:
+            with self.assertRaises(subprocess.CalledProcessError):
+                subprocess.check_call(cmd + ["--output-format", output_format], stderr=subprocess.DEVNULL)
+            self.assertFalse(os.path.exists(self.tmp_output))
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.1.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import gzip
+import uuid
+import tempfile
+import unittest
+from anacore.sequenceIO import FastaIO, IdxFastaIO, Sequence
+from anacore.vcf import VCFRecord
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+
+from mmapSequenceIO import getFastaReader, getRunLengths, getShiftedVariant, InMemoryFastaIO, MmapIdxFastaIO
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class GetRunLengths(unittest.TestCase):
+    def test(self):
+        downstream, upstream = getRunLengths("AAaTGGC")
+        self.assertEqual(downstream.tolist(), [3, 2, 1, 1, 2, 1, 1])
+        self.assertEqual(upstream.tolist(), [1, 2, 3, 1, 1, 2, 1])
+
+
+class TestMmapIdxFastaIO(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_sequences = os.path.join(tmp_folder, unique_id + ".fasta")
+        self.tmp_faidx = os.path.join(tmp_folder, unique_id + ".fasta.fai")
+
+        # Create fasta
+        with FastaIO(self.tmp_sequences, "w") as FH_seq:
+            FH_seq.write(Sequence("artificial_chr1", "CTCAGTCATGTATGTATGTGCTCAAAAAAAAAAAAAAGATCATGGCAC"))
+            FH_seq.write(Sequence("artificial_chr2", "CGATNNNCGAT"))
+
+        # Create faidx
+        with open(self.tmp_faidx, "w") as FH_fai:
+            FH_fai.write("""artificial_chr1	48	17	48	49
+artificial_chr2	11	83	11	12""")
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_sequences, self.tmp_faidx]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testGetSub(self):
+        with IdxFastaIO(self.tmp_sequences) as FH_expected:
+            with MmapIdxFastaIO(self.tmp_sequences, block_size=5, max_blocks=3) as FH_observed:
+                for chrom in ["artificial_chr1", "artificial_chr2"]:
+                    chrom_len = FH_observed.length(chrom)
+                    for start in range(1, chrom_len + 1):
+                        for end in range(start, chrom_len + 1):
+                            self.assertEqual(
+                                FH_expected.getSub(chrom, start, end),
+                                FH_observed.getSub(chrom, start, end)
+                            )
+                    self.assertEqual(
+                        FH_expected.get(chrom).string,
+                        FH_observed.get(chrom).string
+                    )
+                # Out of sequence
+                self.assertEqual(FH_observed.getSub("artificial_chr2", -2, 2), "CG")
+                self.assertEqual(FH_observed.getSub("artificial_chr2", 10, 20), "AT")
+                self.assertEqual(FH_observed.getSub("artificial_chr2", 12, 20), "")
+
+    def testIndexInMemory(self):
+        os.remove(self.tmp_faidx)
+        with FastaIO(self.tmp_sequences, "a") as FH_seq:  # Multi-lines sequence
+            FH_seq.file_handle.write(">artificial_chr3 desc\nACGTA\nCGTAC\nGT\n")
+        with MmapIdxFastaIO(self.tmp_sequences) as FH_seq:
+            self.assertEqual(
+                [(rec.name, rec.length, rec.offset, rec.line_bases, rec.line_width) for rec in FH_seq.index.values()],
+                [("artificial_chr1", 48, 17, 48, 49), ("artificial_chr2", 11, 83, 11, 12), ("artificial_chr3", 12, 117, 5, 6)]
+            )
+            self.assertEqual(FH_seq.getSub("artificial_chr3", 4, 11), "TACGTACG")
+            self.assertEqual(FH_seq.get("artificial_chr3").string, "ACGTACGTACGT")
+
+    def testEmptySequence(self):
+        os.remove(self.tmp_faidx)
+        with FastaIO(self.tmp_sequences, "a") as FH_seq:
+            FH_seq.file_handle.write(">artificial_chr3\n>artificial_chr4\nACGT\n")
+        with MmapIdxFastaIO(self.tmp_sequences) as FH_seq:
+            self.assertEqual(FH_seq.length("artificial_chr3"), 0)
+            self.assertEqual(FH_seq.get("artificial_chr3").string, "")
+            self.assertEqual(FH_seq.getSub("artificial_chr3", 1, 10), "")
+            self.assertEqual(FH_seq.get("artificial_chr4").string, "ACGT")
+
+    def testCompressed(self):
+        with open(self.tmp_sequences, "rb") as reader:
+            content = reader.read()
+        with gzip.open(self.tmp_sequences, "wb") as writer:
+            writer.write(content)
+        with self.assertRaises(IOError):
+            MmapIdxFastaIO(self.tmp_sequences)
+
+    def testGetFastaReader(self):
+        with getFastaReader(self.tmp_sequences) as FH_seq:
+            self.assertIsInstance(FH_seq, MmapIdxFastaIO)
+        # Compressed file
+        with open(self.tmp_sequences, "rb") as reader:
+            content = reader.read()
+        tmp_compressed = self.tmp_sequences + ".gz"
+        try:
+            with gzip.open(tmp_compressed, "wb") as writer:
+                writer.write(content)
+            with MmapIdxFastaIO(self.tmp_sequences) as FH_expected:
+                with getFastaReader(tmp_compressed) as FH_observed:
+                    self.assertIsInstance(FH_observed, InMemoryFastaIO)
+                    self.assertEqual(list(FH_observed.index), ["artificial_chr1", "artificial_chr2"])
+                    for chrom in ["artificial_chr1", "artificial_chr2"]:
+                        chrom_len = FH_expected.length(chrom)
+                        self.assertEqual(FH_observed.length(chrom), chrom_len)
+                        self.assertEqual(FH_observed.get(chrom).string, FH_expected.get(chrom).string)
+                        self.assertEqual(FH_observed.getSub(chrom, -2, chrom_len + 5), FH_expected.getSub(chrom, -2, chrom_len + 5))
+                        for pos in range(1, chrom_len + 1):
+                            self.assertEqual(FH_observed.getSub(chrom, pos, pos + 3), FH_expected.getSub(chrom, pos, pos + 3))
+                            for downstream in [True, False]:
+                                self.assertEqual(
+                                    FH_observed.getHomopolymerLength(chrom, pos, downstream),
+                                    FH_expected.getHomopolymerLength(chrom, pos, downstream)
+                                )
+        finally:
+            os.remove(tmp_compressed)
+
+    def testGetHomopolymerLength(self):
+        with MmapIdxFastaIO(self.tmp_sequences, block_size=5, max_blocks=2) as FH_seq:
+            # Downstream
+            self.assertEqual(FH_seq.getHomopolymerLength("artificial_chr1", 1), 1)
+            self.assertEqual(FH_seq.getHomopolymerLength("artificial_chr1", 24), 14)
+            self.assertEqual(FH_seq.getHomopolymerLength("artificial_chr1", 30), 8)
+            self.assertEqual(FH_seq.getHomopolymerLength("artificial_chr1", 48), 1)
+            self.assertEqual(FH_seq.getHomopolymerLength("artificial_chr2", 5), 3)
+            # Upstream
+            self.assertEqual(FH_seq.getHomopolymerLength("artificial_chr1", 37, False), 14)
+            self.assertEqual(FH_seq.getHomopolymerLength("artificial_chr1", 26, False), 3)
+            self.assertEqual(FH_seq.getHomopolymerLength("artificial_chr1", 1, False), 1)
+            self.assertEqual(FH_seq.getHomopolymerLength("artificial_chr2", 7, False), 3)
+
+    def testGetShiftedVariant(self):
+        chrom_seq = "CTCAGTCATGTATGTATGTGCTCAAAAAAAAAAAAAAGATCATGGCAC"
+        variants = [
+            VCFRecord("artificial_chr1", 36, None, "A", ["-"]),  # Deletion in homopolymer
+            VCFRecord("artificial_chr1", 37, None, "A", ["AA"]),  # Insertion in homopolymer
+            VCFRecord("artificial_chr1", 17, None, "TGT", ["T"]),  # Deletion in repeat
+            VCFRecord("artificial_chr1", 16, None, "A", ["ATGTA"]),  # Insertion in repeat
+            VCFRecord("artificial_chr1", 4, None, "AGTC", ["A"]),  # Deletion without move
+            VCFRecord("artificial_chr1", 30, None, "A", ["T"])  # Substitution
+        ]
+        with MmapIdxFastaIO(self.tmp_sequences, block_size=5, max_blocks=2) as FH_seq:
+            for padding in [1, 3, 200]:
+                for variant in variants:
+                    # Upstream
+                    expected = variant.getMostUpstream(chrom_seq)
+                    observed = getShiftedVariant(variant, FH_seq, True, padding)
+                    self.assertEqual(
+                        (expected.pos, expected.ref, expected.alt),
+                        (observed.pos, observed.ref, observed.alt)
+                    )
+                    # Downstream
+                    expected = variant.getMostDownstream(chrom_seq)
+                    observed = getShiftedVariant(variant, FH_seq, False, padding)
+                    self.assertEqual(
+                        (expected.pos, expected.ref, expected.alt),
+                        (observed.pos, observed.ref, observed.alt)
+                    )
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import random
+import unittest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+
+from nonOverlappingDesign import getNonOverlappingThread, hasNoOverlap
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getFirstFitThreads(selected_areas):
+    """Return non-overlapping threads with the previous linear first-fit algorithm."""
+    sorted_selected_areas = sorted(selected_areas, key=lambda x: (x["region"], x["start"], x["end"]))
+    non_overlapping_threads = []
+    for curr_area in sorted_selected_areas:
+        for thread in non_overlapping_threads:
+            if hasNoOverlap(curr_area, thread[-1]):
+                thread.append(curr_area)
+                break
+        else:
+            non_overlapping_threads.append([curr_area])
+    return non_overlapping_threads
+
+
+def getAreas(coords):
+    return [{"region": region, "start": start, "end": end, "id": "ampl_{}".format(idx)} for idx, (region, start, end) in enumerate(coords)]
+
+
+def getIds(threads):
+    return [[area["id"] for area in thread] for thread in threads]
+
+
+class GetNonOverlappingThread(unittest.TestCase):
+    def testFirstFit(self):
+        random.seed(42)
+        for nb_areas in [1, 10, 500]:
+            areas = []
+            for idx in range(nb_areas):
+                start = random.randint(1, 5000)
+                areas.append((random.choice(["chr1", "chr2", "chr10"]), start, start + random.randint(0, 300)))
+            areas = getAreas(areas)
+            self.assertEqual(getIds(getNonOverlappingThread(areas)), getIds(getFirstFitThreads(areas)))
+
+    def testBalanced(self):
+        areas = getAreas([("chr1", 1, 10), ("chr1", 5, 15), ("chr1", 20, 30), ("chr1", 40, 50), ("chr2", 1, 10)])
+        self.assertEqual(
+            getIds(getNonOverlappingThread(areas)),
+            [["ampl_0", "ampl_2", "ampl_3", "ampl_4"], ["ampl_1"]]
+        )
+        self.assertEqual(
+            getIds(getNonOverlappingThread(areas, True)),
+            [["ampl_0", "ampl_2", "ampl_4"], ["ampl_1", "ampl_3"]]
+        )
+        self.assertEqual(
+            getIds(getNonOverlappingThread(areas, True, 3)),
+            [["ampl_0", "ampl_3"], ["ampl_1", "ampl_4"], ["ampl_2"]]
+        )
+        self.assertEqual(
+            getIds(getNonOverlappingThread(areas, True, 10)),
+            [["ampl_0"], ["ampl_1"], ["ampl_2"], ["ampl_3"], ["ampl_4"]]
+        )
+
+    def testBalancedWithoutOverlap(self):
+        random.seed(1)
+        areas = []
+        for idx in range(2000):
+            start = random.randint(1, 50000)
+            areas.append(("chr1", start, start + random.randint(50, 250)))
+        areas = getAreas(areas)
+        first_fit = getNonOverlappingThread(areas)
+        balanced = getNonOverlappingThread(areas, True)
+        self.assertEqual(len(first_fit), len(balanced))  # Minimum number of groups
+        self.assertEqual(sum(len(thread) for thread in balanced), len(areas))
+        for thread in balanced:
+            for prev_area, curr_area in zip(thread[:-1], thread[1:]):
+                self.assertTrue(hasNoOverlap(curr_area, prev_area))
+        self.assertLess(
+            max(len(elt) for elt in balanced) - min(len(elt) for elt in balanced),
+            max(len(elt) for elt in first_fit) - min(len(elt) for elt in first_fit)
+        )
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import uuid
+import tempfile
+import unittest
+from multiprocessing.pool import ThreadPool
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+
+from persistentCache import PersistentCache
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class TestPersistentCache(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_cache = os.path.join(tmp_folder, unique_id + ".sqlite")
+        self.calls = list()
+
+    def tearDown(self):
+        # Clean temporary files
+        if os.path.exists(self.tmp_cache):
+            os.remove(self.tmp_cache)
+
+    def getMapping(self, hgvs_g):
+        self.calls.append(hgvs_g)
+        if hgvs_g.endswith("?"):
+            return [None, None]
+        return [hgvs_g.replace("g.", "c."), hgvs_g.replace("g.", "p.")]
+
+    def testGetSet(self):
+        with PersistentCache(self.tmp_cache, "mappings", batch_size=2) as cache:
+            cache.set(("GRCh38", "NC_1:g.10A>T", "NM_1.1"), ["NM_1.1:c.2A>T", None])
+            cache.setMany({
+                ("GRCh38", "NC_1:g.12C>G", "NM_1.1"): ["NM_1.1:c.4C>G", "NP_1.1:p.(Leu2Val)"],
+                ("GRCh37", "NC_1:g.10A>T", "NM_1.1"): ["NM_1.1:c.8A>T", None]
+            })
+        with PersistentCache(self.tmp_cache, "transcripts") as cache:  # Other table in same file
+            self.assertIsNone(cache.get(("GRCh38", "NC_1:g.10A>T", "NM_1.1")))
+            cache.set(("GRCh38", "NC_1:g.10A>T"), ["NM_1.1", "NM_2.3"])
+        with PersistentCache(self.tmp_cache, "mappings", batch_size=2) as cache:  # Reopen
+            self.assertEqual(cache.get(("GRCh38", "NC_1:g.10A>T", "NM_1.1")), ["NM_1.1:c.2A>T", None])
+            self.assertEqual(cache.get(("GRCh38", "NC_1:g.99A>T", "NM_1.1"), "missing"), "missing")
+            self.assertEqual(
+                cache.getMany([
+                    ("GRCh38", "NC_1:g.10A>T", "NM_1.1"),
+                    ("GRCh38", "NC_1:g.99A>T", "NM_1.1"),
+                    ("GRCh38", "NC_1:g.12C>G", "NM_1.1"),
+                    ("GRCh37", "NC_1:g.10A>T", "NM_1.1")
+                ]),
+                {
+                    ("GRCh38", "NC_1:g.10A>T", "NM_1.1"): ["NM_1.1:c.2A>T", None],
+                    ("GRCh38", "NC_1:g.12C>G", "NM_1.1"): ["NM_1.1:c.4C>G", "NP_1.1:p.(Leu2Val)"],
+                    ("GRCh37", "NC_1:g.10A>T", "NM_1.1"): ["NM_1.1:c.8A>T", None]
+                }
+            )
+        with self.assertRaises(ValueError):
+            PersistentCache(self.tmp_cache, "mappings;DROP")
+
+    def testGetOrCompute(self):
+        variants = ["NC_1:g.10A>T", "NC_1:g.12C>G", "NC_1:g.10A>T", "NC_1:g.?"]
+        expected = {
+            ("GRCh38", "NC_1:g.10A>T"): ["NC_1:c.10A>T", "NC_1:p.10A>T"],
+            ("GRCh38", "NC_1:g.12C>G"): ["NC_1:c.12C>G", "NC_1:p.12C>G"],
+            ("GRCh38", "NC_1:g.?"): [None, None]
+        }
+        # Duplicates are removed before computation
+        with PersistentCache(self.tmp_cache, "mappings") as cache:
+            self.assertEqual(
+                cache.getOrCompute({("GRCh38", elt): elt for elt in variants}, self.getMapping),
+                expected
+            )
+        self.assertEqual(sorted(self.calls), ["NC_1:g.10A>T", "NC_1:g.12C>G", "NC_1:g.?"])
+        # Only missing are computed
+        self.calls = list()
+        variants.append("NC_1:g.15del")
+        expected[("GRCh38", "NC_1:g.15del")] = ["NC_1:c.15del", "NC_1:p.15del"]
+        with PersistentCache(self.tmp_cache, "mappings") as cache:
+            with ThreadPool(2) as pool:
+                self.assertEqual(
+                    cache.getOrCompute({("GRCh38", elt): elt for elt in variants}, self.getMapping, pool.map),
+                    expected
+                )
+        self.assertEqual(self.calls, ["NC_1:g.15del"])
+        # In memory
+        self.calls = list()
+        with PersistentCache() as cache:
+            cache.getOrCompute({("GRCh38", elt): elt for elt in variants}, self.getMapping)
+            cache.getOrCompute({("GRCh38", elt): elt for elt in variants}, self.getMapping)
+        self.assertEqual(len(self.calls), 4)
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -3,12 +3,13 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2019 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.0'
+__version__ = '1.1.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
 import os
 import uuid
+import random
 import tempfile
 import unittest
 import subprocess
@@ -271,6 +272,54 @@ ATGCATAGTAGTACCATAGAGATAGTTTTCGGCAT
             sorted(observed)
         )
 
+    def testEngines(self):
+        # Sorted data
+        rand = random.Random(42)
+        seq_ids = sorted("read{}".format(rand.randint(0, 10000000)) for idx in range(3000))
+        seq_ids.insert(100, seq_ids[100])  # Duplicated sequence
+        with open(self.tmp_in_seq_2, "w") as FH_out:
+            for seq_id in seq_ids:
+                FH_out.write("@{} desc\nACGT\n+\nIIII\n".format(seq_id))
+        selected_ids = rand.sample(seq_ids, 800) + ["read", "read5", "readZ"]  # With missing
+        with open(self.tmp_in_ids, "w") as FH_out:
+            FH_out.write("\n".join(sorted(selected_ids)) + "\n")
+        # Compare engines
+        for mode in ["select", "remove"]:
+            observed_by_engine = dict()
+            for engine in ["memory", "sorted", "bloom"]:
+                cmd = [
+                    "pickSequences.py",
+                    "--stringency", "lenient",
+                    "--batch-size", "7",
+                    "--engine", engine,
+                    "--mode", mode,
+                    "--input-ids", self.tmp_in_ids,
+                    "--input-sequences", self.tmp_in_seq_2,
+                    "--output-sequences", self.tmp_output
+                ]
+                subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+                with open(self.tmp_output) as FH_obs:
+                    observed_by_engine[engine] = FH_obs.read()
+                with self.assertRaises(Exception):  # Missing IDs in strict mode
+                    subprocess.check_call([elt for elt in cmd if elt not in ["--stringency", "lenient"]], stderr=subprocess.DEVNULL)
+            expected_ids = [elt for elt in seq_ids if (elt in selected_ids) == (mode == "select")]
+            self.assertEqual(observed_by_engine["memory"].count("@"), len(expected_ids))
+            self.assertEqual(observed_by_engine["sorted"], observed_by_engine["memory"])
+            self.assertEqual(observed_by_engine["bloom"], observed_by_engine["memory"])
+        # Unsorted IDs with sorted engine
+        with open(self.tmp_in_ids, "w") as FH_out:
+            FH_out.write("\n".join(reversed(sorted(selected_ids))))
+        cmd = [
+            "pickSequences.py",
+            "--stringency", "lenient",
+            "--engine", "sorted",
+            "--input-ids", self.tmp_in_ids,
+            "--input-sequences", self.tmp_in_seq_2,
+            "--output-sequences", self.tmp_output
+        ]
+        with self.assertRaises(Exception):
+            subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+
 
 ########################################################################
 #
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import re
+import gzip
+import sys
+import uuid
+import random
+import tempfile
+import unittest
+from anacore.sequenceIO import FastaIO, Sequence
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+
+from primersLocator import findPatterns, getSmallestAmplicon, MultiPatternMatcher
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getRegexpHits(pattern, seq):
+    return [(curr_match.start() + 1, curr_match.end()) for curr_match in re.finditer(pattern, seq.upper())]
+
+
+class TestMultiPatternMatcher(unittest.TestCase):
+    def testFindAll(self):
+        seq = "NNACGTACGTAAAAaaaaTTGCANNACGTTTGCAAC"
+        patterns = ["ACGTACG", "AAA", "TTGCA", "ACNNAC", "GCAAC", "CCCCCCC"]
+        matcher = MultiPatternMatcher(patterns)
+        expected = {elt: getRegexpHits(elt, seq) for elt in patterns}
+        self.assertEqual(matcher.findAll(seq), expected)
+        self.assertEqual(matcher.findAll(seq)["AAA"], [(11, 13), (14, 16)])  # Occurrences do not overlap
+
+    def testFindAllRandom(self):
+        random.seed(42)
+        seq = "".join(random.choice("ACGTN" if idx % 500 == 0 else "ACGT") for idx in range(20000))
+        patterns = set()
+        for idx in range(200):
+            start = random.randint(0, len(seq) - 30)
+            patterns.add(seq[start:start + random.randint(6, 30)])
+        patterns.add("ACGACGACG")
+        patterns = sorted(patterns)
+        expected = {elt: getRegexpHits(elt, seq) for elt in patterns}
+        self.assertEqual(MultiPatternMatcher(patterns).findAll(seq), expected)
+        self.assertEqual(MultiPatternMatcher(patterns, chunk_size=1000).findAll(seq), expected)  # Patterns overlapping chunks
+
+
+class TestGetSmallestAmplicon(unittest.TestCase):
+    def test(self):
+        self.assertEqual(getSmallestAmplicon([], [(10, 20)]), (None, None))
+        self.assertEqual(getSmallestAmplicon([(30, 40)], [(10, 20)]), (None, None))
+        self.assertEqual(getSmallestAmplicon([(1, 10), (30, 40)], [(10, 20), (41, 50)]), (1, 20))  # Fragment length 0 is valid
+        self.assertEqual(getSmallestAmplicon([(1, 10), (30, 40)], [(11, 20), (41, 50)]), (1, 20))  # Same length: first is kept
+        self.assertEqual(getSmallestAmplicon([(1, 10), (12, 20)], [(25, 30), (100, 110)]), (12, 30))
+
+
+class TestFindPatterns(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+        self.tmp_sequences = os.path.join(tmp_folder, unique_id + ".fasta")
+        with FastaIO(self.tmp_sequences, "w") as FH_seq:
+            FH_seq.write(Sequence("artificial_chr1", "CTCAGTCATGTATGTATGTGCTCAAAAAAAAAAAAAAGATCATGGCAC"))
+            FH_seq.write(Sequence("artificial_chr2", "CGATNNNCGATTGTATGTA"))
+            FH_seq.write(Sequence("artificial_chr3", "TGTATGTA"))
+
+    def tearDown(self):
+        if os.path.exists(self.tmp_sequences):
+            os.remove(self.tmp_sequences)
+
+    def test(self):
+        expected = [
+            ("artificial_chr1", {"CGAT": [], "TGTATGTA": [(9, 16)]}),
+            ("artificial_chr2", {"CGAT": [(1, 4), (8, 11)], "TGTATGTA": [(12, 19)]}),
+            ("artificial_chr3", {"CGAT": [], "TGTATGTA": [(1, 8)]})
+        ]
+        for nb_jobs in [1, 2]:
+            self.assertEqual(findPatterns(self.tmp_sequences, ["TGTATGTA", "CGAT"], nb_jobs), expected)
+        self.assertEqual(
+            findPatterns(self.tmp_sequences, {"artificial_chr2": ["CGAT"], "artificial_chr1": ["TGTATGTA"]}),
+            [("artificial_chr1", {"TGTATGTA": [(9, 16)]}), ("artificial_chr2", {"CGAT": [(1, 4), (8, 11)]})]
+        )
+        # No sequence matched
+        with self.assertRaises(Exception):
+            findPatterns(self.tmp_sequences, {"chr1": ["TGTATGTA"]})
+
+    def testCompressed(self):
+        expected = findPatterns(self.tmp_sequences, ["TGTATGTA", "CGAT"])
+        with open(self.tmp_sequences, "rb") as reader:
+            content = reader.read()
+        with gzip.open(self.tmp_sequences, "wb") as writer:
+            writer.write(content)
+        for nb_jobs in [1, 2]:
+            self.assertEqual(findPatterns(self.tmp_sequences, ["TGTATGTA", "CGAT"], nb_jobs), expected)
+        self.assertEqual(
+            findPatterns(self.tmp_sequences, {"artificial_chr2": ["CGAT"], "artificial_chr1": ["TGTATGTA"]}, 2),
+            [("artificial_chr1", {"TGTATGTA": [(9, 16)]}), ("artificial_chr2", {"CGAT": [(1, 4), (8, 11)]})]
+        )
+        with self.assertRaises(Exception):
+            findPatterns(self.tmp_sequences, {"chr1": ["TGTATGTA"]})
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import unittest
+from anacore.region import Region
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+sys.path.append(BIN_DIR)
+
+from regionsIndex import RegionsIndex
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class TestRegionsIndex(unittest.TestCase):
+    def setUp(self):
+        self.regions = [Region(40, 45), Region(1, 30), Region(5, 8)]
+        self.regions_idx = RegionsIndex({"artificial_chr1": self.regions})
+
+    def testContains(self):
+        self.assertIn("artificial_chr1", self.regions_idx)
+        self.assertNotIn("artificial_chr2", self.regions_idx)
+
+    def testGetOverlapped(self):
+        region_40_45, region_1_30, region_5_8 = self.regions
+        self.assertEqual(self.regions_idx.getOverlapped("artificial_chr1", 6, 12), [region_1_30, region_5_8])
+        self.assertEqual(self.regions_idx.getOverlapped("artificial_chr1", 10, 12), [region_1_30])
+        self.assertEqual(self.regions_idx.getOverlapped("artificial_chr1", 30, 40), [region_1_30, region_40_45])
+        self.assertEqual(self.regions_idx.getOverlapped("artificial_chr1", 31, 39), [])
+        self.assertEqual(self.regions_idx.getOverlapped("artificial_chr2", 1, 10), [])
+
+    def testHasOverlap(self):
+        self.assertTrue(self.regions_idx.hasOverlap("artificial_chr1", 10, 12))
+        self.assertTrue(self.regions_idx.hasOverlap("artificial_chr1", 30.5, 40))
+        self.assertFalse(self.regions_idx.hasOverlap("artificial_chr1", 30.5, 30.5))
+        self.assertFalse(self.regions_idx.hasOverlap("artificial_chr1", 31, 39))
+        self.assertFalse(self.regions_idx.hasOverlap("artificial_chr1", 46, 50))
+        self.assertFalse(self.regions_idx.hasOverlap("artificial_chr2", 1, 10))
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import gzip
+import uuid
+import pysam
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class TestSamTagUMIToFastq(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_aln = os.path.join(tmp_folder, unique_id + ".bam")
+        self.tmp_out_R1 = os.path.join(tmp_folder, unique_id + "_R1.fastq.gz")
+        self.tmp_out_R2 = os.path.join(tmp_folder, unique_id + "_R2.fastq")
+
+        # Alignments
+        header = {"HD": {"VN": "1.6", "SO": "unsorted"}}
+        reads = [
+            # name, flag, sequence, qualities, tags
+            ("frag1", 77, "ACGTN", [0, 10, 20, 30, 40], {"RX": "AAC-GTT", "QX": "II@ ,II", "BC": "ACGT-TTGA"}),
+            ("frag1", 141, "TTGCA", [40, 30, 20, 10, 0], {"RX": "AAC-GTT", "QX": "II@ ,II", "BC": "ACGT-TTGA"}),
+            ("frag2", 589, "GGCAT", [2, 2, 2, 2, 2], {"RX": "TTA-CCA", "QX": "IIIIIII"}),  # QC failed
+            ("frag2", 653, "CCATG", [2, 2, 2, 2, 2], {"RX": "TTA-CCA", "QX": "IIIIIII"}),  # QC failed
+            ("frag3", 333, "ACCCT", [10, 10, 10, 10, 11], {"RX": "CTA-GGA", "QX": "IIIIIII"}),  # Secondary
+            ("frag4", 93, "AGGTC", [35, 36, 37, 38, 39], {"RX": "GGG-TTT", "QX": "IIIIIII"}),  # Reverse
+            ("frag4", 157, "TTUAC", [1, 2, 3, 4, 5], {"RX": "GGG-TTT", "QX": "IIIIIII"})  # Reverse
+        ]
+        with pysam.AlignmentFile(self.tmp_aln, "wb", header=header) as writer:
+            for name, flag, sequence, qualities, tags in reads:
+                record = pysam.AlignedSegment(writer.header)
+                record.query_name = name
+                record.flag = flag
+                record.query_sequence = sequence
+                record.query_qualities = pysam.qualitystring_to_array("".join(chr(elt + 33) for elt in qualities))
+                for key, value in tags.items():
+                    record.set_tag(key, value)
+                writer.write(record)
+        self.expected = [
+            "@frag1:AAC-GTT 1:N:0:ACGT+TTGA QX=II@ ,II\nACGTN\n+\n!+5?I\n",
+            "@frag1:AAC-GTT 2:N:0:ACGT+TTGA QX=II@ ,II\nTTGCA\n+\nI?5+!\n",
+            "@frag2:TTA-CCA 1:Y:0: QX=IIIIIII\nGGCAT\n+\n#####\n",
+            "@frag2:TTA-CCA 2:Y:0: QX=IIIIIII\nCCATG\n+\n#####\n",
+            "@frag4:GGG-TTT 1:N:0: QX=IIIIIII\nAGGTC\n+\nDEFGH\n",
+            "@frag4:GGG-TTT 2:N:0: QX=IIIIIII\nTTTAC\n+\n\"#$%&\n"
+        ]
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_aln, self.tmp_out_R1, self.tmp_out_R2]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testOneFile(self):
+        cmd = [
+            "samTagUMIToFastq.py",
+            "--batch-size", "2",
+            "--input-aln", self.tmp_aln,
+            "--output-reads", self.tmp_out_R2
+        ]
+        subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+        with open(self.tmp_out_R2) as reader:
+            self.assertEqual(reader.read(), "".join(self.expected[:2] + self.expected[4:]))
+
+    def testPair(self):
+        for options in [[], ["--compression-threads", "2"]]:
+            cmd = [
+                "samTagUMIToFastq.py",
+                "--keep-qc-failed",
+                "--reads-barcode", "TTTT",
+                "--batch-size", "3",
+                "--input-aln", self.tmp_aln,
+                "--output-reads", self.tmp_out_R1,
+                "--output-reads-2", self.tmp_out_R2
+            ] + options
+            subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+            with gzip.open(self.tmp_out_R1, "rt") as reader:
+                self.assertEqual(reader.read(), "".join([elt.replace(":0: ", ":0:TTTT ").replace(":0:ACGT+TTGA", ":0:TTTT") for elt in self.expected[0::2]]))
+            with open(self.tmp_out_R2) as reader:
+                self.assertEqual(reader.read(), "".join([elt.replace(":0: ", ":0:TTTT ").replace(":0:ACGT+TTGA", ":0:TTTT") for elt in self.expected[1::2]]))
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+__author__ = 'Frederic Escudie'
+__copyright__ = 'Copyright (C) 2021 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__email__ = 'escudie.frederic@iuct-oncopole.fr'
+__status__ = 'prod'
+
+import os
+import sys
+import gzip
+import uuid
+import pysam
+import random
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TEST_DIR)
+BIN_DIR = os.path.join(APP_DIR, "bin")
+os.environ['PATH'] = BIN_DIR + os.pathsep + os.environ['PATH']
+sys.path.append(BIN_DIR)
+
+import sortVCF
+from sortVCF import getContigsOrder, getMaxMemory, getRecordKey, sortedLines
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+class SortVCF(unittest.TestCase):
+    def setUp(self):
+        tmp_folder = tempfile.gettempdir()
+        unique_id = str(uuid.uuid1())
+
+        # Temporary files
+        self.tmp_variants = os.path.join(tmp_folder, unique_id + ".vcf")
+        self.tmp_output = os.path.join(tmp_folder, unique_id + "_out.vcf")
+        self.tmp_output_gz = os.path.join(tmp_folder, unique_id + "_out.vcf.gz")
+        self.tmp_output_tbi = os.path.join(tmp_folder, unique_id + "_out.vcf.gz.tbi")
+
+        # Create VCF
+        self.header = [
+            "##fileformat=VCFv4.3\n",
+            "##contig=<ID=chr2,length=1000000>\n",
+            "##contig=<ID=chr10,length=1000000>\n",
+            "##contig=<ID=chr1,length=1000000>\n",
+            "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+        ]
+        self.expected = [
+            "chr2\t10\t.\tA\tT\t.\tPASS\t.\n",
+            "chr2\t10\t.\tAGC\tA\t.\tPASS\t.\n",  # End: 12
+            "chr2\t10\t.\tAGCT\tA\t.\tPASS\t.\n",  # End: 13
+            "chr2\t150\t.\tG\tC,T\t.\tPASS\t.\n",
+            "chr10\t2\t.\tC\tG\t.\tPASS\t.\n",
+            "chr1\t5\t.\tT\tA\t.\tPASS\t.\n",
+            "chr1\t5\t.\tT\tG\t.\tPASS\t.\n",
+            "chr1\t5\t.\tT\tTA\t.\tPASS\t.\n",  # End: 5.5
+            "chr1\t1000\t.\tC\tA\t.\tPASS\t.\n",
+            "chrUn\t3\t.\tA\tC\t.\tPASS\t.\n",
+            "chrX\t1\t.\tG\tT\t.\tPASS\t.\n"
+        ]
+        for idx in range(200):
+            self.expected.append("chrX\t{}\t.\tA\tC\t.\tPASS\t.\n".format(idx * 10 + 5))
+        records = list(self.expected)
+        random.seed(42)
+        random.shuffle(records)
+        with open(self.tmp_variants, "w") as handle:
+            handle.writelines(self.header + records)
+
+    def tearDown(self):
+        # Clean temporary files
+        for curr_file in [self.tmp_variants, self.tmp_output, self.tmp_output_gz, self.tmp_output_tbi]:
+            if os.path.exists(curr_file):
+                os.remove(curr_file)
+
+    def testGetMaxMemory(self):
+        self.assertEqual(getMaxMemory("100"), 100)
+        self.assertEqual(getMaxMemory("2k"), 2048)
+        self.assertEqual(getMaxMemory("1.5G"), int(1.5 * 1024**3))
+        self.assertEqual(getMaxMemory("500MB"), 500 * 1024**2)
+
+    def testGetRecordKey(self):
+        rank_by_contig = getContigsOrder(self.header)
+        self.assertEqual(rank_by_contig, {"chr2": 0, "chr10": 1, "chr1": 2})
+        self.assertEqual(getRecordKey("chr1\t5\t.\tT\tTA\t.\tPASS\t.\n", rank_by_contig), (2, "chr1", 5, 5.5, "TA"))
+        self.assertEqual(getRecordKey("chr2\t10\t.\tAGC\tA,T\t.\tPASS\t.\n", rank_by_contig), (0, "chr2", 10, 12, "A"))
+        self.assertEqual(getRecordKey("chrX\t10\t.\tA\tT\t.\tPASS\t.\n", rank_by_contig), (3, "chrX", 10, 10, "T"))
+
+    def testResults(self):
+        for max_memory in ["1G", "2K"]:  # In memory and with spilled runs
+            subprocess.check_call([
+                "sortVCF.py",
+                "--max-memory", max_memory,
+                "--input-variants", self.tmp_variants,
+                "--output-variants", self.tmp_output
+            ], stderr=subprocess.DEVNULL)
+            with open(self.tmp_output) as handle:
+                self.assertEqual(handle.readlines(), self.header + self.expected)
+
+    def testMultiPassMerge(self):
+        rank_by_contig = getContigsOrder(self.header)
+        with open(self.tmp_variants) as handle:
+            records = [line for line in handle if not line.startswith("#")]
+        # Count runs files opened at the same time
+        open_runs = {"curr": 0, "max": 0}
+        iter_run_fct = sortVCF.iterRun
+
+        def countedIterRun(run_path, rank_by_contig):
+            open_runs["curr"] += 1
+            open_runs["max"] = max(open_runs["max"], open_runs["curr"])
+            try:
+                yield from iter_run_fct(run_path, rank_by_contig)
+            finally:
+                open_runs["curr"] -= 1
+
+        sortVCF.iterRun = countedIterRun
+        try:
+            with tempfile.TemporaryDirectory() as tmp_folder:
+                for max_fan_in in [2, 3, 1000]:
+                    open_runs["max"] = 0
+                    observed = list(sortedLines(records, rank_by_contig, 1000, tmp_folder, max_fan_in))
+                    self.assertEqual(observed, self.expected)
+                    self.assertLessEqual(open_runs["max"], max_fan_in)
+                    self.assertEqual(os.listdir(tmp_folder), [])  # Runs are removed
+                self.assertGreater(open_runs["max"], 3)  # Without limitation all runs are opened
+        finally:
+            sortVCF.iterRun = iter_run_fct
+
+    def testCompressedAndIndexed(self):
+        subprocess.check_call([
+            "sortVCF.py",
+            "--max-memory", "2K",
+            "--tabix-index",
+            "--input-variants", self.tmp_variants,
+            "--output-variants", self.tmp_output_gz
+        ], stderr=subprocess.DEVNULL)
+        with gzip.open(self.tmp_output_gz, "rt") as handle:
+            self.assertEqual(handle.readlines(), self.header + self.expected)
+        with pysam.TabixFile(self.tmp_output_gz) as reader:
+            self.assertEqual(
+                [elt + "\n" for elt in reader.fetch("chr1", 0, 5)],
+                self.expected[5:8]
+            )
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
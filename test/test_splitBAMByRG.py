@@ -3,7 +3,7 @@
 __author__ = 'Frederic Escudie'
 __copyright__ = 'Copyright (C) 2020 IUCT-O'
 __license__ = 'GNU General Public License'
-__version__ = '1.0.0'
+__version__ = '1.2.0'
 __email__ = 'escudie.frederic@iuct-oncopole.fr'
 __status__ = 'prod'
 
@@ -132,6 +132,57 @@ M70265:329:000000000-D5GLP:1:1101:17038:2070_Support_ratio:100/100;R1_start:0;R2
                 observed.strip()
             )
 
+    def testSplitWithUpdateRG(self):
+        # Exec
+        samToBam(self.tmp_in_sam, self.tmp_in_bam)
+        cmd = [
+            "splitBAMByRG.py",
+            "--update-RG", "SM:splA", "PL:ILLUMINA",
+            "--input-aln", self.tmp_in_bam,
+            "--input-design", self.tmp_in_gp,
+            "--output-pattern", self.tmp_out_pattern
+        ]
+        subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+        # Eval
+        for curr_case in self.data:
+            tmp_sam = curr_case["file"].replace(".bam", ".sam")
+            bamToSam(curr_case["file"], tmp_sam)
+            with open(tmp_sam) as reader:
+                observed = "".join(reader.readlines())
+            expected = "\n".join(
+                line.replace("\tLB:", "\tSM:splA\tLB:") + "\tPL:ILLUMINA" if line.startswith("@RG") else line for line in curr_case["expected"].split("\n")
+            )
+            self.assertEqual(
+                expected.strip(),
+                observed.strip()
+            )
+
+    def testSplitWithMergeRG(self):
+        # Exec
+        samToBam(self.tmp_in_sam, self.tmp_in_bam)
+        cmd = [
+            "splitBAMByRG.py",
+            "--merge-RG",
+            "--update-RG", "SM:libA", "LB:libA", "PL:ILLUMINA",
+            "--input-aln", self.tmp_in_bam,
+            "--input-design", self.tmp_in_gp,
+            "--output-pattern", self.tmp_out_pattern
+        ]
+        subprocess.check_call(cmd, stderr=subprocess.DEVNULL)
+        # Eval
+        for curr_case in self.data:
+            tmp_sam = curr_case["file"].replace(".bam", ".sam")
+            bamToSam(curr_case["file"], tmp_sam)
+            with open(tmp_sam) as reader:
+                observed = "".join(reader.readlines())
+            expected = "\n".join(
+                "@RG\tID:1\tSM:libA\tLB:libA\tPL:ILLUMINA" if line.startswith("@RG") else line.replace("\tRG:Z:2", "\tRG:Z:1") for line in curr_case["expected"].split("\n")
+            )
+            self.assertEqual(
+                expected.strip(),
+                observed.strip()
+            )
+
 
 ########################################################################
 #